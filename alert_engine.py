@@ -0,0 +1,182 @@
+# alert_engine.py
+"""Kavşak başına durumlu uyarı motoru: histerezis, tekrar bastırma ve kayan z-skor/CUSUM anomali tespiti"""
+
+import logging
+import threading
+from collections import defaultdict
+from datetime import datetime
+from typing import Dict, List
+
+import numpy as np
+
+from batch_engine import CRITICAL_DENSITY, IntersectionTable, TrafficBatch
+
+logger = logging.getLogger(__name__)
+
+# Anomali izlenen metrikler (TrafficBatch alanları)
+ANOMALY_METRICS = ("density", "avg_speed")
+
+CONGESTION = "TRAFFIC_CONGESTION"
+ANOMALY = "TRAFFIC_ANOMALY"
+
+# Olay -> önem derecesi
+SEVERITY = {
+    (CONGESTION, "raised"): "HIGH",
+    (CONGESTION, "ongoing"): "HIGH",
+    (CONGESTION, "cleared"): "LOW",
+    (ANOMALY, "spike"): "MEDIUM",
+    (ANOMALY, "drop"): "MEDIUM",
+}
+
+
+class AlertEngine:
+    """Yalnızca durum geçişlerini uyarı olayı olarak üretir.
+
+    Tıkanıklık: yoğunluk `enter_density` üstünde `min_duration` saniye kalınca
+    açılır, `exit_density` altında aynı süre kalınca kapanır (aradaki bant
+    titremeyi önler). Açık uyarı `renotify_interval` saniyede bir hatırlatılır.
+    Anomali: metrik başına EWMA ortalama/varyansla z-skor ve iki yönlü CUSUM;
+    her örnek kavşak başına O(1) günceller. Aynı kavşakta bir anomaliden sonra
+    `anomaly_cooldown` saniye yeni anomali bildirilmez.
+    """
+
+    def __init__(self, table: IntersectionTable, enter_density: float = CRITICAL_DENSITY * 100,
+                 exit_density: float = 60.0, min_duration: float = 60.0, renotify_interval: float = 900.0,
+                 z_threshold: float = 4.0, cusum_k: float = 0.5, cusum_h: float = 8.0,
+                 ewma_alpha: float = 0.05, warmup: int = 30, anomaly_cooldown: float = 600.0):
+        if exit_density > enter_density:
+            raise ValueError("Çıkış eşiği giriş eşiğinden büyük olamaz")
+        self.table = table
+        self.enter_density = enter_density
+        self.exit_density = exit_density
+        self.min_duration = min_duration
+        self.renotify_interval = renotify_interval
+        self.z_threshold = z_threshold
+        self.cusum_k = cusum_k
+        self.cusum_h = cusum_h
+        self.ewma_alpha = ewma_alpha
+        self.warmup = warmup
+        self.anomaly_cooldown = anomaly_cooldown
+        self._lock = threading.Lock()
+
+        n, m = len(table), len(ANOMALY_METRICS)
+        self.active = np.zeros(n, dtype=bool)
+        self.pending_since = np.full(n, np.nan)
+        self.active_since = np.full(n, np.nan)
+        self.last_notified = np.full(n, -np.inf)
+
+        self.samples = np.zeros(n, dtype=np.int64)
+        self.mean = np.zeros((n, m))
+        self.var = np.zeros((n, m))
+        self.cusum_pos = np.zeros((n, m))
+        self.cusum_neg = np.zeros((n, m))
+        self.last_anomaly = np.full(n, -np.inf)
+
+        self.stats = {"samples": 0, "raised": 0, "ongoing": 0, "cleared": 0,
+                      "anomalies": 0, "suppressed": 0}
+
+    def process(self, batch: TrafficBatch) -> List[Dict]:
+        """Bir döngünün sonuçlarını işle; yalnızca bu döngüde oluşan geçiş olaylarını döndür"""
+        rows = batch.rows
+        ts = batch.timestamp.timestamp()
+        density = batch.density.astype(np.float64)
+        values = np.stack([getattr(batch, name).astype(np.float64) for name in ANOMALY_METRICS], axis=1)
+
+        with self._lock:
+            raised, ongoing, cleared = self._update_congestion(rows, density, ts)
+            spikes, drops, z, expected = self._update_anomalies(rows, values, ts)
+
+            self.stats["samples"] += len(rows)
+            self.stats["raised"] += int(raised.sum())
+            self.stats["ongoing"] += int(ongoing.sum())
+            self.stats["cleared"] += int(cleared.sum())
+            self.stats["anomalies"] += int((spikes | drops).any(axis=1).sum())
+            # Eski davranışta her döngü yeniden yayınlanacak kritik örnekler
+            self.stats["suppressed"] += int(((density >= self.enter_density) & ~raised & ~ongoing).sum())
+
+        events = []
+        for name, mask in (("raised", raised), ("ongoing", ongoing), ("cleared", cleared)):
+            for i in np.flatnonzero(mask).tolist():
+                row = int(rows[i])
+                events.append(dict(self._describe(row), alertType=CONGESTION, event=name,
+                                   density=float(density[i]),
+                                   since=datetime.fromtimestamp(self.active_since[row]).isoformat(timespec='seconds')
+                                   if name != "cleared" else None,
+                                   durationSec=int(ts - self.active_since[row]) if name != "raised" else 0))
+        for name, mask in (("spike", spikes), ("drop", drops)):
+            for i, j in zip(*np.nonzero(mask)):
+                events.append(dict(self._describe(int(rows[i])), alertType=ANOMALY, event=name,
+                                   metric=ANOMALY_METRICS[j], value=float(values[i, j]),
+                                   expected=round(float(expected[i, j]), 1),
+                                   zScore=round(float(z[i, j]), 2)))
+        return events
+
+    def _describe(self, row: int) -> Dict:
+        return {'id': int(self.table.ids[row]), 'name': self.table.names[row]}
+
+    def _update_congestion(self, rows: np.ndarray, density: np.ndarray, ts: float):
+        active = self.active[rows]
+        # Açıkken çıkış, kapalıyken giriş eşiği aranır
+        wants_change = np.where(active, density <= self.exit_density, density >= self.enter_density)
+        pending = self.pending_since[rows]
+        pending = np.where(wants_change, np.where(np.isnan(pending), ts, pending), np.nan)
+        fire = wants_change & (ts - pending >= self.min_duration)
+
+        raised, cleared = fire & ~active, fire & active
+        ongoing = active & ~fire & (ts - self.last_notified[rows] >= self.renotify_interval)
+
+        self.active[rows] = active ^ fire
+        self.pending_since[rows] = np.where(fire, np.nan, pending)
+        self.active_since[rows[raised]] = ts
+        self.last_notified[rows[raised | ongoing]] = ts
+        return raised, ongoing, cleared
+
+    def _update_anomalies(self, rows: np.ndarray, values: np.ndarray, ts: float):
+        mean, var = self.mean[rows], self.var[rows]
+        samples = self.samples[rows]
+        z = (values - mean) / np.sqrt(var + 1e-6)
+        warm = (samples >= self.warmup)[:, None]
+
+        cusum_pos = np.where(warm, np.maximum(0.0, self.cusum_pos[rows] + z - self.cusum_k), 0.0)
+        cusum_neg = np.where(warm, np.maximum(0.0, self.cusum_neg[rows] - z - self.cusum_k), 0.0)
+        ready = warm & (ts - self.last_anomaly[rows] >= self.anomaly_cooldown)[:, None]
+        spikes = ready & ((z >= self.z_threshold) | (cusum_pos >= self.cusum_h))
+        drops = ready & ((z <= -self.z_threshold) | (cusum_neg >= self.cusum_h)) & ~spikes
+        fired = spikes | drops
+
+        # İlk örneklerde aritmetik ortalama, sonra EWMA. Alarm veren örnek tabana katılmaz ve
+        # taban sonraki örneklerden yeniden ısınır: tek sıçrama da kalıcı seviye kayması da tekrar alarm üretmez
+        alarmed = fired.any(axis=1)
+        alpha = np.maximum(1.0 / (samples + 1), self.ewma_alpha)[:, None]
+        diff = values - mean
+        keep = alarmed[:, None]
+        self.mean[rows] = np.where(keep, mean, mean + alpha * diff)
+        self.var[rows] = np.where(keep, var, (1 - alpha) * (var + alpha * diff ** 2))
+        self.samples[rows] = np.where(alarmed, 0, samples + 1)
+        self.cusum_pos[rows] = np.where(fired, 0.0, cusum_pos)
+        self.cusum_neg[rows] = np.where(fired, 0.0, cusum_neg)
+        self.last_anomaly[rows[alarmed]] = ts
+        return spikes, drops, z, mean
+
+
+def alert_payloads(events: List[Dict], timestamp: str = None) -> List[Dict]:
+    """Olayları (uyarı tipi, olay) başına tek mesajda topla"""
+    timestamp = timestamp or datetime.now().isoformat()
+    groups = defaultdict(list)
+    for event in events:
+        groups[(event['alertType'], event['event'])].append(event)
+
+    payloads = []
+    for (alert_type, name), items in groups.items():
+        payloads.append({
+            'alertType': alert_type,
+            'event': name,
+            'severity': SEVERITY[(alert_type, name)],
+            'timestamp': timestamp,
+            'affectedIntersections': [
+                {key: value for key, value in item.items() if key not in ('alertType', 'event')}
+                for item in items
+            ],
+            'recommendedAction': 'Consider alternative routes' if name in ('raised', 'ongoing') else None
+        })
+    return payloads
@@ -0,0 +1,115 @@
+# async_pipeline.py
+"""Analiz döngüsü aşamalarını sınırlı kuyruklarla bağlayan asyncio boru hattı"""
+
+import asyncio
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, List, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Kuyruk doluyken davranış: toplayıcıyı beklet veya bekleyen eski veriyi at
+BLOCK = "block"
+LATEST = "latest"
+
+
+class PipelineSink:
+    """Kendi sınırlı kuyruğu ve tek thread'lik yürütücüsü olan çıkış aşaması (sıra korunur)"""
+
+    def __init__(self, name: str, handler: Callable[[List], None], maxsize: int = 2, policy: str = BLOCK):
+        self.name = name
+        self.handler = handler
+        self.policy = policy
+        self.maxsize = maxsize
+        # Kuyruk çalışan asyncio döngüsünde oluşturulur
+        self.queue: asyncio.Queue = None
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix=f"pipeline-{name}")
+
+    async def offer(self, item, count: Callable[[str, int], None]):
+        """Öğeyi kuyruğa koy; doluysa politikaya göre bekle veya en eskisini at"""
+        if self.queue.full():
+            if self.policy == LATEST:
+                self.queue.get_nowait()
+                self.queue.task_done()
+                count(f"{self.name}_dropped")
+            else:
+                count(f"{self.name}_blocked")
+        await self.queue.put(item)
+
+    async def consume(self, count: Callable[[str, int], None]):
+        loop = asyncio.get_running_loop()
+        while True:
+            item = await self.queue.get()
+            try:
+                await loop.run_in_executor(self.executor, self.handler, item)
+                count(f"{self.name}_done")
+            except Exception as e:
+                count("errors")
+                logger.error(f"Boru hattı '{self.name}' aşaması hatası: {e}")
+            finally:
+                self.queue.task_done()
+
+
+class AsyncTrafficPipeline:
+    """Toplama → (kayıt, AWS yayını, JSON export) boru hattı.
+
+    Toplama aşaması zamanlayıcının tiklerinde çalışır ve sonucu her çıkış
+    aşamasının sınırlı kuyruğuna koyar; böylece N+1. döngünün veri toplaması,
+    N. döngünün kaydı ve yayınıyla örtüşür. Kayıt ve yayın kuyrukları doluysa
+    toplayıcı bekler (geri basınç, tikler atlanır); export yalnızca en güncel
+    veriyi yazar. Engelleyen çağrılar (sqlite3, awscrt) yürütücülerde çalışır.
+    """
+
+    def __init__(self, analyzer, queue_size: int = 2):
+        self.analyzer = analyzer
+        self.gather_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="pipeline-gather")
+        self.sinks = [
+            PipelineSink("persist", analyzer.save_to_database, queue_size, BLOCK),
+            PipelineSink("export", analyzer.export_to_json, 1, LATEST),
+        ]
+        if analyzer.publisher:
+            self.sinks.insert(1, PipelineSink("publish", analyzer.send_traffic_data_to_aws, queue_size, BLOCK))
+
+        self.stats = {"cycles": 0, "errors": 0}
+        for sink in self.sinks:
+            self.stats.update({f"{sink.name}_done": 0, f"{sink.name}_blocked": 0, f"{sink.name}_dropped": 0})
+        self._stats_lock = threading.Lock()
+
+    def _count(self, key: str, n: int = 1):
+        with self._stats_lock:
+            self.stats[key] += n
+
+    async def gather(self, classes: Tuple[str, ...], reason: str):
+        """Bir tikte veriyi topla ve çıkış aşamalarına dağıt"""
+        rows = self.analyzer.rows_for_classes(classes)
+        self.analyzer.publish_shard_heartbeat(len(self.analyzer.intersection_table) if rows is None else len(rows))
+        if rows is not None and not len(rows):
+            return
+        loop = asyncio.get_running_loop()
+        traffic_data = await loop.run_in_executor(self.gather_executor, self.analyzer.analyze_traffic_data, rows)
+        self._count("cycles")
+        for sink in self.sinks:
+            await sink.offer(traffic_data, self._count)
+        logger.debug(f"🔄 Trafik verileri toplandı ({reason}: {', '.join(classes)})")
+
+    async def run(self, drain_timeout: float = 10.0):
+        """Zamanlayıcı durdurulana kadar çalış, ardından kuyrukları boşalt"""
+        for sink in self.sinks:
+            sink.queue = asyncio.Queue(sink.maxsize)
+        consumers = [asyncio.create_task(sink.consume(self._count), name=f"pipeline-{sink.name}")
+                     for sink in self.sinks]
+        try:
+            await self.analyzer.scheduler.run_async(self.gather)
+        finally:
+            try:
+                await asyncio.wait_for(asyncio.gather(*(sink.queue.join() for sink in self.sinks)),
+                                       drain_timeout)
+            except (asyncio.TimeoutError, asyncio.CancelledError):
+                logger.warning("Boru hattı kuyrukları süresinde boşaltılamadı")
+            for task in consumers:
+                task.cancel()
+            await asyncio.gather(*consumers, return_exceptions=True)
+            self.gather_executor.shutdown(wait=True)
+            for sink in self.sinks:
+                sink.executor.shutdown(wait=True)
@@ -0,0 +1,252 @@
+# batch_engine.py
+"""Kavşakların NumPy dizileri üzerinde toplu (vektörel) trafik analizi"""
+
+import csv
+import json
+import logging
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Dict, List, Optional
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Kavşak tipleri ve dizi içindeki kodları
+INTERSECTION_TYPES = ("major", "medium", "minor")
+TYPE_CODES = {name: code for code, name in enumerate(INTERSECTION_TYPES)}
+
+# Durum kodları (veritabanı ve binary payload'larda da aynı sıra kullanılır)
+STATUS_NAMES = ("normal", "moderate", "critical")
+STATUS_CODES = {name: code for code, name in enumerate(STATUS_NAMES)}
+
+# Yoğunluk eşikleri (0-1 aralığında)
+CRITICAL_DENSITY = 0.7
+MODERATE_DENSITY = 0.4
+
+HOURS_PER_WEEK = 7 * 24
+
+
+def build_peak_table() -> np.ndarray:
+    """Haftanın saati × kavşak tipi zirve çarpanı tablosunu oluştur"""
+    table = np.ones((HOURS_PER_WEEK, len(INTERSECTION_TYPES)), dtype=np.float64)
+    major = TYPE_CODES["major"]
+
+    for weekday in range(7):
+        for hour in range(24):
+            row = table[weekday * 24 + hour]
+            if weekday < 5:
+                # Sabah zirvesi (07:00-09:59)
+                if 7 <= hour <= 9:
+                    row[:] = 2.2
+                    row[major] = 2.8
+                # Akşam zirvesi (17:00-19:59)
+                elif 17 <= hour <= 19:
+                    row[:] = 2.5
+                    row[major] = 3.2
+                # Öğle arası (12:00-14:59)
+                elif 12 <= hour <= 14:
+                    row[:] = 1.8
+                # Normal çalışma saatleri
+                elif 10 <= hour <= 16:
+                    row[:] = 1.4
+            else:
+                # Hafta sonu daha düşük trafik
+                if 11 <= hour <= 15:
+                    row[:] = 1.6
+                elif 19 <= hour <= 22:
+                    row[:] = 1.3
+    return table
+
+
+PEAK_TABLE = build_peak_table()
+
+
+def hour_of_week(now: datetime) -> int:
+    """Pazartesi 00:00'dan itibaren geçen saat (0-167)"""
+    return now.weekday() * 24 + now.hour
+
+
+def peak_multiplier(now: datetime, intersection_type: str) -> float:
+    """Tek bir kavşak tipi için zirve çarpanı"""
+    code = TYPE_CODES.get(intersection_type, TYPE_CODES["minor"])
+    return float(PEAK_TABLE[hour_of_week(now), code])
+
+
+@dataclass
+class IntersectionTable:
+    """Kavşak tanımlarının sütun bazlı (NumPy) gösterimi"""
+    ids: np.ndarray
+    names: List[str]
+    lat: np.ndarray
+    lng: np.ndarray
+    type_code: np.ndarray
+    _row_by_id: Dict[int, int] = field(default=None, repr=False)
+    _id_order: np.ndarray = field(default=None, repr=False)
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    @classmethod
+    def from_records(cls, records: List[Dict]) -> "IntersectionTable":
+        ids = np.array([int(r["id"]) for r in records], dtype=np.int64)
+        if len(np.unique(ids)) != len(ids):
+            raise ValueError("Kavşak tanımlarında tekrarlanan id var")
+
+        return cls(
+            ids=ids,
+            names=[str(r.get("name", r["id"])) for r in records],
+            lat=np.array([float(r["lat"]) for r in records], dtype=np.float64),
+            lng=np.array([float(r["lng"]) for r in records], dtype=np.float64),
+            type_code=np.array(
+                [TYPE_CODES.get(r.get("type", "minor"), TYPE_CODES["minor"]) for r in records],
+                dtype=np.int8
+            )
+        )
+
+    def row_of(self, intersection_id: int) -> Optional[int]:
+        """Kavşak id'sinin dizi içindeki satırı"""
+        if self._row_by_id is None:
+            self._row_by_id = {int(i): row for row, i in enumerate(self.ids)}
+        return self._row_by_id.get(int(intersection_id))
+
+    def rows_of(self, intersection_ids: np.ndarray) -> np.ndarray:
+        """Birden çok id için satır indeksleri (bilinmeyen id'ler için -1)"""
+        ids = np.asarray(intersection_ids, dtype=np.int64)
+        if not len(self.ids):
+            return np.full(len(ids), -1, dtype=np.int64)
+        # Sıralı id dizisinde ikili arama: milyonlarca id için de tek vektörel geçiş
+        if self._id_order is None:
+            self._id_order = np.argsort(self.ids, kind='stable')
+        rows = self._id_order[np.minimum(np.searchsorted(self.ids, ids, sorter=self._id_order), len(self.ids) - 1)]
+        return np.where(self.ids[rows] == ids, rows, -1)
+
+    def to_dicts(self) -> List[Dict]:
+        """Eski `self.intersections` liste-sözlük biçimi"""
+        return [
+            {
+                "id": int(self.ids[i]),
+                "name": self.names[i],
+                "lat": float(self.lat[i]),
+                "lng": float(self.lng[i]),
+                "type": INTERSECTION_TYPES[self.type_code[i]]
+            }
+            for i in range(len(self))
+        ]
+
+
+def load_intersections(path: str) -> IntersectionTable:
+    """Kavşak tanımlarını JSON veya CSV dosyasından yükle"""
+    if path.lower().endswith(".csv"):
+        with open(path, newline='', encoding='utf-8') as f:
+            records = list(csv.DictReader(f))
+    else:
+        with open(path, encoding='utf-8') as f:
+            records = json.load(f)
+        if isinstance(records, dict):
+            records = records.get("intersections", [])
+
+    table = IntersectionTable.from_records(records)
+    logger.info(f"{len(table)} kavşak tanımı yüklendi: {path}")
+    return table
+
+
+@dataclass
+class TrafficBatch:
+    """Bir analiz döngüsünün tüm kavşaklar için sonuçları"""
+    rows: np.ndarray           # IntersectionTable içindeki satırlar
+    ids: np.ndarray
+    density: np.ndarray        # yüzde (0-100), 1 ondalık
+    avg_speed: np.ndarray      # km/h
+    wait_time: np.ndarray      # saniye
+    vehicle_count: np.ndarray
+    status_code: np.ndarray    # STATUS_NAMES indeksi
+    timestamp: datetime
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def apply_travel_times(self, duration_sec: np.ndarray, distance_m: np.ndarray):
+        """Gerçek seyahat süresi olan kavşaklarda hız ve bekleme süresini güncelle"""
+        valid = (duration_sec > 0) & (distance_m > 0)
+        if not valid.any():
+            return
+        self.avg_speed[valid] = (distance_m[valid] / 1000 / (duration_sec[valid] / 3600)).astype(np.int32)
+        self.wait_time[valid] = (duration_sec[valid] % 180).astype(np.int32)
+
+    def apply_measurements(self, density: np.ndarray, avg_speed: np.ndarray,
+                           wait_time: np.ndarray, vehicle_count: np.ndarray):
+        """Ölçülen değerleri (NaN = ölçüm yok) yaz; ölçülen yoğunlukta durum yeniden hesaplanır"""
+        measured = ~np.isnan(density)
+        self.density[measured] = np.round(density[measured], 1)
+        self.status_code[measured] = ((density[measured] > MODERATE_DENSITY * 100).astype(np.int8)
+                                      + (density[measured] > CRITICAL_DENSITY * 100))
+        for target, values in ((self.avg_speed, avg_speed), (self.wait_time, wait_time),
+                               (self.vehicle_count, vehicle_count)):
+            measured = ~np.isnan(values)
+            target[measured] = values[measured].astype(target.dtype)
+
+    def to_traffic_data(self, table: IntersectionTable, factory) -> List:
+        """Batch'i `factory` (TrafficData) nesnelerinin listesine çevir"""
+        names = table.names
+        lat = table.lat[self.rows].tolist()
+        lng = table.lng[self.rows].tolist()
+        return [
+            factory(
+                intersection_id=i,
+                name=names[row],
+                lat=la,
+                lng=ln,
+                density=d,
+                avg_speed=s,
+                wait_time=w,
+                vehicle_count=v,
+                status=STATUS_NAMES[c],
+                timestamp=self.timestamp
+            )
+            for i, row, la, ln, d, s, w, v, c in zip(
+                self.ids.tolist(), self.rows.tolist(), lat, lng,
+                self.density.tolist(), self.avg_speed.tolist(), self.wait_time.tolist(),
+                self.vehicle_count.tolist(), self.status_code.tolist()
+            )
+        ]
+
+
+class BatchTrafficEngine:
+    """Tüm kavşaklar için yoğunluk, hız, bekleme süresi ve durumu tek geçişte hesaplar"""
+
+    def __init__(self, table: IntersectionTable, rng: np.random.Generator = None):
+        self.table = table
+        self.rng = rng if rng is not None else np.random.default_rng()
+
+    def compute(self, now: datetime = None, rows: np.ndarray = None) -> TrafficBatch:
+        """Verilen an (saat anlık görüntüsü) için toplu analiz"""
+        # Döngü başına tek saat okuması
+        now = now or datetime.now()
+        if rows is None:
+            rows = np.arange(len(self.table))
+
+        metrics = self.compute_block(np.array([hour_of_week(now)]), rows)
+        return TrafficBatch(
+            rows=rows,
+            ids=self.table.ids[rows],
+            **{name: values[0] for name, values in metrics.items()},
+            timestamp=now
+        )
+
+    def compute_block(self, hours: np.ndarray, rows: np.ndarray) -> Dict[str, np.ndarray]:
+        """Birden çok an (haftanın saati, T) × satır (n) için metrikler; her dizi (T, n).
+
+        Tek an için `compute` ile aynı rastgele sayı sırasını kullanır.
+        """
+        shape = (len(hours), len(rows))
+        multiplier = PEAK_TABLE[hours][:, self.table.type_code[rows]]
+        density = np.minimum(self.rng.uniform(0.1, 0.3, shape) * multiplier, 1.0)
+
+        return {
+            'density': np.round(density * 100, 1),
+            'avg_speed': np.maximum(15, (60 - density * 45).astype(np.int32)),
+            'wait_time': (density * 180).astype(np.int32),
+            'vehicle_count': (density * 150 + self.rng.uniform(10, 50, shape)).astype(np.int32),
+            'status_code': (density > MODERATE_DENSITY).astype(np.int8) + (density > CRITICAL_DENSITY)
+        }
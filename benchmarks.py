@@ -0,0 +1,244 @@
+# benchmarks.py
+"""Analiz hattı aşamalarının yerel taklitlerle (Maps, MQTT, geçici veritabanı) ölçümü ve temel çizgi karşılaştırması"""
+
+import argparse
+import contextlib
+import json
+import logging
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+from datetime import datetime
+from typing import Callable, Dict, List
+
+import numpy as np
+
+from batch_engine import IntersectionTable
+from local_stubs import DistanceMatrixStub, FakeMQTTConnection
+from traffic_replay import DatabaseSink, SyntheticTraffic, synthetic_intersections
+
+logger = logging.getLogger(__name__)
+
+BASELINE_VERSION = 1
+
+DEFAULT_SIZES = (8, 1000, 10000, 50000)
+# Geçmiş boyutu döngü sayısıyla verilir: kavşak sayısı × döngü satır
+DEFAULT_HISTORY_CYCLES = (10, 100, 1000)
+
+# Ölçüm sırasında analizörün dosyaları geçici dizine yönlendirilir, dış bağlantılar kapatılır
+BENCH_ENV = {
+    "TRAFFIC_SNAPSHOT_PATH": "current_traffic_data.json",
+    "TRAFFIC_PREDICTIONS_PATH": "traffic_predictions.json",
+    "FORECAST_STATE_PATH": "traffic_forecast_state.npz",
+    "AWS_IOT_SPOOL_PATH": "aws_iot_spool.bin",
+    "DB_DEAD_LETTER_PATH": "traffic_db_dead_letter.jsonl",
+    "TRAFFIC_TILE_INDEX_PATH": "intersections.tiles.json",
+    "AWS_IOT_ENDPOINT": None,
+    "MQTT_BROKER_HOST": None,
+    "TRAFFIC_SHARD_ID": None,
+    "ARCHIVE_ENABLED": None,
+    "MAPS_PAIRING": None,
+}
+
+
+@contextlib.contextmanager
+def patched_env(values: Dict[str, str]):
+    """Ortam değişkenlerini geçici olarak değiştir (None: kaldır)"""
+    saved = {key: os.environ.get(key) for key in values}
+    try:
+        for key, value in values.items():
+            if value is None:
+                os.environ.pop(key, None)
+            else:
+                os.environ[key] = value
+        yield
+    finally:
+        for key, value in saved.items():
+            if value is None:
+                os.environ.pop(key, None)
+            else:
+                os.environ[key] = value
+
+
+def timed(fn: Callable) -> float:
+    """Tek çağrının süresi (ms)"""
+    started = time.perf_counter()
+    fn()
+    return (time.perf_counter() - started) * 1000
+
+
+def summarize(samples: List[float]) -> Dict:
+    values = np.array(samples)
+    return {
+        "runs": len(values),
+        "min_ms": round(float(values.min()), 3),
+        "median_ms": round(float(np.median(values)), 3),
+        "p95_ms": round(float(np.percentile(values, 95)), 3),
+        "max_ms": round(float(values.max()), 3),
+    }
+
+
+def bench_size(n: int, args) -> List[Dict]:
+    """Bir kavşak sayısı için tüm aşamaları ölç"""
+    # İçe aktarma ortam ayarından sonra: modül düzeyinde logging yapılandırması var
+    from trafik_analizi_aws import AWSIoTTrafficAnalyzer
+
+    results = []
+
+    def record(stage: str, samples: List[float], history: int = None, rows: int = None):
+        entry = {"size": n, "stage": stage, "history": history, "rows": rows, **summarize(samples)}
+        results.append(entry)
+        logger.info(f"⏱️ {n:>6} {stage:<28} {'' if history is None else history:>6} "
+                    f"median {entry['median_ms']:.2f} ms")
+
+    workdir = tempfile.mkdtemp(prefix=f"bench-{n}-")
+    cwd = os.getcwd()
+    table = IntersectionTable.from_records(synthetic_intersections(n, args.seed))
+    stub = None if args.no_maps else DistanceMatrixStub(latency=args.maps_latency, seed=args.seed).start()
+    connection = FakeMQTTConnection(ack_latency=args.ack_latency, seed=args.seed)
+    analyzer = None
+    try:
+        os.chdir(workdir)
+        with patched_env(BENCH_ENV):
+            started = time.perf_counter()
+            analyzer = AWSIoTTrafficAnalyzer(
+                None if stub is None else "bench-key",
+                db_path=os.path.join(workdir, "traffic_data.db"),
+                maps_api_url=None if stub is None else stub.url,
+                connection=connection,
+                intersection_table=table
+            )
+            record("init", [(time.perf_counter() - started) * 1000])
+        analyzer.connect_to_aws_iot(wait=5.0)
+
+        # İlk döngü: Maps önbelleği soğuk
+        record("analyze_traffic_data_cold", [timed(analyzer.analyze_traffic_data)])
+
+        samples = {name: [] for name in ("analyze_traffic_data", "save_to_database", "db_flush",
+                                         "send_traffic_data_to_aws", "mqtt_ack_drain", "export_to_json")}
+        for _ in range(args.repeat):
+            data = []
+            samples["analyze_traffic_data"].append(timed(lambda: data.extend(analyzer.analyze_traffic_data())))
+            samples["save_to_database"].append(timed(lambda: analyzer.save_to_database(data)))
+            samples["db_flush"].append(timed(analyzer.db_writer.flush))
+            samples["send_traffic_data_to_aws"].append(timed(lambda: analyzer.send_traffic_data_to_aws(data)))
+            samples["mqtt_ack_drain"].append(timed(lambda: analyzer.publisher.drain(30.0)))
+            samples["export_to_json"].append(timed(lambda: analyzer.export_to_json(data)))
+        for stage, values in samples.items():
+            record(stage, values, rows=n)
+
+        # Geçmiş büyüdükçe sorgu: eksik döngüler daha eski zamanlara eklenir
+        now = int(time.time())
+        filled = 0
+        sink = None
+        for cycles in sorted(args.history_cycles):
+            if n * cycles > args.max_history_rows:
+                logger.info(f"{n} kavşak × {cycles} döngü atlandı (--max-history-rows)")
+                continue
+            sink = sink or DatabaseSink(analyzer.db_path, table)
+            source = SyntheticTraffic(table, args.seed + cycles, args.step)
+            for records in source.blocks(now - cycles * args.step, now - filled * args.step):
+                sink.write(records)
+            filled = cycles
+
+            hours = cycles * args.step / 3600
+            rows = []
+            history = [timed(lambda: rows.append(len(analyzer.get_historical_data(hours))))
+                       for _ in range(args.repeat)]
+            record("get_historical_data", history, history=cycles, rows=rows[-1])
+        if sink is not None:
+            sink.close()
+    finally:
+        if analyzer is not None:
+            analyzer.disconnect_aws_iot()
+            analyzer.db_writer.close()
+        if stub is not None:
+            stub.stop()
+        os.chdir(cwd)
+        if args.keep:
+            logger.info(f"Ölçüm dizini: {workdir}")
+        else:
+            shutil.rmtree(workdir, ignore_errors=True)
+    return results
+
+
+def compare(results: List[Dict], baseline: Dict, threshold: float, min_delta_ms: float) -> List[Dict]:
+    """Temel çizgiye göre medyanı `threshold` oranından ve `min_delta_ms`'den fazla artan ölçümler"""
+    previous = {(r["size"], r["stage"], r["history"]): r for r in baseline.get("results", [])}
+    regressions = []
+    for result in results:
+        old = previous.get((result["size"], result["stage"], result["history"]))
+        if old is None or not old["median_ms"]:
+            continue
+        ratio = result["median_ms"] / old["median_ms"]
+        line = (f"{result['size']:>6} {result['stage']:<28} {'' if result['history'] is None else result['history']:>6} "
+                f"{old['median_ms']:>10.2f} → {result['median_ms']:>10.2f} ms ({ratio:.2f}×)")
+        if ratio > 1 + threshold and result["median_ms"] - old["median_ms"] > min_delta_ms:
+            regressions.append(dict(result, baseline_ms=old["median_ms"], ratio=round(ratio, 3)))
+            print(f"❌ {line}")
+        else:
+            print(f"   {line}")
+    return regressions
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Analiz hattı ölçümleri (yerel Maps/MQTT taklitleri, geçici DB)")
+    parser.add_argument("--sizes", default=",".join(map(str, DEFAULT_SIZES)), help="Kavşak sayıları (virgülle)")
+    parser.add_argument("--history-cycles", default=",".join(map(str, DEFAULT_HISTORY_CYCLES)),
+                        help="get_historical_data için geçmiş döngü sayıları (virgülle)")
+    parser.add_argument("--max-history-rows", type=int, default=5_000_000)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--step", type=int, default=20, help="Geçmiş döngü aralığı (sn)")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--ack-latency", type=float, default=0.02, help="MQTT onay gecikmesi (sn)")
+    parser.add_argument("--maps-latency", type=float, default=0.0, help="Maps taklidi yanıt gecikmesi (sn)")
+    parser.add_argument("--no-maps", action="store_true", help="Maps olmadan (yalnızca simülasyon)")
+    parser.add_argument("--out", default="bench_results.json", help="Sonuç dosyası (JSON)")
+    parser.add_argument("--baseline", help="Karşılaştırılacak önceki sonuç dosyası")
+    parser.add_argument("--threshold", type=float, default=0.25, help="Gerileme sayılan medyan artış oranı")
+    parser.add_argument("--min-delta-ms", type=float, default=1.0, help="Bundan küçük artışlar gürültü sayılır")
+    parser.add_argument("--keep", action="store_true", help="Geçici dizinleri silme")
+    parser.add_argument("--verbose", action="store_true", help="Analizör loglarını göster")
+    args = parser.parse_args(argv)
+    args.history_cycles = [int(c) for c in args.history_cycles.split(",") if c]
+
+    import trafik_analizi_aws  # noqa: F401  (logging yapılandırmasını ölçümden önce yap)
+    logging.getLogger().setLevel(logging.INFO if args.verbose else logging.WARNING)
+    logger.setLevel(logging.INFO)
+
+    results = []
+    for n in (int(size) for size in args.sizes.split(",") if size):
+        results.extend(bench_size(n, args))
+
+    document = {
+        "version": BASELINE_VERSION,
+        "generated": datetime.now().isoformat(timespec="seconds"),
+        "environment": {
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+        },
+        "config": {key: value for key, value in vars(args).items()
+                   if key not in ("out", "baseline", "keep", "verbose")},
+        "results": results,
+    }
+    with open(args.out, "w", encoding="utf-8") as f:
+        json.dump(document, f, indent=2, ensure_ascii=False)
+    logger.info(f"📄 Sonuçlar yazıldı: {args.out}")
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            regressions = compare(results, json.load(f), args.threshold, args.min_delta_ms)
+        if regressions:
+            logger.error(f"❌ {len(regressions)} ölçümde gerileme")
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    sys.exit(main())
@@ -0,0 +1,202 @@
+# db_schema.py
+"""traffic_data.db şeması ve eski (v1) şemadan yerinde geçiş"""
+
+import logging
+import sqlite3
+from typing import List, Sequence, Tuple
+
+# batch_engine (numpy) yalnızca sync_intersections içinde yüklenir: CLI sorguları şemayı hafif içe aktarır
+
+logger = logging.getLogger(__name__)
+
+# PRAGMA user_version ile tutulur
+SCHEMA_VERSION = 3
+
+# Özet (rollup) tabloları: ad -> kova genişliği (saniye)
+ROLLUP_RESOLUTIONS = {"1m": 60, "1h": 3600, "1d": 86400}
+ROLLUP_METRICS = ("density", "speed", "wait")
+
+# Durum kodları batch_engine.STATUS_NAMES ile aynı sıradadır
+STATUS_CASE_SQL = "CASE {col} WHEN 0 THEN 'normal' WHEN 1 THEN 'moderate' ELSE 'critical' END"
+
+ROLLUP_TABLE_SQL = '''
+    CREATE TABLE IF NOT EXISTS traffic_rollup_{name} (
+        intersection_id INTEGER NOT NULL,
+        bucket INTEGER NOT NULL,
+        n INTEGER NOT NULL,
+        {metric_columns},
+        normal_count INTEGER NOT NULL,
+        moderate_count INTEGER NOT NULL,
+        critical_count INTEGER NOT NULL,
+        hist BLOB,
+        PRIMARY KEY (intersection_id, bucket)
+    ) WITHOUT ROWID;
+
+    CREATE INDEX IF NOT EXISTS idx_traffic_rollup_{name}_bucket ON traffic_rollup_{name} (bucket);
+'''
+
+ROLLUP_METRIC_COLUMNS = [
+    f"{metric}_{agg}" for metric in ROLLUP_METRICS for agg in ("mean", "min", "max", "p95")
+]
+
+ROLLUP_SCHEMA_SQL = "".join(
+    ROLLUP_TABLE_SQL.format(
+        name=name,
+        metric_columns=",\n        ".join(f"{col} REAL" for col in ROLLUP_METRIC_COLUMNS)
+    )
+    for name in ROLLUP_RESOLUTIONS
+)
+
+SCHEMA_SQL = f'''
+    CREATE TABLE IF NOT EXISTS intersections (
+        id INTEGER PRIMARY KEY,
+        name TEXT NOT NULL,
+        lat REAL NOT NULL,
+        lng REAL NOT NULL,
+        type TEXT NOT NULL DEFAULT 'minor'
+    );
+
+    -- ts: UTC epoch saniye, status: 0 normal / 1 moderate / 2 critical
+    CREATE TABLE IF NOT EXISTS traffic_logs (
+        intersection_id INTEGER NOT NULL,
+        ts INTEGER NOT NULL,
+        density REAL NOT NULL,
+        avg_speed INTEGER NOT NULL,
+        wait_time INTEGER NOT NULL,
+        vehicle_count INTEGER NOT NULL,
+        status INTEGER NOT NULL,
+        PRIMARY KEY (intersection_id, ts)
+    ) WITHOUT ROWID;
+
+    CREATE INDEX IF NOT EXISTS idx_traffic_logs_ts ON traffic_logs (ts);
+
+    -- Eski satır biçimini (isim, koordinat, metin durum) sunan görünüm
+    CREATE VIEW IF NOT EXISTS traffic_history AS
+        SELECT l.intersection_id, i.name, i.lat, i.lng,
+               l.density, l.avg_speed, l.wait_time, l.vehicle_count,
+               {STATUS_CASE_SQL.format(col="l.status")} AS status,
+               l.ts, datetime(l.ts, 'unixepoch') AS timestamp
+        FROM traffic_logs l
+        JOIN intersections i ON i.id = l.intersection_id;
+
+    -- AWS IoT mesaj logları için tablo
+    CREATE TABLE IF NOT EXISTS aws_iot_messages (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        topic TEXT,
+        message TEXT,
+        timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
+        status TEXT
+    );
+
+    {ROLLUP_SCHEMA_SQL}
+'''
+
+# Birincil anahtar (kavşak, ts) saniye çözünürlüğündedir: aynı saniyedeki ikinci okuma
+# (ör. zamanlanmış döngünün hemen ardından komutla tetiklenen çalışma) satırı günceller, en yeni kazanır.
+# Özetler o saniyeyi bir kez sayar (ilk örneğin değerleriyle); çakışmalar TrafficRollups.stats'ta sayılır
+INSERT_TRAFFIC_LOG_SQL = '''
+    INSERT INTO traffic_logs
+    (intersection_id, ts, density, avg_speed, wait_time, vehicle_count, status)
+    VALUES (?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT(intersection_id, ts) DO UPDATE SET
+        density = excluded.density, avg_speed = excluded.avg_speed, wait_time = excluded.wait_time,
+        vehicle_count = excluded.vehicle_count, status = excluded.status
+'''
+
+# Geri doldurma mevcut (gerçek) satırların üzerine yazmaz
+BACKFILL_TRAFFIC_LOG_SQL = '''
+    INSERT OR IGNORE INTO traffic_logs
+    (intersection_id, ts, density, avg_speed, wait_time, vehicle_count, status)
+    VALUES (?, ?, ?, ?, ?, ?, ?)
+'''
+
+# traffic_history görünümünün sütunları; arşivden okunurken aynı adlarla türetilir
+HISTORY_COLUMNS = ("intersection_id", "name", "lat", "lng", "density", "avg_speed", "wait_time",
+                   "vehicle_count", "status", "ts", "timestamp")
+
+# v1: name/lat/lng her satırda, metin timestamp (yerel saat) ve uuid aws_message_id
+MIGRATE_V1_SQL = f'''
+    ALTER TABLE traffic_logs RENAME TO traffic_logs_v1;
+
+    {SCHEMA_SQL}
+
+    INSERT OR IGNORE INTO intersections (id, name, lat, lng)
+        SELECT intersection_id, name, lat, lng
+        FROM traffic_logs_v1
+        WHERE intersection_id IS NOT NULL
+        GROUP BY intersection_id;
+
+    -- Eski zaman damgaları yerel saattir; 'utc' niteleyicisi makinenin saat dilimiyle çevirir
+    INSERT OR REPLACE INTO traffic_logs
+        SELECT intersection_id,
+               CAST(strftime('%s', timestamp, 'utc') AS INTEGER),
+               density, avg_speed, wait_time, vehicle_count,
+               CASE status WHEN 'critical' THEN 2 WHEN 'moderate' THEN 1 ELSE 0 END
+        FROM traffic_logs_v1
+        WHERE intersection_id IS NOT NULL AND timestamp IS NOT NULL;
+
+    DROP TABLE traffic_logs_v1;
+'''
+
+
+def _columns(conn: sqlite3.Connection, table: str) -> set:
+    return {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}
+
+
+def rollup_insert_sql(name: str) -> str:
+    """Bir özet tablosu için upsert ifadesi"""
+    columns = ["intersection_id", "bucket", "n", *ROLLUP_METRIC_COLUMNS,
+               "normal_count", "moderate_count", "critical_count", "hist"]
+    return (f"INSERT OR REPLACE INTO traffic_rollup_{name} ({', '.join(columns)}) "
+            f"VALUES ({', '.join('?' * len(columns))})")
+
+
+def history_query(columns: Sequence[str], since: int, intersection_id: int = None) -> Tuple[str, List]:
+    """`traffic_history`'den `since` ve sonrası için sorgu ve parametreler (yeniden eskiye)"""
+    unknown = [name for name in columns if name not in HISTORY_COLUMNS]
+    if unknown:
+        raise ValueError(f"Bilinmeyen geçmiş sütunu: {', '.join(unknown)}")
+    query = f'SELECT {", ".join(columns)} FROM traffic_history WHERE ts >= ?'
+    params = [int(since)]
+    if intersection_id is not None:
+        query += ' AND intersection_id = ?'
+        params.append(int(intersection_id))
+    return query + ' ORDER BY ts DESC', params
+
+
+def migrate(conn: sqlite3.Connection) -> int:
+    """Şemayı oluştur veya güncel sürüme taşı; eski sürüm numarasını döndür"""
+    version = conn.execute("PRAGMA user_version").fetchone()[0]
+    if version >= SCHEMA_VERSION:
+        return version
+
+    legacy = "name" in _columns(conn, "traffic_logs")
+    # executescript kendi COMMIT'ini yapar; geçiş tek bir işlemde çalışır
+    script = MIGRATE_V1_SQL if legacy else SCHEMA_SQL
+    conn.executescript(f"BEGIN;\n{script}\nPRAGMA user_version = {SCHEMA_VERSION};\nCOMMIT;")
+
+    if legacy:
+        migrated = conn.execute("SELECT COUNT(*) FROM traffic_logs").fetchone()[0]
+        # Eski satırların boşalttığı sayfaları geri kazan
+        conn.execute("VACUUM")
+        logger.info(f"🗄️ traffic_logs yeni şemaya taşındı ({migrated} satır)")
+
+    return version
+
+
+def sync_intersections(conn: sqlite3.Connection, table: "IntersectionTable"):
+    """Kavşak boyut tablosunu tanım dosyasıyla eşitle"""
+    from batch_engine import INTERSECTION_TYPES
+
+    rows = [
+        (int(table.ids[i]), table.names[i], float(table.lat[i]), float(table.lng[i]),
+         INTERSECTION_TYPES[table.type_code[i]])
+        for i in range(len(table))
+    ]
+    conn.execute("BEGIN")
+    conn.executemany('''
+        INSERT INTO intersections (id, name, lat, lng, type) VALUES (?, ?, ?, ?, ?)
+        ON CONFLICT(id) DO UPDATE SET
+            name = excluded.name, lat = excluded.lat, lng = excluded.lng, type = excluded.type
+    ''', rows)
+    conn.execute("COMMIT")
@@ -0,0 +1,242 @@
+# db_writer.py
+"""Tek, uzun ömürlü SQLite bağlantısı üzerinden arka planda toplu yazma"""
+
+import json
+import logging
+import queue
+import sqlite3
+import threading
+import time
+from typing import Callable, Iterable, Sequence
+
+logger = logging.getLogger(__name__)
+
+# Okuyucular (server.js) yazma sırasında kilitlenmesin diye WAL kullanılır
+CONNECTION_PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA cache_size=-32000",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA busy_timeout=5000",
+)
+
+_STOP = object()
+
+
+def connect(db_path: str, check_same_thread: bool = True) -> sqlite3.Connection:
+    """Ayarlı (WAL) bir SQLite bağlantısı aç"""
+    conn = sqlite3.connect(db_path, check_same_thread=check_same_thread, isolation_level=None)
+    for pragma in CONNECTION_PRAGMAS:
+        conn.execute(pragma)
+    return conn
+
+
+class TrafficDBWriter:
+    """Satırları sınırlı bir kuyruktan alıp `executemany` ile gruplu commit eden yazıcı"""
+
+    def __init__(self, db_path: str, batch_rows: int = 5000, flush_interval: float = 1.0,
+                 max_pending: int = 10000, put_timeout: float = 0.05, block_timeout: float = 60.0,
+                 on_commit: Callable[[float, int], None] = None,
+                 dead_letter_path: str = None):
+        self.db_path = db_path
+        self.batch_rows = batch_rows
+        self.flush_interval = flush_interval
+        self.put_timeout = put_timeout
+        # Kuyruk doluysa çağıran en fazla bu kadar bekletilir (geri basınç); sonra satırlar ölü mektuba
+        self.block_timeout = block_timeout
+        # Başarılı commit'in süresi (sn) ve satır sayısı; metrikler için
+        self.on_commit = on_commit
+        # Yazılamayan satırlar (JSON Lines); None ise yalnızca loglanır ve sayılır
+        self.dead_letter_path = dead_letter_path
+
+        self._queue = queue.Queue(maxsize=max_pending)
+        self.stats = {"rows_written": 0, "commits": 0, "blocked": 0, "errors": 0, "dead_lettered": 0}
+        self._stats_lock = threading.Lock()
+        # Ölü mektuba hem yazıcı thread'i hem (kuyruk dolu kaldığında) çağıranlar yazar
+        self._dead_letter_lock = threading.Lock()
+        self._thread = threading.Thread(target=self._run, name="db-writer", daemon=True)
+        self._thread.start()
+
+    def _count(self, key: str, n: int = 1):
+        with self._stats_lock:
+            self.stats[key] += n
+
+    def write(self, sql: str, params: Sequence):
+        """Tek satırı kuyruğa al"""
+        self.write_many(sql, [params])
+
+    def write_many(self, sql: str, rows: Iterable[Sequence]) -> bool:
+        """Satırları kuyruğa al.
+
+        Kuyruk doluysa çağıran `block_timeout` saniyeye kadar bekletilir (geri basınç);
+        yazıcı o sürede de yer açmazsa veya durmuşsa satırlar atılmaz, ölü mektuba yazılır.
+        """
+        rows = list(rows)
+        if not rows:
+            return True
+        if self._thread.is_alive():
+            try:
+                self._queue.put((sql, rows), timeout=self.put_timeout)
+                return True
+            except queue.Full:
+                self._count("blocked")
+                logger.warning(f"Veritabanı yazma kuyruğu dolu, {len(rows)} satır için bekleniyor")
+            try:
+                self._queue.put((sql, rows), timeout=self.block_timeout)
+                return True
+            except queue.Full:
+                error = f"yazma kuyruğu {self.block_timeout:g} sn boyunca dolu kaldı"
+        else:
+            error = "veritabanı yazıcısı çalışmıyor"
+        self._dead_letter([(sql, row, error) for row in rows])
+        return False
+
+    def flush(self, timeout: float = 10.0) -> bool:
+        """Kuyruktaki her şeyin diske yazılmasını bekle (kuyruk doluysa da en fazla `timeout`)"""
+        if not self._thread.is_alive():
+            return False
+        deadline = time.monotonic() + timeout
+        done = threading.Event()
+        try:
+            self._queue.put(done, timeout=timeout)
+        except queue.Full:
+            logger.warning("Veritabanı yazma kuyruğu dolu, flush beklenemedi")
+            return False
+        return done.wait(max(0.0, deadline - time.monotonic()))
+
+    def close(self, timeout: float = 10.0):
+        """Kalan satırları yaz ve bağlantıyı kapat"""
+        if not self._thread.is_alive():
+            return
+        deadline = time.monotonic() + timeout
+        try:
+            self._queue.put(_STOP, timeout=timeout)
+        except queue.Full:
+            logger.error(f"Veritabanı yazıcısı {timeout:g} sn içinde kapatılamadı "
+                         f"(~{self._queue.qsize()} iş kuyrukta)")
+            return
+        self._thread.join(max(0.0, deadline - time.monotonic()))
+
+    def _commit(self, conn: sqlite3.Connection, pending: list):
+        started = time.perf_counter()
+        try:
+            conn.execute("BEGIN")
+            # Aynı SQL'e sahip ardışık işler tek `executemany` ile yazılır
+            sql, rows = None, []
+            for item_sql, item_rows in pending:
+                if item_sql != sql and rows:
+                    conn.executemany(sql, rows)
+                    rows = []
+                sql = item_sql
+                rows.extend(item_rows)
+            if rows:
+                conn.executemany(sql, rows)
+            conn.execute("COMMIT")
+            written = sum(len(r) for _, r in pending)
+        except Exception as e:
+            logger.warning(f"Veritabanı toplu yazma hatası, satır satır yeniden deneniyor: {e}")
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            written = self._commit_each(conn, pending)
+            if written is None:
+                return
+
+        with self._stats_lock:
+            self.stats["rows_written"] += written
+            self.stats["commits"] += 1
+        if self.on_commit:
+            try:
+                self.on_commit(time.perf_counter() - started, written)
+            except Exception as e:
+                logger.error(f"Commit kancası hatası: {e}")
+
+    def _commit_each(self, conn: sqlite3.Connection, pending: list):
+        """Grup başarısız olunca: her iş, hata verirse her satır kendi savepoint'iyle.
+
+        Hatalı satırlar ölü mektup olarak ayrılır, diğerleri tek commit'te yazılır.
+        Commit'in kendisi başarısız olursa (disk, kilit) tüm grup ayrılır; None döner.
+        """
+        written, failed = 0, []
+        try:
+            conn.execute("BEGIN")
+            for sql, rows in pending:
+                conn.execute("SAVEPOINT item")
+                try:
+                    conn.executemany(sql, rows)
+                    conn.execute("RELEASE item")
+                    written += len(rows)
+                    continue
+                except sqlite3.Error:
+                    conn.execute("ROLLBACK TO item")
+                    conn.execute("RELEASE item")
+                for row in rows:
+                    conn.execute("SAVEPOINT row")
+                    try:
+                        conn.execute(sql, row)
+                        conn.execute("RELEASE row")
+                        written += 1
+                    except sqlite3.Error as e:
+                        conn.execute("ROLLBACK TO row")
+                        conn.execute("RELEASE row")
+                        failed.append((sql, row, str(e)))
+            conn.execute("COMMIT")
+        except Exception as e:
+            self._count("errors")
+            logger.error(f"Veritabanı yazma hatası: {e}")
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            self._dead_letter([(sql, row, str(e)) for sql, rows in pending for row in rows])
+            return None
+
+        if failed:
+            self._count("errors")
+            self._dead_letter(failed)
+        return written
+
+    def _dead_letter(self, failed: list):
+        """Yazılamayan satırları say, logla ve varsa ölü mektup dosyasına ekle"""
+        self._count("dead_lettered", len(failed))
+        logger.error(f"☠️ {len(failed)} satır yazılamadı: {failed[0][2]}")
+        if not self.dead_letter_path:
+            return
+        try:
+            with self._dead_letter_lock, open(self.dead_letter_path, "a", encoding="utf-8") as f:
+                now = time.time()
+                for sql, row, error in failed:
+                    f.write(json.dumps({"ts": now, "sql": sql, "params": list(row), "error": error},
+                                       ensure_ascii=False, default=str))
+                    f.write("\n")
+        except OSError as e:
+            logger.error(f"Ölü mektup dosyasına yazılamadı: {e}")
+
+    def _run(self):
+        conn = connect(self.db_path)
+        pending, pending_rows, first_at = [], 0, None
+
+        while True:
+            timeout = None if first_at is None else max(0.0, first_at + self.flush_interval - time.monotonic())
+            try:
+                item = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                item = None
+
+            if item is not None and item is not _STOP and not isinstance(item, threading.Event):
+                pending.append(item)
+                pending_rows += len(item[1])
+                if first_at is None:
+                    first_at = time.monotonic()
+
+            # Boyut veya süre eşiğine ulaşıldığında ya da flush/kapatma istendiğinde commit
+            if pending and (item is None or item is _STOP or isinstance(item, threading.Event)
+                            or pending_rows >= self.batch_rows
+                            or time.monotonic() - first_at >= self.flush_interval):
+                self._commit(conn, pending)
+                pending, pending_rows, first_at = [], 0, None
+
+            if isinstance(item, threading.Event):
+                item.set()
+            elif item is _STOP:
+                break
+
+        conn.close()
+        logger.info("Veritabanı yazıcısı kapatıldı")
@@ -0,0 +1,257 @@
+# forecaster.py
+"""Haftanın saati mevsimsel profilleri ve Holt eğilimiyle artımlı trafik tahmini"""
+
+import io
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Dict, Sequence
+
+import numpy as np
+
+from batch_engine import (CRITICAL_DENSITY, HOURS_PER_WEEK, MODERATE_DENSITY, STATUS_NAMES,
+                          IntersectionTable, hour_of_week)
+from snapshot_publisher import atomic_write
+
+logger = logging.getLogger(__name__)
+
+# Tahmin ufukları (dakika)
+DEFAULT_HORIZONS = (15, 30, 60)
+
+# Tahmin edilen metrikler: yoğunluk (%), ortalama hız (km/h)
+FORECAST_METRICS = ("density", "avgSpeed")
+METRIC_LIMITS = np.array([[0.0, 100.0], [0.0, 120.0]])
+
+STATE_FORMAT_VERSION = 1
+
+
+class TrafficForecaster:
+    """Kavşak başına 168 saatlik mevsimsel taban + kalıntı üzerinde sönümlü Holt eğilimi.
+
+    Her analiz partisiyle O(kavşak) güncellenir; geçmişin yeniden taranması gerekmez.
+    Bir saat dilimi ilk `1/season_alpha` örnekte ortalama, sonra EWMA olarak güncellenir.
+    """
+
+    def __init__(self, table: IntersectionTable, horizons: Sequence[int] = DEFAULT_HORIZONS,
+                 season_alpha: float = 0.1, level_alpha: float = 0.3, trend_beta: float = 0.1,
+                 damping: float = 0.98, max_gap_minutes: float = 60.0, min_step_minutes: float = 1 / 3):
+        self.table = table
+        self.horizons = tuple(int(h) for h in horizons)
+        self.season_alpha = season_alpha
+        self.level_alpha = level_alpha
+        self.trend_beta = trend_beta
+        # Kalıntı ve eğilim dakika başına bu oranla sıfıra söner
+        self.damping = damping
+        self.max_gap_minutes = max_gap_minutes
+        # Art arda gelen (komutla tetiklenen) analizler eğilimi patlatmasın
+        self.min_step_minutes = min_step_minutes
+        self._lock = threading.Lock()
+
+        n, m = len(table), len(FORECAST_METRICS)
+        self.season = np.zeros((n, HOURS_PER_WEEK, m), dtype=np.float32)
+        self.season_n = np.zeros((n, HOURS_PER_WEEK), dtype=np.uint16)
+        self.level = np.zeros((n, m))
+        self.trend = np.zeros((n, m))
+        self.last_value = np.full((n, m), np.nan)
+        self.last_ts = np.zeros(n)
+
+    # --- Güncelleme ---
+
+    def update(self, rows: np.ndarray, values: np.ndarray, now: datetime):
+        """Bir partinin (n, 2) [yoğunluk, hız] değerleriyle profilleri güncelle"""
+        values = np.asarray(values, dtype=np.float64)
+        ts = now.timestamp()
+        slot = hour_of_week(now)
+
+        with self._lock:
+            seen = self.season_n[rows, slot] > 0
+            baseline = np.where(seen[:, None], self.season[rows, slot], values)
+            residual = values - baseline
+
+            # Düzensiz aralıklar için Holt adımı dakika cinsinden
+            dt = (ts - self.last_ts[rows]) / 60.0
+            fresh = (self.last_ts[rows] > 0) & (dt > 0) & (dt <= self.max_gap_minutes)
+            dt = np.where(fresh, np.maximum(dt, self.min_step_minutes), 1.0)[:, None]
+            decay = self.damping ** dt
+            level, trend = self.level[rows], self.trend[rows]
+            predicted = np.where(fresh[:, None], (level + trend * dt) * decay, 0.0)
+            new_level = self.level_alpha * residual + (1 - self.level_alpha) * predicted
+            new_trend = np.where(
+                fresh[:, None],
+                self.trend_beta * (new_level - level) / dt + (1 - self.trend_beta) * trend * decay,
+                0.0
+            )
+            self.level[rows] = new_level
+            self.trend[rows] = new_trend
+
+            count = self.season_n[rows, slot].astype(np.float64)
+            alpha = np.maximum(1.0 / (count + 1), self.season_alpha)[:, None]
+            self.season[rows, slot] = baseline + alpha * (values - baseline)
+            self.season_n[rows, slot] = np.minimum(count + 1, np.iinfo(np.uint16).max)
+            self.last_value[rows] = values
+            self.last_ts[rows] = ts
+
+    # --- Tahmin ---
+
+    def forecast(self, now: datetime) -> Dict[int, np.ndarray]:
+        """Ufuk (dakika) -> (n, 2) tahmin dizisi; hiç gözlenmemiş kavşaklar NaN"""
+        current_slot = hour_of_week(now)
+        result = {}
+
+        with self._lock:
+            age = np.where(self.last_ts > 0, (now.timestamp() - self.last_ts) / 60.0, np.inf)
+            for horizon in self.horizons:
+                slot = hour_of_week(now + timedelta(minutes=horizon))
+                # Hedef dilim henüz görülmediyse şimdiki dilim, o da yoksa son gözlem kullanılır
+                base = np.where((self.season_n[:, current_slot] > 0)[:, None],
+                                self.season[:, current_slot], self.last_value)
+                base = np.where((self.season_n[:, slot] > 0)[:, None], self.season[:, slot], base)
+
+                steps = (age + horizon)[:, None]
+                decay = np.where(np.isfinite(steps), self.damping ** np.minimum(steps, 1e6), 0.0)
+                adjustment = (self.level + self.trend * np.minimum(steps, self.max_gap_minutes)) * decay
+                result[horizon] = np.clip(base + adjustment, METRIC_LIMITS[:, 0], METRIC_LIMITS[:, 1])
+        return result
+
+    def predictions_document(self, now: datetime = None) -> Dict:
+        """server.js /api/traffic/predictions için JSON belgesi"""
+        now = now or datetime.now()
+        forecasts = self.forecast(now)
+        with self._lock:
+            samples = self.season_n.sum(axis=1)
+
+        # Sütunlar tek geçişte hesaplanır; satır döngüsü yalnızca hazır listelerden belge kurar
+        rows = np.flatnonzero(~np.isnan(forecasts[self.horizons[0]][:, 0]))
+        status_names = np.array(STATUS_NAMES)
+        columns = []
+        for h in self.horizons:
+            density = forecasts[h][rows, 0]
+            status = (density > MODERATE_DENSITY * 100).astype(np.int8) + (density > CRITICAL_DENSITY * 100)
+            columns.append((
+                h, (now + timedelta(minutes=h)).isoformat(timespec='seconds'),
+                np.round(density, 1).tolist(),
+                np.rint(forecasts[h][rows, 1]).astype(np.int64).tolist(),
+                status_names[status].tolist()
+            ))
+
+        names = self.table.names
+        intersections = [
+            {
+                'id': iid,
+                'name': names[row],
+                'samples': count,
+                'forecasts': [
+                    {'horizon': h, 'time': time_str, 'density': density[i],
+                     'avgSpeed': speed[i], 'status': status[i]}
+                    for h, time_str, density, speed, status in columns
+                ]
+            }
+            for i, (row, iid, count) in enumerate(zip(rows.tolist(), self.table.ids[rows].tolist(),
+                                                      samples[rows].tolist()))
+        ]
+
+        return {
+            'timestamp': now.isoformat(),
+            'horizons': list(self.horizons),
+            'model': 'seasonal_holt',
+            'intersections': intersections
+        }
+
+    def write_predictions(self, path: str, now: datetime = None) -> int:
+        """Tahmin belgesini atomik olarak yaz; tahmin edilen kavşak sayısını döndür"""
+        document = self.predictions_document(now)
+        atomic_write(path, json.dumps(document, ensure_ascii=False, separators=(',', ':')).encode('utf-8'))
+        return len(document['intersections'])
+
+    # --- Kalıcılık ---
+
+    def save(self, path: str):
+        """Model durumunu sıkıştırılmış .npz olarak atomik kaydet"""
+        buffer = io.BytesIO()
+        with self._lock:
+            np.savez_compressed(
+                buffer, format_version=STATE_FORMAT_VERSION, ids=self.table.ids,
+                season=self.season, season_n=self.season_n, level=self.level,
+                trend=self.trend, last_value=self.last_value, last_ts=self.last_ts
+            )
+        atomic_write(path, buffer.getvalue())
+
+    def load(self, path: str) -> bool:
+        """Kaydedilmiş durumu id eşleştirerek yükle (yeni/çıkarılmış kavşaklar desteklenir)"""
+        if not os.path.exists(path):
+            return False
+        try:
+            with np.load(path) as state:
+                if int(state['format_version']) != STATE_FORMAT_VERSION:
+                    logger.warning(f"Tahmin durumu sürümü uyumsuz, yok sayıldı: {path}")
+                    return False
+                rows = self.table.rows_of(state['ids'])
+                known = rows >= 0
+                target = rows[known]
+                with self._lock:
+                    for name in ('season', 'season_n', 'level', 'trend', 'last_value', 'last_ts'):
+                        getattr(self, name)[target] = state[name][known]
+        except (OSError, ValueError, KeyError) as e:
+            logger.warning(f"Tahmin durumu okunamadı ({path}): {e}")
+            return False
+
+        logger.info(f"🔮 Tahmin modeli yüklendi: {int(known.sum())} kavşak")
+        return True
+
+    def bootstrap_from_rollups(self, conn: sqlite3.Connection, days: int = 28,
+                               chunk_rows: int = 100_000, now: float = None) -> int:
+        """Durum dosyası yokken mevsimsel profilleri son günlerin 1 saatlik özetlerinden doldur.
+
+        Özetler `chunk_rows` satırlık parçalarla okunur; bellek kullanımı parça
+        boyutu ve (kavşak × 168) birikim dizileriyle sınırlıdır.
+        """
+        now = time.time() if now is None else now
+        since, until = int(now) - days * 86400, int(now)
+        cursor = conn.execute('''
+            SELECT intersection_id, bucket, density_mean, speed_mean
+            FROM traffic_rollup_1h WHERE bucket >= ? AND bucket <= ? ORDER BY bucket
+        ''', (since, until))
+
+        n, m = len(self.table), len(FORECAST_METRICS)
+        counts = np.zeros(n * HOURS_PER_WEEK, dtype=np.int64)
+        sums = np.zeros((n * HOURS_PER_WEEK, m))
+        total = 0
+        while True:
+            chunk = cursor.fetchmany(chunk_rows)
+            if not chunk:
+                break
+            data = np.array(chunk, dtype=np.float64)
+            rows = self.table.rows_of(data[:, 0].astype(np.int64))
+            known = rows >= 0
+            data, rows = data[known], rows[known]
+            if not len(rows):
+                continue
+
+            # Kovalar UTC epoch; dilimler yerel saatle (yaz saati dahil) yalnızca tekil kovalar için hesaplanır
+            buckets, inverse = np.unique(data[:, 1].astype(np.int64), return_inverse=True)
+            slot_of = np.array([hour_of_week(datetime.fromtimestamp(b)) for b in buckets.tolist()], dtype=np.int64)
+            cell = rows * HOURS_PER_WEEK + slot_of[inverse.ravel()]
+            counts += np.bincount(cell, minlength=len(counts))
+            for j in range(m):
+                sums[:, j] += np.bincount(cell, weights=data[:, 2 + j], minlength=len(counts))
+
+            # Kayıtlar kovaya göre sıralı; tekrarlanan indekste son atama (en yeni gözlem) kalır
+            with self._lock:
+                self.last_value[rows] = data[:, 2:4]
+            total += len(rows)
+
+        if not total:
+            return 0
+        with self._lock:
+            season_n = self.season_n.astype(np.int64) + counts.reshape(n, HOURS_PER_WEEK)
+            self.season_n = np.minimum(season_n, np.iinfo(np.uint16).max).astype(np.uint16)
+            seen = (season_n > 0)[..., None]
+            means = sums.reshape(n, HOURS_PER_WEEK, m) / np.maximum(season_n, 1)[..., None]
+            self.season = np.where(seen, means, 0).astype(np.float32)
+
+        logger.info(f"🔮 Tahmin profilleri {total} saatlik özetten oluşturuldu")
+        return total
@@ -0,0 +1,489 @@
+# local_stubs.py
+"""Harici servisler için yerel taklitler (Google Maps Distance Matrix, MQTT broker, süreç içi MQTT bağlantısı)"""
+
+import heapq
+import json
+import logging
+import math
+import random
+import socket
+import socketserver
+import struct
+import threading
+import time
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Tuple
+from urllib.parse import parse_qs, urlparse
+
+logger = logging.getLogger(__name__)
+
+
+def haversine_m(lat1: float, lng1: float, lat2: float, lng2: float) -> float:
+    """İki nokta arasındaki büyük daire mesafesi (metre)"""
+    p1, p2 = math.radians(lat1), math.radians(lat2)
+    dp, dl = p2 - p1, math.radians(lng2 - lng1)
+    a = math.sin(dp / 2) ** 2 + math.cos(p1) * math.cos(p2) * math.sin(dl / 2) ** 2
+    return 2 * 6371000 * math.asin(math.sqrt(a))
+
+
+class DistanceMatrixStub:
+    """Gecikme ve hata enjekte edebilen yerel Distance Matrix HTTP sunucusu"""
+
+    def __init__(self, latency: float = 0.0, error_rate: float = 0.0,
+                 error_status: int = 500, speed_kmh: float = 30.0, seed: int = None):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.speed_kmh = speed_kmh
+        self.random = random.Random(seed)
+        self.request_count = 0
+        self.origin_count = 0
+        self._lock = threading.Lock()
+        self._server = None
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/maps/api/distancematrix/json"
+
+    def _build_response(self, query: dict) -> dict:
+        origins = query.get('origins', [''])[0].split('|')
+        destinations = query.get('destinations', [''])[0].split('|')
+        rows = []
+        for origin in origins:
+            o_lat, o_lng = map(float, origin.split(','))
+            elements = []
+            for destination in destinations:
+                d_lat, d_lng = map(float, destination.split(','))
+                distance = max(1.0, haversine_m(o_lat, o_lng, d_lat, d_lng))
+                duration = distance / (self.speed_kmh / 3.6)
+                elements.append({
+                    "status": "OK",
+                    "distance": {"value": int(distance)},
+                    "duration": {"value": int(duration)},
+                    "duration_in_traffic": {"value": int(duration * self.random.uniform(1.0, 1.8))}
+                })
+            rows.append({"elements": elements})
+        return {"status": "OK", "origin_addresses": origins,
+                "destination_addresses": destinations, "rows": rows}
+
+    def _make_handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+                query = parse_qs(urlparse(self.path).query)
+                with stub._lock:
+                    stub.request_count += 1
+                    stub.origin_count += len(query.get('origins', [''])[0].split('|'))
+                    fail = stub.random.random() < stub.error_rate
+
+                if stub.latency:
+                    time.sleep(stub.latency)
+
+                if fail:
+                    body = b'{"status": "UNKNOWN_ERROR"}'
+                    self.send_response(stub.error_status)
+                else:
+                    body = json.dumps(stub._build_response(query)).encode('utf-8')
+                    self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def start(self, host: str = "127.0.0.1", port: int = 0) -> "DistanceMatrixStub":
+        self._server = ThreadingHTTPServer((host, port), self._make_handler())
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        logger.info(f"Distance Matrix taklidi başlatıldı: {self.url}")
+        return self
+
+    def stop(self):
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+def topic_matches(topic_filter: str, topic: str) -> bool:
+    """MQTT abonelik filtresi (+ ve # joker karakterleri) eşleşmesi"""
+    filter_parts, topic_parts = topic_filter.split('/'), topic.split('/')
+    for i, part in enumerate(filter_parts):
+        if part == '#':
+            return True
+        if i >= len(topic_parts) or (part != '+' and part != topic_parts[i]):
+            return False
+    return len(filter_parts) == len(topic_parts)
+
+
+def _encode_length(length: int) -> bytes:
+    encoded = bytearray()
+    while True:
+        byte, length = length % 128, length // 128
+        encoded.append(byte | (0x80 if length else 0))
+        if not length:
+            return bytes(encoded)
+
+
+def _encode_string(value: str) -> bytes:
+    data = value.encode('utf-8')
+    return struct.pack('!H', len(data)) + data
+
+
+class _MQTTSession:
+    """Broker tarafında tek bir istemci bağlantısı"""
+
+    def __init__(self, broker: "LocalMQTTBroker", sock: socket.socket):
+        self.broker = broker
+        self.sock = sock
+        self.client_id = None
+        self.subscriptions: Dict[str, int] = {}
+        self._send_lock = threading.Lock()
+        self._packet_id = 0
+
+    def send(self, packet_type: int, body: bytes, flags: int = 0):
+        with self._send_lock:
+            try:
+                self.sock.sendall(bytes([packet_type << 4 | flags]) + _encode_length(len(body)) + body)
+            except OSError:
+                pass
+
+    def deliver(self, topic: str, payload: bytes, qos: int, retain: bool = False):
+        body = _encode_string(topic)
+        if qos:
+            with self._send_lock:
+                self._packet_id = self._packet_id % 0xFFFF + 1
+                packet_id = self._packet_id
+            body += struct.pack('!H', packet_id)
+        self.send(3, body + payload, flags=(qos << 1) | int(retain))
+
+    def _read_exact(self, n: int) -> bytes:
+        data = b''
+        while len(data) < n:
+            chunk = self.sock.recv(n - len(data))
+            if not chunk:
+                raise ConnectionError("istemci bağlantıyı kapattı")
+            data += chunk
+        return data
+
+    def read_packet(self) -> Tuple[int, int, bytes]:
+        header = self._read_exact(1)[0]
+        length, multiplier = 0, 1
+        while True:
+            byte = self._read_exact(1)[0]
+            length += (byte & 0x7F) * multiplier
+            multiplier *= 128
+            if not byte & 0x80:
+                break
+        return header >> 4, header & 0x0F, self._read_exact(length)
+
+    def serve(self):
+        try:
+            while not self.broker.closing:
+                packet_type, flags, body = self.read_packet()
+                if not self.handle(packet_type, flags, body):
+                    break
+        except (ConnectionError, OSError):
+            pass
+        finally:
+            self.broker._remove(self)
+            try:
+                self.sock.close()
+            except OSError:
+                pass
+
+    def handle(self, packet_type: int, flags: int, body: bytes) -> bool:
+        if packet_type == 1:  # CONNECT
+            name_len = struct.unpack_from('!H', body)[0]
+            offset = 2 + name_len + 4  # protokol adı, seviye, bayraklar, keep-alive
+            id_len = struct.unpack_from('!H', body, offset)[0]
+            self.client_id = body[offset + 2:offset + 2 + id_len].decode('utf-8')
+            self.broker._register(self)
+            self.send(2, b'\x00\x00')
+        elif packet_type == 3:  # PUBLISH
+            qos, retain = (flags >> 1) & 0x03, bool(flags & 0x01)
+            topic_len = struct.unpack_from('!H', body)[0]
+            topic = body[2:2 + topic_len].decode('utf-8')
+            offset = 2 + topic_len
+            packet_id = None
+            if qos:
+                packet_id = body[offset:offset + 2]
+                offset += 2
+            self.broker.route(topic, body[offset:], qos, retain)
+            if qos:
+                self.broker._acknowledge(self, packet_id)
+        elif packet_type == 8:  # SUBSCRIBE
+            packet_id, offset, granted = body[:2], 2, []
+            filters = []
+            while offset < len(body):
+                filter_len = struct.unpack_from('!H', body, offset)[0]
+                topic_filter = body[offset + 2:offset + 2 + filter_len].decode('utf-8')
+                qos = body[offset + 2 + filter_len] & 0x03
+                offset += 3 + filter_len
+                self.subscriptions[topic_filter] = min(qos, 1)
+                granted.append(min(qos, 1))
+                filters.append(topic_filter)
+            self.send(9, packet_id + bytes(granted))
+            self.broker._send_retained(self, filters)
+        elif packet_type == 10:  # UNSUBSCRIBE
+            offset = 2
+            while offset < len(body):
+                filter_len = struct.unpack_from('!H', body, offset)[0]
+                self.subscriptions.pop(body[offset + 2:offset + 2 + filter_len].decode('utf-8'), None)
+                offset += 2 + filter_len
+            self.send(11, body[:2])
+        elif packet_type == 12:  # PINGREQ
+            self.send(13, b'')
+        elif packet_type == 14:  # DISCONNECT
+            return False
+        # PUBACK (4) ve diğerleri: bu taklitte yeniden gönderim yoktur
+        return True
+
+
+class LocalMQTTBroker:
+    """Testler için QoS 0/1, joker abonelik ve retained mesaj destekli yerel MQTT 3.1.1 broker'ı.
+
+    Oturumlar kalıcı değildir ve onaylanmayan mesajlar yeniden gönderilmez.
+    `ack_latency` ile PUBACK gecikmesi, `drop_rate` ile onaysız düşen yayın enjekte edilebilir.
+    """
+
+    def __init__(self, ack_latency: float = 0.0, drop_rate: float = 0.0, seed: int = None):
+        self.ack_latency = ack_latency
+        self.drop_rate = drop_rate
+        self.random = random.Random(seed)
+        self.retained: Dict[str, bytes] = {}
+        self.sessions: List[_MQTTSession] = []
+        self.closing = False
+        self.stats = {"connections": 0, "published": 0, "delivered": 0, "dropped": 0}
+        self._lock = threading.Lock()
+        self._server = None
+        self._thread = None
+
+    @property
+    def port(self) -> int:
+        return self._server.server_address[1]
+
+    @property
+    def host(self) -> str:
+        return self._server.server_address[0]
+
+    def _register(self, session: _MQTTSession):
+        with self._lock:
+            # Aynı client id ile yeni bağlantı eskisini düşürür (MQTT kuralı)
+            for old in [s for s in self.sessions if s.client_id == session.client_id and s is not session]:
+                self.sessions.remove(old)
+                try:
+                    old.sock.shutdown(socket.SHUT_RDWR)
+                except OSError:
+                    pass
+            self.sessions.append(session)
+            self.stats["connections"] += 1
+
+    def _remove(self, session: _MQTTSession):
+        with self._lock:
+            if session in self.sessions:
+                self.sessions.remove(session)
+
+    def _acknowledge(self, session: _MQTTSession, packet_id: bytes):
+        if self.ack_latency:
+            timer = threading.Timer(self.ack_latency, session.send, (4, packet_id))
+            timer.daemon = True
+            timer.start()
+        else:
+            session.send(4, packet_id)
+
+    def _send_retained(self, session: _MQTTSession, filters: List[str]):
+        with self._lock:
+            retained = list(self.retained.items())
+        for topic, payload in retained:
+            qos = max((q for f, q in session.subscriptions.items() if f in filters and topic_matches(f, topic)),
+                      default=None)
+            if qos is not None:
+                session.deliver(topic, payload, qos, retain=True)
+
+    def route(self, topic: str, payload: bytes, qos: int, retain: bool = False):
+        """Yayını eşleşen abonelere ilet"""
+        with self._lock:
+            self.stats["published"] += 1
+            if self.drop_rate and self.random.random() < self.drop_rate:
+                self.stats["dropped"] += 1
+                return
+            if retain:
+                if payload:
+                    self.retained[topic] = payload
+                else:
+                    self.retained.pop(topic, None)
+            targets = []
+            for session in self.sessions:
+                granted = [q for f, q in session.subscriptions.items() if topic_matches(f, topic)]
+                if granted:
+                    targets.append((session, min(qos, max(granted))))
+            self.stats["delivered"] += len(targets)
+        for session, delivery_qos in targets:
+            session.deliver(topic, payload, delivery_qos)
+
+    def disconnect_client(self, client_id: str) -> bool:
+        """Hata enjeksiyonu: istemcinin bağlantısını broker tarafında kopar"""
+        with self._lock:
+            sessions = [s for s in self.sessions if s.client_id == client_id]
+        for session in sessions:
+            try:
+                session.sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+        return bool(sessions)
+
+    def start(self, host: str = "127.0.0.1", port: int = 0) -> "LocalMQTTBroker":
+        broker = self
+
+        class Handler(socketserver.BaseRequestHandler):
+            def handle(self):
+                self.request.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+                _MQTTSession(broker, self.request).serve()
+
+        class Server(socketserver.ThreadingTCPServer):
+            allow_reuse_address = True
+            daemon_threads = True
+
+        self._server = Server((host, port), Handler)
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        logger.info(f"Yerel MQTT broker başlatıldı: {self.host}:{self.port}")
+        return self
+
+    def stop(self):
+        if self._server:
+            self.closing = True
+            with self._lock:
+                sessions = list(self.sessions)
+            for session in sessions:
+                try:
+                    session.sock.shutdown(socket.SHUT_RDWR)
+                except OSError:
+                    pass
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+class FakeMQTTConnection:
+    """awscrt `mqtt.Connection` yerine süreç içi çift: soket ve broker olmadan yayın yolunu ölçmek için.
+
+    QoS1 yayınların future'ı `ack_latency` saniye sonra tek bir zamanlayıcı thread'inden
+    (awscrt olay döngüsü gibi) tamamlanır; `fail_rate` ile onaysız yayın enjekte edilebilir.
+    Eşleşen aboneliklere yayın da aynı thread'den iletilir.
+    """
+
+    def __init__(self, ack_latency: float = 0.0, fail_rate: float = 0.0, seed: int = None,
+                 keep_payloads: bool = False):
+        self.ack_latency = ack_latency
+        self.fail_rate = fail_rate
+        self.random = random.Random(seed)
+        self.keep_payloads = keep_payloads
+        self.published: List[Tuple[str, bytes]] = []
+        self.subscriptions: Dict[str, object] = {}
+        self.stats = {"published": 0, "bytes": 0, "acked": 0, "failed": 0, "delivered": 0}
+        self._pending = []
+        self._seq = 0
+        self._cond = threading.Condition()
+        self._closing = False
+        self._thread = None
+
+    def _done(self, result=None) -> Future:
+        future = Future()
+        future.set_result(result)
+        return future
+
+    def connect(self) -> Future:
+        with self._cond:
+            self._closing = False
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="fake-mqtt", daemon=True)
+                self._thread.start()
+        return self._done({"session_present": False})
+
+    def disconnect(self) -> Future:
+        with self._cond:
+            self._closing = True
+            self._cond.notify()
+        if self._thread is not None:
+            self._thread.join(5)
+        return self._done()
+
+    def subscribe(self, topic: str, qos, callback=None):
+        self.subscriptions[topic] = callback
+        self._seq += 1
+        return self._done({"packet_id": self._seq, "topic": topic, "qos": qos}), self._seq
+
+    def publish(self, topic: str, payload, qos, retain: bool = False):
+        if isinstance(payload, str):
+            payload = payload.encode('utf-8')
+        future = Future()
+        with self._cond:
+            self._seq += 1
+            packet_id = self._seq
+            self.stats["published"] += 1
+            self.stats["bytes"] += len(payload)
+            if self.keep_payloads:
+                self.published.append((topic, payload))
+            failed = bool(self.fail_rate) and self.random.random() < self.fail_rate
+            # QoS 0 onay beklemez; iletim yine zamanlayıcı thread'inden yapılır
+            due = time.monotonic() + (self.ack_latency if int(qos) else 0.0)
+            heapq.heappush(self._pending, (due, packet_id, future, topic, payload, failed))
+            self._cond.notify()
+        return future, packet_id
+
+    def inject(self, topic: str, payload: bytes):
+        """Dışarıdan gelen mesajı aboneliklere ilet (komut ve sensör yolları için)"""
+        for topic_filter, callback in list(self.subscriptions.items()):
+            if callback and topic_matches(topic_filter, topic):
+                callback(topic=topic, payload=payload, dup=False, qos=1, retain=False)
+                self.stats["delivered"] += 1
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._closing and (not self._pending or self._pending[0][0] > time.monotonic()):
+                    self._cond.wait(self._pending[0][0] - time.monotonic() if self._pending else None)
+                if self._closing:
+                    pending, self._pending = self._pending, []
+                else:
+                    now = time.monotonic()
+                    pending = []
+                    while self._pending and self._pending[0][0] <= now:
+                        pending.append(heapq.heappop(self._pending))
+            for _, _, future, topic, payload, failed in pending:
+                if self._closing:
+                    future.set_exception(ConnectionError("Bağlantı kapatıldı"))
+                elif failed:
+                    self.stats["failed"] += 1
+                    future.set_exception(TimeoutError("Simüle onay hatası"))
+                else:
+                    self.stats["acked"] += 1
+                    future.set_result({"packet_id": None})
+                    self.inject(topic, payload)
+            if self._closing:
+                return
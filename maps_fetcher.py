@@ -0,0 +1,197 @@
+# maps_fetcher.py
+"""Google Maps Distance Matrix için toplu, havuzlu ve önbellekli veri çekme"""
+
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from typing import Callable, Dict, List, Optional, Sequence, Set, Tuple
+
+import numpy as np
+import requests
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger(__name__)
+
+DISTANCE_MATRIX_URL = "https://maps.googleapis.com/maps/api/distancematrix/json"
+
+# API limiti: istek başına en fazla 25 başlangıç noktası
+MAX_ORIGINS_PER_REQUEST = 25
+
+
+def format_point(lat: float, lng: float) -> str:
+    """Koordinatı API'nin beklediği 'lat,lng' biçimine çevir"""
+    return f"{lat:.6f},{lng:.6f}"
+
+
+class DistanceMatrixFetcher:
+    """Birden çok başlangıç noktasını tek istekte toplayan, eşzamanlı Distance Matrix istemcisi"""
+
+    def __init__(self, api_key: str, base_url: str = DISTANCE_MATRIX_URL,
+                 max_workers: int = 4, cache_ttl: float = 300.0,
+                 request_timeout: float = 3.0,
+                 max_origins: int = MAX_ORIGINS_PER_REQUEST,
+                 on_request_latency: Callable[[float], None] = None):
+        self.api_key = api_key
+        self.base_url = base_url
+        self.cache_ttl = cache_ttl
+        self.request_timeout = request_timeout
+        self.max_origins = max(1, min(max_origins, MAX_ORIGINS_PER_REQUEST))
+        # Her HTTP isteğinin süresi (sn, hatalı ve zaman aşımına uğrayanlar dahil)
+        self.on_request_latency = on_request_latency
+
+        # Keep-alive bağlantıları işçi sayısı kadar havuzda tutulur
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_workers, max_retries=0)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="maps")
+
+        # (origin, destination) -> (son geçerlilik, süre sn, mesafe m)
+        self._cache: Dict[Tuple[str, str], Tuple[float, float, float]] = {}
+        self._cache_lock = threading.Lock()
+        # Yanıtı beklenen (origin, destination) çiftleri; önceki döngüden kalan istek tekrar gönderilmez
+        self._in_flight: Set[Tuple[str, str]] = set()
+        self.stats = {"requests": 0, "errors": 0, "timeouts": 0, "cache_hits": 0, "fallbacks": 0,
+                      "in_flight_skips": 0}
+        self._stats_lock = threading.Lock()
+
+    def _count(self, key: str, n: int = 1):
+        with self._stats_lock:
+            self.stats[key] += n
+
+    def request(self, origins: Sequence[str], destination: str,
+                timeout: float = None) -> Optional[Dict]:
+        """Tek bir Distance Matrix isteği yap, ham JSON yanıtını döndür"""
+        params = {
+            'origins': '|'.join(origins),
+            'destinations': destination,
+            'departure_time': 'now',
+            'key': self.api_key
+        }
+        self._count("requests")
+
+        started = time.perf_counter()
+        try:
+            response = self.session.get(self.base_url, params=params,
+                                        timeout=timeout or self.request_timeout)
+            if self.on_request_latency:
+                self.on_request_latency(time.perf_counter() - started)
+            if response.status_code == 200:
+                return response.json()
+            logger.error(f"Distance Matrix API hatası: {response.status_code}")
+        except requests.Timeout:
+            self._count("timeouts")
+            if self.on_request_latency:
+                self.on_request_latency(time.perf_counter() - started)
+            logger.warning("Distance Matrix API zaman aşımı")
+            return None
+        except Exception as e:
+            logger.error(f"Distance Matrix API çağrısında hata: {e}")
+
+        self._count("errors")
+        return None
+
+    def _fetch_chunk(self, origins: List[str], destination: str, ttl: np.ndarray,
+                     timeout: float) -> Dict[str, Tuple[float, float]]:
+        """Bir grup başlangıç noktası için isteği yap ve sonuçları önbelleğe yaz"""
+        try:
+            data = self.request(origins, destination, timeout)
+        finally:
+            with self._cache_lock:
+                self._in_flight.difference_update((origin, destination) for origin in origins)
+        results = {}
+        if not data or data.get("status", "OK") != "OK":
+            return results
+
+        expires = time.monotonic()
+        for origin, row, origin_ttl in zip(origins, data.get("rows", []), ttl):
+            try:
+                element = row["elements"][0]
+                if element.get("status", "OK") != "OK" or "duration_in_traffic" not in element:
+                    continue
+                value = (float(element["duration_in_traffic"]["value"]),
+                         float(element["distance"]["value"]))
+            except (KeyError, IndexError, TypeError, ValueError):
+                continue
+            results[origin] = value
+            with self._cache_lock:
+                self._cache[(origin, destination)] = (expires + origin_ttl, *value)
+        return results
+
+    def fetch(self, lat: np.ndarray, lng: np.ndarray, destinations: Sequence[str],
+              deadline: float, ttl: np.ndarray = None) -> Tuple[np.ndarray, np.ndarray]:
+        """Tüm noktalar için trafikli süre ve mesafeyi getir.
+
+        `deadline` time.monotonic() cinsindendir; süresi içinde gelmeyen noktalar
+        NaN döner ve çağıran taraf simüle değerlere geri düşer.
+        """
+        n = len(lat)
+        duration_sec = np.full(n, np.nan)
+        distance_m = np.full(n, np.nan)
+        if ttl is None:
+            ttl = np.full(n, self.cache_ttl)
+
+        origins = [format_point(la, ln) for la, ln in zip(lat.tolist(), lng.tolist())]
+        self.evict_expired()
+        now = time.monotonic()
+
+        # Önbellekte geçerli kaydı olmayanları hedef noktasına göre grupla;
+        # yanıtı hâlâ beklenenler yeniden istenmez (havuz kuyruğu döngüden döngüye büyümesin)
+        pending: Dict[str, List[int]] = {}
+        hits = skipped = 0
+        claimed = set()
+        with self._cache_lock:
+            for i, key in enumerate(zip(origins, destinations)):
+                cached = self._cache.get(key)
+                if cached and cached[0] > now:
+                    duration_sec[i], distance_m[i] = cached[1], cached[2]
+                    hits += 1
+                elif key in self._in_flight and key not in claimed:
+                    skipped += 1
+                else:
+                    self._in_flight.add(key)
+                    claimed.add(key)
+                    pending.setdefault(key[1], []).append(i)
+        self._count("cache_hits", hits)
+        self._count("in_flight_skips", skipped)
+
+        futures = {}
+        for destination, indices in pending.items():
+            for start in range(0, len(indices), self.max_origins):
+                chunk = indices[start:start + self.max_origins]
+                timeout = max(0.1, min(self.request_timeout, deadline - now))
+                future = self.executor.submit(
+                    self._fetch_chunk, [origins[i] for i in chunk], destination,
+                    ttl[chunk], timeout
+                )
+                futures[future] = chunk
+
+        # Süresi dolan istekler arka planda tamamlanır ve sonraki döngü için önbelleği ısıtır
+        done, not_done = wait(futures, timeout=max(0.0, deadline - time.monotonic()))
+        for future in done:
+            results = future.result()
+            for i in futures[future]:
+                value = results.get(origins[i])
+                if value is not None:
+                    duration_sec[i], distance_m[i] = value
+
+        missing = int(np.isnan(duration_sec).sum())
+        if missing:
+            self._count("fallbacks", missing)
+            logger.debug(f"{missing} kavşak için Maps verisi yok, simüle değerler kullanılacak")
+        if not_done:
+            logger.warning(f"⏱️ {len(not_done)} Distance Matrix isteği döngü süresini aştı")
+
+        return duration_sec, distance_m
+
+    def evict_expired(self):
+        """Süresi dolmuş önbellek kayıtlarını temizle (her `fetch` başında çağrılır)"""
+        now = time.monotonic()
+        with self._cache_lock:
+            for key in [k for k, v in self._cache.items() if v[0] <= now]:
+                del self._cache[key]
+
+    def close(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+        self.session.close()
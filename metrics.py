@@ -0,0 +1,311 @@
+# metrics.py
+"""Aşama süre histogramları ve sayaçlar, Prometheus metin biçiminde yerel uç nokta, çalışırken açılan örneklemeli profil çıkarıcı"""
+
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from bisect import bisect_left
+from collections import Counter as FrameCounter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+from urllib.parse import parse_qs, urlparse
+
+logger = logging.getLogger(__name__)
+
+# Saniye cinsinden kova sınırları: 1 ms'den 30 sn'ye
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def _labels(labels: Tuple[Tuple[str, str], ...], extra: Tuple[Tuple[str, str], ...] = ()) -> str:
+    pairs = labels + extra
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in pairs) + "}"
+
+
+def _number(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """Yalnızca artan sayaç"""
+
+    __slots__ = ("value", "_lock")
+
+    def __init__(self):
+        self.value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, n: float = 1):
+        with self._lock:
+            self.value += n
+
+
+class Histogram:
+    """Sabit kovalı süre histogramı; gözlem bir ikili arama ve kilitli üç toplama"""
+
+    __slots__ = ("buckets", "counts", "sum", "count", "_lock")
+
+    def __init__(self, buckets: Iterable[float] = DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float):
+        i = bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[i] += 1
+            self.sum += value
+            self.count += 1
+
+    def observe_since(self, started: float):
+        """`time.perf_counter()` ile alınan başlangıçtan bu yana geçen süreyi gözle"""
+        self.observe(time.perf_counter() - started)
+
+    def snapshot(self) -> Tuple[List[int], float, int]:
+        with self._lock:
+            return list(self.counts), self.sum, self.count
+
+
+class MetricsRegistry:
+    """Metrik aileleri (ad → etiketli örnekler) ve mevcut `stats` sözlüklerini okuyan toplayıcılar.
+
+    Bileşenlerin kendi `stats` sayaçları kopyalanmaz; her kazımada okunur,
+    böylece sıcak yolda yalnızca aşama histogramlarının gözlemleri kalır.
+    """
+
+    def __init__(self, namespace: str = "traffic"):
+        self.namespace = namespace
+        # ad -> (tür, açıklama, {etiketler: örnek})
+        self._families: Dict[str, Tuple[str, str, Dict]] = {}
+        self._collectors: List[Tuple[str, str, Callable[[], Optional[Dict]], Tuple[str, ...]]] = []
+        self._lock = threading.Lock()
+
+    def _metric(self, kind: str, name: str, help_text: str, labels: Dict[str, str], factory):
+        name = f"{self.namespace}_{name}"
+        key = tuple(sorted((k, str(v)) for k, v in labels.items()))
+        with self._lock:
+            family = self._families.setdefault(name, (kind, help_text, {}))
+            if family[0] != kind:
+                raise ValueError(f"{name} zaten {family[0]} olarak tanımlı")
+            metric = family[2].get(key)
+            if metric is None:
+                metric = family[2][key] = factory()
+            return metric
+
+    def counter(self, name: str, help_text: str, **labels) -> Counter:
+        return self._metric("counter", name, help_text, labels, Counter)
+
+    def histogram(self, name: str, help_text: str, buckets: Iterable[float] = DEFAULT_BUCKETS,
+                  **labels) -> Histogram:
+        return self._metric("histogram", name, help_text, labels, lambda: Histogram(buckets))
+
+    def register_stats(self, prefix: str, help_text: str, source: Callable[[], Optional[Dict]],
+                       gauges: Iterable[str] = ()):
+        """`source()` sözlüğünün sayısal alanlarını `<namespace>_<prefix>_<alan>` olarak yayınla.
+
+        `gauges` dışındaki alanlar sayaçtır (`_total` sonekiyle). Kaynak henüz yoksa
+        (ör. bağlantı kurulmadan yayıncı) None döndürebilir.
+        """
+        self._collectors.append((prefix, help_text, source, tuple(gauges)))
+
+    def render(self) -> str:
+        """Prometheus metin biçimi (0.0.4)"""
+        lines = []
+        with self._lock:
+            families = [(name, kind, help_text, list(children.items()))
+                        for name, (kind, help_text, children) in self._families.items()]
+
+        for name, kind, help_text, children in families:
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, metric in sorted(children, key=lambda item: item[0]):
+                if kind == "histogram":
+                    counts, total, count = metric.snapshot()
+                    cumulative = 0
+                    for bound, n in zip(metric.buckets + (float("inf"),), counts):
+                        cumulative += n
+                        lines.append(f"{name}_bucket{_labels(labels, (('le', _number(bound)),))} {cumulative}")
+                    lines.append(f"{name}_sum{_labels(labels)} {_number(total)}")
+                    lines.append(f"{name}_count{_labels(labels)} {count}")
+                else:
+                    lines.append(f"{name}{_labels(labels)} {_number(metric.value)}")
+
+        for prefix, help_text, source, gauges in self._collectors:
+            try:
+                stats = source()
+            except Exception as e:
+                logger.error(f"Metrik toplayıcı hatası ({prefix}): {e}")
+                continue
+            for key, value in sorted((stats or {}).items()):
+                if isinstance(value, bool) or not isinstance(value, (int, float)):
+                    continue
+                kind = "gauge" if key in gauges else "counter"
+                name = f"{self.namespace}_{prefix}_{key}" + ("_total" if kind == "counter" else "")
+                lines.append(f"# HELP {name} {help_text}: {key}")
+                lines.append(f"# TYPE {name} {kind}")
+                lines.append(f"{name} {_number(value)}")
+        return "\n".join(lines) + "\n"
+
+
+class SamplingProfiler:
+    """Tüm thread'lerin yığınlarını periyodik örnekleyen profil çıkarıcı.
+
+    Kapalıyken maliyeti yoktur; açıldığında ayrı bir thread `sys._current_frames()`
+    ile örnek alır. Çıktı katlanmış yığın biçimindedir (`thread;dosya:fonksiyon;... sayı`),
+    flamegraph araçlarına doğrudan verilebilir.
+    """
+
+    def __init__(self, interval: float = 0.01, max_depth: int = 64):
+        self.interval = interval
+        self.max_depth = max_depth
+        self.samples = FrameCounter()
+        self.started_at = None
+        self.stopped_at = None
+        self._stop = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, duration: float = None, interval: float = None) -> bool:
+        """Örneklemeyi başlat (önceki örnekler silinir); `duration` saniye sonra kendiliğinden durur"""
+        if self.running:
+            return False
+        if interval:
+            self.interval = interval
+        with self._lock:
+            self.samples.clear()
+        self.started_at, self.stopped_at = time.time(), None
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, args=(duration,), name="sampling-profiler", daemon=True)
+        self._thread.start()
+        logger.info(f"🔬 Profil örneklemesi başladı ({self.interval * 1000:g} ms aralık)")
+        return True
+
+    def stop(self) -> bool:
+        if not self.running:
+            return False
+        self._stop.set()
+        self._thread.join(5.0)
+        return True
+
+    def _stack(self, frame) -> str:
+        parts = []
+        while frame is not None and len(parts) < self.max_depth:
+            code = frame.f_code
+            parts.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+            frame = frame.f_back
+        return ";".join(reversed(parts))
+
+    def _run(self, duration: Optional[float]):
+        own = threading.get_ident()
+        deadline = None if duration is None else time.monotonic() + duration
+        while not self._stop.wait(self.interval):
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            stacks = [f"{names.get(ident, ident)};{self._stack(frame)}"
+                      for ident, frame in sys._current_frames().items() if ident != own]
+            with self._lock:
+                self.samples.update(stacks)
+            if deadline is not None and time.monotonic() >= deadline:
+                break
+        self.stopped_at = time.time()
+        logger.info(f"🔬 Profil örneklemesi bitti ({sum(self.samples.values())} örnek)")
+
+    def folded(self, limit: int = None) -> str:
+        """En sık yığınlar önce, katlanmış yığın biçiminde"""
+        with self._lock:
+            items = self.samples.most_common(limit)
+        return "".join(f"{stack} {count}\n" for stack, count in items)
+
+    def status(self) -> Dict:
+        with self._lock:
+            total = sum(self.samples.values())
+        return {'running': self.running, 'intervalMs': self.interval * 1000, 'samples': total,
+                'stacks': len(self.samples), 'startedAt': self.started_at, 'stoppedAt': self.stopped_at}
+
+
+class MetricsServer:
+    """Yerel metrik uç noktası: GET /metrics (Prometheus), /profile, /profile/start, /profile/stop"""
+
+    def __init__(self, registry: MetricsRegistry, profiler: SamplingProfiler = None,
+                 host: str = "127.0.0.1", port: int = 3003):
+        self.registry = registry
+        self.profiler = profiler
+        self.host = host
+        self.port = port
+        self._server = None
+
+    def _make_handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+                url = urlparse(self.path)
+                query = parse_qs(url.query)
+                status, content_type = 200, "application/json; charset=utf-8"
+                profiler = server.profiler
+                if url.path == "/metrics":
+                    body, content_type = server.registry.render(), PROMETHEUS_CONTENT_TYPE
+                elif url.path.startswith("/profile") and profiler is None:
+                    status, body = 404, {'success': False, 'message': 'Profil çıkarıcı kapalı'}
+                elif url.path == "/profile":
+                    limit = int(query.get('limit', ['0'])[0]) or None
+                    body, content_type = profiler.folded(limit), "text/plain; charset=utf-8"
+                elif url.path == "/profile/start":
+                    try:
+                        seconds = float(query['seconds'][0]) if 'seconds' in query else None
+                        interval = float(query['intervalMs'][0]) / 1000 if 'intervalMs' in query else None
+                    except ValueError:
+                        status, body = 400, {'success': False, 'message': 'seconds ve intervalMs sayı olmalı'}
+                    else:
+                        started = profiler.start(seconds, interval)
+                        body = {'success': started, 'data': profiler.status()}
+                elif url.path == "/profile/stop":
+                    body = {'success': profiler.stop(), 'data': profiler.status()}
+                else:
+                    status, body = 404, {'success': False, 'message': 'Endpoint bulunamadı'}
+
+                if not isinstance(body, str):
+                    body = json.dumps(body, ensure_ascii=False)
+                payload = body.encode('utf-8')
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def start(self) -> "MetricsServer":
+        self._server = ThreadingHTTPServer((self.host, self.port), self._make_handler())
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, name="metrics-server", daemon=True).start()
+        logger.info(f"📈 Metrik servisi: http://{self.host}:{self._server.server_address[1]}/metrics")
+        return self
+
+    def stop(self):
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
@@ -0,0 +1,434 @@
+# mqtt_publisher.py
+"""AWS IoT için bloklamayan MQTT yayını, disk tabanlı çevrimdışı kuyruk ve yeniden bağlanma"""
+
+import logging
+import os
+import random
+import struct
+import threading
+import time
+from typing import Callable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Kayıt başlığı: payload uzunluğu (uint32), topic uzunluğu (uint16)
+_RECORD_HEADER = struct.Struct('<IH')
+
+
+def build_connection(client_id: str, endpoint: str = None, cert_path: str = None, key_path: str = None,
+                     ca_path: str = None, broker_host: str = None, broker_port: int = 1883,
+                     on_interrupted: Callable = None, on_resumed: Callable = None,
+                     clean_session: bool = False):
+    """AWS IoT Core (mTLS) veya yerel broker (şifresiz TCP) için awscrt MQTT bağlantısı.
+
+    Sertifikalar eksikse ve yerel broker da verilmemişse None döner.
+    """
+    from awscrt import io, mqtt
+    from awsiot import mqtt_connection_builder
+
+    # Event loop ve host resolver
+    event_loop_group = io.EventLoopGroup(1)
+    host_resolver = io.DefaultHostResolver(event_loop_group)
+    client_bootstrap = io.ClientBootstrap(event_loop_group, host_resolver)
+    options = dict(
+        client_id=client_id,
+        clean_session=clean_session,
+        keep_alive_secs=6,
+        on_connection_interrupted=on_interrupted,
+        on_connection_resumed=on_resumed,
+        reconnect_min_timeout_secs=1,
+        reconnect_max_timeout_secs=60
+    )
+
+    if endpoint and all(path and os.path.exists(path) for path in (cert_path, key_path, ca_path)):
+        return mqtt_connection_builder.mtls_from_path(
+            endpoint=endpoint,
+            cert_filepath=cert_path,
+            pri_key_filepath=key_path,
+            client_bootstrap=client_bootstrap,
+            ca_filepath=ca_path,
+            **options
+        )
+    if broker_host:
+        return mqtt.Connection(
+            client=mqtt.Client(client_bootstrap, None),
+            host_name=broker_host,
+            port=broker_port,
+            **options
+        )
+    return None
+
+
+class DiskSpool:
+    """Sıralı okunan, boyutu sınırlı, yalnızca sona eklenen disk kuyruğu.
+
+    Okuma imleci tüketilmiş ofsetten ayrıdır: okunan kayıtlar `commit` edilene
+    kadar kuyrukta kalır ve `rewind` ile yeniden okunabilir.
+    """
+
+    def __init__(self, path: str, max_bytes: int = 64 * 1024 * 1024):
+        self.path = path
+        self.offset_path = path + '.offset'
+        self.max_bytes = max_bytes
+        self.dropped = 0
+        self._lock = threading.Lock()
+
+        self._file = open(path, 'ab+')
+        self._offset = 0
+        if os.path.exists(self.offset_path):
+            with open(self.offset_path, 'rb') as f:
+                self._offset = int(f.read() or 0)
+        self._size = self._file.seek(0, os.SEEK_END)
+        self._offset = min(self._offset, self._size)
+        self._position = self._offset
+        self.closed = False
+
+    def __len__(self) -> int:
+        """Okunmamış bayt sayısı"""
+        return self._size - self._offset
+
+    def append(self, topic: str, payload: bytes) -> bool:
+        """Mesajı sona ekle; kuyruk doluysa veya kapatıldıysa düşür"""
+        topic_bytes = topic.encode('utf-8')
+        record = _RECORD_HEADER.pack(len(payload), len(topic_bytes)) + topic_bytes + payload
+        with self._lock:
+            if self.closed:
+                return False
+            if self._size - self._offset + len(record) > self.max_bytes:
+                self.dropped += 1
+                return False
+            self._file.seek(0, os.SEEK_END)
+            self._file.write(record)
+            self._file.flush()
+            self._size += len(record)
+        return True
+
+    def read(self, limit: int) -> List[Tuple[int, str, bytes]]:
+        """Okuma imlecinden en fazla `limit` kaydı (bitiş ofseti, topic, payload) olarak oku"""
+        records = []
+        with self._lock:
+            if self.closed:
+                return records
+            position = self._position
+            self._file.seek(position)
+            while len(records) < limit and position < self._size:
+                header = self._file.read(_RECORD_HEADER.size)
+                if len(header) < _RECORD_HEADER.size:
+                    break
+                payload_len, topic_len = _RECORD_HEADER.unpack(header)
+                topic = self._file.read(topic_len).decode('utf-8')
+                payload = self._file.read(payload_len)
+                position += _RECORD_HEADER.size + topic_len + payload_len
+                records.append((position, topic, payload))
+            self._position = position
+        return records
+
+    def rewind(self):
+        """Okuma imlecini tüketilmemiş ilk kayda geri al"""
+        with self._lock:
+            self._position = self._offset
+
+    def commit(self, offset: int):
+        """`offset`e kadar okunan kayıtları tüketilmiş say"""
+        with self._lock:
+            if self.closed:
+                return
+            self._offset = max(self._offset, offset)
+            self._position = max(self._position, self._offset)
+            if self._offset >= self._size:
+                # Kuyruk boşaldı: dosyayı sıfırla
+                self._file.truncate(0)
+                self._size = self._offset = self._position = 0
+            with open(self.offset_path, 'wb') as f:
+                f.write(str(self._offset).encode())
+
+    def close(self):
+        with self._lock:
+            self.closed = True
+            self._file.close()
+
+
+class AsyncMQTTPublisher:
+    """QoS1 mesajlarını sınırlı sayıda onaysız (in-flight) pencereyle, geri çağrılarla yayınlar.
+
+    Bağlantı yokken, pencere doluyken veya diskte bekleyen mesaj varken yeni
+    mesajlar sıra bozulmasın diye diske yazılır ve bağlantı gelince sırayla gönderilir.
+    Diskten gönderilen kayıtlar ancak onaylanınca tüketilir; onay alınamazsa okuma
+    onaylanmamış ilk kayda geri sarılır ve sıra yeniden gönderilir.
+    """
+
+    def __init__(self, connection, spool: DiskSpool, qos=None, max_inflight: int = 100,
+                 on_ack: Callable[[str, bytes], None] = None,
+                 on_ack_latency: Callable[[float], None] = None,
+                 backoff_min: float = 1.0, backoff_max: float = 60.0,
+                 connect_timeout: float = 10.0):
+        self.connection = connection
+        self.spool = spool
+        self.qos = qos
+        self.max_inflight = max_inflight
+        self.on_ack = on_ack
+        # Gönderimden onaya geçen süre (sn); metrik histogramı için
+        self.on_ack_latency = on_ack_latency
+        self.backoff_min = backoff_min
+        self.backoff_max = backoff_max
+        self.connect_timeout = connect_timeout
+        self.on_connected: Optional[Callable[[], None]] = None
+
+        self.connected = threading.Event()
+        self._inflight = 0
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._closing = threading.Event()
+        self._connector = None
+        # Onay bekleyen doğrudan mesajlar (kapatmada diske yazılır)
+        self._unacked = {}
+        self._next_token = 0
+        # Diskten gönderilip onay bekleyen kayıtlar: bitiş ofseti -> onaylandı mı (gönderim sırasıyla)
+        self._replay_pending = {}
+        self._replay_generation = 0
+        self.stats = {"published": 0, "acked": 0, "failed": 0, "spooled": 0, "replayed": 0,
+                      "rewinds": 0, "persisted_on_close": 0}
+        self._stats_lock = threading.Lock()
+
+        self._replayer = threading.Thread(target=self._replay_loop, name="mqtt-replay", daemon=True)
+        self._replayer.start()
+
+    def _count(self, key: str, n: int = 1):
+        with self._stats_lock:
+            self.stats[key] += n
+
+    # --- Bağlantı yönetimi ---
+
+    def connect(self, wait: float = None, on_connected: Callable[[], None] = None) -> bool:
+        """Arka planda üstel geri çekilmeyle bağlan; `wait` saniye kadar sonucu bekle"""
+        if on_connected:
+            self.on_connected = on_connected
+        if self._connector is None or not self._connector.is_alive():
+            self._connector = threading.Thread(target=self._connect_loop, name="mqtt-connect", daemon=True)
+            self._connector.start()
+        return self.connected.wait(wait) if wait else self.connected.is_set()
+
+    def _connect_loop(self):
+        delay = self.backoff_min
+        while not self._closing.is_set() and not self.connected.is_set():
+            try:
+                self.connection.connect().result(self.connect_timeout)
+                logger.info("✅ AWS IoT Core'a başarıyla bağlandı")
+                self._set_connected()
+                return
+            except Exception as e:
+                logger.warning(f"AWS IoT bağlantı hatası, {delay:.1f} sn sonra tekrar denenecek: {e}")
+            # Eşzamanlı yeniden bağlanmaları dağıtmak için rastgele sapma
+            self._closing.wait(delay * random.uniform(0.8, 1.2))
+            delay = min(delay * 2, self.backoff_max)
+
+    def _set_connected(self):
+        self.connected.set()
+        if self.on_connected:
+            try:
+                self.on_connected()
+            except Exception as e:
+                logger.error(f"Bağlantı sonrası işlem hatası: {e}")
+        self._wakeup.set()
+
+    def on_connection_interrupted(self, connection, error, **kwargs):
+        """awscrt: bağlantı koptu (SDK kendi içinde yeniden bağlanmayı dener)"""
+        logger.warning(f"AWS IoT bağlantısı kesildi: {error}")
+        self.connected.clear()
+
+    def on_connection_resumed(self, connection, return_code, session_present, **kwargs):
+        """awscrt: bağlantı yeniden kuruldu"""
+        logger.info(f"AWS IoT bağlantısı yeniden kuruldu (session_present={session_present})")
+        self._set_connected()
+
+    # --- Yayın ---
+
+    def publish(self, topic: str, payload, on_ack: Callable[[], None] = None) -> bool:
+        """Mesajı bloklamadan gönder veya diske yaz; mesaj kaybolmadıysa True.
+
+        `on_ack` yalnızca doğrudan gönderilen mesajın onayında çağrılır;
+        diske yazılan mesajlar için çağrılmaz.
+        """
+        if isinstance(payload, str):
+            payload = payload.encode('utf-8')
+
+        with self._lock:
+            can_send = (self.connected.is_set() and not len(self.spool)
+                        and self._inflight < self.max_inflight)
+            if can_send:
+                self._inflight += 1
+
+        if can_send:
+            with self._lock:
+                token = self._next_token
+                self._next_token += 1
+                self._unacked[token] = (topic, payload)
+            return self._send(topic, payload, on_ack, token=token)
+        return self._to_spool(topic, payload)
+
+    def _to_spool(self, topic: str, payload: bytes) -> bool:
+        if self.spool.append(topic, payload):
+            self._count("spooled")
+            self._wakeup.set()
+            return True
+        if self.spool.closed:
+            logger.error(f"Çevrimdışı kuyruk kapatıldı, mesaj düşürüldü: {topic}")
+        else:
+            logger.error(f"Çevrimdışı kuyruk dolu, mesaj düşürüldü: {topic}")
+        return False
+
+    def _send(self, topic: str, payload: bytes, on_ack: Callable[[], None] = None,
+              token: int = None, replay: Tuple[int, int] = None) -> bool:
+        """In-flight yeri önceden ayrılmış bir mesajı gönder.
+
+        Doğrudan mesajlar `token` ile, diskten okunanlar `(nesil, bitiş ofseti)` ile izlenir.
+        """
+        try:
+            future, _ = self.connection.publish(topic=topic, payload=payload, qos=self.qos)
+        except Exception as e:
+            logger.warning(f"AWS IoT mesaj gönderme hatası: {e}")
+            self._release()
+            if replay is not None:
+                self._replay_failed(replay[0])
+                return True
+            return self._spool_unacked(token, topic, payload)
+
+        self._count("published")
+        sent = time.perf_counter()
+        future.add_done_callback(lambda f: self._on_done(f, topic, payload, on_ack, sent, token, replay))
+        return True
+
+    def _spool_unacked(self, token: Optional[int], topic: str, payload: bytes) -> bool:
+        """Onaylanmayan doğrudan mesajı diske yaz (kapatmada zaten yazıldıysa atla)"""
+        with self._lock:
+            if token is not None and self._unacked.pop(token, None) is None:
+                return True
+        return self._to_spool(topic, payload)
+
+    def _replay_acked(self, generation: int, end: int):
+        """Kaydı onaylanmış işaretle; baştaki kesintisiz onaylı kayıtlar kadar ofseti ilerlet"""
+        commit_to = None
+        with self._lock:
+            if generation != self._replay_generation or end not in self._replay_pending:
+                return
+            self._replay_pending[end] = True
+            for offset in list(self._replay_pending):
+                if not self._replay_pending[offset]:
+                    break
+                del self._replay_pending[offset]
+                commit_to = offset
+        if commit_to is not None:
+            self.spool.commit(commit_to)
+
+    def _replay_failed(self, generation: int):
+        """Onay alınamadı: okumayı onaylanmamış ilk kayda geri sar (eski nesil onayları yok sayılır)"""
+        with self._lock:
+            if generation != self._replay_generation:
+                return
+            self._replay_generation += 1
+            self._replay_pending.clear()
+            self.spool.rewind()
+        self._count("rewinds")
+        self._wakeup.set()
+
+    def _release(self):
+        with self._lock:
+            self._inflight -= 1
+        self._wakeup.set()
+
+    def _on_done(self, future, topic: str, payload: bytes, on_ack: Callable[[], None] = None,
+                 sent: float = None, token: int = None, replay: Tuple[int, int] = None):
+        self._release()
+        error = future.exception()
+        if error is not None:
+            self._count("failed")
+            logger.warning(f"AWS IoT onayı alınamadı, mesaj kuyruğa alındı: {topic} ({error})")
+            if replay is not None:
+                # Kayıt hâlâ diskte: okuma ona geri sarılır, sıra korunur
+                self._replay_failed(replay[0])
+            else:
+                # Doğrudan mesaj: sonraki mesajlar zaten gönderildi, kuyruğun sonuna yazılır
+                self._spool_unacked(token, topic, payload)
+            return
+
+        self._count("acked")
+        if replay is not None:
+            self._replay_acked(*replay)
+        elif token is not None:
+            with self._lock:
+                self._unacked.pop(token, None)
+        try:
+            if self.on_ack_latency and sent is not None:
+                self.on_ack_latency(time.perf_counter() - sent)
+            if on_ack:
+                on_ack()
+            if self.on_ack:
+                self.on_ack(topic, payload)
+        except Exception as e:
+            logger.error(f"Yayın onayı işleme hatası: {e}")
+
+    def _replay_loop(self):
+        """Bağlantı varken diskteki mesajları sırayla ve pencere içinde gönder"""
+        while not self._closing.is_set():
+            self._wakeup.wait(1.0)
+            self._wakeup.clear()
+
+            while self.connected.is_set() and len(self.spool) and not self._closing.is_set():
+                with self._lock:
+                    free = self.max_inflight - self._inflight
+                    self._inflight += max(free, 0)
+                if free <= 0:
+                    break
+
+                # Okuma ve nesil birlikte alınır: araya geri sarma girmez
+                with self._lock:
+                    generation = self._replay_generation
+                    records = self.spool.read(free)
+                    for end, _, _ in records:
+                        self._replay_pending[end] = False
+                unused = free - len(records)
+                # Ofset yalnızca onaylarla ilerler (`_replay_acked`)
+                for end, topic, payload in records:
+                    self._send(topic, payload, replay=(generation, end))
+                if records:
+                    self._count("replayed", len(records))
+                if unused:
+                    with self._lock:
+                        self._inflight -= unused
+                if not records:
+                    break
+
+    @property
+    def inflight(self) -> int:
+        return self._inflight
+
+    def drain(self, timeout: float = 5.0) -> bool:
+        """Onay bekleyen mesajlar için en fazla `timeout` saniye bekle"""
+        deadline = time.monotonic() + timeout
+        while self._inflight > 0 and time.monotonic() < deadline:
+            time.sleep(0.05)
+        return self._inflight == 0
+
+    def close(self, timeout: float = 5.0):
+        """Onayları bekle, arka plan thread'lerini durdur ve kuyruğu kapat.
+
+        Süre içinde onaylanmayan doğrudan mesajlar diske yazılır (sonraki açılışta
+        yeniden gönderilir); diskten gönderilenler zaten tüketilmemiş durumdadır.
+        Kapatmadan sonra gelen onay/hata geri çağrıları kuyruğa dokunmaz.
+        """
+        self.drain(timeout)
+        self._closing.set()
+        self._wakeup.set()
+        # Yeniden gönderim döngüsü uyandırıldı, kısa sürede çıkar
+        self._replayer.join(max(timeout, 1.0))
+        with self._lock:
+            self._replay_generation += 1
+            self._replay_pending.clear()
+            leftovers = list(self._unacked.values())
+            self._unacked.clear()
+        for topic, payload in leftovers:
+            if self.spool.append(topic, payload):
+                self._count("persisted_on_close")
+        if leftovers:
+            logger.warning(f"{len(leftovers)} onaysız mesaj kapatmada diske yazıldı")
+        self.spool.close()
@@ -0,0 +1,292 @@
+# payload_codec.py
+"""AWS IoT trafik mesajları için delta/keyframe ve sıkıştırılmış binary payload kodlayıcı/çözücü"""
+
+import json
+import logging
+import struct
+import sys
+import threading
+import time
+import zlib
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from batch_engine import IntersectionTable
+
+logger = logging.getLogger(__name__)
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+try:
+    import cbor2
+except ImportError:
+    cbor2 = None
+
+PAYLOAD_VERSION = 1
+
+# Sütun adları ve her metrik için "değişti" sayılma eşiği
+METRIC_FIELDS = ("density", "averageSpeed", "waitTime", "vehicleCount", "status")
+DEFAULT_THRESHOLDS = (1.0, 2.0, 5.0, 5.0, 0.5)  # status: her değişiklik
+
+# AWS IoT Core MQTT mesaj sınırı 128 KB; başlık için pay bırakılır
+MAX_MESSAGE_BYTES = 120 * 1024
+
+# Binary çerçeve: "TRF", sürüm, bayraklar, seq (uint32), parça no (uint16), parça sayısı (uint16)
+FRAME_MAGIC = b"TRF"
+_FRAME_HEADER = struct.Struct('<3sBBIHH')
+FLAG_COMPRESSED = 0x01
+FORMAT_CODES = {"json": 0, "msgpack": 1, "cbor": 2}
+FORMAT_NAMES = {code: name for name, code in FORMAT_CODES.items()}
+
+
+def default_binary_format() -> str:
+    """Kurulu en kompakt serileştirici"""
+    if msgpack is not None:
+        return "msgpack"
+    if cbor2 is not None:
+        return "cbor"
+    return "json"
+
+
+def _dumps(doc: dict, fmt: str) -> bytes:
+    if fmt == "msgpack":
+        return msgpack.packb(doc, use_bin_type=True)
+    if fmt == "cbor":
+        return cbor2.dumps(doc)
+    return json.dumps(doc, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+
+def _loads(data: bytes, fmt: str) -> dict:
+    if fmt == "msgpack":
+        return msgpack.unpackb(data, raw=False)
+    if fmt == "cbor":
+        return cbor2.loads(data)
+    return json.loads(data)
+
+
+class PayloadEncoder:
+    """Son onaylanan görüntüye göre eşiği aşan kavşakları gönderen, periyodik keyframe üreten kodlayıcı"""
+
+    def __init__(self, table: IntersectionTable, device_id: str, binary: bool = False,
+                 binary_format: str = None, compress: bool = True, keyframe_interval: int = 30,
+                 thresholds: Tuple[float, ...] = DEFAULT_THRESHOLDS,
+                 max_message_bytes: int = MAX_MESSAGE_BYTES):
+        self.table = table
+        self.device_id = device_id
+        self.binary = binary
+        self.binary_format = binary_format or default_binary_format()
+        self.compress = compress
+        self.keyframe_interval = max(1, keyframe_interval)
+        self.thresholds = np.asarray(thresholds, dtype=np.float64)
+        self.max_message_bytes = max_message_bytes
+
+        n = len(table)
+        self.seq = 0
+        # Alıcının onayladığı değerler; kavşak başına hangi seq ile onaylandığı tutulur
+        self.baseline = np.zeros((n, len(METRIC_FIELDS)))
+        self.baseline_seq = np.full(n, -1, dtype=np.int64)
+        # Kodlanan son değerler: sınıf bazlı kısmi döngülerde keyframe yine tüm tabloyu taşır
+        self.latest = np.zeros((n, len(METRIC_FIELDS)))
+        self.latest_seen = np.zeros(n, dtype=bool)
+        self._pending: Dict[int, Tuple[np.ndarray, np.ndarray, bool]] = {}
+        self._last_keyframe_acked = -1
+        # Onaylar MQTT geri çağrı thread'lerinden gelir
+        self._lock = threading.Lock()
+
+    def encode(self, rows: np.ndarray, values: np.ndarray, timestamp: float = None) -> Tuple[int, List]:
+        """Görüntüyü kodla; (seq, mesaj listesi) döndür.
+
+        `values` sütunları METRIC_FIELDS sırasındadır (status kod olarak). `rows` tablonun
+        bir kısmı olabilir (sınıf bazlı döngüler); keyframe yine de şimdiye kadar kodlanan
+        tüm kavşakları en son değerleriyle içerir, çünkü alıcı keyframe'de olmayanları siler.
+        """
+        with self._lock:
+            self.seq += 1
+            seq = self.seq
+            keyframe = (self._last_keyframe_acked < 0 or seq % self.keyframe_interval == 0)
+            self.latest[rows] = values
+            self.latest_seen[rows] = True
+
+            if keyframe:
+                send_rows = np.flatnonzero(self.latest_seen)
+                send_values = self.latest[send_rows]
+            else:
+                known = self.baseline_seq[rows] >= 0
+                changed = (np.abs(values - self.baseline[rows]) >= self.thresholds).any(axis=1)
+                send = changed | ~known
+                send_rows, send_values = rows[send], values[send]
+            self._pending[seq] = (send_rows, send_values, keyframe)
+            # Hiç onaylanmayan eski görüntüler birikmesin
+            for old in [s for s in self._pending if s < seq - 4 * self.keyframe_interval]:
+                del self._pending[old]
+
+        doc = {
+            "v": PAYLOAD_VERSION,
+            "type": "key" if keyframe else "delta",
+            "seq": seq,
+            "deviceId": self.device_id,
+            "ts": round(timestamp or time.time(), 3),
+        }
+        messages = self._split(doc, send_rows, send_values, include_meta=keyframe)
+        return seq, messages
+
+    def acknowledge(self, seq: int):
+        """`seq` görüntüsünün tüm parçaları onaylandı: referans değerleri ilerlet"""
+        with self._lock:
+            pending = self._pending.pop(seq, None)
+            if pending is None:
+                return
+            rows, values, keyframe = pending
+            newer = self.baseline_seq[rows] < seq
+            self.baseline[rows[newer]] = values[newer]
+            self.baseline_seq[rows[newer]] = seq
+            if keyframe:
+                self._last_keyframe_acked = max(self._last_keyframe_acked, seq)
+
+    def _columns(self, rows: np.ndarray, values: np.ndarray, include_meta: bool) -> dict:
+        columns = {"ids": self.table.ids[rows].tolist()}
+        for i, name in enumerate(METRIC_FIELDS):
+            column = values[:, i]
+            columns[name] = column.round(1).tolist() if name == "density" else column.astype(int).tolist()
+        if include_meta:
+            columns["meta"] = {
+                "names": [self.table.names[r] for r in rows.tolist()],
+                "lat": self.table.lat[rows].tolist(),
+                "lng": self.table.lng[rows].tolist(),
+            }
+        return columns
+
+    def _split(self, doc: dict, rows: np.ndarray, values: np.ndarray, include_meta: bool) -> List:
+        if self.binary:
+            body = _dumps({**doc, **self._columns(rows, values, include_meta)}, self.binary_format)
+            return self._frames(doc["seq"], body)
+
+        # JSON modunda satırlar sınırın altında kalacak şekilde parçalara bölünür
+        parts = [(rows, values)]
+        while True:
+            encoded = [
+                json.dumps({**doc, **self._columns(r, v, include_meta), "part": i, "parts": len(parts)},
+                           ensure_ascii=False, separators=(',', ':'))
+                for i, (r, v) in enumerate(parts)
+            ]
+            if max(len(m.encode('utf-8')) for m in encoded) <= self.max_message_bytes or len(parts) >= len(rows):
+                return encoded
+            count = len(parts) * 2
+            parts = list(zip(np.array_split(rows, count), np.array_split(values, count)))
+
+    def _frames(self, seq: int, body: bytes) -> List[bytes]:
+        flags = FORMAT_CODES[self.binary_format] << 1
+        if self.compress:
+            body = zlib.compress(body, 6)
+            flags |= FLAG_COMPRESSED
+
+        chunk_size = self.max_message_bytes - _FRAME_HEADER.size
+        chunks = [body[i:i + chunk_size] for i in range(0, len(body), chunk_size)] or [b""]
+        return [
+            _FRAME_HEADER.pack(FRAME_MAGIC, PAYLOAD_VERSION, flags, seq & 0xFFFFFFFF, i, len(chunks)) + chunk
+            for i, chunk in enumerate(chunks)
+        ]
+
+
+class PayloadDecoder:
+    """Delta/keyframe ve binary mesajlardan güncel kavşak durumunu yeniden kuran çözücü"""
+
+    def __init__(self):
+        # kavşak id -> {metrik: değer}
+        self.state: Dict[int, Dict] = {}
+        self.meta: Dict[int, Dict] = {}
+        # kavşak id -> değerinin geldiği seq; eski (yeniden iletilen) mesajlar yeni değeri ezmez
+        self.seq_of: Dict[int, int] = {}
+        self.last_seq = 0
+        self._keyframe_seq = -1
+        self._chunks: Dict[int, Dict[int, bytes]] = {}
+
+    def feed(self, payload) -> Optional[dict]:
+        """Bir MQTT mesajını işle; tamamlanan belgeyi döndür (eksik parça varsa None)"""
+        if isinstance(payload, str):
+            payload = payload.encode('utf-8')
+
+        if payload[:3] == FRAME_MAGIC:
+            doc = self._reassemble(payload)
+            if doc is None:
+                return None
+        else:
+            doc = json.loads(payload)
+
+        self.apply(doc)
+        return doc
+
+    def _reassemble(self, frame: bytes) -> Optional[dict]:
+        _, version, flags, seq, index, count = _FRAME_HEADER.unpack_from(frame)
+        if version != PAYLOAD_VERSION:
+            raise ValueError(f"Desteklenmeyen payload sürümü: {version}")
+
+        parts = self._chunks.setdefault(seq, {})
+        parts[index] = frame[_FRAME_HEADER.size:]
+        if len(parts) < count:
+            return None
+        del self._chunks[seq]
+
+        body = b"".join(parts[i] for i in range(count))
+        if flags & FLAG_COMPRESSED:
+            body = zlib.decompress(body)
+        return _loads(body, FORMAT_NAMES[(flags >> 1) & 0x03])
+
+    def apply(self, doc: dict) -> int:
+        """Kodlanmış belgeyi duruma uygula; uygulanan kavşak sayısı.
+
+        QoS1 yeniden iletimi ve çevrimdışı kuyruk mesajları sırasız getirebilir:
+        son keyframe'den eski mesajlar yok sayılır, bir kavşağın değeri yalnızca
+        daha yeni bir seq ile değişir. Aynı mesajın tekrarı durumu değiştirmez.
+        """
+        seq = doc["seq"]
+        if seq < self._keyframe_seq:
+            return 0
+        if doc["type"] == "key" and seq > self._keyframe_seq:
+            # Yeni keyframe durumu yeniden kurar; ondan yeni delta değerleri korunur
+            self._keyframe_seq = seq
+            self.seq_of = {iid: s for iid, s in self.seq_of.items() if s > seq}
+            self.state = {iid: self.state[iid] for iid in self.seq_of}
+
+        columns = [doc[name] for name in METRIC_FIELDS]
+        meta = doc.get("meta")
+        applied = 0
+        for i, intersection_id in enumerate(doc["ids"]):
+            if self.seq_of.get(intersection_id, -1) > seq:
+                continue
+            self.state[intersection_id] = {name: column[i] for name, column in zip(METRIC_FIELDS, columns)}
+            self.seq_of[intersection_id] = seq
+            applied += 1
+            if meta:
+                self.meta[intersection_id] = {
+                    "name": meta["names"][i], "lat": meta["lat"][i], "lng": meta["lng"][i]
+                }
+        self.last_seq = max(self.last_seq, seq)
+        return applied
+
+    def snapshot(self) -> List[Dict]:
+        """Güncel durum, tam JSON payload'daki kavşak biçimine yakın"""
+        return [
+            {"intersectionId": intersection_id, **self.meta.get(intersection_id, {}), **metrics}
+            for intersection_id, metrics in sorted(self.state.items())
+        ]
+
+
+def main(paths: List[str]):
+    """Kaydedilmiş payload dosyalarını sırayla çöz ve son durumu JSON olarak yazdır"""
+    decoder = PayloadDecoder()
+    for path in paths:
+        with open(path, 'rb') as f:
+            doc = decoder.feed(f.read())
+        if doc is not None:
+            logger.info(f"{path}: {doc['type']} seq={doc['seq']} ({len(doc['ids'])} kavşak)")
+    json.dump(decoder.snapshot(), sys.stdout, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    main(sys.argv[1:])
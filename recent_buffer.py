@@ -0,0 +1,184 @@
+# recent_buffer.py
+"""Son K analiz döngüsünün bellek içi halka tamponu ve artımlı kayan istatistikler"""
+
+import logging
+import threading
+import time
+from typing import Dict, Optional
+
+import numpy as np
+
+from batch_engine import IntersectionTable, TrafficBatch
+
+logger = logging.getLogger(__name__)
+
+# Tek hücre: bir döngüde bir kavşağın değerleri (22 bayt)
+RECENT_DTYPE = np.dtype([
+    ('ts', '<f8'),
+    ('density', '<f4'),
+    ('avg_speed', '<i2'),
+    ('wait_time', '<i2'),
+    ('vehicle_count', '<i4'),
+    ('status', 'i1'),
+    ('valid', '?'),
+])
+
+# Kayan istatistik tutulan alanlar
+STAT_FIELDS = ('density', 'avg_speed', 'wait_time', 'vehicle_count')
+
+
+def _values(cells: np.ndarray) -> np.ndarray:
+    """Yapısal hücrelerden (..., alan) float64 değer dizisi"""
+    return np.stack([cells[name].astype(np.float64) for name in STAT_FIELDS], axis=-1)
+
+
+def _extremes(cells: np.ndarray):
+    """(döngü, kavşak) hücrelerinden min, max ve pencerede kaç kez tekrarlandıkları"""
+    valid = cells['valid'][..., None]
+    values = _values(cells)
+    mins = np.where(valid, values, np.inf).min(axis=0, initial=np.inf)
+    maxs = np.where(valid, values, -np.inf).max(axis=0, initial=-np.inf)
+    return (mins, (valid & (values == mins)).sum(axis=0),
+            maxs, (valid & (values == maxs)).sum(axis=0))
+
+
+def _summarize(cells: np.ndarray):
+    """(döngü, kavşak) hücrelerinden count, toplam, kare toplamı ve uç değerler"""
+    valid = cells['valid'][..., None]
+    values = np.where(valid, _values(cells), 0)
+    return (valid[..., 0].sum(axis=0), values.sum(axis=0), (values ** 2).sum(axis=0),
+            *_extremes(cells))
+
+
+def _finish(count, sums, sumsq, mins, maxs) -> Dict[str, np.ndarray]:
+    n = np.maximum(count, 1)[..., None]
+    mean = sums / n
+    variance = np.maximum(sumsq / n - mean ** 2, 0.0)
+    empty = (count == 0)[..., None]
+    return {
+        'count': count,
+        'mean': np.where(empty, np.nan, mean),
+        'std': np.where(empty, np.nan, np.sqrt(variance)),
+        'min': np.where(empty, np.nan, mins),
+        'max': np.where(empty, np.nan, maxs),
+    }
+
+
+class RecentCycleBuffer:
+    """(kapasite, kavşak) boyutlu sabit yapısal dizi üzerinde halka tampon.
+
+    Her eklemede pencere toplamları, kare toplamları, min ve max artımlı
+    güncellenir. Min/max değerinin pencerede kaç kez bulunduğu tutulur;
+    yalnızca son kopyası düşen kavşaklar için pencere yeniden taranır. Kayan noktalı birikmeyi önlemek için toplamlar
+    her tam turda bir kez sıfırdan hesaplanır.
+    """
+
+    def __init__(self, table: IntersectionTable, capacity: int = 180):
+        self.table = table
+        self.capacity = max(1, capacity)
+        n, m = len(table), len(STAT_FIELDS)
+
+        self.data = np.zeros((self.capacity, n), dtype=RECENT_DTYPE)
+        self.cycle_ts = np.zeros(self.capacity)
+        self.head = 0
+        self.cycles = 0
+
+        self.count = np.zeros(n, dtype=np.int64)
+        self.sums = np.zeros((n, m))
+        self.sumsq = np.zeros((n, m))
+        self.mins = np.full((n, m), np.inf)
+        self.maxs = np.full((n, m), -np.inf)
+        self.min_n = np.zeros((n, m), dtype=np.int64)
+        self.max_n = np.zeros((n, m), dtype=np.int64)
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        """Tamponda tutulan döngü sayısı"""
+        return min(self.cycles, self.capacity)
+
+    @property
+    def nbytes(self) -> int:
+        return self.data.nbytes
+
+    def push(self, batch: TrafficBatch):
+        """Bir döngünün sonuçlarını ekle; en eski döngü düşer"""
+        cells = np.zeros(len(self.table), dtype=RECENT_DTYPE)
+        rows = batch.rows
+        cells['ts'][rows] = batch.timestamp.timestamp()
+        cells['density'][rows] = batch.density
+        cells['avg_speed'][rows] = batch.avg_speed
+        cells['wait_time'][rows] = batch.wait_time
+        cells['vehicle_count'][rows] = batch.vehicle_count
+        cells['status'][rows] = batch.status_code
+        cells['valid'][rows] = True
+        new_values = _values(cells)
+
+        with self._lock:
+            # Geçersiz hücreler sıfırdır; toplamlar maskesiz güncellenebilir
+            evicted = self.data[self.head]
+            old_valid = evicted['valid'][:, None].copy()
+            old_values = _values(evicted)
+            self.count -= old_valid[:, 0]
+            self.sums -= old_values
+            self.sumsq -= old_values ** 2
+            self.min_n -= old_valid & (old_values == self.mins)
+            self.max_n -= old_valid & (old_values == self.maxs)
+
+            self.data[self.head] = cells
+            self.cycle_ts[self.head] = batch.timestamp.timestamp()
+            self.head = (self.head + 1) % self.capacity
+            self.cycles += 1
+
+            valid = cells['valid'][:, None]
+            self.count += cells['valid']
+            self.sums += new_values
+            self.sumsq += new_values ** 2
+            lower = valid & (new_values < self.mins)
+            higher = valid & (new_values > self.maxs)
+            self.min_n = np.where(lower, 1, self.min_n + (valid & (new_values == self.mins)))
+            self.max_n = np.where(higher, 1, self.max_n + (valid & (new_values == self.maxs)))
+            self.mins = np.where(lower, new_values, self.mins)
+            self.maxs = np.where(higher, new_values, self.maxs)
+
+            if self.head == 0:
+                (self.count, self.sums, self.sumsq,
+                 self.mins, self.min_n, self.maxs, self.max_n) = _summarize(self.data)
+            else:
+                # Uç değerin son kopyası düştüyse yalnızca o kavşaklar taranır
+                stale = ((self.min_n == 0) | (self.max_n == 0)).any(axis=1) & (self.count > 0)
+                if stale.any():
+                    rows = np.flatnonzero(stale)
+                    (self.mins[rows], self.min_n[rows],
+                     self.maxs[rows], self.max_n[rows]) = _extremes(self.data[:, rows])
+
+    # --- Sorgular ---
+
+    def stats(self, rows: np.ndarray = None) -> Dict[str, np.ndarray]:
+        """Tüm pencere için kavşak başına count, mean, std, min, max (O(kavşak))"""
+        if rows is None:
+            rows = slice(None)
+        with self._lock:
+            return _finish(self.count[rows].copy(), self.sums[rows].copy(), self.sumsq[rows].copy(),
+                           self.mins[rows].copy(), self.maxs[rows].copy())
+
+    def latest(self) -> Optional[np.ndarray]:
+        """Son döngünün hücreleri (kavşak sırasıyla) veya tampon boşsa None"""
+        if not self.cycles:
+            return None
+        with self._lock:
+            return self.data[(self.head - 1) % self.capacity].copy()
+
+    def window(self, seconds: float = None, now: float = None) -> np.ndarray:
+        """Son `seconds` saniyedeki döngüler, eskiden yeniye (döngü, kavşak) dizisi"""
+        with self._lock:
+            size = len(self)
+            order = np.arange(self.head - size, self.head) % self.capacity
+            if seconds is not None:
+                since = (now or time.time()) - seconds
+                order = order[self.cycle_ts[order] >= since]
+            return self.data[order]
+
+    def window_stats(self, seconds: float, now: float = None) -> Dict[str, np.ndarray]:
+        """Pencereden kısa bir süre için istatistikler (O(döngü × kavşak))"""
+        count, sums, sumsq, mins, _, maxs, _ = _summarize(self.window(seconds, now))
+        return _finish(count, sums, sumsq, mins, maxs)
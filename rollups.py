@@ -0,0 +1,259 @@
+# rollups.py
+"""Kavşak başına 1 dakika / 1 saat / 1 gün özetlerinin artımlı bakımı"""
+
+import logging
+import sqlite3
+import time
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from batch_engine import IntersectionTable
+from db_schema import ROLLUP_METRICS, ROLLUP_RESOLUTIONS, rollup_insert_sql
+
+logger = logging.getLogger(__name__)
+
+# p95 için metrik başına sabit aralıklı histogram (birleştirilebilir özet)
+HIST_BINS = 20
+HIST_RANGES = np.array([100.0, 120.0, 300.0])  # yoğunluk %, hız km/h, bekleme sn
+
+# Varsayılan saklama süreleri (saniye); None = süresiz.
+# Ham veri varsayılan olarak silinmez (RETENTION_RAW_HOURS ile açılır)
+DEFAULT_RETENTION = {"raw": None, "1m": 14 * 86400, "1h": 400 * 86400, "1d": None}
+
+# Ham veri için sorgu çözünürlüğü tahmini (analiz döngüsü aralığı)
+RAW_SAMPLE_SECONDS = 20
+
+
+class RollupLevel:
+    """Tek bir çözünürlükteki açık kovaların bellek içi durumu"""
+
+    def __init__(self, name: str, seconds: int, size: int):
+        self.name = name
+        self.seconds = seconds
+        self.sql = rollup_insert_sql(name)
+        # 1 dakikalık kovada örnek sayısı küçüktür; histogram 16 bitte tutulur
+        self.hist_dtype = np.dtype('<u2') if seconds <= 60 else np.dtype('<u4')
+
+        m = len(ROLLUP_METRICS)
+        self.bucket = np.full(size, -1, dtype=np.int64)
+        self.count = np.zeros(size, dtype=np.int64)
+        self.sums = np.zeros((size, m))
+        self.mins = np.full((size, m), np.inf)
+        self.maxs = np.full((size, m), -np.inf)
+        self.hist = np.zeros((size, m, HIST_BINS), dtype=np.int64)
+        self.status = np.zeros((size, 3), dtype=np.int64)
+
+    def reset(self, rows: np.ndarray, bucket: np.ndarray):
+        self.bucket[rows] = bucket
+        self.count[rows] = 0
+        self.sums[rows] = 0
+        self.mins[rows] = np.inf
+        self.maxs[rows] = -np.inf
+        self.hist[rows] = 0
+        self.status[rows] = 0
+
+    def p95(self, rows: np.ndarray) -> np.ndarray:
+        """Histogramdan yaklaşık p95 (kova üst sınırı, gözlenen maksimumla kırpılır)"""
+        cum = self.hist[rows].cumsum(axis=-1)
+        target = 0.95 * self.count[rows][:, None, None]
+        idx = np.argmax(cum >= target, axis=-1)
+        upper = (idx + 1) * (HIST_RANGES / HIST_BINS)
+        return np.minimum(upper, self.maxs[rows])
+
+    def records(self, rows: np.ndarray, ids: np.ndarray) -> List[Tuple]:
+        """Satırların veritabanı kayıtları"""
+        rows = rows[self.count[rows] > 0]
+        if not len(rows):
+            return []
+
+        n = self.count[rows]
+        mean = self.sums[rows] / n[:, None]
+        # Sütun sırası: metrik başına mean, min, max, p95
+        metrics = np.stack([mean, self.mins[rows], self.maxs[rows], self.p95(rows)], axis=-1)
+        metrics = np.round(metrics.reshape(len(rows), -1), 2)
+        hist = self.hist[rows].astype(self.hist_dtype)
+
+        return [
+            (iid, bucket, count, *values, *status, blob.tobytes())
+            for iid, bucket, count, values, status, blob in zip(
+                ids[rows].tolist(), self.bucket[rows].tolist(), n.tolist(),
+                metrics.tolist(), self.status[rows].tolist(), hist
+            )
+        ]
+
+
+class TrafficRollups:
+    """Her kayıt partisinde özet kovalarını günceller ve yazılacak satırları üretir"""
+
+    def __init__(self, table: IntersectionTable, resolutions: Dict[str, int] = None):
+        self.table = table
+        self.levels = [
+            RollupLevel(name, seconds, len(table))
+            for name, seconds in (resolutions or ROLLUP_RESOLUTIONS).items()
+        ]
+        # Kavşak başına son işlenen ts: aynı (kavşak, ts) ikinci kez sayılmaz
+        self.last_ts = np.full(len(table), -1, dtype=np.int64)
+        # Atlanan örnekler: aynı saniyede yeniden yazım ve sırasız (daha eski) örnek
+        self.stats = {"same_second": 0, "out_of_order": 0}
+
+    def load_open_buckets(self, conn: sqlite3.Connection, now: int = None):
+        """Yeniden başlatmada, henüz kapanmamış kovaları veritabanından geri yükle"""
+        now = int(now or time.time())
+        m = len(ROLLUP_METRICS)
+        since = min(now - now % level.seconds for level in self.levels)
+        for intersection_id, ts in conn.execute(
+                "SELECT intersection_id, MAX(ts) FROM traffic_logs WHERE ts >= ? GROUP BY intersection_id",
+                (since,)):
+            row = self.table.row_of(intersection_id)
+            if row is not None:
+                self.last_ts[row] = max(self.last_ts[row], ts)
+
+        for level in self.levels:
+            bucket = now - now % level.seconds
+            cursor = conn.execute(
+                f"SELECT intersection_id, n, {', '.join(f'{x}_mean, {x}_min, {x}_max' for x in ROLLUP_METRICS)}, "
+                f"normal_count, moderate_count, critical_count, hist "
+                f"FROM traffic_rollup_{level.name} WHERE bucket = ?", (bucket,)
+            )
+            for record in cursor:
+                row = self.table.row_of(record[0])
+                if row is None:
+                    continue
+                n = record[1]
+                stats = np.array(record[2:2 + 3 * m], dtype=np.float64).reshape(m, 3)
+                level.bucket[row] = bucket
+                level.count[row] = n
+                level.sums[row] = stats[:, 0] * n
+                level.mins[row] = stats[:, 1]
+                level.maxs[row] = stats[:, 2]
+                level.status[row] = record[2 + 3 * m:5 + 3 * m]
+                if record[-1]:
+                    level.hist[row] = np.frombuffer(record[-1], dtype=level.hist_dtype).reshape(m, HIST_BINS)
+
+    def update(self, rows: np.ndarray, ts: np.ndarray, values: np.ndarray,
+               status_code: np.ndarray, emit_open: bool = True) -> List[Tuple[str, List[Tuple]]]:
+        """Yeni örnekleri ekle; `(sql, kayıtlar)` listesi döndür.
+
+        `rows` bir çağrı içinde tekrar etmemelidir. Kavşağın son işlenen ts'inden
+        yeni olmayan örnekler (aynı saniyede yeniden yazım, tekrar teslim) atlanır ve
+        `stats`ta sayılır; ham tabloda aynı saniyenin en yeni okuması kalır. `emit_open` açıkken dokunulan
+        kovaların güncel hali, kapalıyken yalnızca kapanan kovalar döner.
+        """
+        fresh = ts > self.last_ts[rows]
+        if not fresh.all():
+            same = int((ts == self.last_ts[rows]).sum())
+            self.stats["same_second"] += same
+            self.stats["out_of_order"] += int((~fresh).sum()) - same
+            rows, ts, values, status_code = rows[fresh], ts[fresh], values[fresh], status_code[fresh]
+        self.last_ts[rows] = ts
+
+        writes = []
+        bins = np.minimum((values / HIST_RANGES * HIST_BINS).astype(np.int64), HIST_BINS - 1)
+        bins = np.maximum(bins, 0)
+
+        for level in self.levels:
+            bucket = ts - ts % level.seconds
+            stale = level.bucket[rows] != bucket
+            records = []
+            if stale.any():
+                if not emit_open:
+                    records = level.records(rows[stale], self.table.ids)
+                level.reset(rows[stale], bucket[stale])
+
+            level.count[rows] += 1
+            level.sums[rows] += values
+            level.mins[rows] = np.minimum(level.mins[rows], values)
+            level.maxs[rows] = np.maximum(level.maxs[rows], values)
+            for metric in range(values.shape[1]):
+                level.hist[rows, metric, bins[:, metric]] += 1
+            level.status[rows, status_code] += 1
+
+            if emit_open:
+                records = level.records(rows, self.table.ids)
+            if records:
+                writes.append((level.sql, records))
+        return writes
+
+    def flush_open(self) -> List[Tuple[str, List[Tuple]]]:
+        """Tüm açık kovaların kayıtları"""
+        all_rows = np.arange(len(self.table))
+        return [(level.sql, level.records(all_rows, self.table.ids)) for level in self.levels]
+
+    def rebuild_from_raw(self, conn: sqlite3.Connection, chunk_rows: int = 200_000,
+                         start: int = None, end: int = None):
+        """Özet tablolarını mevcut traffic_logs satırlarından yeniden oluştur.
+
+        `start`/`end` verilirse yalnızca [start, end) aralığına dokunan kovalar silinip
+        yeniden hesaplanır; aralık en kaba çözünürlüğün sınırlarına genişletilir, böylece
+        her çözünürlükte yeniden yazılan kovalar tamdır. Yeni bir nesnede çağrılmalıdır.
+        """
+        where, params = "", ()
+        if start is not None and end is not None:
+            widest = max(level.seconds for level in self.levels)
+            start, end = start - start % widest, end + (-end) % widest
+            where, params = "WHERE ts >= ? AND ts < ?", (start, end)
+        cursor = conn.execute(f'''
+            SELECT intersection_id, ts, density, avg_speed, wait_time, status
+            FROM traffic_logs {where} ORDER BY ts
+        ''', params)
+        total = 0
+        conn.execute("BEGIN")
+        if params:
+            for level in self.levels:
+                conn.execute(f"DELETE FROM traffic_rollup_{level.name} WHERE bucket >= ? AND bucket < ?", params)
+        while True:
+            chunk = cursor.fetchmany(chunk_rows)
+            if not chunk:
+                break
+            data = np.array(chunk, dtype=np.float64)
+            rows = self.table.rows_of(data[:, 0].astype(np.int64))
+            known = rows >= 0
+            data, rows = data[known], rows[known]
+
+            # Aynı kavşağın k. örnekleri aynı çağrıda işlenir (çağrı içinde tekrar yok)
+            order = np.lexsort((data[:, 1], rows))
+            rows, data = rows[order], data[order]
+            starts = np.r_[0, np.flatnonzero(np.diff(rows)) + 1]
+            rank = np.arange(len(rows)) - np.repeat(starts, np.diff(np.r_[starts, len(rows)]))
+            for k in range(int(rank.max()) + 1 if len(rank) else 0):
+                sel = rank == k
+                for sql, records in self.update(rows[sel], data[sel, 1].astype(np.int64),
+                                                data[sel, 2:5], data[sel, 5].astype(np.int64),
+                                                emit_open=False):
+                    conn.executemany(sql, records)
+            total += len(rows)
+
+        for sql, records in self.flush_open():
+            conn.executemany(sql, records)
+        conn.execute("COMMIT")
+        logger.info(f"📊 Özet tabloları {total} ham satırdan yeniden oluşturuldu")
+        return total
+
+
+def retention_statements(now: int, retention: Dict[str, Optional[int]] = None) -> List[Tuple[str, List[Tuple]]]:
+    """Saklama süresi dolan ham ve özet satırları için silme ifadeleri"""
+    retention = retention or DEFAULT_RETENTION
+    statements = []
+    if retention.get("raw"):
+        statements.append(("DELETE FROM traffic_logs WHERE ts < ?", [(now - retention["raw"],)]))
+    for name in ROLLUP_RESOLUTIONS:
+        if retention.get(name):
+            statements.append((f"DELETE FROM traffic_rollup_{name} WHERE bucket < ?",
+                               [(now - retention[name],)]))
+    return statements
+
+
+def choose_resolution(window_secs: int, max_points: int = 1000,
+                      retention: Dict[str, Optional[int]] = None) -> str:
+    """Pencereyi saklama süresi içinde ve kavşak başına nokta bütçesini aşmadan karşılayan çözünürlük.
+
+    Ham veriden 1 güne doğru denenir; hiçbiri bütçeye sığmazsa en kaba çözünürlük döner.
+    """
+    retention = retention or DEFAULT_RETENTION
+    candidates = [("raw", RAW_SAMPLE_SECONDS), *ROLLUP_RESOLUTIONS.items()]
+    for name, seconds in candidates:
+        covered = retention.get(name) is None or window_secs <= retention[name]
+        if covered and window_secs / seconds <= max_points:
+            return name
+    return candidates[-1][0]
@@ -0,0 +1,371 @@
+# routing.py
+"""Kavşak grafı üzerinde canlı ağırlıklı rota motoru (A*/Dijkstra, artımlı güncellenen en kısa yol ağaçları)"""
+
+import heapq
+import json
+import logging
+import math
+import threading
+from array import array
+from collections import Counter, OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, urlparse
+
+import numpy as np
+
+from batch_engine import STATUS_CODES, TrafficBatch
+from spatial_index import SpatialIndex
+
+logger = logging.getLogger(__name__)
+
+# Ağırlık profilleri: en hızlı ve kritik kavşaklardan kaçınan
+ROUTING_PROFILES = ("fastest", "avoid_critical")
+
+DEFAULT_SPEED_KMH = 40.0
+MIN_SPEED_KMH = 5.0
+INF = math.inf
+
+
+class _PathTree:
+    """Tek kaynaktan en kısa yol ağacı (kompakt diziler)"""
+
+    __slots__ = ("source", "dist", "parent")
+
+    def __init__(self, source: int, n: int):
+        self.source = source
+        self.dist = array('d', [INF]) * n
+        self.parent = array('q', [-1]) * n
+
+
+class RoutingEngine:
+    """Kavşakların k-en-yakın-komşu yol grafı; kenar ağırlıkları döngü verisinden saniye cinsinden.
+
+    u→v kenarının süresi = uzunluk / (u ve v hızlarının harmonik ortalaması)
+    + v'deki bekleme süresi (+ kaçınma profilinde kritik v için ceza).
+    Sık sorgulanan kaynakların en kısa yol ağaçları önbellekte tutulur ve her
+    döngüde yalnızca `tolerance` oranından fazla değişen kenarlar için onarılır
+    (artan ağaç kenarlarının alt ağacı yeniden bağlanır, azalanlar gevşetilir).
+    """
+
+    def __init__(self, index: SpatialIndex, neighbors: int = 4, detour: float = 1.3,
+                 critical_penalty: float = 600.0, tolerance: float = 0.05,
+                 cache_size: int = 32, popular_after: int = 2, max_repair_fraction: float = 0.25):
+        self.index = index
+        self.table = index.table
+        self.detour = detour
+        self.critical_penalty = critical_penalty
+        self.tolerance = tolerance
+        self.cache_size = cache_size
+        self.popular_after = popular_after
+        self.max_repair_fraction = max_repair_fraction
+        self._lock = threading.Lock()
+
+        self._build_graph(neighbors)
+        n = len(self.table)
+        self.speed = np.full(n, DEFAULT_SPEED_KMH)
+        self.wait = np.zeros(n)
+        self.critical = np.zeros(n, dtype=bool)
+        self.weights = {profile: self._edge_weights(profile).tolist() for profile in ROUTING_PROFILES}
+
+        self.trees: "OrderedDict[Tuple[str, int], _PathTree]" = OrderedDict()
+        self.source_hits = Counter()
+        self.stats = {"queries": 0, "cache_hits": 0, "trees_built": 0, "repairs": 0,
+                      "full_rebuilds": 0, "changed_edges": 0}
+
+    # --- Graf ---
+
+    def _build_graph(self, neighbors: int):
+        """Her kavşağı en yakın `neighbors` kavşağa iki yönlü bağla (CSR)"""
+        n = len(self.table)
+        pairs = []
+        for row, (lat, lng) in enumerate(zip(self.table.lat.tolist(), self.table.lng.tolist())):
+            rows, _ = self.index.nearest(lat, lng, neighbors + 1)
+            pairs.extend((row, other) for other in rows.tolist() if other != row)
+        pairs = np.array(pairs, dtype=np.int64).reshape(-1, 2)
+        pairs = np.unique(np.concatenate([pairs, pairs[:, ::-1]]), axis=0)
+
+        self.src, self.dst = pairs[:, 0], pairs[:, 1]
+        self.indptr = np.searchsorted(self.src, np.arange(n + 1))
+        # Ters kenar: (v, u) satırı; graf simetrik olduğundan her kenarın tersi vardır
+        self.reverse = np.searchsorted(self.src * n + self.dst, self.dst * n + self.src)
+        self.length_m = np.hypot(self.index.x[self.src] - self.index.x[self.dst],
+                                 self.index.y[self.src] - self.index.y[self.dst]) * self.detour
+
+        self._ptr = self.indptr.tolist()
+        self._src = self.src.tolist()
+        self._dst = self.dst.tolist()
+        self._rev = self.reverse.tolist()
+        logger.info(f"🛣️ Rota grafı: {n} kavşak, {len(self.src)} yönlü kenar")
+
+    def _edge_weights(self, profile: str) -> np.ndarray:
+        speed = np.maximum(self.speed, MIN_SPEED_KMH) / 3.6
+        travel = self.length_m * (1 / speed[self.src] + 1 / speed[self.dst]) / 2
+        weights = travel + self.wait[self.dst]
+        if profile == "avoid_critical":
+            weights = weights + self.critical[self.dst] * self.critical_penalty
+        return weights
+
+    # --- Canlı ağırlıklar ---
+
+    def update(self, batch: TrafficBatch) -> int:
+        """Döngü sonuçlarıyla ağırlıkları güncelle ve önbellekteki ağaçları onar; değişen kenar sayısı"""
+        changed_total = 0
+        with self._lock:
+            self.speed[batch.rows] = batch.avg_speed
+            self.wait[batch.rows] = batch.wait_time
+            self.critical[batch.rows] = batch.status_code == STATUS_CODES['critical']
+
+            for profile in ROUTING_PROFILES:
+                current = np.array(self.weights[profile])
+                new = self._edge_weights(profile)
+                # Küçük değişimler uygulanmaz; ağaçlar uygulanan ağırlıklarla tutarlı kalır
+                changed = np.flatnonzero(np.abs(new - current) > self.tolerance * current)
+                if not len(changed):
+                    continue
+                weights = self.weights[profile]
+                old = {e: weights[e] for e in changed.tolist()}
+                for e, w in zip(changed.tolist(), new[changed].tolist()):
+                    weights[e] = w
+                changed_total += len(changed)
+
+                for key, tree in self.trees.items():
+                    if key[0] == profile:
+                        self._repair(tree, weights, old)
+            self.stats["changed_edges"] += changed_total
+        return changed_total
+
+    # --- En kısa yollar ---
+
+    def _relax(self, tree: _PathTree, weights: List[float], heap: list):
+        """Yığındaki düğümlerden Dijkstra gevşetmesi (tembel silme)"""
+        dist, parent, ptr, dst = tree.dist, tree.parent, self._ptr, self._dst
+        while heap:
+            d, u = heapq.heappop(heap)
+            if d > dist[u]:
+                continue
+            for e in range(ptr[u], ptr[u + 1]):
+                v = dst[e]
+                nd = d + weights[e]
+                if nd < dist[v]:
+                    dist[v] = nd
+                    parent[v] = u
+                    heapq.heappush(heap, (nd, v))
+
+    def _build_tree(self, source: int, weights: List[float]) -> _PathTree:
+        tree = _PathTree(source, len(self.table))
+        tree.dist[source] = 0.0
+        self._relax(tree, weights, [(0.0, source)])
+        self.stats["trees_built"] += 1
+        return tree
+
+    def _repair(self, tree: _PathTree, weights: List[float], old: Dict[int, float]):
+        """Değişen kenarlar için ağacı yerinde onar; etki çok büyükse yeniden kur"""
+        dist, parent, ptr, dst, rev = tree.dist, tree.parent, self._ptr, self._dst, self._rev
+        src = self._src
+
+        # Artan ağaç kenarları: hedefin alt ağacı geçersizleşir
+        roots = [dst[e] for e, w in old.items() if weights[e] > w and parent[dst[e]] == src[e]]
+        affected = set(roots)
+        stack = list(roots)
+        while stack:
+            u = stack.pop()
+            for e in range(ptr[u], ptr[u + 1]):
+                v = dst[e]
+                if parent[v] == u and v not in affected:
+                    affected.add(v)
+                    stack.append(v)
+        if len(affected) > self.max_repair_fraction * len(dist):
+            fresh = self._build_tree(tree.source, weights)
+            tree.dist, tree.parent = fresh.dist, fresh.parent
+            self.stats["full_rebuilds"] += 1
+            return
+
+        for v in affected:
+            dist[v] = INF
+            parent[v] = -1
+        heap = []
+        # Etkilenen düğümler etkilenmemiş komşulardan yeniden bağlanır
+        for v in affected:
+            for e in range(ptr[v], ptr[v + 1]):
+                u, incoming = dst[e], rev[e]
+                nd = dist[u] + weights[incoming]
+                if nd < dist[v]:
+                    dist[v] = nd
+                    parent[v] = u
+            if dist[v] < INF:
+                heap.append((dist[v], v))
+        # Azalan kenarlar yeni kısa yollar açabilir
+        for e, w in old.items():
+            u, v = src[e], dst[e]
+            nd = dist[u] + weights[e]
+            if weights[e] < w and nd < dist[v]:
+                dist[v] = nd
+                parent[v] = u
+                heap.append((nd, v))
+        heapq.heapify(heap)
+        self._relax(tree, weights, heap)
+        self.stats["repairs"] += 1
+
+    def _astar(self, source: int, target: int, weights: List[float]) -> Optional[List[int]]:
+        """Tek hedefli A*; sezgisel = kuş uçuşu mesafe / en yüksek hız (kabul edilebilir)"""
+        max_speed = max(float(self.speed.max()), MIN_SPEED_KMH) / 3.6
+        x, y = self.index.x, self.index.y
+        tx, ty = float(x[target]), float(y[target])
+        ptr, dst = self._ptr, self._dst
+
+        def h(v: int) -> float:
+            return math.hypot(float(x[v]) - tx, float(y[v]) - ty) / max_speed
+
+        dist = {source: 0.0}
+        parent = {source: -1}
+        heap = [(h(source), source)]
+        closed = set()
+        while heap:
+            _, u = heapq.heappop(heap)
+            if u == target:
+                return self._walk(parent.__getitem__, target)
+            if u in closed:
+                continue
+            closed.add(u)
+            for e in range(ptr[u], ptr[u + 1]):
+                v = dst[e]
+                nd = dist[u] + weights[e]
+                if nd < dist.get(v, INF):
+                    dist[v] = nd
+                    parent[v] = u
+                    heapq.heappush(heap, (nd + h(v), v))
+        return None
+
+    @staticmethod
+    def _walk(parent_of, target: int) -> List[int]:
+        path = [target]
+        while parent_of(path[-1]) != -1:
+            path.append(parent_of(path[-1]))
+        return path[::-1]
+
+    def shortest_path(self, source: int, target: int, profile: str = "fastest") -> Tuple[Optional[List[int]], bool]:
+        """Satırlar arası en kısa yol ve önbellekten gelip gelmediği"""
+        if profile not in ROUTING_PROFILES:
+            raise ValueError(f"Bilinmeyen rota profili: {profile}")
+        with self._lock:
+            self.stats["queries"] += 1
+            weights = self.weights[profile]
+            key = (profile, source)
+            tree = self.trees.get(key)
+            if tree is not None:
+                self.trees.move_to_end(key)
+                self.stats["cache_hits"] += 1
+                if tree.dist[target] == INF:
+                    return None, True
+                return self._walk(tree.parent.__getitem__, target), True
+
+            self.source_hits[key] += 1
+            if self.source_hits[key] < self.popular_after:
+                return self._astar(source, target, weights), False
+
+            # Popüler kaynak: tam ağaç kurulur ve sonraki döngülerde artımlı onarılır
+            tree = self._build_tree(source, weights)
+            self.trees[key] = tree
+            if len(self.trees) > self.cache_size:
+                self.trees.popitem(last=False)
+            if tree.dist[target] == INF:
+                return None, False
+            return self._walk(tree.parent.__getitem__, target), False
+
+    def route(self, origin: Tuple[float, float], destination: Tuple[float, float],
+              avoid_critical: bool = False) -> Optional[Dict]:
+        """İki nokta arasında rota: en yakın kavşaklara bağlanır; ulaşılamıyorsa None"""
+        (source,), _ = self.index.nearest(*origin, 1)
+        (target,), _ = self.index.nearest(*destination, 1)
+        source, target = int(source), int(target)
+        profile = "avoid_critical" if avoid_critical else "fastest"
+        path, cached = self.shortest_path(source, target, profile)
+        if path is None:
+            return None
+
+        edges = [int(self.indptr[u] + np.searchsorted(self.dst[self.indptr[u]:self.indptr[u + 1]], v))
+                 for u, v in zip(path[:-1], path[1:])]
+        with self._lock:
+            fastest = self.weights["fastest"]
+            duration = sum(fastest[e] for e in edges)
+            critical = [row for row in path if self.critical[row]]
+        distance = float(self.length_m[edges].sum()) if edges else 0.0
+
+        def point(row: int) -> Dict:
+            return {'id': int(self.table.ids[row]), 'name': self.table.names[row],
+                    'lat': float(self.table.lat[row]), 'lng': float(self.table.lng[row])}
+
+        return {
+            'profile': profile,
+            'path': [point(row) for row in path],
+            'distanceKm': round(distance / 1000, 2),
+            'estimatedDuration': round(duration / 60, 1),
+            'criticalOnPath': [point(row) for row in critical],
+            'cached': cached
+        }
+
+
+class RoutingServer:
+    """Node API'nin çağırdığı yerel rota HTTP uç noktası (GET /route, GET /health)"""
+
+    def __init__(self, engine: RoutingEngine, host: str = "127.0.0.1", port: int = 3002):
+        self.engine = engine
+        self.host = host
+        self.port = port
+        self._server = None
+
+    @staticmethod
+    def _point(value: str) -> Tuple[float, float]:
+        lat, lng = (float(part) for part in value.split(','))
+        return lat, lng
+
+    def _make_handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+                url = urlparse(self.path)
+                query = parse_qs(url.query)
+                status, body = 200, None
+                if url.path == "/health":
+                    body = {'success': True, 'data': dict(server.engine.stats)}
+                elif url.path == "/route":
+                    try:
+                        origin = server._point(query['from'][0])
+                        destination = server._point(query['to'][0])
+                    except (KeyError, ValueError):
+                        status, body = 400, {'success': False, 'message': "from ve to 'enlem,boylam' olmalı"}
+                    else:
+                        avoid = query.get('avoidCritical', ['1'])[0] not in ('0', 'false')
+                        route = server.engine.route(origin, destination, avoid)
+                        body = {'success': route is not None, 'data': route or 'Rota bulunamadı'}
+                else:
+                    status, body = 404, {'success': False, 'message': 'Endpoint bulunamadı'}
+
+                payload = json.dumps(body, ensure_ascii=False).encode('utf-8')
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json; charset=utf-8")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def start(self) -> "RoutingServer":
+        self._server = ThreadingHTTPServer((self.host, self.port), self._make_handler())
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, name="routing-server", daemon=True).start()
+        logger.info(f"🛣️ Rota servisi: http://{self.host}:{self._server.server_address[1]}/route")
+        return self
+
+    def stop(self):
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
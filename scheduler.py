@@ -0,0 +1,195 @@
+# scheduler.py
+"""Kaymayan (sabit oranlı) analiz döngüsü zamanlayıcısı ve birleştirilen anlık çalıştırmalar"""
+
+import asyncio
+import logging
+import math
+import threading
+import time
+from typing import Awaitable, Callable, Dict, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class CycleScheduler:
+    """Sabit tik aralığıyla sınıf başına farklı sıklıkta döngü çalıştırır.
+
+    Tik zamanları başlangıca göre hesaplanır, döngü süresi periyodu kaydırmaz.
+    Döngü bir veya daha fazla tiki aşarsa kaçırılan tikler atlanır (yığılma olmaz);
+    atlanan tikte sırası gelen sınıflar bir sonraki tikte çalışır.
+    Anlık çalıştırma istekleri tek bir bekleyen çalıştırmada birleştirilir ve
+    her zaman zamanlayıcı thread'inde, döngülerle sırayla yürütülür.
+    """
+
+    def __init__(self, run_cycle: Callable[[Tuple[str, ...], str], None],
+                 intervals: Dict[str, float], clock: Callable[[], float] = time.monotonic):
+        if not intervals:
+            raise ValueError("En az bir sınıf aralığı gerekli")
+        self.run_cycle = run_cycle
+        self.clock = clock
+        # Tik aralığı en sık sınıfın aralığıdır; diğerleri bunun katlarına yuvarlanır
+        self.tick_interval = min(intervals.values())
+        self.periods = {name: max(1, round(seconds / self.tick_interval)) for name, seconds in intervals.items()}
+        self.classes = tuple(intervals)
+
+        self._last_tick = {name: -math.inf for name in self.classes}
+        self._pending = threading.Event()
+        self._wakeup = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        # run_async çalışırken (döngü, asyncio.Event); başka thread'lerden uyandırmak için
+        self._async_wakeup = None
+
+        self.stats = {
+            "ticks": 0, "runs": 0, "on_demand": 0, "coalesced": 0,
+            "overruns": 0, "skipped_ticks": 0, "errors": 0,
+            "last_lag": 0.0, "max_lag": 0.0, "last_duration": 0.0, "max_duration": 0.0,
+        }
+        self._stats_lock = threading.Lock()
+
+    def _count(self, key: str, n: int = 1):
+        with self._stats_lock:
+            self.stats[key] += n
+
+    def due_classes(self, tick: int) -> Tuple[str, ...]:
+        """`tick` anında sırası gelen sınıflar"""
+        return tuple(name for name in self.classes if tick - self._last_tick[name] >= self.periods[name])
+
+    def request_run(self) -> bool:
+        """Anlık tam çalıştırma iste; zaten bekleyen bir istek varsa onunla birleştir"""
+        with self._stats_lock:
+            if self._pending.is_set():
+                self.stats["coalesced"] += 1
+                return False
+            self._pending.set()
+        self._notify()
+        return True
+
+    def _notify(self):
+        self._wakeup.set()
+        if self._async_wakeup is not None:
+            loop, event = self._async_wakeup
+            loop.call_soon_threadsafe(event.set)
+
+    def _take_pending(self) -> bool:
+        if not self._pending.is_set():
+            return False
+        self._pending.clear()
+        self._count("on_demand")
+        return True
+
+    def _select(self, tick: int, lag: float) -> Tuple[Tuple[str, ...], str]:
+        """Süresi gelen tikte çalışacak sınıflar; bekleyen anlık istek bu tike katılır"""
+        if self._take_pending():
+            classes, reason = self.classes, "on_demand"
+        else:
+            classes, reason = self.due_classes(tick), "tick"
+        for name in classes:
+            self._last_tick[name] = tick
+
+        with self._stats_lock:
+            self.stats["ticks"] += 1
+            self.stats["last_lag"] = lag
+            self.stats["max_lag"] = max(self.stats["max_lag"], lag)
+        return classes, reason
+
+    def _advance(self, tick: int, start: float) -> int:
+        """Sonraki tik; aşımda geçmişte kalan tikler atlanır"""
+        next_tick = tick + 1
+        current = math.floor((self.clock() - start) / self.tick_interval) + 1
+        if current > next_tick:
+            skipped = current - next_tick
+            self._count("overruns")
+            self._count("skipped_ticks", skipped)
+            logger.warning(f"⏱️ Analiz döngüsü {self.tick_interval:g} sn aralığı aştı, {skipped} tik atlandı")
+            next_tick = current
+        return next_tick
+
+    def _record_run(self, started: float):
+        duration = self.clock() - started
+        with self._stats_lock:
+            self.stats["runs"] += 1
+            self.stats["last_duration"] = duration
+            self.stats["max_duration"] = max(self.stats["max_duration"], duration)
+
+    # --- Döngü ---
+
+    def run_forever(self):
+        """Zamanlayıcıyı çağıran thread'de çalıştır (stop() çağrılana kadar)"""
+        start = self.clock()
+        tick = 0
+        while not self._stop.is_set():
+            wait = start + tick * self.tick_interval - self.clock()
+            if wait > 0:
+                # Tikler arasında gelen istek hemen, tek seferde çalıştırılır
+                if self._take_pending():
+                    self._run(self.classes, "on_demand")
+                    continue
+                self._wakeup.wait(wait)
+                self._wakeup.clear()
+                continue
+
+            classes, reason = self._select(tick, -wait)
+            if classes:
+                self._run(classes, reason)
+            tick = self._advance(tick, start)
+
+    def _run(self, classes: Tuple[str, ...], reason: str):
+        started = self.clock()
+        try:
+            self.run_cycle(classes, reason)
+        except Exception as e:
+            self._count("errors")
+            logger.error(f"Analiz döngüsü hatası: {e}")
+        self._record_run(started)
+
+    async def run_async(self, run_cycle: Callable[[Tuple[str, ...], str], Awaitable[None]]):
+        """Aynı tik kurallarıyla asyncio döngüsünde çalıştır; `run_cycle` bir coroutine fonksiyonudur"""
+        wakeup = asyncio.Event()
+        self._async_wakeup = (asyncio.get_running_loop(), wakeup)
+        start = self.clock()
+        tick = 0
+        try:
+            while not self._stop.is_set():
+                wait = start + tick * self.tick_interval - self.clock()
+                if wait > 0:
+                    if self._take_pending():
+                        await self._run_async(run_cycle, self.classes, "on_demand")
+                        continue
+                    try:
+                        await asyncio.wait_for(wakeup.wait(), wait)
+                    except asyncio.TimeoutError:
+                        pass
+                    wakeup.clear()
+                    continue
+
+                classes, reason = self._select(tick, -wait)
+                if classes:
+                    await self._run_async(run_cycle, classes, reason)
+                tick = self._advance(tick, start)
+        finally:
+            self._async_wakeup = None
+
+    async def _run_async(self, run_cycle, classes: Tuple[str, ...], reason: str):
+        started = self.clock()
+        try:
+            await run_cycle(classes, reason)
+        except Exception as e:
+            self._count("errors")
+            logger.error(f"Analiz döngüsü hatası: {e}")
+        self._record_run(started)
+
+    def start(self) -> threading.Thread:
+        """Zamanlayıcıyı arka plan thread'inde başlat"""
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self.run_forever, name="cycle-scheduler", daemon=True)
+            self._thread.start()
+        return self._thread
+
+    def stop(self, timeout: float = None):
+        """Devam eden döngünün bitmesini bekleyip zamanlayıcıyı durdur"""
+        self._stop.set()
+        self._notify()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join(timeout)
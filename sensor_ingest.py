@@ -0,0 +1,193 @@
+# sensor_ingest.py
+"""MQTT sensör mesajlarının sınırlı kuyruk ve mikro partilerle alınması ve döngüye katılması"""
+
+import json
+import logging
+import queue
+import threading
+import time
+from typing import Dict, Optional
+
+import numpy as np
+
+from batch_engine import IntersectionTable, TrafficBatch
+
+logger = logging.getLogger(__name__)
+
+# server.js /api/iot/sensor/data -> traffic/sensors/{sensorId}/data
+SENSOR_TOPIC = "traffic/sensors/+/data"
+
+# Sensör alanı -> (iç alan, alt sınır, üst sınır); farklı yazımlar kabul edilir
+SENSOR_FIELDS = {
+    'density': ('density', 0.0, 100.0),
+    'avgSpeed': ('avg_speed', 0.0, 200.0),
+    'speed': ('avg_speed', 0.0, 200.0),
+    'waitTime': ('wait_time', 0.0, 3600.0),
+    'vehicleCount': ('vehicle_count', 0.0, 100000.0),
+}
+READING_FIELDS = ('density', 'avg_speed', 'wait_time', 'vehicle_count')
+
+
+class SensorIngestor:
+    """MQTT geri çağrısı ham mesajı yalnızca kuyruğa koyar; çözme ve doğrulama arka plan
+    thread'inde mikro partiler halinde yapılır.
+
+    Kuyruk doluyken awscrt olay döngüsü bekletilmez: yeni mesaj atılır ve sayılır
+    (açık geri basınç). Her kavşak için alan başına en son okuma ve zamanı tutulur;
+    `max_age` saniyeden eski okumalar döngüye katılmaz.
+    """
+
+    def __init__(self, table: IntersectionTable, maxsize: int = 10000, batch_size: int = 500,
+                 max_age: float = 120.0):
+        self.table = table
+        self.batch_size = batch_size
+        self.max_age = max_age
+        self.queue: "queue.Queue" = queue.Queue(maxsize)
+
+        n = len(table)
+        self.values = np.full((n, len(READING_FIELDS)), np.nan)
+        self.updated = np.zeros((n, len(READING_FIELDS)))
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+        self.stats = {"received": 0, "accepted": 0, "dropped": 0, "invalid": 0,
+                      "unknown_intersection": 0, "batches": 0, "applied": 0, "max_queue": 0}
+        self._stats_lock = threading.Lock()
+
+    def _count(self, key: str, n: int = 1):
+        with self._stats_lock:
+            self.stats[key] += n
+
+    # --- Alım ---
+
+    def on_message(self, topic, payload, dup, qos, retain, **kwargs):
+        """MQTT geri çağrısı: bloklamadan kuyruğa koy, doluysa at"""
+        try:
+            self.queue.put_nowait((payload, time.time()))
+        except queue.Full:
+            self._count("dropped")
+
+    def offer(self, payload: bytes, received: float = None) -> bool:
+        """Geri çağrı dışından (test, yeniden oynatma) mesaj ekle; atıldıysa False"""
+        try:
+            self.queue.put_nowait((payload, received or time.time()))
+            return True
+        except queue.Full:
+            self._count("dropped")
+            return False
+
+    def _drain(self, timeout: float = 0.1) -> list:
+        """Bir mikro parti: ilk mesajı bekle, sonra kuyrukta olanları bloklamadan al"""
+        try:
+            items = [self.queue.get(timeout=timeout)]
+        except queue.Empty:
+            return []
+        depth = self.queue.qsize()
+        while len(items) < self.batch_size:
+            try:
+                items.append(self.queue.get_nowait())
+            except queue.Empty:
+                break
+        with self._stats_lock:
+            self.stats["max_queue"] = max(self.stats["max_queue"], depth + 1)
+        return items
+
+    def process_batch(self, items: list) -> int:
+        """Mesajları çöz, doğrula ve kavşak başına en son okumaları güncelle; kabul edilen sayısı"""
+        latest: Dict[int, tuple] = {}
+        invalid = unknown = 0
+        for payload, received in items:
+            try:
+                message = json.loads(payload)
+                data = message['data']
+                if not isinstance(data, dict):
+                    raise TypeError("data bir nesne olmalı")
+                row = self.table.row_of(int(message['intersectionId']))
+            except (ValueError, KeyError, TypeError):
+                invalid += 1
+                continue
+            if row is None:
+                unknown += 1
+                continue
+
+            reading = [np.nan] * len(READING_FIELDS)
+            valid = False
+            for key, value in data.items():
+                spec = SENSOR_FIELDS.get(key)
+                if spec is None or isinstance(value, bool) or not isinstance(value, (int, float)):
+                    continue
+                name, low, high = spec
+                if low <= value <= high:
+                    reading[READING_FIELDS.index(name)] = float(value)
+                    valid = True
+            if not valid:
+                invalid += 1
+                continue
+
+            # Aynı partide aynı kavşağa gelen okumalar alan bazında birleşir; yenisi kazanır
+            previous = latest.get(row)
+            if previous is not None:
+                reading = [new if new == new else old for new, old in zip(reading, previous[0])]
+            latest[row] = (reading, received)
+
+        if latest:
+            rows = np.fromiter(latest, dtype=np.int64, count=len(latest))
+            readings = np.array([value[0] for value in latest.values()])
+            received = np.array([value[1] for value in latest.values()])
+            present = ~np.isnan(readings)
+            with self._lock:
+                self.values[rows] = np.where(present, readings, self.values[rows])
+                self.updated[rows] = np.where(present, received[:, None], self.updated[rows])
+
+        accepted = len(items) - invalid - unknown
+        with self._stats_lock:
+            self.stats["received"] += len(items)
+            self.stats["accepted"] += accepted
+            self.stats["invalid"] += invalid
+            self.stats["unknown_intersection"] += unknown
+            self.stats["batches"] += 1
+        return accepted
+
+    def run_forever(self):
+        while not self._stop.is_set():
+            items = self._drain()
+            if items:
+                try:
+                    self.process_batch(items)
+                except Exception as e:
+                    logger.error(f"Sensör partisi işlenemedi: {e}")
+
+    def start(self) -> threading.Thread:
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self.run_forever, name="sensor-ingest", daemon=True)
+            self._thread.start()
+        return self._thread
+
+    def stop(self, timeout: float = 5.0):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    # --- Döngüye katma ---
+
+    def readings(self, rows: np.ndarray, now: float = None) -> Optional[np.ndarray]:
+        """Satırlar için taze okumalar (n, alan; okuma yoksa NaN) veya hiç taze okuma yoksa None"""
+        now = now or time.time()
+        with self._lock:
+            values = self.values[rows]
+            fresh = (now - self.updated[rows]) <= self.max_age
+        if not fresh.any():
+            return None
+        return np.where(fresh, values, np.nan)
+
+    def apply(self, batch: TrafficBatch) -> int:
+        """Taze sensör okumalarını partiye yaz; okuma alınan kavşak sayısı"""
+        readings = self.readings(batch.rows)
+        if readings is None:
+            return 0
+        batch.apply_measurements(*(readings[:, i] for i in range(len(READING_FIELDS))))
+        applied = int((~np.isnan(readings)).any(axis=1).sum())
+        self._count("applied", applied)
+        return applied
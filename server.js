@@ -6,6 +6,7 @@ const mqtt = require('mqtt');
 const WebSocket = require('ws');
 const sqlite3 = require('sqlite3').verbose();
 const { promisify } = require('util');
+const axios = require('axios');
 
 const app = express();
 const PORT = process.env.PORT || 3001;
@@ -24,6 +25,24 @@ const wss = new WebSocket.Server({ port: WS_PORT });
 
 let latestTrafficData = null;
 
+// Python tarafının yazdığı anlık görüntü dosyaları
+const SNAPSHOT_FILE = 'current_traffic_data.json';
+const SNAPSHOT_INDEX_FILE = 'current_traffic_data.index.json';
+const SNAPSHOT_STATS_FILE = 'current_traffic_data.stats.json';
+const SNAPSHOT_META_FILE = 'current_traffic_data.meta.json';
+const SNAPSHOT_POLL_MS = parseInt(process.env.SNAPSHOT_POLL_MS) || 2000;
+
+// Yalnızca sürüm değiştiğinde yeniden okunan bellek içi önbellek
+let snapshot = { version: null, current: null, index: null, stats: null };
+
+// Python rota motoru (routing.py); yanıt vermezse eski tahmine dönülür
+const ROUTING_URL = process.env.ROUTING_URL || 'http://127.0.0.1:3002';
+const ROUTING_TIMEOUT_MS = parseInt(process.env.ROUTING_TIMEOUT_MS) || 2000;
+
+// Karo -> kavşak id indeksi (Python tarafı başlangıçta yazar); dosya değişince yeniden okunur
+const TILE_INDEX_FILE = process.env.TILE_INDEX_FILE || 'intersections.tiles.json';
+let tileIndex = { mtimeMs: null, data: null };
+
 // Utility fonksiyonlar
 const readJsonFile = async (filename) => {
     try {
@@ -34,6 +53,111 @@ const readJsonFile = async (filename) => {
     }
 };
 
+// Küçük sürüm dosyasını kontrol et; sürüm değiştiyse belgeleri yeniden yükle
+const refreshSnapshot = async () => {
+    const meta = await readJsonFile(SNAPSHOT_META_FILE);
+    if (!meta) {
+        // Sürüm dosyası yoksa (eski yazıcı) ana dosya doğrudan okunur
+        const current = await readJsonFile(SNAPSHOT_FILE);
+        const changed = !!current && current.timestamp !== snapshot.current?.timestamp;
+        if (changed) snapshot = { version: null, current, index: null, stats: null };
+        return changed;
+    }
+    if (meta.version === snapshot.version) return false;
+
+    const [current, index, stats] = await Promise.all([
+        readJsonFile(SNAPSHOT_FILE),
+        readJsonFile(SNAPSHOT_INDEX_FILE),
+        readJsonFile(SNAPSHOT_STATS_FILE)
+    ]);
+    // Yazım sürerken okunduysa bir sonraki kontrolde tekrar denenir
+    if (!current || current.version !== meta.version) return false;
+
+    snapshot = {
+        version: meta.version,
+        current,
+        index: index?.version === meta.version ? index.intersections : null,
+        stats: stats?.version === meta.version ? stats : null
+    };
+    return true;
+};
+
+const getSnapshot = async () => {
+    if (!snapshot.current) await refreshSnapshot();
+    return snapshot;
+};
+
+const getTileIndex = async () => {
+    try {
+        const { mtimeMs } = await fs.stat(TILE_INDEX_FILE);
+        if (mtimeMs !== tileIndex.mtimeMs) {
+            tileIndex = { mtimeMs, data: await readJsonFile(TILE_INDEX_FILE) };
+        }
+    } catch (error) {
+        tileIndex = { mtimeMs: null, data: null };
+    }
+    return tileIndex.data;
+};
+
+// "enlem,boylam", { lat, lng } veya kavşak id/adı -> [enlem, boylam] (bulunamazsa null)
+const resolvePoint = (value, intersections) => {
+    if (value && typeof value === 'object') {
+        const point = [parseFloat(value.lat), parseFloat(value.lng)];
+        return point.every(Number.isFinite) ? point : null;
+    }
+    const text = String(value).trim();
+    const parts = text.split(',').map(parseFloat);
+    if (parts.length === 2 && parts.every(Number.isFinite)) return parts;
+
+    const query = text.toLocaleLowerCase('tr');
+    const match = intersections.find(i =>
+        String(i.id) === text || i.name.toLocaleLowerCase('tr').includes(query));
+    return match ? [match.lat, match.lng] : null;
+};
+
+const fetchRoute = async (from, to, avoidCritical) => {
+    try {
+        const { data } = await axios.get(`${ROUTING_URL}/route`, {
+            params: { from: from.join(','), to: to.join(','), avoidCritical: avoidCritical ? 1 : 0 },
+            timeout: ROUTING_TIMEOUT_MS
+        });
+        return data.success ? data.data : null;
+    } catch (error) {
+        return null;
+    }
+};
+
+// "güney,batı,kuzey,doğu" -> [s, w, n, e] (geçersizse null)
+const parseBbox = (value) => {
+    const parts = String(value).split(',').map(parseFloat);
+    return parts.length === 4 && parts.every(Number.isFinite) ? parts : null;
+};
+
+// Web Mercator karo koordinatları (spatial_index.tile_xy ile aynı)
+const tileX = (lng, n) => Math.min(n - 1, Math.max(0, Math.floor((lng + 180) / 360 * n)));
+const tileY = (lat, n) => {
+    const rad = Math.max(-85.0511, Math.min(85.0511, lat)) * Math.PI / 180;
+    return Math.min(n - 1, Math.max(0, Math.floor((1 - Math.asinh(Math.tan(rad)) / Math.PI) / 2 * n)));
+};
+
+// Sınır kutusundaki kavşaklar: karo indeksi ve id indeksi varsa yalnızca görünen karolar okunur
+const intersectionsInBbox = (intersections, index, tiles, [south, west, north, east]) => {
+    const inside = (i) => i.lat >= south && i.lat <= north && i.lng >= west && i.lng <= east;
+    if (!tiles || !index) return intersections.filter(inside);
+
+    const n = 2 ** tiles.zoom;
+    const result = [];
+    for (let x = tileX(west, n); x <= tileX(east, n); x++) {
+        for (let y = tileY(north, n); y <= tileY(south, n); y++) {
+            for (const id of tiles.tiles[`${tiles.zoom}/${x}/${y}`] || []) {
+                const intersection = index[id];
+                if (intersection && inside(intersection)) result.push(intersection);
+            }
+        }
+    }
+    return result;
+};
+
 // MQTT handlers
 mqttClient.on('connect', () => {
     console.log('MQTT bağlandı');
@@ -64,14 +188,29 @@ const broadcastToWebSocket = (data) => {
 
 // API Routes
 app.get('/api/traffic/current', async (req, res) => {
-    const data = await readJsonFile('current_traffic_data.json');
-    res.json({ success: !!data, data: data || 'Veri bulunamadı' });
+    const { current: data, index } = await getSnapshot();
+    const bbox = req.query.bbox ? parseBbox(req.query.bbox) : null;
+    if (req.query.bbox && !bbox) {
+        return res.json({ success: false, data: 'Geçersiz bbox (güney,batı,kuzey,doğu)' });
+    }
+    if (!data?.intersections || !bbox) {
+        return res.json({ success: !!data, data: data || 'Veri bulunamadı' });
+    }
+    
+    const intersections = intersectionsInBbox(data.intersections, index, await getTileIndex(), bbox);
+    res.json({ success: true, data: { ...data, bbox, intersections } });
+});
+
+app.get('/api/traffic/tiles', async (req, res) => {
+    const tiles = await getTileIndex();
+    res.json({ success: !!tiles, data: tiles || 'Karo indeksi bulunamadı' });
 });
 
 app.get('/api/traffic/intersection/:id', async (req, res) => {
-    const data = await readJsonFile('current_traffic_data.json');
+    const { current: data, index } = await getSnapshot();
     if (data?.intersections) {
-        const intersection = data.intersections.find(i => i.id === parseInt(req.params.id));
+        const id = parseInt(req.params.id);
+        const intersection = index ? index[id] : data.intersections.find(i => i.id === id);
         res.json({ success: !!intersection, data: intersection || 'Kavşak bulunamadı' });
     } else {
         res.json({ success: false, data: 'Veri bulunamadı' });
@@ -83,31 +222,62 @@ app.get('/api/traffic/predictions', async (req, res) => {
     res.json({ success: !!data, data: data || 'Tahmin bulunamadı' });
 });
 
+// Varsayılan: en yeni ham satırlar (eski yanıt biçimi). Özetler isteğe bağlıdır:
+// ?resolution=auto|raw|1m|1h|1d veya ?max_points=N (auto) verilirse yanıt resolution/truncated içerir
 app.get('/api/traffic/history', async (req, res) => {
-    const hours = parseInt(req.query.hours) || 24;
+    const hours = parseFloat(req.query.hours) || 24;
     const intersectionId = req.query.intersection_id;
+    const requested = req.query.resolution || (req.query.max_points ? 'auto' : null);
+    if (requested && requested !== 'auto' && !RESOLUTIONS.some(([name]) => name === requested)) {
+        return res.json({ success: false, data: 'Geçersiz resolution (auto, raw, 1m, 1h, 1d)' });
+    }
+    const maxPoints = parseInt(req.query.max_points) || 1000;
+    const resolution = requested === 'auto' ? chooseResolution(hours * 3600, maxPoints) : (requested || 'raw');
+    const rowLimit = resolution === 'raw' ? HISTORY_ROW_LIMIT : ROLLUP_ROW_LIMIT;
     
-    let query = `SELECT * FROM traffic_logs WHERE timestamp >= datetime('now', '-${hours} hours')`;
+    // ts/bucket UTC epoch saniyedir; (intersection_id, ts) ve ts indeksleri kullanılır
+    let query;
     const params = [];
+    if (resolution === 'raw') {
+        query = `SELECT * FROM traffic_history WHERE ts >= CAST(strftime('%s', 'now') AS INTEGER) - ?`;
+        params.push(hours * 3600);
+    } else {
+        query = `SELECT r.intersection_id, i.name, i.lat, i.lng, r.bucket, r.n,
+                        ${ROLLUP_METRIC_COLUMNS.map(c => `r.${c}`).join(', ')},
+                        r.normal_count, r.moderate_count, r.critical_count,
+                        datetime(r.bucket, 'unixepoch') AS timestamp
+                 FROM traffic_rollup_${resolution} r
+                 JOIN intersections i ON i.id = r.intersection_id
+                 WHERE r.bucket >= CAST(strftime('%s', 'now') AS INTEGER) - ?`;
+        params.push(hours * 3600 + RESOLUTIONS.find(([name]) => name === resolution)[1]);
+    }
     
     if (intersectionId) {
         query += ' AND intersection_id = ?';
-        params.push(intersectionId);
+        params.push(parseInt(intersectionId));
     }
-    query += ' ORDER BY timestamp DESC LIMIT 1000';
+    query += ` ORDER BY ${resolution === 'raw' ? 'ts' : 'r.bucket'} DESC LIMIT ${rowLimit + (requested ? 1 : 0)}`;
     
     try {
         const rows = await dbAll(query, params);
-        res.json({ success: true, data: rows, count: rows.length });
+        if (!requested) {
+            return res.json({ success: true, data: rows, count: rows.length });
+        }
+        const truncated = rows.length > rowLimit;
+        if (truncated) rows.pop();
+        res.json({ success: true, data: rows, count: rows.length, resolution, truncated });
     } catch (error) {
         res.json({ success: false, data: 'Veritabanı hatası' });
     }
 });
 
 app.get('/api/traffic/stats', async (req, res) => {
-    const data = await readJsonFile('current_traffic_data.json');
+    const { current: data, stats: precomputed } = await getSnapshot();
     
-    if (data?.intersections) {
+    if (precomputed) {
+        const { version, timestamp, trafficCondition, estimatedDuration, ...stats } = precomputed;
+        res.json({ success: true, data: stats });
+    } else if (data?.intersections) {
         const intersections = data.intersections;
         const stats = {
             totalIntersections: intersections.length,
@@ -131,22 +301,33 @@ app.post('/api/traffic/route/optimize', async (req, res) => {
         return res.json({ success: false, message: 'Başlangıç ve hedef gerekli' });
     }
     
-    const data = await readJsonFile('current_traffic_data.json');
+    const { current: data, stats } = await getSnapshot();
     
     if (data?.intersections) {
         const criticalIntersections = data.intersections
             .filter(i => i.status === 'critical')
             .map(i => ({ lat: i.lat, lng: i.lng, name: i.name }));
         
+        // Canlı ağırlıklı graf rotası; motor kapalıysa veya nokta çözülemezse şehir ortalaması
+        const from = resolvePoint(origin, data.intersections);
+        const to = resolvePoint(destination, data.intersections);
+        const graphRoute = from && to ? await fetchRoute(from, to, avoidCritical) : null;
+        
         const recommendation = {
             route: {
                 origin,
                 destination,
                 avoidPoints: avoidCritical ? criticalIntersections : [],
-                estimatedDuration: calculateDuration(data.intersections)
+                estimatedDuration: graphRoute ? graphRoute.estimatedDuration
+                    : stats ? stats.estimatedDuration : calculateDuration(data.intersections),
+                ...(graphRoute && {
+                    path: graphRoute.path,
+                    distanceKm: graphRoute.distanceKm,
+                    criticalOnPath: graphRoute.criticalOnPath
+                })
             },
             trafficConditions: {
-                overall: getTrafficCondition(data.intersections),
+                overall: stats ? stats.trafficCondition : getTrafficCondition(data.intersections),
                 criticalAreas: criticalIntersections.length
             }
         };
@@ -176,6 +357,31 @@ app.post('/api/iot/sensor/data', async (req, res) => {
 });
 
 // Yardımcı fonksiyonlar
+
+// Geçmiş sorguları için çözünürlükler (rollups.py ile aynı kurallar)
+// Ham satırlar en fazla 1000 (eski davranış); özet satırları kavşak başına nokta bütçesiyle sınırlıdır
+const HISTORY_ROW_LIMIT = 1000;
+const ROLLUP_ROW_LIMIT = 100000;
+const ROLLUP_METRIC_COLUMNS = ['density', 'speed', 'wait']
+    .flatMap(m => ['mean', 'min', 'max', 'p95'].map(agg => `${m}_${agg}`));
+const retentionSecs = (name, defaultHours) => {
+    const hours = process.env[`RETENTION_${name.toUpperCase()}_HOURS`];
+    const value = hours !== undefined ? parseFloat(hours) : defaultHours;
+    return value ? value * 3600 : null;
+};
+const RESOLUTIONS = [
+    ['raw', 20, retentionSecs('raw', 0)],
+    ['1m', 60, retentionSecs('1m', 14 * 24)],
+    ['1h', 3600, retentionSecs('1h', 400 * 24)],
+    ['1d', 86400, retentionSecs('1d', 0)]
+];
+
+const chooseResolution = (windowSecs, maxPoints) => {
+    const match = RESOLUTIONS.find(([, seconds, retention]) =>
+        (retention === null || windowSecs <= retention) && windowSecs / seconds <= maxPoints);
+    return (match || RESOLUTIONS[RESOLUTIONS.length - 1])[0];
+};
+
 const calculateDuration = (intersections) => {
     const avgSpeed = intersections.reduce((sum, i) => sum + i.avgSpeed, 0) / intersections.length;
     const avgWaitTime = intersections.reduce((sum, i) => sum + i.waitTime, 0) / intersections.length;
@@ -204,14 +410,13 @@ wss.on('connection', (ws) => {
     }
 });
 
-// Periyodik güncelleme
+// Periyodik güncelleme: yalnızca küçük sürüm dosyası okunur, değişiklikte yayın yapılır
 setInterval(async () => {
-    const data = await readJsonFile('current_traffic_data.json');
-    if (data && JSON.stringify(data) !== JSON.stringify(latestTrafficData)) {
-        latestTrafficData = data;
-        broadcastToWebSocket(data);
+    if (await refreshSnapshot()) {
+        latestTrafficData = snapshot.current;
+        broadcastToWebSocket(snapshot.current);
     }
-}, 30000);
+}, SNAPSHOT_POLL_MS);
 
 // 404 handler
 app.use('*', (req, res) => {
@@ -219,10 +424,11 @@ app.use('*', (req, res) => {
         success: false,
         message: 'Endpoint bulunamadı',
         endpoints: [
-            'GET /api/traffic/current',
+            'GET /api/traffic/current?bbox=güney,batı,kuzey,doğu',
+            'GET /api/traffic/tiles',
             'GET /api/traffic/intersection/:id',
             'GET /api/traffic/predictions',
-            'GET /api/traffic/history',
+            'GET /api/traffic/history?hours=24&resolution=auto&max_points=1000',
             'GET /api/traffic/stats',
             'POST /api/traffic/route/optimize',
             'POST /api/iot/sensor/data'
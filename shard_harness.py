@@ -0,0 +1,182 @@
+# shard_harness.py
+"""Yerel MQTT broker üzerinde parçalı çalışmanın uçtan uca denemesi: işçi öldürme ve yeniden dengeleme"""
+
+import argparse
+import json
+import logging
+import os
+import socket
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+
+from local_stubs import LocalMQTTBroker
+from traffic_replay import synthetic_intersections
+
+logger = logging.getLogger(__name__)
+
+
+def write_intersections(path: str, count: int, seed: int = 42):
+    """Ankara çevresinde rastgele `count` kavşak tanımını dosyaya yaz"""
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(synthetic_intersections(count, seed), f, ensure_ascii=False)
+
+
+def read_snapshot(path: str) -> dict:
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def free_port_base(count: int) -> int:
+    """Ardışık `count` portu boş görünen bir taban port (işçi metrik portları için)"""
+    for _ in range(20):
+        with socket.socket() as probe:
+            probe.bind(("127.0.0.1", 0))
+            base = probe.getsockname()[1]
+        if base + count >= 65536:
+            continue
+        try:
+            for port in range(base + 1, base + count + 1):
+                with socket.socket() as s:
+                    s.bind(("127.0.0.1", port))
+            return base
+        except OSError:
+            continue
+    raise RuntimeError("Boş metrik portu bulunamadı")
+
+
+def scrape(port: int) -> str:
+    try:
+        with urllib.request.urlopen(f"http://127.0.0.1:{port}/metrics", timeout=2) as response:
+            return response.read().decode("utf-8")
+    except OSError:
+        return ""
+
+
+def wait_for(predicate, timeout: float, interval: float = 0.5) -> bool:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if predicate():
+            return True
+        time.sleep(interval)
+    return predicate()
+
+
+def run(shards: int, intersections: int, method: str, cycle: float, dead_after: float, timeout: float) -> bool:
+    workdir = tempfile.mkdtemp(prefix="shard-harness-")
+    intersections_path = os.path.join(workdir, "intersections.json")
+    snapshot_path = os.path.join(workdir, "current_traffic_data.json")
+    write_intersections(intersections_path, intersections)
+
+    broker = LocalMQTTBroker().start()
+    metrics_base = free_port_base(shards)
+    os.environ.update({
+        "METRICS_PORT": str(metrics_base),
+        "MQTT_BROKER_HOST": broker.host,
+        "MQTT_BROKER_PORT": str(broker.port),
+        "AWS_IOT_ENDPOINT": "",
+        "TRAFFIC_INTERSECTIONS_PATH": intersections_path,
+        "CYCLE_INTERVAL_SECS": str(cycle),
+        "TRAFFIC_SNAPSHOT_PATH": snapshot_path,
+        "TRAFFIC_DB_PATH": os.path.join(workdir, "traffic_data.db"),
+        "TRAFFIC_PREDICTIONS_PATH": os.path.join(workdir, "traffic_predictions.json"),
+        "FORECAST_STATE_PATH": os.path.join(workdir, "traffic_forecast_state.npz"),
+        "AWS_IOT_SPOOL_PATH": os.path.join(workdir, "aws_iot_spool.bin"),
+        "TRAFFIC_TILE_INDEX_PATH": os.path.join(workdir, "intersections.tiles.json"),
+    })
+    os.environ.pop("GOOGLE_MAPS_API_KEY", None)
+
+    # İşçiler ortam değişkenlerini okuduğundan içe aktarma burada yapılır
+    from sharding import coordinator_from_env, shard_environment, start_worker
+
+    workers = [f"shard-{i}" for i in range(shards)]
+    metrics_ports = {worker: int(shard_environment(worker, workers, method)["METRICS_PORT"]) for worker in workers}
+    coordinator = coordinator_from_env(workers, method, dead_after=dead_after, publish_interval=0.5)
+    coordinator.start()
+    threading.Thread(target=coordinator.run_forever, name="shard-coordinator", daemon=True).start()
+    processes = {worker: start_worker(worker, workers, method) for worker in workers}
+
+    def covered() -> int:
+        return len(read_snapshot(snapshot_path).get("intersections", []))
+
+    def owners() -> dict:
+        result = {}
+        for item in read_snapshot(snapshot_path).get("intersections", []):
+            result[item["shard"]] = result.get(item["shard"], 0) + 1
+        return result
+
+    ok = True
+    try:
+        if not wait_for(lambda: covered() == intersections, timeout):
+            logger.error(f"❌ Birleşik anlık görüntü tamamlanmadı: {covered()}/{intersections}")
+            return False
+        logger.info(f"✅ Tüm kavşaklar birleşti: {owners()}")
+
+        # Her işçinin kendi metrik uç noktası olmalı (aynı porta bağlanmaya çalışmamalı)
+        if len(set(metrics_ports.values())) != shards or 0 in metrics_ports.values():
+            logger.error(f"❌ İşçi metrik portları ayrık değil: {metrics_ports}")
+            return False
+        unreachable = [worker for worker, port in metrics_ports.items()
+                       if "traffic_stage_seconds" not in scrape(port)]
+        if unreachable:
+            logger.error(f"❌ Metrik uç noktasına ulaşılamayan işçiler: {unreachable}")
+            return False
+        logger.info(f"✅ İşçi metrik portları: {metrics_ports}")
+
+        victim = workers[0]
+        processes[victim].kill()
+        processes[victim].join()
+        broker.disconnect_client(f"{coordinator.thing_name}-{victim}")
+        logger.info(f"💀 {victim} öldürüldü, yeniden dengeleme bekleniyor")
+
+        survivors = set(workers[1:])
+        if not wait_for(lambda: victim not in coordinator.live, dead_after + timeout):
+            logger.error("❌ Koordinatör ölen işçiyi üyelikten çıkarmadı")
+            return False
+        rebalanced = wait_for(lambda: covered() == intersections and set(owners()) <= survivors, timeout)
+        logger.info(f"{'✅' if rebalanced else '❌'} Yeniden dengeleme sonrası sahipler: {owners()}")
+        ok = rebalanced
+    finally:
+        coordinator.stop()
+        for process in processes.values():
+            process.terminate()
+        for process in processes.values():
+            process.join(10)
+        broker.stop()
+
+    report = {
+        "shards": shards,
+        "intersections": intersections,
+        "method": method,
+        "coordinator": coordinator.stats,
+        "broker": broker.stats,
+        "metricsPorts": metrics_ports,
+        "workdir": workdir,
+        "passed": ok,
+    }
+    print(json.dumps(report, indent=2, ensure_ascii=False))
+    return ok
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Parçalı çalışma ve yeniden dengeleme denemesi")
+    parser.add_argument("--shards", type=int, default=3)
+    parser.add_argument("--intersections", type=int, default=200)
+    parser.add_argument("--method", choices=("hash", "geohash"), default="hash")
+    parser.add_argument("--cycle", type=float, default=1.0, help="Analiz döngüsü aralığı (sn)")
+    parser.add_argument("--dead-after", type=float, default=5.0)
+    parser.add_argument("--timeout", type=float, default=60.0)
+    args = parser.parse_args(argv)
+
+    passed = run(args.shards, args.intersections, args.method, args.cycle, args.dead_after, args.timeout)
+    return 0 if passed else 1
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    sys.exit(main())
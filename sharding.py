@@ -0,0 +1,450 @@
+# sharding.py
+"""Kavşakların işçi süreçlere/sunuculara bölünmesi, koordinatör ve yeniden dengeleme"""
+
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import threading
+import time
+import zlib
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+
+from batch_engine import IntersectionTable
+from mqtt_publisher import build_connection
+from snapshot_publisher import SnapshotPublisher
+
+logger = logging.getLogger(__name__)
+
+SHARD_METHODS = ("hash", "geohash")
+GEOHASH_ALPHABET = "0123456789bcdefghjkmnpqrstuvwxyz"
+
+# İşçi başına ayrı tutulan dosyalar (aynı SQLite dosyasına birden çok yazıcı olmasın)
+SHARD_PATH_DEFAULTS = {
+    'TRAFFIC_DB_PATH': 'traffic_data.db',
+    'TRAFFIC_SNAPSHOT_PATH': 'current_traffic_data.json',
+    'TRAFFIC_PREDICTIONS_PATH': 'traffic_predictions.json',
+    'FORECAST_STATE_PATH': 'traffic_forecast_state.npz',
+    'AWS_IOT_SPOOL_PATH': 'aws_iot_spool.bin',
+}
+
+
+def members_topic(thing_name: str) -> str:
+    return f"ankara-traffic/shards/{thing_name}/members"
+
+
+def heartbeat_topic(thing_name: str, shard_id: str = '+') -> str:
+    return f"ankara-traffic/shards/{thing_name}/heartbeat/{shard_id}"
+
+
+def geohash(lat: float, lng: float, precision: int = 5) -> str:
+    """Standart base32 geohash"""
+    lat_range, lng_range = [-90.0, 90.0], [-180.0, 180.0]
+    chars, bits, value, even = [], 0, 0, True
+    while len(chars) < precision:
+        target, rng = (lng, lng_range) if even else (lat, lat_range)
+        mid = (rng[0] + rng[1]) / 2
+        value <<= 1
+        if target >= mid:
+            value |= 1
+            rng[0] = mid
+        else:
+            rng[1] = mid
+        even = not even
+        bits += 1
+        if bits == 5:
+            chars.append(GEOHASH_ALPHABET[value])
+            bits, value = 0, 0
+    return "".join(chars)
+
+
+def _mix64(x: np.ndarray) -> np.ndarray:
+    """splitmix64 karıştırıcısı (uint64 taşmaları modüler aritmetiktir)"""
+    x = np.asarray(x, dtype=np.uint64)
+    x = (x ^ (x >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    x = (x ^ (x >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return x ^ (x >> np.uint64(31))
+
+
+def shard_keys(table: IntersectionTable, method: str = "hash", precision: int = 5) -> np.ndarray:
+    """Kavşak başına bölme anahtarı: id veya geohash hücresi (komşu kavşaklar aynı işçide kalır)"""
+    if method == "geohash":
+        cells = [geohash(la, ln, precision) for la, ln in zip(table.lat.tolist(), table.lng.tolist())]
+        return np.array([zlib.crc32(cell.encode()) for cell in cells], dtype=np.uint64)
+    if method == "hash":
+        return table.ids.astype(np.uint64)
+    raise ValueError(f"Bilinmeyen bölme yöntemi: {method}")
+
+
+def rendezvous_assign(keys: np.ndarray, members: Sequence[str]) -> np.ndarray:
+    """En yüksek rastgele ağırlık (HRW) ile her anahtarın sahibi (members indeksi).
+
+    Bir işçi ayrıldığında yalnızca onun anahtarları diğerlerine dağılır.
+    """
+    if not members:
+        return np.full(len(keys), -1, dtype=np.int64)
+    member_hash = _mix64(np.array([zlib.crc32(m.encode()) for m in members], dtype=np.uint64))
+    scores = _mix64(_mix64(keys)[:, None] ^ member_hash[None, :])
+    return scores.argmax(axis=1)
+
+
+def shard_path(path: str, shard_id: str) -> str:
+    """'traffic_data.db' -> 'traffic_data.shard-0.db'"""
+    base, ext = os.path.splitext(path)
+    return f"{base}.{shard_id}{ext}"
+
+
+def shard_environment(shard_id: str, members: Sequence[str], method: str = "hash") -> Dict[str, str]:
+    """Bir işçi sürecinin ortam değişkenleri (işçiye özel dosya yolları dahil)"""
+    env = {
+        'TRAFFIC_SHARD_ID': shard_id,
+        'TRAFFIC_SHARD_MEMBERS': ','.join(members),
+        'TRAFFIC_SHARD_METHOD': method,
+        # Koordinatör birleştirmesi tam JSON mesajlarını okur
+        'AWS_IOT_PAYLOAD_MODE': 'full',
+        # Aynı makinedeki işçiler rota portunda çakışmasın
+        'ROUTING_PORT': '0',
+    }
+    # Metrik portu işçinin üyelikteki sırasıyla kaydırılır (tek süreçli analizörün portu boş kalır);
+    # METRICS_PORT=0 ise tüm işçilerde kapalı
+    base = int(os.getenv('METRICS_PORT', '3003'))
+    members = list(members)
+    env['METRICS_PORT'] = str(base + 1 + members.index(shard_id)) if base and shard_id in members else '0'
+    for name, default in SHARD_PATH_DEFAULTS.items():
+        env[name] = shard_path(os.getenv(name, default), shard_id)
+    return env
+
+
+class ShardAssignment:
+    """Bir işçinin sahip olduğu kavşak satırları; koordinatörün üyelik mesajıyla güncellenir"""
+
+    def __init__(self, table: IntersectionTable, shard_id: str, members: Sequence[str],
+                 method: str = "hash"):
+        self.table = table
+        self.shard_id = shard_id
+        self.method = method
+        self.keys = shard_keys(table, method)
+        self.members: List[str] = []
+        self.epoch = -1
+        self.rows = np.empty(0, dtype=np.int64)
+        self.update(members, epoch=0)
+
+    def update(self, members: Sequence[str], epoch: int, method: str = None) -> bool:
+        """Yeni üyelik listesini uygula; eski dönemli mesajlar yok sayılır"""
+        if epoch < self.epoch:
+            return False
+        if method and method != self.method:
+            self.method = method
+            self.keys = shard_keys(self.table, method)
+
+        members = sorted(members)
+        owner = rendezvous_assign(self.keys, members)
+        mine = members.index(self.shard_id) if self.shard_id in members else -2
+        # Dizi tek atamayla değişir; döngü thread'i her zaman tutarlı bir kopya okur
+        self.rows = np.flatnonzero(owner == mine)
+        self.members, self.epoch = members, epoch
+        logger.info(f"🧩 Parça {self.shard_id}: {len(self.rows)} kavşak "
+                    f"({len(members)} işçi, dönem {epoch})")
+        return True
+
+    def on_members_message(self, topic, payload, dup, qos, retain, **kwargs):
+        """MQTT üyelik mesajı (koordinatör tarafından retained yayınlanır)"""
+        try:
+            doc = json.loads(payload.decode('utf-8'))
+            self.update(doc['members'], int(doc['epoch']), doc.get('method'))
+        except Exception as e:
+            logger.error(f"Parça üyelik mesajı işlenemedi: {e}")
+
+
+class ShardCoordinator:
+    """İşçi çıktılarını birleştirir, uyarıları tek akışta toplar ve ölen işçilerin kavşaklarını dağıtır.
+
+    İşçi yaşamı veri/uyarı/kalp atışı mesajlarından izlenir; `dead_after` saniye
+    sessiz kalan işçi üyelikten çıkarılır, tekrar mesaj gönderince geri eklenir.
+    """
+
+    def __init__(self, thing_name: str, connection, workers: Sequence[str],
+                 snapshot_path: str = 'current_traffic_data.json', method: str = "hash",
+                 dead_after: float = 60.0, publish_interval: float = 1.0):
+        from awscrt import mqtt
+
+        self.thing_name = thing_name
+        self.connection = connection
+        # awscrt yalnızca koordinatörde yüklenir; işçiler ShardAssignment'ı MQTT'siz içe aktarır
+        self.qos = mqtt.QoS.AT_LEAST_ONCE
+        self.method = method
+        self.dead_after = dead_after
+        self.publish_interval = publish_interval
+        self.snapshot_publisher = SnapshotPublisher(snapshot_path)
+
+        started = time.monotonic()
+        self.live: List[str] = sorted(workers)
+        self.last_seen: Dict[str, float] = {worker: started for worker in workers}
+        # Koordinatör yeniden başlasa da dönem numarası geriye gitmesin diye saatten türetilir
+        self.epoch = int(time.time() * 1000)
+        # kavşak id -> export biçimindeki son değer
+        self.latest: Dict[int, Dict] = {}
+        self._dirty = False
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self.stats = {"messages": 0, "alerts": 0, "rebalances": 0, "snapshots": 0}
+        self._stats_lock = threading.Lock()
+
+    def _count(self, key: str, n: int = 1):
+        with self._stats_lock:
+            self.stats[key] += n
+
+    def _next_epoch(self):
+        self.epoch = max(self.epoch + 1, int(time.time() * 1000))
+
+    @property
+    def alert_topic(self) -> str:
+        return f"ankara-traffic/alerts/{self.thing_name}"
+
+    def _shard_of(self, device: str) -> Optional[str]:
+        prefix = f"{self.thing_name}-"
+        return device[len(prefix):] if device and device.startswith(prefix) else None
+
+    def start(self, timeout: float = 10.0):
+        """Bağlan, işçi topic'lerine abone ol ve ilk üyelik listesini yayınla"""
+        self.connection.connect().result(timeout)
+        for topic, callback in (("ankara-traffic/data/+", self.on_data),
+                                ("ankara-traffic/alerts/+", self.on_alert),
+                                (heartbeat_topic(self.thing_name), self.on_heartbeat)):
+            future, _ = self.connection.subscribe(topic=topic, qos=self.qos, callback=callback)
+            future.result(timeout)
+        self.publish_membership()
+        logger.info(f"🧭 Parça koordinatörü başlatıldı: {', '.join(self.live)}")
+
+    def publish_membership(self):
+        payload = json.dumps({'epoch': self.epoch, 'members': self.live, 'method': self.method})
+        self.connection.publish(topic=members_topic(self.thing_name), payload=payload,
+                                qos=self.qos, retain=True)
+
+    # --- Gelen mesajlar ---
+
+    def seen(self, shard: str):
+        with self._lock:
+            self.last_seen[shard] = time.monotonic()
+            if shard in self.live:
+                return
+            self.live = sorted(self.live + [shard])
+            self._next_epoch()
+        logger.info(f"🧩 Parça {shard} katıldı, kavşaklar yeniden dağıtılıyor")
+        self._count("rebalances")
+        self.publish_membership()
+
+    def on_data(self, topic, payload, dup, qos, retain, **kwargs):
+        try:
+            doc = json.loads(payload.decode('utf-8'))
+            shard = self._shard_of(doc.get('deviceId'))
+            if shard is None or 'intersections' not in doc:
+                return
+            self.seen(shard)
+            with self._lock:
+                for item in doc['intersections']:
+                    current = self.latest.get(item['intersectionId'])
+                    # Yeniden dengelemede eski sahibin geciken mesajları yenisini ezmesin
+                    if current and current['_timestamp'] > item['timestamp']:
+                        continue
+                    metrics, coordinates = item['metrics'], item['coordinates']
+                    self.latest[item['intersectionId']] = {
+                        'id': item['intersectionId'],
+                        'name': item['name'],
+                        'lat': coordinates['latitude'],
+                        'lng': coordinates['longitude'],
+                        'density': metrics['density'],
+                        'avgSpeed': metrics['averageSpeed'],
+                        'waitTime': metrics['waitTime'],
+                        'vehicleCount': metrics['vehicleCount'],
+                        'status': item['status'],
+                        'shard': shard,
+                        '_timestamp': item['timestamp'],
+                    }
+                self._dirty = True
+            self._count("messages")
+        except Exception as e:
+            logger.error(f"Parça veri mesajı işlenemedi ({topic}): {e}")
+
+    def on_alert(self, topic, payload, dup, qos, retain, **kwargs):
+        if topic == self.alert_topic:
+            return
+        shard = self._shard_of(topic.rsplit('/', 1)[-1])
+        if shard is None:
+            return
+        try:
+            doc = json.loads(payload.decode('utf-8'))
+            doc['sourceShard'] = shard
+            self.seen(shard)
+            self.connection.publish(topic=self.alert_topic, payload=json.dumps(doc),
+                                    qos=self.qos)
+            self._count("alerts")
+        except Exception as e:
+            logger.error(f"Parça uyarısı iletilemedi ({topic}): {e}")
+
+    def on_heartbeat(self, topic, payload, dup, qos, retain, **kwargs):
+        self.seen(topic.rsplit('/', 1)[-1])
+
+    # --- Periyodik işler ---
+
+    def check_workers(self, now: float = None) -> List[str]:
+        """Sessiz kalan işçileri üyelikten çıkar; çıkarılanları döndür"""
+        now = now or time.monotonic()
+        with self._lock:
+            dead = [w for w in self.live if now - self.last_seen.get(w, now) > self.dead_after]
+            if not dead:
+                return []
+            self.live = [w for w in self.live if w not in dead]
+            self._next_epoch()
+        logger.warning(f"⚠️ Yanıt vermeyen parçalar: {', '.join(dead)}; kavşakları "
+                       f"{len(self.live)} işçiye dağıtılıyor")
+        self._count("rebalances")
+        self.publish_membership()
+        return dead
+
+    def write_snapshot(self) -> bool:
+        """Birleşik current_traffic_data.json (tek süreçli çalışmayla aynı biçim)"""
+        with self._lock:
+            if not self._dirty:
+                return False
+            self._dirty = False
+            intersections = [
+                {key: value for key, value in item.items() if key != '_timestamp'}
+                for _, item in sorted(self.latest.items())
+            ]
+            shards = list(self.live)
+        export_data = {
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'source': 'AWS_IoT_Core',
+            'shards': shards,
+            'intersections': intersections
+        }
+        if self.snapshot_publisher.publish(export_data):
+            self._count("snapshots")
+            return True
+        return False
+
+    def run_forever(self):
+        while not self._stop.wait(self.publish_interval):
+            try:
+                self.check_workers()
+                self.write_snapshot()
+            except Exception as e:
+                logger.error(f"Koordinatör döngüsü hatası: {e}")
+
+    def stop(self):
+        self._stop.set()
+        try:
+            self.connection.disconnect().result(5)
+        except Exception as e:
+            logger.error(f"Koordinatör bağlantısı kapatılamadı: {e}")
+
+
+def coordinator_from_env(workers: Sequence[str], method: str = "hash", **kwargs) -> ShardCoordinator:
+    """Analizörle aynı ortam değişkenlerinden MQTT bağlantılı koordinatör oluştur"""
+    thing_name = os.getenv('AWS_IOT_THING_NAME', 'AnkaraTrafficSystem')
+    connection = build_connection(
+        f"{thing_name}-coordinator",
+        endpoint=os.getenv('AWS_IOT_ENDPOINT'),
+        cert_path=os.getenv('AWS_IOT_CERT_PATH', './certs/device.pem.crt'),
+        key_path=os.getenv('AWS_IOT_PRIVATE_KEY_PATH', './certs/private.pem.key'),
+        ca_path=os.getenv('AWS_IOT_CA_PATH', './certs/Amazon-root-CA-1.pem'),
+        broker_host=os.getenv('MQTT_BROKER_HOST'),
+        broker_port=int(os.getenv('MQTT_BROKER_PORT', '1883')),
+        clean_session=True
+    )
+    if connection is None:
+        raise RuntimeError("Parçalı çalışma için AWS IoT sertifikaları veya MQTT_BROKER_HOST gerekli")
+    return ShardCoordinator(thing_name, connection, workers,
+                            snapshot_path=os.getenv('TRAFFIC_SNAPSHOT_PATH', 'current_traffic_data.json'),
+                            method=method, **kwargs)
+
+
+def worker_main(shard_id: str, members: Sequence[str], method: str = "hash"):
+    """Tek bir parçayı bu süreçte çalıştır (ortam değişkenleri süreç başında ayarlanır)"""
+    os.environ.update(shard_environment(shard_id, members, method))
+    import trafik_analizi_aws
+    trafik_analizi_aws.main()
+
+
+def start_worker(shard_id: str, members: Sequence[str], method: str = "hash") -> multiprocessing.Process:
+    # Thread'li ebeveynden fork yerine temiz süreç
+    context = multiprocessing.get_context("spawn")
+    process = context.Process(target=worker_main, args=(shard_id, list(members), method),
+                              name=f"traffic-{shard_id}", daemon=True)
+    process.start()
+    return process
+
+
+def run_local(shards: int, method: str = "hash", restart_delay: float = 30.0, dead_after: float = 60.0):
+    """Bu makinede `shards` işçi süreci ve koordinatörü çalıştır; ölen işçiyi gecikmeyle yeniden başlat"""
+    workers = [f"shard-{i}" for i in range(shards)]
+    coordinator = coordinator_from_env(workers, method, dead_after=dead_after)
+    coordinator.start()
+    threading.Thread(target=coordinator.run_forever, name="shard-coordinator", daemon=True).start()
+
+    processes = {worker: start_worker(worker, workers, method) for worker in workers}
+    died_at: Dict[str, float] = {}
+    try:
+        while True:
+            time.sleep(1.0)
+            for worker, process in processes.items():
+                if process.is_alive():
+                    continue
+                if worker not in died_at:
+                    died_at[worker] = time.monotonic()
+                    logger.warning(f"⚠️ {worker} süreci sonlandı (çıkış kodu {process.exitcode})")
+                elif restart_delay and time.monotonic() - died_at[worker] >= restart_delay:
+                    processes[worker] = start_worker(worker, coordinator.live or workers, method)
+                    del died_at[worker]
+                    logger.info(f"🔁 {worker} yeniden başlatıldı")
+    except KeyboardInterrupt:
+        logger.info("🛑 Parçalı sistem kapatılıyor...")
+    finally:
+        for process in processes.values():
+            process.terminate()
+        for process in processes.values():
+            process.join(10)
+        coordinator.stop()
+
+
+def main(argv: List[str] = None):
+    parser = argparse.ArgumentParser(description="Parçalı (çok süreçli/çok sunuculu) trafik analizi")
+    sub = parser.add_subparsers(dest="mode", required=True)
+
+    local = sub.add_parser("local", help="Bu makinede işçi süreçleri ve koordinatör")
+    local.add_argument("--shards", type=int, default=os.cpu_count() or 2)
+    local.add_argument("--restart-delay", type=float, default=30.0)
+
+    worker = sub.add_parser("worker", help="Tek işçi (ayrı sunucularda)")
+    worker.add_argument("--shard-id", required=True)
+
+    coordinator = sub.add_parser("coordinator", help="Yalnızca koordinatör")
+
+    for p in (local, worker, coordinator):
+        p.add_argument("--method", choices=SHARD_METHODS, default="hash")
+    for p in (worker, coordinator):
+        p.add_argument("--members", required=True, help="Virgülle ayrılmış işçi adları")
+    for p in (local, coordinator):
+        p.add_argument("--dead-after", type=float, default=60.0)
+
+    args = parser.parse_args(argv)
+    if args.mode == "local":
+        run_local(args.shards, args.method, args.restart_delay, args.dead_after)
+    elif args.mode == "worker":
+        worker_main(args.shard_id, args.members.split(','), args.method)
+    else:
+        coord = coordinator_from_env(args.members.split(','), args.method, dead_after=args.dead_after)
+        coord.start()
+        try:
+            coord.run_forever()
+        except KeyboardInterrupt:
+            coord.stop()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    main()
@@ -0,0 +1,137 @@
+# snapshot_publisher.py
+"""Node.js API için atomik, değişiklik duyarlı JSON anlık görüntü yayıncısı"""
+
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import time
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+def atomic_write(path: str, data: bytes, fsync: bool = False):
+    """Geçici dosyaya yazıp yeniden adlandır; okuyucu hiçbir zaman yarım dosya görmez"""
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(prefix='.' + os.path.basename(path) + '.', dir=directory)
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+            if fsync:
+                f.flush()
+                os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def _dump(doc) -> bytes:
+    return json.dumps(doc, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+
+def traffic_condition(critical: int, moderate: int, total: int) -> str:
+    """Genel trafik durumu (server.js getTrafficCondition ile aynı kurallar)"""
+    if not total:
+        return 'light'
+    if critical / total > 0.4:
+        return 'heavy'
+    if critical / total > 0.2 or moderate / total > 0.5:
+        return 'moderate'
+    return 'light'
+
+
+def _js_round(value: float) -> int:
+    """JavaScript Math.round ile aynı yuvarlama (Python round çifte yuvarlar)"""
+    return int(value + 0.5) if value >= 0 else -int(-value + 0.5)
+
+
+def compute_stats(intersections: List[Dict]) -> Dict:
+    """/api/traffic/stats yanıtının önceden hesaplanmış hali"""
+    total = len(intersections)
+    counts = {'critical': 0, 'moderate': 0, 'normal': 0}
+    vehicles = speed = wait = 0
+    for item in intersections:
+        counts[item['status']] = counts.get(item['status'], 0) + 1
+        vehicles += item['vehicleCount']
+        speed += item['avgSpeed']
+        wait += item['waitTime']
+
+    avg_speed = speed / total if total else 0
+    avg_wait = wait / total if total else 0
+    return {
+        'totalIntersections': total,
+        'totalVehicles': vehicles,
+        'averageSpeed': _js_round(avg_speed),
+        'averageWaitTime': _js_round(avg_wait),
+        'criticalIntersections': counts['critical'],
+        'moderateIntersections': counts['moderate'],
+        'normalIntersections': counts['normal'],
+        'trafficCondition': traffic_condition(counts['critical'], counts['moderate'], total),
+        # 10 km'lik örnek rota süresi (dakika), server.js calculateDuration ile aynı
+        'estimatedDuration': _js_round((10 / avg_speed) * 60 + avg_wait / 60) if avg_speed else None,
+    }
+
+
+class SnapshotPublisher:
+    """Anlık görüntüyü, kavşak indeksini, istatistikleri ve küçük bir sürüm dosyasını yazar.
+
+    İçerik (zaman damgası hariç) değişmediyse hiçbir dosya yazılmaz. Sürüm
+    dosyası en son yazılır; onu okuyan tüketici diğer dosyaları hazır bulur.
+    """
+
+    def __init__(self, path: str = 'current_traffic_data.json'):
+        self.path = path
+        base, _ = os.path.splitext(path)
+        self.index_path = base + '.index.json'
+        self.stats_path = base + '.stats.json'
+        self.meta_path = base + '.meta.json'
+
+        self.version = 0
+        self.hash: Optional[str] = None
+        self.skipped = 0
+        try:
+            with open(self.meta_path, encoding='utf-8') as f:
+                meta = json.load(f)
+            self.version, self.hash = int(meta['version']), meta['hash']
+        except (OSError, ValueError, KeyError):
+            pass
+
+    def publish(self, export_data: Dict) -> bool:
+        """Değiştiyse anlık görüntüyü yayınla; dosya yazıldıysa True"""
+        intersections = export_data.get('intersections', [])
+        body = _dump(intersections)
+        digest = hashlib.sha1(body).hexdigest()
+        if digest == self.hash:
+            self.skipped += 1
+            return False
+
+        version = self.version + 1
+        header = {key: value for key, value in export_data.items() if key != 'intersections'}
+        header['version'] = version
+
+        # Ana belge: kavşak listesi tekrar serileştirilmeden başlığa eklenir
+        document = _dump(header)[:-1] + b',"intersections":' + body + b'}'
+        index = {
+            'version': version,
+            'timestamp': export_data.get('timestamp'),
+            'intersections': {str(item['id']): item for item in intersections}
+        }
+        stats = {'version': version, 'timestamp': export_data.get('timestamp'), **compute_stats(intersections)}
+
+        atomic_write(self.path, document)
+        atomic_write(self.index_path, _dump(index))
+        atomic_write(self.stats_path, _dump(stats))
+        atomic_write(self.meta_path, _dump({
+            'version': version,
+            'hash': digest,
+            'mtime': time.time(),
+            'timestamp': export_data.get('timestamp'),
+            'count': len(intersections),
+        }))
+
+        self.version, self.hash = version, digest
+        return True
@@ -0,0 +1,189 @@
+# spatial_index.py
+"""Kavşaklar için ızgara tabanlı mekânsal indeks (en yakın k, yarıçap, sınır kutusu) ve harita karo indeksi"""
+
+import json
+import logging
+import math
+from datetime import datetime
+from typing import Dict, Tuple
+
+import numpy as np
+
+from batch_engine import IntersectionTable
+from snapshot_publisher import atomic_write
+
+logger = logging.getLogger(__name__)
+
+EARTH_RADIUS_M = 6371000.0
+
+# Hücre başına hedeflenen ortalama kavşak sayısı
+TARGET_PER_CELL = 8
+
+TILE_INDEX_VERSION = 1
+
+
+def tile_xy(lat, lng, zoom: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Web Mercator (slippy map) karo koordinatları"""
+    lat = np.clip(np.asarray(lat, dtype=np.float64), -85.0511, 85.0511)
+    n = 2 ** zoom
+    x = np.floor((np.asarray(lng, dtype=np.float64) + 180.0) / 360.0 * n)
+    y = np.floor((1.0 - np.arcsinh(np.tan(np.radians(lat))) / math.pi) / 2.0 * n)
+    return np.clip(x, 0, n - 1).astype(np.int64), np.clip(y, 0, n - 1).astype(np.int64)
+
+
+class SpatialIndex:
+    """Metre cinsinden eşdikdörtgen izdüşüm üzerinde düzgün ızgara.
+
+    Noktalar hücre numarasına göre sıralanır; her hücre sıralı dizide bitişik
+    bir aralıktır (CSR). Sınır kutusu sorgusu ızgara satırı başına tek dilim
+    okur ve adayları tam koordinatla süzer; en yakın k sorgusu kareyi
+    k. mesafe kapsanana kadar büyütür.
+    """
+
+    def __init__(self, table: IntersectionTable, cell_m: float = None):
+        self.rebuild(table, cell_m)
+
+    def rebuild(self, table: IntersectionTable, cell_m: float = None):
+        """Kavşak tanımları değiştiğinde indeksi yeniden oluştur"""
+        self.table = table
+        n = len(table)
+        self.origin_lat = float(table.lat.mean()) if n else 0.0
+        self._cos = math.cos(math.radians(self.origin_lat))
+        self.x, self.y = self.project(table.lat, table.lng)
+
+        if n:
+            self.min_x, self.min_y = float(self.x.min()), float(self.y.min())
+            width, height = float(self.x.max()) - self.min_x, float(self.y.max()) - self.min_y
+        else:
+            self.min_x = self.min_y = width = height = 0.0
+        if cell_m is None:
+            # Kapsanan alanı hücre başına ~TARGET_PER_CELL noktaya böl
+            area = max(width, 1.0) * max(height, 1.0)
+            cell_m = math.sqrt(area * TARGET_PER_CELL / max(n, 1))
+        self.cell_m = max(float(cell_m), 1.0)
+        self.nx = int(width // self.cell_m) + 1
+        self.ny = int(height // self.cell_m) + 1
+
+        cx, cy = self._cells(self.x, self.y)
+        cell = cy * self.nx + cx
+        self.order = np.argsort(cell, kind='stable')
+        self.starts = np.searchsorted(cell[self.order], np.arange(self.nx * self.ny + 1))
+        # Sıralı koordinatlar: aday süzme bitişik bellekten okunur
+        self.sx, self.sy = self.x[self.order], self.y[self.order]
+        logger.info(f"🗺️ Mekânsal indeks: {n} kavşak, {self.nx}×{self.ny} hücre ({self.cell_m:.0f} m)")
+
+    def __len__(self) -> int:
+        return len(self.order)
+
+    def project(self, lat, lng) -> Tuple[np.ndarray, np.ndarray]:
+        """Enlem/boylamı indeks merkezine göre metreye çevir"""
+        lat = np.radians(np.asarray(lat, dtype=np.float64))
+        lng = np.radians(np.asarray(lng, dtype=np.float64))
+        return EARTH_RADIUS_M * lng * self._cos, EARTH_RADIUS_M * lat
+
+    def _cells(self, x, y) -> Tuple[np.ndarray, np.ndarray]:
+        cx = np.clip(((x - self.min_x) // self.cell_m).astype(np.int64), 0, self.nx - 1)
+        cy = np.clip(((y - self.min_y) // self.cell_m).astype(np.int64), 0, self.ny - 1)
+        return cx, cy
+
+    def _candidates(self, x0: float, y0: float, x1: float, y1: float) -> np.ndarray:
+        """Metre kutusuyla kesişen hücrelerdeki noktaların sıralı dizideki konumları"""
+        if (not len(self) or x1 < self.min_x or y1 < self.min_y
+                or x0 > self.min_x + self.nx * self.cell_m or y0 > self.min_y + self.ny * self.cell_m):
+            return np.empty(0, dtype=np.int64)
+        (cx0, cx1), (cy0, cy1) = self._cells(np.array([x0, x1]), np.array([y0, y1]))
+        # Izgara satırı başına bir bitişik aralık
+        first = np.arange(cy0, cy1 + 1) * self.nx
+        lo, hi = self.starts[first + cx0], self.starts[first + cx1 + 1]
+        if len(lo) == 1:
+            return np.arange(lo[0], hi[0])
+        return np.concatenate([np.arange(a, b) for a, b in zip(lo.tolist(), hi.tolist())])
+
+    # --- Sorgular (kavşak tablosu satırları döndürür) ---
+
+    def bbox(self, south: float, west: float, north: float, east: float) -> np.ndarray:
+        """Sınır kutusu içindeki kavşaklar"""
+        (x0, x1), (y0, y1) = self.project([south, north], [west, east])
+        pos = self._candidates(x0, y0, x1, y1)
+        inside = (self.sx[pos] >= x0) & (self.sx[pos] <= x1) & (self.sy[pos] >= y0) & (self.sy[pos] <= y1)
+        return self.order[pos[inside]]
+
+    def radius(self, lat: float, lng: float, radius_m: float, sort: bool = False) -> np.ndarray:
+        """Noktaya `radius_m` metre içindeki kavşaklar (istenirse yakından uzağa)"""
+        x, y = self.project(lat, lng)
+        pos = self._candidates(x - radius_m, y - radius_m, x + radius_m, y + radius_m)
+        d2 = (self.sx[pos] - x) ** 2 + (self.sy[pos] - y) ** 2
+        inside = d2 <= radius_m ** 2
+        pos, d2 = pos[inside], d2[inside]
+        if sort:
+            pos = pos[np.argsort(d2, kind='stable')]
+        return self.order[pos]
+
+    def nearest(self, lat: float, lng: float, k: int = 1) -> Tuple[np.ndarray, np.ndarray]:
+        """En yakın k kavşağın satırları ve metre cinsinden mesafeleri (yakından uzağa)"""
+        k = min(int(k), len(self))
+        if k <= 0:
+            return np.empty(0, dtype=np.int64), np.empty(0)
+        x, y = self.project(lat, lng)
+        # Sorgu noktası ızgara dışındaysa arama en yakın kenardan başlar
+        gap = math.hypot(max(self.min_x - x, 0, x - (self.min_x + self.nx * self.cell_m)),
+                         max(self.min_y - y, 0, y - (self.min_y + self.ny * self.cell_m)))
+        half = gap + self.cell_m * max(1.0, math.sqrt(k / TARGET_PER_CELL))
+        while True:
+            pos = self._candidates(x - half, y - half, x + half, y + half)
+            if len(pos) >= k:
+                d2 = (self.sx[pos] - x) ** 2 + (self.sy[pos] - y) ** 2
+                part = np.argpartition(d2, k - 1)[:k] if len(pos) > k else np.arange(len(pos))
+                # Kare içindeki k. mesafe yarı genişlikten kısaysa kare dışında daha yakını yoktur
+                if d2[part].max() <= half ** 2 or len(pos) == len(self):
+                    part = part[np.argsort(d2[part], kind='stable')]
+                    return self.order[pos[part]], np.sqrt(d2[part])
+            half *= 2
+
+    def nearest_neighbors(self) -> np.ndarray:
+        """Her kavşağın kendisi dışındaki en yakın kavşağı (tek kavşakta kendisi)"""
+        result = np.arange(len(self))
+        for row, (lat, lng) in enumerate(zip(self.table.lat.tolist(), self.table.lng.tolist())):
+            rows, _ = self.nearest(lat, lng, 2)
+            others = rows[rows != row]
+            if len(others):
+                result[row] = others[0]
+        return result
+
+    def distances_m(self, rows: np.ndarray, lat: float, lng: float) -> np.ndarray:
+        """Verilen satırların noktaya izdüşüm mesafesi (metre)"""
+        x, y = self.project(lat, lng)
+        return np.hypot(self.x[rows] - x, self.y[rows] - y)
+
+    # --- Harita karoları ---
+
+    def tile_index(self, zoom: int = 14) -> Dict:
+        """Web haritası ve API için karo -> kavşak id listesi belgesi"""
+        table = self.table
+        tx, ty = tile_xy(table.lat, table.lng, zoom)
+        key = tx * (2 ** zoom) + ty
+        order = np.argsort(key, kind='stable')
+        unique, starts = np.unique(key[order], return_index=True)
+        ends = np.append(starts[1:], len(order))
+        ids = table.ids[order].tolist()
+
+        tiles = {}
+        for k, a, b in zip(unique.tolist(), starts.tolist(), ends.tolist()):
+            tiles[f"{zoom}/{k // 2 ** zoom}/{k % 2 ** zoom}"] = ids[a:b]
+
+        bounds = ([float(table.lat.min()), float(table.lng.min()), float(table.lat.max()), float(table.lng.max())]
+                  if len(table) else None)
+        return {
+            'version': TILE_INDEX_VERSION,
+            'generated': datetime.now().isoformat(timespec='seconds'),
+            'zoom': zoom,
+            'count': len(table),
+            'bounds': bounds,
+            'tiles': tiles
+        }
+
+    def write_tile_index(self, path: str, zoom: int = 14) -> int:
+        """Karo indeksini atomik olarak yaz; dolu karo sayısını döndür"""
+        document = self.tile_index(zoom)
+        atomic_write(path, json.dumps(document, ensure_ascii=False, separators=(',', ':')).encode('utf-8'))
+        return len(document['tiles'])
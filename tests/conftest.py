@@ -0,0 +1,32 @@
+# conftest.py
+"""Testler için ortak yardımcılar; modüller depo kökünden içe aktarılır"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np  # noqa: E402
+
+from batch_engine import INTERSECTION_TYPES, IntersectionTable  # noqa: E402
+
+
+def make_table(count: int) -> IntersectionTable:
+    """Ankara çevresinde `count` kavşaklık sabit tablo"""
+    return IntersectionTable.from_records([
+        {"id": i + 1, "name": f"Kavşak {i + 1}", "lat": 39.85 + i * 1e-3, "lng": 32.70 + i * 1e-3,
+         "type": INTERSECTION_TYPES[i % len(INTERSECTION_TYPES)]}
+        for i in range(count)
+    ])
+
+
+def make_values(count: int, seed: int = 0) -> np.ndarray:
+    """METRIC_FIELDS sırasında rastgele değerler (status kod olarak)"""
+    rng = np.random.default_rng(seed)
+    return np.column_stack([
+        rng.uniform(0, 100, count).round(1),
+        rng.integers(5, 60, count),
+        rng.integers(0, 120, count),
+        rng.integers(0, 200, count),
+        rng.integers(0, 3, count),
+    ]).astype(np.float64)
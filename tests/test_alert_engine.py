@@ -0,0 +1,140 @@
+# test_alert_engine.py
+"""AlertEngine: histerezis, asgari süre, tekrar bildirim ve z-skor/CUSUM anomali geçişleri"""
+
+from datetime import datetime, timedelta
+
+import numpy as np
+import pytest
+
+from alert_engine import ANOMALY, CONGESTION, AlertEngine, alert_payloads
+from batch_engine import TrafficBatch
+from conftest import make_table
+
+START = datetime(2024, 1, 1, 8, 0)
+STEP = 30
+
+
+def make_batch(table, cycle, density, avg_speed=40):
+    n = len(table)
+    density = np.broadcast_to(np.asarray(density, dtype=np.float64), n).copy()
+    return TrafficBatch(rows=np.arange(n), ids=table.ids, density=density,
+                        avg_speed=np.broadcast_to(np.asarray(avg_speed, dtype=np.int32), n).copy(),
+                        wait_time=np.zeros(n, dtype=np.int32), vehicle_count=np.zeros(n, dtype=np.int32),
+                        status_code=np.zeros(n, dtype=np.int8),
+                        timestamp=START + timedelta(seconds=STEP * cycle))
+
+
+def run(engine, densities, speeds=None):
+    """Tek kavşaklı seriyi işle; döngü başına (alertType, event) listeleri"""
+    speeds = speeds or [40] * len(densities)
+    return [[(e["alertType"], e["event"]) for e in engine.process(make_batch(engine.table, i, d, s))]
+            for i, (d, s) in enumerate(zip(densities, speeds))]
+
+
+def congestion_engine(**kwargs):
+    # Anomali tespiti bu testlerde devre dışı (ısınma hiç bitmez)
+    return AlertEngine(make_table(1), min_duration=60, warmup=10 ** 9, **kwargs)
+
+
+def test_exit_threshold_above_enter_rejected():
+    with pytest.raises(ValueError):
+        AlertEngine(make_table(1), enter_density=50, exit_density=60)
+
+
+def test_congestion_needs_min_duration_and_hysteresis():
+    engine = congestion_engine()
+    events = run(engine, [80, 80, 80, 65, 65, 50, 50, 50])
+
+    raised, cleared = (CONGESTION, "raised"), (CONGESTION, "cleared")
+    # 60 sn kesintisiz giriş eşiği üstünde: üçüncü örnekte açılır
+    assert events[:3] == [[], [], [raised]]
+    # Bant içindeki 65 ne açık uyarıyı kapatır ne de çıkış sayacını başlatır
+    assert events[3:5] == [[], []]
+    assert events[5:] == [[], [], [cleared]]
+    assert engine.stats["raised"] == 1 and engine.stats["cleared"] == 1
+
+
+def test_interrupted_pending_restarts_timer():
+    engine = congestion_engine()
+    events = run(engine, [80, 80, 50, 80, 80, 80])
+    assert events == [[], [], [], [], [], [(CONGESTION, "raised")]]
+
+
+def test_open_alert_is_renotified_not_repeated():
+    engine = congestion_engine(renotify_interval=90)
+    events = run(engine, [80] * 10)
+
+    flat = [event for cycle in events for _, event in cycle]
+    assert flat == ["raised", "ongoing", "ongoing"]
+    assert [i for i, cycle in enumerate(events) if cycle] == [2, 5, 8]
+    # Her döngü yayınlanacak kritik örneklerden yalnızca bildirilenler bastırılmadı
+    assert engine.stats["suppressed"] == 7
+
+    ongoing = engine.process(make_batch(engine.table, 11, 80))[0]
+    assert ongoing["event"] == "ongoing" and ongoing["durationSec"] == 9 * STEP
+
+
+def anomaly_engine(**kwargs):
+    options = dict(enter_density=101, exit_density=100, warmup=20, anomaly_cooldown=300)
+    options.update(kwargs)
+    return AlertEngine(make_table(1), **options)
+
+
+def baseline(count, level=30.0):
+    """±1 salınan kararlı seri"""
+    return [level + (1 if i % 2 else -1) for i in range(count)]
+
+
+def test_zscore_spike_rewarms_baseline():
+    engine = anomaly_engine()
+    events = run(engine, baseline(30) + [95, 30, 95])
+    flat = [(i, event) for i, cycle in enumerate(events) for event in cycle]
+
+    # İlk sıçrama bildirilir; taban yeniden ısındığından sonrakiler sessiz kalır
+    assert flat == [(30, (ANOMALY, "spike"))]
+    assert engine.samples[0] == 2 and engine.stats["anomalies"] == 1
+
+
+def test_anomaly_cooldown_suppresses_repeat():
+    engine = anomaly_engine(warmup=2)
+    events = run(engine, baseline(10) + [95] + baseline(3) + [95])
+    flat = [(i, event) for i, cycle in enumerate(events) for event in cycle]
+
+    # Taban ısındı ama 14. döngü ilk alarmdan yalnızca 120 sn sonra
+    assert flat == [(10, (ANOMALY, "spike"))]
+    assert engine.samples[0] == 4
+
+
+def test_speed_drop_is_reported_per_metric():
+    engine = anomaly_engine()
+    run(engine, baseline(25), speeds=[50] * 25)
+    events = engine.process(make_batch(engine.table, 25, 30, avg_speed=10))
+
+    assert [(e["event"], e["metric"]) for e in events] == [("drop", "avg_speed")]
+    assert events[0]["expected"] == 50.0 and events[0]["zScore"] < -4
+
+
+def test_cusum_catches_small_persistent_shift():
+    engine = anomaly_engine(z_threshold=10.0)
+    events = run(engine, baseline(30) + baseline(15, level=32.5))
+
+    anomalies = [(i, e) for i, cycle in enumerate(events) for e in cycle]
+    assert len(anomalies) == 1
+    index, event = anomalies[0]
+    # Tek örnek z eşiğine yaklaşmadan birikimli sapma alarm verir
+    assert event == (ANOMALY, "spike") and 30 < index < 40
+
+    engine = anomaly_engine(z_threshold=10.0, cusum_h=1e9)
+    assert not any(run(engine, baseline(30) + baseline(15, level=32.5)))
+
+
+def test_alert_payloads_group_by_event():
+    engine = AlertEngine(make_table(3), min_duration=0, warmup=10 ** 9)
+    events = engine.process(make_batch(engine.table, 0, [80, 90, 10]))
+    payloads = alert_payloads(events, timestamp="2024-01-01T08:00:00")
+
+    assert len(payloads) == 1
+    payload = payloads[0]
+    assert (payload["alertType"], payload["event"], payload["severity"]) == (CONGESTION, "raised", "HIGH")
+    assert [item["id"] for item in payload["affectedIntersections"]] == [1, 2]
+    assert "alertType" not in payload["affectedIntersections"][0]
@@ -0,0 +1,107 @@
+# test_batch_engine.py
+"""Toplu analiz motoru: kavşak tablosu, zirve çarpanları ve ölçümlerin uygulanması"""
+
+import json
+from datetime import datetime
+
+import numpy as np
+import pytest
+
+from batch_engine import (CRITICAL_DENSITY, MODERATE_DENSITY, PEAK_TABLE, STATUS_CODES, TYPE_CODES,
+                          BatchTrafficEngine, IntersectionTable, hour_of_week, load_intersections,
+                          peak_multiplier)
+from conftest import make_table
+
+MONDAY_8 = datetime(2024, 1, 1, 8, 30)      # hafta içi sabah zirvesi
+SUNDAY_3 = datetime(2024, 1, 7, 3, 0)       # hafta sonu gece
+
+
+def test_duplicate_ids_rejected():
+    records = [{"id": 1, "lat": 0, "lng": 0}, {"id": 1, "lat": 1, "lng": 1}]
+    with pytest.raises(ValueError):
+        IntersectionTable.from_records(records)
+
+
+def test_rows_of_maps_unknown_ids_to_minus_one():
+    table = IntersectionTable.from_records([
+        {"id": iid, "lat": 0, "lng": 0} for iid in (30, 10, 20)
+    ])
+    assert table.rows_of(np.array([20, 99, 30, 10, 5])).tolist() == [2, -1, 0, 1, -1]
+    assert table.row_of(10) == 1 and table.row_of(99) is None
+    assert IntersectionTable.from_records([]).rows_of(np.array([1])).tolist() == [-1]
+
+
+def test_load_intersections_json_and_csv(tmp_path):
+    records = make_table(3).to_dicts()
+    json_path = tmp_path / "k.json"
+    json_path.write_text(json.dumps({"intersections": records}), encoding="utf-8")
+    csv_path = tmp_path / "k.csv"
+    csv_path.write_text("id,name,lat,lng,type\n" + "".join(
+        f"{r['id']},{r['name']},{r['lat']},{r['lng']},{r['type']}\n" for r in records), encoding="utf-8")
+
+    for path in (json_path, csv_path):
+        table = load_intersections(str(path))
+        assert table.to_dicts() == records
+
+
+def test_peak_multiplier_matches_table():
+    assert hour_of_week(MONDAY_8) == 8
+    assert peak_multiplier(MONDAY_8, "major") == 2.8
+    assert peak_multiplier(MONDAY_8, "minor") == 2.2
+    assert peak_multiplier(SUNDAY_3, "major") == 1.0
+    # Bilinmeyen tip "minor" sayılır
+    assert peak_multiplier(MONDAY_8, "unknown") == PEAK_TABLE[8, TYPE_CODES["minor"]]
+
+
+def test_compute_matches_compute_block_for_same_seed():
+    table = make_table(12)
+    rows = np.arange(len(table))
+    batch = BatchTrafficEngine(table, np.random.default_rng(7)).compute(MONDAY_8)
+    block = BatchTrafficEngine(table, np.random.default_rng(7)).compute_block(
+        np.array([hour_of_week(MONDAY_8)]), rows)
+
+    for name in ("density", "avg_speed", "wait_time", "vehicle_count", "status_code"):
+        np.testing.assert_array_equal(getattr(batch, name), block[name][0])
+    np.testing.assert_array_equal(batch.ids, table.ids)
+
+
+def test_compute_subset_and_status_thresholds():
+    table = make_table(200)
+    rows = np.arange(0, 200, 3)
+    batch = BatchTrafficEngine(table, np.random.default_rng(1)).compute(MONDAY_8, rows)
+
+    assert len(batch) == len(rows)
+    np.testing.assert_array_equal(batch.ids, table.ids[rows])
+    assert ((batch.density >= 0) & (batch.density <= 100)).all()
+    assert (batch.avg_speed >= 15).all()
+    # Durum yoğunluk eşiklerinden türetilir (yuvarlama sınırı dışında)
+    clear = (np.abs(batch.density - CRITICAL_DENSITY * 100) > 0.1) & (np.abs(batch.density - MODERATE_DENSITY * 100) > 0.1)
+    expected = (batch.density > MODERATE_DENSITY * 100).astype(int) + (batch.density > CRITICAL_DENSITY * 100)
+    np.testing.assert_array_equal(batch.status_code[clear], expected[clear])
+
+
+def test_apply_measurements_overrides_only_measured():
+    table = make_table(3)
+    batch = BatchTrafficEngine(table, np.random.default_rng(3)).compute(SUNDAY_3)
+    before_speed = batch.avg_speed.copy()
+    nan = np.nan
+
+    batch.apply_measurements(density=np.array([85.04, nan, 10.0]),
+                             avg_speed=np.array([nan, 42.0, nan]),
+                             wait_time=np.full(3, nan),
+                             vehicle_count=np.array([nan, nan, 9.0]))
+
+    assert batch.density[0] == 85.0 and batch.density[2] == 10.0
+    assert batch.status_code[0] == STATUS_CODES["critical"] and batch.status_code[2] == STATUS_CODES["normal"]
+    assert batch.avg_speed[1] == 42 and batch.avg_speed[0] == before_speed[0]
+    assert batch.vehicle_count[2] == 9
+
+
+def test_apply_travel_times_skips_missing_routes():
+    table = make_table(2)
+    batch = BatchTrafficEngine(table, np.random.default_rng(4)).compute(SUNDAY_3)
+    before = batch.avg_speed.copy()
+
+    batch.apply_travel_times(np.array([360.0, 0.0]), np.array([6000.0, 500.0]))
+    assert batch.avg_speed[0] == 60 and batch.wait_time[0] == 0
+    assert batch.avg_speed[1] == before[1]
@@ -0,0 +1,43 @@
+# test_db_schema.py
+"""db_schema: hafif içe aktarma ve kavşak tablosu eşitleme"""
+
+import os
+import subprocess
+import sys
+
+import db_schema
+from conftest import make_table
+from db_writer import connect
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_import_does_not_load_numpy():
+    code = "import sys, db_schema; sys.exit('numpy' in sys.modules)"
+    assert subprocess.run([sys.executable, "-c", code], cwd=ROOT).returncode == 0
+
+
+def test_sync_intersections(tmp_path):
+    conn = connect(str(tmp_path / "t.db"))
+    db_schema.migrate(conn)
+    db_schema.sync_intersections(conn, make_table(3))
+    rows = conn.execute("SELECT id, name, type FROM intersections ORDER BY id").fetchall()
+    conn.close()
+
+    assert [(iid, name) for iid, name, _ in rows] == [(1, "Kavşak 1"), (2, "Kavşak 2"), (3, "Kavşak 3")]
+    assert all(kind for _, _, kind in rows)
+
+
+def test_same_second_reading_newest_wins_backfill_keeps_existing(tmp_path):
+    conn = connect(str(tmp_path / "t.db"))
+    db_schema.migrate(conn)
+    db_schema.sync_intersections(conn, make_table(1))
+
+    conn.execute(db_schema.INSERT_TRAFFIC_LOG_SQL, (1, 100, 40.0, 30, 10, 5, 0))
+    # Komutla tetiklenen çalışma aynı saniyede
+    conn.execute(db_schema.INSERT_TRAFFIC_LOG_SQL, (1, 100, 85.0, 12, 60, 9, 2))
+    conn.execute(db_schema.BACKFILL_TRAFFIC_LOG_SQL, (1, 100, 1.0, 1, 1, 1, 0))
+    rows = conn.execute("SELECT density, avg_speed, wait_time, vehicle_count, status FROM traffic_logs").fetchall()
+    conn.close()
+
+    assert rows == [(85.0, 12, 60, 9, 2)]
@@ -0,0 +1,120 @@
+# test_db_writer.py
+"""TrafficDBWriter: grup commit, hatalı satırların ayrılması ve zaman aşımlı flush/close"""
+
+import json
+import sqlite3
+import threading
+import time
+
+import pytest
+
+from db_writer import TrafficDBWriter
+
+INSERT = "INSERT INTO t (id, value) VALUES (?, ?)"
+INSERT_OTHER = "INSERT INTO u (id) VALUES (?)"
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    path = str(tmp_path / "t.db")
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE t (id INTEGER PRIMARY KEY, value INTEGER NOT NULL)")
+    conn.execute("CREATE TABLE u (id INTEGER PRIMARY KEY)")
+    conn.commit()
+    conn.close()
+    return path
+
+
+def rows_of(path, table):
+    conn = sqlite3.connect(path)
+    try:
+        return conn.execute(f"SELECT * FROM {table} ORDER BY id").fetchall()
+    finally:
+        conn.close()
+
+
+def test_grouped_commit_and_hook(db_path):
+    commits = []
+    writer = TrafficDBWriter(db_path, flush_interval=60, on_commit=lambda s, n: commits.append(n))
+    writer.write_many(INSERT, [(1, 10), (2, 20)])
+    writer.write_many(INSERT_OTHER, [(1,)])
+    assert writer.flush()
+    writer.close()
+
+    assert rows_of(db_path, "t") == [(1, 10), (2, 20)]
+    assert rows_of(db_path, "u") == [(1,)]
+    assert commits == [3]
+    assert writer.stats["commits"] == 1 and writer.stats["errors"] == 0
+
+
+def test_bad_row_does_not_roll_back_group(db_path, tmp_path):
+    dead_letter = tmp_path / "dead.jsonl"
+    writer = TrafficDBWriter(db_path, flush_interval=60, dead_letter_path=str(dead_letter))
+    writer.write_many(INSERT, [(1, 10), (2, None), (3, 30)])     # NOT NULL ihlali
+    writer.write_many(INSERT_OTHER, [(1,), (2,)])
+    writer.flush()
+    writer.close()
+
+    assert rows_of(db_path, "t") == [(1, 10), (3, 30)]
+    assert rows_of(db_path, "u") == [(1,), (2,)]
+    assert writer.stats["rows_written"] == 4
+    assert writer.stats["dead_lettered"] == 1
+
+    entries = [json.loads(line) for line in dead_letter.read_text(encoding="utf-8").splitlines()]
+    assert [e["params"] for e in entries] == [[2, None]]
+    assert entries[0]["sql"] == INSERT and "NOT NULL" in entries[0]["error"]
+
+
+def test_failing_hook_does_not_count_as_write_error(db_path):
+    def hook(seconds, rows):
+        raise RuntimeError("hook")
+
+    writer = TrafficDBWriter(db_path, flush_interval=60, on_commit=hook)
+    writer.write_many(INSERT, [(1, 10)])
+    writer.flush()
+    writer.close()
+
+    assert rows_of(db_path, "t") == [(1, 10)]
+    assert writer.stats["errors"] == 0 and writer.stats["dead_lettered"] == 0
+
+
+def test_flush_and_close_time_out_when_queue_full(db_path, monkeypatch):
+    writer = TrafficDBWriter(db_path, max_pending=1)
+    writer.close()
+    # Yazıcı thread'i çalışıyor görünür ama kuyruğu kimse boşaltmaz
+    monkeypatch.setattr(writer._thread, "is_alive", lambda: True)
+    writer._queue.put(object())
+
+    assert writer.flush(timeout=0.05) is False
+    writer.close(timeout=0.05)
+
+
+def test_full_queue_applies_backpressure(db_path):
+    writer = TrafficDBWriter(db_path, max_pending=1, flush_interval=60, put_timeout=0.01)
+    # Yazıcı thread'i durdurulur, kuyruk elle doldurulup sonra boşaltılır
+    writer.close()
+    release = threading.Event()
+    writer._thread = threading.Thread(target=release.wait)
+    writer._thread.start()
+    writer._queue.put(("x", [()]))
+    threading.Timer(0.2, writer._queue.get).start()
+
+    started = time.monotonic()
+    assert writer.write_many(INSERT, [(1, 10)])
+    assert time.monotonic() - started >= 0.15
+    assert writer.stats["blocked"] == 1
+    assert writer._queue.get_nowait() == (INSERT, [(1, 10)])
+    release.set()
+
+
+def test_stuck_queue_spills_to_dead_letter(db_path, tmp_path):
+    dead_letter = tmp_path / "dead.jsonl"
+    writer = TrafficDBWriter(db_path, max_pending=1, put_timeout=0.01, block_timeout=0.05,
+                             dead_letter_path=str(dead_letter))
+    writer.close()
+    # Durmuş yazıcı: satırlar düşürülmez, ölü mektuba yazılır
+    assert writer.write_many(INSERT, [(1, 10), (2, 20)]) is False
+
+    entries = [json.loads(line) for line in dead_letter.read_text(encoding="utf-8").splitlines()]
+    assert [e["params"] for e in entries] == [[1, 10], [2, 20]]
+    assert writer.stats["dead_lettered"] == 2
@@ -0,0 +1,102 @@
+# test_forecaster.py
+"""TrafficForecaster: özetlerden parça parça ön doldurma ve tahmin belgesi"""
+
+from datetime import datetime
+
+import numpy as np
+import pytest
+
+import db_schema
+from batch_engine import STATUS_NAMES, hour_of_week
+from conftest import make_table, make_values
+from db_writer import connect
+from forecaster import TrafficForecaster
+
+NOW = 1_700_000_000 - 1_700_000_000 % 3600
+DAY = 86400
+
+
+def insert_rollups(conn, records):
+    """(kavşak id, kova, yoğunluk ort., hız ort.) satırları; diğer sütunlar önemsiz"""
+    others = [c for c in db_schema.ROLLUP_METRIC_COLUMNS if c not in ("density_mean", "speed_mean")]
+    conn.executemany(
+        f"INSERT INTO traffic_rollup_1h (intersection_id, bucket, n, density_mean, speed_mean, "
+        f"{', '.join(others)}, normal_count, moderate_count, critical_count) "
+        f"VALUES (?, ?, 1, ?, ?, {', '.join('0' for _ in others)}, 1, 0, 0)",
+        records
+    )
+
+
+@pytest.fixture
+def rollup_conn(tmp_path):
+    conn = connect(str(tmp_path / "t.db"))
+    db_schema.migrate(conn)
+    rng = np.random.default_rng(0)
+    records = [
+        (iid, bucket, float(rng.uniform(0, 100)), float(rng.uniform(5, 60)))
+        for bucket in range(NOW - 35 * DAY, NOW + 3600, 3600)
+        for iid in (1, 2, 3, 99)                                   # 99 tabloda yok
+        if rng.random() < 0.7
+    ]
+    insert_rollups(conn, records)
+    yield conn, records
+    conn.close()
+
+
+def expected_profiles(records, table, days):
+    n = len(table)
+    sums, counts = np.zeros((n, 168, 2)), np.zeros((n, 168))
+    last = {}
+    for iid, bucket, density, speed in records:
+        row = table.row_of(iid)
+        if row is None or not NOW - days * DAY <= bucket <= NOW:
+            continue
+        slot = hour_of_week(datetime.fromtimestamp(bucket))
+        sums[row, slot] += (density, speed)
+        counts[row, slot] += 1
+        last[row] = (density, speed)
+    return sums / np.maximum(counts, 1)[..., None], counts, last
+
+
+@pytest.mark.parametrize("chunk_rows", [7, 100_000])
+def test_bootstrap_matches_per_row_means(rollup_conn, chunk_rows):
+    conn, records = rollup_conn
+    table = make_table(3)
+    forecaster = TrafficForecaster(table)
+    loaded = forecaster.bootstrap_from_rollups(conn, days=28, chunk_rows=chunk_rows, now=NOW)
+
+    means, counts, last = expected_profiles(records, table, days=28)
+    assert loaded == counts.sum()
+    np.testing.assert_array_equal(forecaster.season_n, counts)
+    np.testing.assert_allclose(forecaster.season, means, rtol=1e-5)
+    for row, value in last.items():
+        np.testing.assert_array_equal(forecaster.last_value[row], value)
+
+
+def test_bootstrap_without_rollups_is_noop(tmp_path):
+    conn = connect(str(tmp_path / "t.db"))
+    db_schema.migrate(conn)
+    forecaster = TrafficForecaster(make_table(2))
+    assert forecaster.bootstrap_from_rollups(conn, now=NOW) == 0
+    assert not forecaster.season_n.any()
+    conn.close()
+
+
+def test_predictions_document_skips_unobserved():
+    table = make_table(4)
+    forecaster = TrafficForecaster(table, horizons=(15, 60))
+    values = make_values(4)[:, :2]
+    now = datetime(2024, 1, 1, 8, 0)
+    forecaster.update(np.array([0, 2, 3]), values[[0, 2, 3]], now)
+
+    document = forecaster.predictions_document(now)
+    assert document["horizons"] == [15, 60]
+    assert [item["id"] for item in document["intersections"]] == [1, 3, 4]
+
+    first = document["intersections"][0]
+    assert first["samples"] == 1
+    assert [f["time"] for f in first["forecasts"]] == ["2024-01-01T08:15:00", "2024-01-01T09:00:00"]
+    for forecast in first["forecasts"]:
+        assert forecast["density"] == round(values[0, 0], 1)
+        assert forecast["avgSpeed"] == int(values[0, 1])
+        assert isinstance(forecast["avgSpeed"], int) and forecast["status"] in STATUS_NAMES
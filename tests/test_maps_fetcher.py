@@ -0,0 +1,135 @@
+# test_maps_fetcher.py
+"""DistanceMatrixFetcher: yerel Distance Matrix taklidine karşı gruplama, önbellek, süre aşımı ve hatalar"""
+
+import time
+
+import numpy as np
+import pytest
+
+from local_stubs import DistanceMatrixStub
+from maps_fetcher import MAX_ORIGINS_PER_REQUEST, DistanceMatrixFetcher, format_point
+
+DESTINATION = format_point(39.9208, 32.8541)
+
+
+@pytest.fixture
+def stub():
+    server = DistanceMatrixStub(seed=1).start()
+    yield server
+    server.stop()
+
+
+def points(count):
+    lat = 39.85 + np.arange(count) * 1e-3
+    lng = 32.70 + np.arange(count) * 1e-3
+    return lat, lng, [DESTINATION] * count
+
+
+def make_fetcher(stub, **kwargs):
+    return DistanceMatrixFetcher("test-key", base_url=stub.url, **kwargs)
+
+
+def test_origins_batched_per_request(stub):
+    fetcher = make_fetcher(stub)
+    lat, lng, destinations = points(60)
+    try:
+        duration, distance = fetcher.fetch(lat, lng, destinations, time.monotonic() + 5)
+    finally:
+        fetcher.close()
+
+    assert stub.request_count == 3                      # 25 + 25 + 10
+    assert stub.origin_count == 60
+    assert not np.isnan(duration).any() and not np.isnan(distance).any()
+    assert fetcher.stats["requests"] == 3
+
+
+def test_max_origins_capped_at_api_limit(stub):
+    fetcher = make_fetcher(stub, max_origins=100)
+    assert fetcher.max_origins == MAX_ORIGINS_PER_REQUEST
+    fetcher.close()
+
+
+def test_cache_hit_within_ttl(stub):
+    fetcher = make_fetcher(stub, cache_ttl=60)
+    lat, lng, destinations = points(10)
+    try:
+        first = fetcher.fetch(lat, lng, destinations, time.monotonic() + 5)
+        second = fetcher.fetch(lat, lng, destinations, time.monotonic() + 5)
+    finally:
+        fetcher.close()
+
+    assert stub.request_count == 1
+    assert fetcher.stats["cache_hits"] == 10
+    np.testing.assert_array_equal(first[0], second[0])
+
+
+def test_expired_entries_refetched_and_evicted(stub):
+    fetcher = make_fetcher(stub)
+    lat, lng, destinations = points(5)
+    ttl = np.full(5, 0.05)
+    try:
+        fetcher.fetch(lat, lng, destinations, time.monotonic() + 5, ttl)
+        time.sleep(0.1)
+        fetcher.evict_expired()
+        assert fetcher._cache == {}
+        fetcher.fetch(lat, lng, destinations, time.monotonic() + 5, ttl)
+    finally:
+        fetcher.close()
+
+    assert stub.request_count == 2
+    assert fetcher.stats["cache_hits"] == 0
+
+
+def test_deadline_falls_back_to_nan(stub):
+    stub.latency = 0.3
+    fetcher = make_fetcher(stub)
+    lat, lng, destinations = points(5)
+    try:
+        duration, distance = fetcher.fetch(lat, lng, destinations, time.monotonic() + 0.05)
+        assert np.isnan(duration).all() and np.isnan(distance).all()
+        assert fetcher.stats["fallbacks"] == 5
+
+        # Bekleyen istek bitmeden gelen döngü aynı noktaları tekrar istemez
+        fetcher.fetch(lat, lng, destinations, time.monotonic() + 0.05)
+        assert fetcher.stats["in_flight_skips"] == 5
+        assert fetcher.stats["requests"] == 1
+
+        # İstek zaman aşımıyla bitince noktalar yeniden istenebilir
+        time.sleep(0.2)
+        stub.latency = 0.0
+        duration, _ = fetcher.fetch(lat, lng, destinations, time.monotonic() + 5)
+    finally:
+        fetcher.close()
+
+    assert not np.isnan(duration).any()
+    assert fetcher.stats["timeouts"] == 1 and fetcher.stats["requests"] == 2
+
+
+def test_error_response_returns_nan_and_allows_retry(stub):
+    stub.error_rate = 1.0
+    fetcher = make_fetcher(stub)
+    lat, lng, destinations = points(3)
+    try:
+        duration, _ = fetcher.fetch(lat, lng, destinations, time.monotonic() + 5)
+        assert np.isnan(duration).all()
+        assert fetcher.stats["errors"] == 1
+
+        stub.error_rate = 0.0
+        duration, _ = fetcher.fetch(lat, lng, destinations, time.monotonic() + 5)
+    finally:
+        fetcher.close()
+
+    assert not np.isnan(duration).any()
+    assert stub.request_count == 2
+
+
+def test_request_latency_hook(stub):
+    observed = []
+    fetcher = make_fetcher(stub, on_request_latency=observed.append)
+    lat, lng, destinations = points(30)
+    try:
+        fetcher.fetch(lat, lng, destinations, time.monotonic() + 5)
+    finally:
+        fetcher.close()
+
+    assert len(observed) == 2 and all(s >= 0 for s in observed)
@@ -0,0 +1,127 @@
+# test_mqtt_publisher.py
+"""AsyncMQTTPublisher: diskten yeniden gönderimde sıra, onaydan sonra tüketim ve kapatma"""
+
+import threading
+import time
+from concurrent.futures import Future
+
+import pytest
+
+from mqtt_publisher import AsyncMQTTPublisher, DiskSpool
+
+
+class ScriptedConnection:
+    """Onayları testin elle tamamladığı bağlantı"""
+
+    def __init__(self):
+        self.sent = []
+        self._cond = threading.Condition()
+
+    def connect(self):
+        future = Future()
+        future.set_result({"session_present": False})
+        return future
+
+    def publish(self, topic, payload, qos):
+        future = Future()
+        with self._cond:
+            self.sent.append((payload, future))
+            self._cond.notify_all()
+        return future, len(self.sent)
+
+    def wait_sent(self, count, timeout=5.0):
+        with self._cond:
+            assert self._cond.wait_for(lambda: len(self.sent) >= count, timeout), len(self.sent)
+        return self.sent[:count]
+
+
+def wait_until(predicate, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+
+
+@pytest.fixture
+def spool_path(tmp_path):
+    return str(tmp_path / "spool.bin")
+
+
+def test_replay_rewinds_to_failed_record(spool_path):
+    connection = ScriptedConnection()
+    spool = DiskSpool(spool_path)
+    publisher = AsyncMQTTPublisher(connection, spool)
+    messages = [f"m{i}".encode() for i in range(10)]
+    for payload in messages:
+        publisher.publish("t", payload)          # bağlantı yok: diske
+    assert publisher.stats["spooled"] == 10
+
+    publisher.connect(wait=1.0)
+    first = connection.wait_sent(10)
+    assert [p for p, _ in first] == messages
+
+    for payload, future in first[:3]:
+        future.set_result(None)
+    remaining = len(spool)
+    assert remaining > 0                          # onaylanmayanlar tüketilmedi
+    first[3][1].set_exception(RuntimeError("ack timeout"))
+    for _, future in first[4:]:
+        future.set_result(None)                   # eski nesil onayları ofseti ilerletmez
+    assert len(spool) == remaining
+
+    resent = connection.wait_sent(17)[10:]
+    assert [p for p, _ in resent] == messages[3:]
+    for _, future in resent:
+        future.set_result(None)
+    wait_until(lambda: len(spool) == 0)
+    assert publisher.stats["rewinds"] == 1
+
+    # Kuyruk boşken yeni mesaj doğrudan gönderilir
+    publisher.publish("t", b"live")
+    assert connection.wait_sent(18)[-1][0] == b"live"
+    connection.sent[-1][1].set_result(None)
+    publisher.close()
+
+
+def test_new_messages_queue_behind_unacked_replay(spool_path):
+    connection = ScriptedConnection()
+    spool = DiskSpool(spool_path)
+    publisher = AsyncMQTTPublisher(connection, spool)
+    publisher.publish("t", b"old")
+    publisher.connect(wait=1.0)
+    connection.wait_sent(1)
+
+    publisher.publish("t", b"new")                # "old" onaylanmadı: "new" arkasına yazılır
+    assert publisher.stats["spooled"] == 2
+    connection.sent[0][1].set_result(None)
+    sent = connection.wait_sent(2)
+    assert [p for p, _ in sent] == [b"old", b"new"]
+    sent[1][1].set_result(None)
+    wait_until(lambda: len(spool) == 0)
+    publisher.close()
+
+
+def test_close_persists_unacked_and_ignores_late_failures(spool_path):
+    connection = ScriptedConnection()
+    publisher = AsyncMQTTPublisher(connection, DiskSpool(spool_path))
+    publisher.connect(wait=1.0)
+    publisher.publish("t", b"pending")
+    (_, future), = connection.wait_sent(1)
+
+    publisher.close(timeout=0)
+    assert publisher.stats["persisted_on_close"] == 1
+
+    # Kapatmadan sonra gelen hata kapalı kuyruğa yazmaya çalışmaz
+    future.set_exception(RuntimeError("disconnected"))
+    assert publisher.spool.closed
+
+    reopened = DiskSpool(spool_path)
+    assert [(topic, payload) for _, topic, payload in reopened.read(10)] == [("t", b"pending")]
+    reopened.close()
+
+
+def test_closed_spool_rejects_appends(spool_path):
+    spool = DiskSpool(spool_path)
+    spool.close()
+    assert spool.append("t", b"x") is False
+    assert spool.read(1) == []
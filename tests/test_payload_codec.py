@@ -0,0 +1,227 @@
+# test_payload_codec.py
+"""PayloadEncoder → PayloadDecoder gidiş-dönüş testleri: tüm modlar, parçalar ve sırasız teslim"""
+
+import json
+import random
+
+import numpy as np
+import pytest
+
+import payload_codec
+from conftest import make_table, make_values
+from payload_codec import FRAME_MAGIC, METRIC_FIELDS, PayloadDecoder, PayloadEncoder
+
+
+def expected_state(table, rows, values):
+    return {
+        int(table.ids[r]): {
+            name: (round(float(v[i]), 1) if name == "density" else int(v[i]))
+            for i, name in enumerate(METRIC_FIELDS)
+        }
+        for r, v in zip(rows.tolist(), values)
+    }
+
+
+def send(encoder, decoder, rows, values, order=None, ack=True):
+    """Kodla, (isteğe bağlı sırayla) çözücüye ver; tamamlanan belge sayısı"""
+    seq, messages = encoder.encode(rows, values)
+    if order is not None:
+        messages = [messages[i] for i in order(len(messages))]
+    done = sum(decoder.feed(m) is not None for m in messages)
+    if ack:
+        encoder.acknowledge(seq)
+    return seq, messages, done
+
+
+@pytest.mark.parametrize("binary_format", ["msgpack", "cbor", "json"])
+@pytest.mark.parametrize("compress", [True, False])
+def test_binary_round_trip(binary_format, compress):
+    table = make_table(50)
+    rows, values = np.arange(50), make_values(50)
+    encoder = PayloadEncoder(table, "dev", binary=True, binary_format=binary_format, compress=compress)
+    decoder = PayloadDecoder()
+
+    _, messages, done = send(encoder, decoder, rows, values)
+
+    assert all(m[:3] == FRAME_MAGIC for m in messages)
+    assert done == 1
+    assert decoder.state == expected_state(table, rows, values)
+    assert decoder.meta[1] == {"name": "Kavşak 1", "lat": table.lat[0], "lng": table.lng[0]}
+
+
+def test_json_keyframe_round_trip():
+    table = make_table(20)
+    rows, values = np.arange(20), make_values(20)
+    encoder = PayloadEncoder(table, "dev")
+    decoder = PayloadDecoder()
+
+    _, messages, _ = send(encoder, decoder, rows, values)
+
+    doc = json.loads(messages[0])
+    assert doc["type"] == "key" and doc["deviceId"] == "dev"
+    assert decoder.state == expected_state(table, rows, values)
+
+
+def test_json_fallback_when_no_binary_serializer(monkeypatch):
+    monkeypatch.setattr(payload_codec, "msgpack", None)
+    monkeypatch.setattr(payload_codec, "cbor2", None)
+    assert payload_codec.default_binary_format() == "json"
+
+    table = make_table(10)
+    rows, values = np.arange(10), make_values(10)
+    encoder = PayloadEncoder(table, "dev", binary=True)
+    decoder = PayloadDecoder()
+    send(encoder, decoder, rows, values)
+
+    assert encoder.binary_format == "json"
+    assert decoder.state == expected_state(table, rows, values)
+
+
+def test_default_format_prefers_msgpack():
+    assert payload_codec.default_binary_format() == "msgpack"
+
+
+@pytest.mark.parametrize("binary", [True, False])
+def test_parts_delivered_out_of_order(binary):
+    table = make_table(300)
+    rows, values = np.arange(300), make_values(300)
+    encoder = PayloadEncoder(table, "dev", binary=binary, compress=False, max_message_bytes=2048)
+    decoder = PayloadDecoder()
+    rng = random.Random(7)
+
+    _, messages, done = send(encoder, decoder, rows, values,
+                             order=lambda n: rng.sample(range(n), n))
+
+    assert len(messages) > 2
+    # Binary: tek belge son parçayla tamamlanır; JSON: her parça bağımsız bir belgedir
+    assert done == (1 if binary else len(messages))
+    assert decoder.state == expected_state(table, rows, values)
+
+
+def test_incomplete_binary_frames_wait_for_all_parts():
+    table = make_table(300)
+    encoder = PayloadEncoder(table, "dev", binary=True, compress=False, max_message_bytes=2048)
+    decoder = PayloadDecoder()
+    _, messages = encoder.encode(np.arange(300), make_values(300))
+
+    assert [decoder.feed(m) for m in messages[:-1]] == [None] * (len(messages) - 1)
+    assert decoder.state == {}
+    assert decoder.feed(messages[-1]) is not None
+
+
+@pytest.mark.parametrize("binary", [True, False])
+def test_delta_sends_only_changed_rows(binary):
+    table = make_table(30)
+    rows, values = np.arange(30), make_values(30)
+    encoder = PayloadEncoder(table, "dev", binary=binary)
+    decoder = PayloadDecoder()
+    send(encoder, decoder, rows, values)
+
+    changed = values.copy()
+    changed[[3, 17], 0] += 10          # yoğunluk eşiği aşılır
+    changed[5, 0] += 0.2               # eşik altı: gönderilmez
+    seq, messages, _ = send(encoder, decoder, rows, changed)
+
+    doc = decoder.feed(messages[0]) if binary else json.loads(messages[0])
+    assert doc["type"] == "delta" and doc["seq"] == seq
+    assert doc["ids"] == [4, 18]
+    expected = expected_state(table, rows, changed)
+    expected[6] = expected_state(table, rows, values)[6]
+    assert decoder.state == expected
+
+
+def test_unacknowledged_delta_is_resent():
+    table = make_table(10)
+    rows, values = np.arange(10), make_values(10)
+    encoder = PayloadEncoder(table, "dev")
+    decoder = PayloadDecoder()
+    send(encoder, decoder, rows, values)
+
+    changed = values.copy()
+    changed[2, 0] += 10
+    send(encoder, decoder, rows, changed, ack=False)
+    _, messages, _ = send(encoder, decoder, rows, changed)
+
+    assert json.loads(messages[0])["ids"] == [3]
+
+
+def test_keyframe_resets_state():
+    table = make_table(10)
+    values = make_values(10)
+    encoder = PayloadEncoder(table, "dev", keyframe_interval=3)
+    decoder = PayloadDecoder()
+    # Önceki çalışmadan kalan, artık tabloda olmayan kavşak
+    decoder.apply({"seq": 0, "type": "key", "ids": [999], "density": [1.0], "averageSpeed": [1],
+                   "waitTime": [1], "vehicleCount": [1], "status": [0]})
+    send(encoder, decoder, np.arange(10), values)           # seq 1: keyframe
+    send(encoder, decoder, np.arange(10), values + 20)      # seq 2: delta
+    seq, messages, _ = send(encoder, decoder, np.arange(10), values)   # seq 3: periyodik keyframe
+
+    assert json.loads(messages[0])["type"] == "key" and seq == 3
+    assert decoder.state == expected_state(table, np.arange(10), values)
+
+
+@pytest.mark.parametrize("binary", [True, False])
+def test_partial_batches_keep_other_classes(binary):
+    """Sınıf bazlı döngüler: her encode tablonun yalnızca bir kısmını verir"""
+    table = make_table(20)
+    major, minor = np.arange(0, 20, 2), np.arange(1, 20, 2)
+    encoder = PayloadEncoder(table, "dev", binary=binary, keyframe_interval=3)
+    decoder = PayloadDecoder()
+    latest = np.zeros((20, 5))
+
+    for cycle in range(12):
+        rows = major if cycle % 2 == 0 else minor
+        values = make_values(len(rows), seed=cycle)
+        latest[rows] = values
+        send(encoder, decoder, rows, values)
+        if cycle:
+            # Keyframe'ler (seq 3, 6, ...) diğer sınıfın kavşaklarını silmez
+            assert decoder.state == expected_state(table, np.arange(20), latest), cycle
+
+
+def test_stale_delta_after_keyframe_is_ignored():
+    table = make_table(5)
+    rows, values = np.arange(5), make_values(5)
+    encoder = PayloadEncoder(table, "dev", keyframe_interval=3)
+    decoder = PayloadDecoder()
+    send(encoder, decoder, rows, values)                          # seq 1: keyframe
+    _, stale, _ = send(encoder, decoder, rows, values + 20, ack=False)  # seq 2: delta
+    _, key, _ = send(encoder, decoder, rows, values + 40)         # seq 3: keyframe
+
+    # seq 2 yeniden iletilir (QoS1 / çevrimdışı kuyruk)
+    decoder.feed(stale[0])
+    assert decoder.state == expected_state(table, rows, values + 40)
+
+
+def test_older_delta_does_not_overwrite_newer_value():
+    decoder = PayloadDecoder()
+
+    def doc(seq, kind, density, ids=(1,)):
+        return {"seq": seq, "type": kind, "ids": list(ids), "density": [density] * len(ids),
+                "averageSpeed": [30] * len(ids), "waitTime": [10] * len(ids),
+                "vehicleCount": [5] * len(ids), "status": [0] * len(ids)}
+
+    decoder.apply(doc(1, "key", 10.0, ids=(1, 2)))
+    assert decoder.apply(doc(5, "delta", 50.0)) == 1
+    assert decoder.apply(doc(4, "delta", 40.0)) == 0
+    assert decoder.state[1]["density"] == 50.0
+    # Aynı mesajın tekrarı değişiklik yapmaz
+    assert decoder.apply(doc(5, "delta", 50.0)) == 1
+    assert decoder.state[1]["density"] == 50.0
+
+
+def test_keyframe_after_newer_delta_keeps_delta():
+    decoder = PayloadDecoder()
+
+    def doc(seq, kind, density, ids):
+        return {"seq": seq, "type": kind, "ids": list(ids), "density": [density] * len(ids),
+                "averageSpeed": [30] * len(ids), "waitTime": [10] * len(ids),
+                "vehicleCount": [5] * len(ids), "status": [0] * len(ids)}
+
+    decoder.apply(doc(1, "key", 10.0, (1, 2, 3)))
+    decoder.apply(doc(7, "delta", 70.0, (2,)))
+    # seq 6 keyframe geç geldi: 2 numaralı kavşağın seq 7 değeri korunur, 3 kaldırılır
+    decoder.apply(doc(6, "key", 60.0, (1, 2)))
+
+    assert {iid: s["density"] for iid, s in decoder.state.items()} == {1: 60.0, 2: 70.0}
@@ -0,0 +1,99 @@
+# test_recent_buffer.py
+"""RecentCycleBuffer: artımlı kayan istatistiklerin tam taramayla tutarlılığı"""
+
+from datetime import datetime, timedelta
+
+import numpy as np
+
+from batch_engine import TrafficBatch
+from conftest import make_table, make_values
+from recent_buffer import RecentCycleBuffer
+
+START = datetime(2024, 1, 1, 12, 0)
+
+
+def make_batch(table, values, rows=None, cycle=0):
+    rows = np.arange(len(table)) if rows is None else np.asarray(rows)
+    values = values[rows]
+    return TrafficBatch(
+        rows=rows, ids=table.ids[rows],
+        density=values[:, 0].astype(np.float32),
+        avg_speed=values[:, 1].astype(np.int32),
+        wait_time=values[:, 2].astype(np.int32),
+        vehicle_count=values[:, 3].astype(np.int32),
+        status_code=values[:, 4].astype(np.int8),
+        timestamp=START + timedelta(seconds=30 * cycle),
+    )
+
+
+def assert_matches_full_scan(buffer):
+    incremental = buffer.stats()
+    scanned = buffer.window_stats(None)
+    np.testing.assert_array_equal(incremental["count"], scanned["count"])
+    for key in ("mean", "std", "min", "max"):
+        np.testing.assert_allclose(incremental[key], scanned[key], rtol=1e-9, atol=1e-4, equal_nan=True)
+
+
+def test_incremental_stats_match_scan_across_wraparound():
+    table = make_table(20)
+    buffer = RecentCycleBuffer(table, capacity=5)
+    rng = np.random.default_rng(0)
+
+    for cycle in range(17):
+        values = make_values(len(table), seed=cycle)
+        # Bazı döngüler yalnızca kavşakların bir kısmını içerir
+        rows = np.sort(rng.choice(len(table), 12, replace=False)) if cycle % 3 else None
+        buffer.push(make_batch(table, values, rows, cycle))
+        assert_matches_full_scan(buffer)
+
+    assert len(buffer) == 5 and buffer.cycles == 17
+
+
+def test_evicted_extremes_are_recomputed():
+    table = make_table(1)
+    buffer = RecentCycleBuffer(table, capacity=3)
+    for cycle, density in enumerate((90.0, 10.0, 50.0, 40.0, 60.0)):
+        values = np.array([[density, 30, 10, 5, 0]])
+        buffer.push(make_batch(table, values, cycle=cycle))
+
+    stats = buffer.stats()
+    assert stats["min"][0, 0] == 40.0 and stats["max"][0, 0] == 60.0
+    assert stats["count"][0] == 3
+
+
+def test_repeated_extreme_survives_single_eviction():
+    table = make_table(1)
+    buffer = RecentCycleBuffer(table, capacity=4)
+    for cycle, density in enumerate((80.0, 80.0, 20.0, 30.0, 40.0)):
+        buffer.push(make_batch(table, np.array([[density, 30, 10, 5, 0]]), cycle=cycle))
+
+    assert buffer.stats()["max"][0, 0] == 80.0
+    assert_matches_full_scan(buffer)
+
+
+def test_missing_intersection_has_nan_stats():
+    table = make_table(3)
+    buffer = RecentCycleBuffer(table, capacity=4)
+    buffer.push(make_batch(table, make_values(3), rows=[0, 2]))
+
+    stats = buffer.stats()
+    assert stats["count"].tolist() == [1, 0, 1]
+    assert np.isnan(stats["mean"][1]).all()
+    assert not buffer.latest()["valid"][1]
+
+
+def test_window_by_seconds_and_latest():
+    table = make_table(2)
+    buffer = RecentCycleBuffer(table, capacity=10)
+    assert buffer.latest() is None
+
+    for cycle in range(6):
+        buffer.push(make_batch(table, make_values(2, seed=cycle), cycle=cycle))
+
+    now = (START + timedelta(seconds=150)).timestamp()
+    assert buffer.window(seconds=60, now=now).shape == (3, 2)
+    assert buffer.window().shape == (6, 2)
+    np.testing.assert_allclose(buffer.latest()["density"], make_values(2, seed=5)[:, 0], rtol=1e-6)
+
+    recent = buffer.window_stats(60, now=now)
+    assert recent["count"].tolist() == [3, 3]
@@ -0,0 +1,71 @@
+# test_rollups.py
+"""TrafficRollups: yeniden yazılan (kavşak, ts) satırlarının tek sayılması ve saklama varsayılanları"""
+
+import numpy as np
+
+import db_schema
+from conftest import make_table
+from db_writer import connect
+from rollups import DEFAULT_RETENTION, TrafficRollups, retention_statements
+
+
+def sample(rows, ts, density=50.0):
+    n = len(rows)
+    return (np.asarray(rows), np.full(n, ts, dtype=np.int64),
+            np.column_stack([np.full(n, density), np.full(n, 30.0), np.full(n, 10.0)]),
+            np.zeros(n, dtype=np.int64))
+
+
+def minute_counts(rollups):
+    level = next(level for level in rollups.levels if level.name == "1m")
+    return level.count.tolist()
+
+
+def test_rewritten_timestamp_counted_once():
+    rollups = TrafficRollups(make_table(3))
+    rollups.update(*sample([0, 1, 2], 120))
+    rollups.update(*sample([0, 1], 120, density=90.0))     # aynı döngü tekrar yazıldı
+    rollups.update(*sample([0], 100))                       # eski örnek
+
+    assert minute_counts(rollups) == [1, 1, 1]
+    assert rollups.stats == {"same_second": 2, "out_of_order": 1}
+    level = rollups.levels[0]
+    assert level.maxs[0, 0] == 50.0
+
+    rollups.update(*sample([0, 1, 2], 140))
+    assert minute_counts(rollups) == [2, 2, 2]
+
+
+def test_same_second_rewrite_keeps_newest_raw_row(tmp_path):
+    table = make_table(2)
+    conn = connect(str(tmp_path / "t.db"))
+    db_schema.migrate(conn)
+    db_schema.sync_intersections(conn, table)
+    rollups = TrafficRollups(table)
+
+    for density in (50.0, 90.0):
+        raw = [(iid, 120, density, 30, 10, 5, 0) for iid in (1, 2)]
+        conn.executemany(db_schema.INSERT_TRAFFIC_LOG_SQL, raw)
+        for sql, records in rollups.update(*sample([0, 1], 120, density)):
+            conn.executemany(sql, records)
+
+    # Ham tabloda en yeni okuma kalır; özet o saniyeyi bir kez sayar ve çakışma sayılır
+    assert conn.execute("SELECT COUNT(*), MAX(density) FROM traffic_logs").fetchone() == (2, 90.0)
+    assert conn.execute("SELECT SUM(n) FROM traffic_rollup_1m").fetchone() == (2,)
+    assert rollups.stats == {"same_second": 2, "out_of_order": 0}
+
+    # Yeniden başlatmada son ts veritabanından gelir; aynı döngü tekrar sayılmaz
+    restarted = TrafficRollups(table)
+    restarted.load_open_buckets(conn, now=130)
+    restarted.update(*sample([0, 1], 120, 90.0))
+    assert minute_counts(restarted) == [1, 1]
+    conn.close()
+
+
+def test_raw_retention_is_opt_in():
+    assert DEFAULT_RETENTION["raw"] is None
+    statements = retention_statements(10 ** 9)
+    assert not any("traffic_logs" in sql for sql, _ in statements)
+
+    statements = retention_statements(10 ** 9, dict(DEFAULT_RETENTION, raw=3600))
+    assert ("DELETE FROM traffic_logs WHERE ts < ?", [(10 ** 9 - 3600,)]) in statements
@@ -0,0 +1,144 @@
+# test_routing.py
+"""RoutingEngine: onarılan yol ağaçlarının sıfırdan Dijkstra ile, A*'ın ağaçla tutarlılığı"""
+
+from datetime import datetime
+
+import numpy as np
+import pytest
+
+from batch_engine import IntersectionTable, TrafficBatch
+from conftest import make_values
+from routing import INF, RoutingEngine
+from spatial_index import SpatialIndex
+
+
+def grid_table(side=12, seed=0):
+    """Hafif kaydırılmış `side` × `side` kavşak ızgarası (~300 m aralık)"""
+    rng = np.random.default_rng(seed)
+    records = []
+    for i in range(side):
+        for j in range(side):
+            records.append({"id": i * side + j + 1,
+                            "lat": 39.90 + i * 0.0027 + rng.normal(0, 0.0003),
+                            "lng": 32.80 + j * 0.0035 + rng.normal(0, 0.0003)})
+    return IntersectionTable.from_records(records)
+
+
+def make_batch(table, seed, rows=None):
+    rows = np.arange(len(table)) if rows is None else np.asarray(rows)
+    values = make_values(len(table), seed)[rows]
+    return TrafficBatch(rows=rows, ids=table.ids[rows], density=values[:, 0],
+                        avg_speed=values[:, 1].astype(np.int32), wait_time=values[:, 2].astype(np.int32),
+                        vehicle_count=values[:, 3].astype(np.int32), status_code=values[:, 4].astype(np.int8),
+                        timestamp=datetime(2024, 1, 1, 8, 0))
+
+
+def path_cost(engine, path, profile):
+    weights = engine.weights[profile]
+    total = 0.0
+    for u, v in zip(path[:-1], path[1:]):
+        edges = range(engine.indptr[u], engine.indptr[u + 1])
+        total += next(weights[e] for e in edges if engine.dst[e] == v)
+    return total
+
+
+@pytest.fixture
+def engine():
+    return RoutingEngine(SpatialIndex(grid_table()), popular_after=1, tolerance=0.0)
+
+
+def test_graph_is_symmetric(engine):
+    pairs = set(zip(engine.src.tolist(), engine.dst.tolist()))
+    assert all((v, u) in pairs for u, v in pairs)
+    np.testing.assert_array_equal(engine.src[engine.reverse], engine.dst)
+
+
+@pytest.mark.parametrize("max_repair_fraction", [1.0, 0.0])
+def test_repaired_trees_match_fresh_dijkstra(max_repair_fraction):
+    table = grid_table()
+    engine = RoutingEngine(SpatialIndex(table), popular_after=1, tolerance=0.0,
+                           max_repair_fraction=max_repair_fraction)
+    sources = [0, 77, 143]
+    for source in sources:
+        engine.shortest_path(source, 5)
+
+    rng = np.random.default_rng(1)
+    for cycle in range(6):
+        # Bazı döngüler yalnızca bir bölgeyi günceller
+        rows = None if cycle % 2 else np.sort(rng.choice(len(table), 40, replace=False))
+        assert engine.update(make_batch(table, cycle, rows)) > 0
+
+        for profile, source in engine.trees:
+            fresh = engine._build_tree(source, engine.weights[profile])
+            np.testing.assert_allclose(engine.trees[(profile, source)].dist, fresh.dist)
+
+    stat = "repairs" if max_repair_fraction else "full_rebuilds"
+    assert engine.stats[stat] > 0
+
+
+def test_astar_cost_matches_tree(engine):
+    engine.update(make_batch(grid_table(), seed=3))
+    weights = engine.weights["fastest"]
+    tree = engine._build_tree(0, weights)
+    for target in (11, 70, 143):
+        path = engine._astar(0, target, weights)
+        assert path[0] == 0 and path[-1] == target
+        assert path_cost(engine, path, "fastest") == pytest.approx(tree.dist[target])
+
+
+def test_popular_sources_are_cached():
+    engine = RoutingEngine(SpatialIndex(grid_table()), popular_after=2, cache_size=1)
+    assert engine.shortest_path(0, 50)[1] is False          # A*
+    assert engine.shortest_path(0, 60)[1] is False          # ağaç kuruldu
+    assert engine.shortest_path(0, 70)[1] is True
+    assert engine.stats["trees_built"] == 1
+
+    engine.shortest_path(5, 70)
+    engine.shortest_path(5, 71)                             # önbellek boyutu 1: 0 düşer
+    assert list(engine.trees) == [("fastest", 5)]
+    with pytest.raises(ValueError):
+        engine.shortest_path(0, 1, "scenic")
+
+
+def test_small_changes_below_tolerance_are_ignored():
+    table = grid_table()
+    engine = RoutingEngine(SpatialIndex(table), tolerance=0.05)
+    batch = make_batch(table, seed=4)
+    assert engine.update(batch) > 0
+    assert engine.update(batch) == 0
+
+
+def test_avoid_critical_route_skips_critical_intersection():
+    table = grid_table()
+    engine = RoutingEngine(SpatialIndex(table), critical_penalty=1e6)
+    origin = (float(table.lat[60]), float(table.lng[60]))
+    destination = (float(table.lat[71]), float(table.lng[71]))
+
+    fastest = engine.route(origin, destination)
+    middle = [point["id"] for point in fastest["path"][1:-1]]
+    blocked = engine.table.row_of(middle[len(middle) // 2])
+
+    batch = make_batch(table, seed=5)
+    batch.avg_speed[:] = 40
+    batch.wait_time[:] = 0
+    batch.status_code[:] = 0
+    batch.status_code[blocked] = 2
+    engine.update(batch)
+
+    avoiding = engine.route(origin, destination, avoid_critical=True)
+    assert int(table.ids[blocked]) not in [point["id"] for point in avoiding["path"]]
+    assert avoiding["criticalOnPath"] == []
+    # Hızlar varsayılanla aynı: en hızlı rota değişmez ve kritik kavşağı bildirir
+    assert [point["id"] for point in engine.route(origin, destination)["criticalOnPath"]] == [int(table.ids[blocked])]
+    assert avoiding["distanceKm"] >= fastest["distanceKm"] > 0
+
+
+def test_unreachable_target_returns_none():
+    # İki uzak küme: k-en-yakın-komşu grafı bağlantısız kalır
+    records = [{"id": i + 1, "lat": 39.9 + i * 1e-3, "lng": 32.8} for i in range(3)]
+    records += [{"id": i + 10, "lat": 41.0 + i * 1e-3, "lng": 29.0} for i in range(3)]
+    engine = RoutingEngine(SpatialIndex(IntersectionTable.from_records(records)), neighbors=2, popular_after=1)
+
+    assert engine.shortest_path(0, 4) == (None, False)
+    assert engine.trees[("fastest", 0)].dist[4] == INF
+    assert engine.route((39.9, 32.8), (41.0, 29.0)) is None
@@ -0,0 +1,128 @@
+# test_scheduler.py
+"""CycleScheduler: kaymasız tikler, aşımda tik atlama ve anlık isteklerin birleştirilmesi"""
+
+import pytest
+
+from scheduler import CycleScheduler
+
+
+class FakeClock:
+    """Yalnızca döngüler ve beklemeler ilerlettiğinde ilerleyen saat"""
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class AdvancingEvent:
+    """Beklemeyi gerçek zamanda değil, sahte saati ilerleterek yapan olay"""
+
+    def __init__(self, clock):
+        self.clock = clock
+
+    def wait(self, timeout):
+        self.clock.now += timeout
+        return False
+
+    def set(self):
+        pass
+
+    def clear(self):
+        pass
+
+
+def make_scheduler(intervals, durations, runs, on_run=None):
+    """`runs` döngüden sonra duran, döngü sürelerini `durations` ile taklit eden zamanlayıcı"""
+    clock = FakeClock()
+    log = []
+
+    def run_cycle(classes, reason):
+        log.append((clock.now, classes, reason))
+        if on_run:
+            on_run(scheduler, len(log))
+        clock.now += durations(len(log))
+        if len(log) >= runs:
+            scheduler.stop()
+
+    scheduler = CycleScheduler(run_cycle, intervals, clock=clock)
+    scheduler._wakeup = AdvancingEvent(clock)
+    return scheduler, log
+
+
+def test_requires_intervals_and_rounds_periods():
+    with pytest.raises(ValueError):
+        CycleScheduler(lambda classes, reason: None, {})
+    scheduler = CycleScheduler(lambda classes, reason: None, {"fast": 30, "slow": 100, "same": 30})
+    assert scheduler.tick_interval == 30
+    assert scheduler.periods == {"fast": 1, "slow": 3, "same": 1}
+
+
+def test_ticks_do_not_drift_with_cycle_duration():
+    scheduler, log = make_scheduler({"fast": 1.0, "slow": 3.0}, lambda n: 0.25, runs=7)
+    scheduler.run_forever()
+
+    assert [t for t, _, _ in log] == [0.0, 1.0, 2.0, 3.0, 4.0, 5.0, 6.0]
+    assert [classes for t, classes, _ in log if "slow" in classes] == [("fast", "slow")] * 3
+    assert [t for t, classes, _ in log if "slow" in classes] == [0.0, 3.0, 6.0]
+    assert scheduler.stats["skipped_ticks"] == 0 and scheduler.stats["runs"] == 7
+
+
+def test_overrun_skips_missed_ticks_and_catches_up_due_classes():
+    # 3. döngü (t=2) 2.5 sn sürer: 3 ve 4. tikler atlanır
+    scheduler, log = make_scheduler({"fast": 1.0, "slow": 3.0},
+                                    lambda n: 2.5 if n == 3 else 0.25, runs=5)
+    scheduler.run_forever()
+
+    assert [t for t, _, _ in log] == [0.0, 1.0, 2.0, 5.0, 6.0]
+    # Atlanan 3. tikte sırası gelen yavaş sınıf ilk uygun tikte (5) çalışır, yığılma olmaz
+    assert log[3][1] == ("fast", "slow")
+    assert log[4][1] == ("fast",)
+    assert scheduler.stats["overruns"] == 1 and scheduler.stats["skipped_ticks"] == 2
+    assert scheduler.stats["max_duration"] == 2.5
+
+
+def test_on_demand_requests_coalesce_and_run_between_ticks():
+    def on_run(scheduler, n):
+        if n == 1:
+            assert scheduler.request_run()
+            assert not scheduler.request_run()
+
+    scheduler, log = make_scheduler({"fast": 1.0, "slow": 4.0}, lambda n: 0.25, runs=3, on_run=on_run)
+    scheduler.run_forever()
+
+    # İstek tikler arasında hemen ve tek kez çalışır; sonraki tik zamanında gelir
+    assert log == [(0.0, ("fast", "slow"), "tick"),
+                   (0.25, ("fast", "slow"), "on_demand"),
+                   (1.0, ("fast",), "tick")]
+    assert scheduler.stats["on_demand"] == 1 and scheduler.stats["coalesced"] == 1
+
+
+def test_pending_request_joins_due_tick():
+    scheduler, log = make_scheduler({"fast": 1.0, "slow": 2.0}, lambda n: 0.25, runs=2)
+    scheduler.request_run()
+    scheduler.run_forever()
+
+    # Tik 0'da istek tüm sınıfları çalıştırır ve yavaş sınıfın sayacını sıfırlar
+    assert [(classes, reason) for _, classes, reason in log] == [
+        (("fast", "slow"), "on_demand"), (("fast",), "tick")]
+
+
+def test_cycle_error_is_counted_and_loop_continues():
+    clock = FakeClock()
+    calls = []
+
+    def run_cycle(classes, reason):
+        calls.append(clock.now)
+        clock.now += 0.25
+        if len(calls) == 1:
+            raise RuntimeError("boom")
+        scheduler.stop()
+
+    scheduler = CycleScheduler(run_cycle, {"fast": 1.0}, clock=clock)
+    scheduler._wakeup = AdvancingEvent(clock)
+    scheduler.run_forever()
+
+    assert calls == [0.0, 1.0]
+    assert scheduler.stats["errors"] == 1 and scheduler.stats["runs"] == 2
@@ -0,0 +1,104 @@
+# test_sensor_ingest.py
+"""SensorIngestor: sınırlı kuyruk, hatalı/bilinmeyen mesajlar, parti içi birleştirme ve tazelik"""
+
+import json
+
+import numpy as np
+
+from conftest import make_table
+from sensor_ingest import READING_FIELDS, SensorIngestor
+
+DENSITY, SPEED, WAIT, VEHICLES = range(len(READING_FIELDS))
+
+
+def message(intersection_id, **data):
+    return json.dumps({"intersectionId": intersection_id, "data": data}).encode()
+
+
+def drain_all(ingestor):
+    """Kuyruktaki her şeyi tek partide işle"""
+    items = ingestor._drain(timeout=0.01)
+    return ingestor.process_batch(items), items
+
+
+def test_full_queue_drops_and_counts():
+    ingestor = SensorIngestor(make_table(3), maxsize=2)
+    assert ingestor.offer(message(1, density=10))
+    assert ingestor.offer(message(2, density=20))
+    assert not ingestor.offer(message(3, density=30))
+    ingestor.on_message("traffic/sensors/s/data", message(3, density=30), False, 1, False)
+
+    assert ingestor.stats["dropped"] == 2
+    accepted, items = drain_all(ingestor)
+    assert accepted == 2 and len(items) == 2
+    assert ingestor.stats["max_queue"] == 2
+
+
+def test_bad_message_only_drops_itself():
+    ingestor = SensorIngestor(make_table(3))
+    now = 1000.0
+    payloads = [
+        message(1, density=40, avgSpeed=25),
+        json.dumps({"intersectionId": 2, "data": "oops"}).encode(),   # data nesne değil
+        b"{not json",
+        json.dumps({"data": {"density": 5}}).encode(),               # kavşak yok
+        json.dumps([1, 2]).encode(),
+        message(2, density=500),                                     # aralık dışı
+        message(2, density=True),                                    # bool sayı sayılmaz
+        message(99, density=50),                                     # bilinmeyen kavşak
+        message(3, waitTime=30),
+    ]
+    accepted = ingestor.process_batch([(p, now) for p in payloads])
+
+    assert accepted == 2
+    assert ingestor.stats["invalid"] == 6
+    assert ingestor.stats["unknown_intersection"] == 1
+    assert ingestor.stats["received"] == len(payloads)
+
+    readings = ingestor.readings(np.arange(3), now=now)
+    assert readings[0, DENSITY] == 40 and readings[0, SPEED] == 25
+    assert np.isnan(readings[1]).all()
+    assert readings[2, WAIT] == 30 and np.isnan(readings[2, DENSITY])
+
+
+def test_same_batch_fields_merge_newest_wins():
+    ingestor = SensorIngestor(make_table(2))
+    ingestor.process_batch([
+        (message(1, density=10, avgSpeed=50), 100.0),
+        (message(1, density=20, vehicleCount=7), 101.0),
+        (message(1, speed=35), 102.0),
+    ])
+
+    readings = ingestor.readings(np.array([0]), now=102.0)[0]
+    assert readings[DENSITY] == 20
+    assert readings[SPEED] == 35
+    assert readings[VEHICLES] == 7
+    assert np.isnan(readings[WAIT])
+
+
+def test_fields_from_separate_batches_persist():
+    ingestor = SensorIngestor(make_table(1))
+    ingestor.process_batch([(message(1, density=10), 100.0)])
+    ingestor.process_batch([(message(1, avgSpeed=40), 110.0)])
+
+    readings = ingestor.readings(np.array([0]), now=110.0)[0]
+    assert readings[DENSITY] == 10 and readings[SPEED] == 40
+
+
+def test_stale_readings_are_excluded():
+    ingestor = SensorIngestor(make_table(2), max_age=60)
+    ingestor.process_batch([(message(1, density=10), 100.0),
+                            (message(2, density=20), 150.0)])
+    ingestor.process_batch([(message(1, avgSpeed=30), 150.0)])
+
+    readings = ingestor.readings(np.arange(2), now=200.0)
+    assert np.isnan(readings[0, DENSITY])           # 100 sn eski
+    assert readings[0, SPEED] == 30
+    assert readings[1, DENSITY] == 20
+
+    assert ingestor.readings(np.arange(2), now=300.0) is None
+
+
+def test_no_readings_returns_none():
+    ingestor = SensorIngestor(make_table(2))
+    assert ingestor.readings(np.arange(2), now=1000.0) is None
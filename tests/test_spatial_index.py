@@ -0,0 +1,88 @@
+# test_spatial_index.py
+"""SpatialIndex: ızgara sorgularının kaba kuvvet aramayla tutarlılığı ve karo indeksi"""
+
+import json
+
+import numpy as np
+import pytest
+
+from batch_engine import IntersectionTable
+from conftest import make_table
+from spatial_index import SpatialIndex, tile_xy
+
+
+def scattered_table(count, seed=0):
+    """Ankara çevresinde kümelenmiş ve seyrek noktalar"""
+    rng = np.random.default_rng(seed)
+    lat = np.concatenate([rng.normal(39.93, 0.01, count // 2), rng.uniform(39.7, 40.1, count - count // 2)])
+    lng = np.concatenate([rng.normal(32.85, 0.01, count // 2), rng.uniform(32.5, 33.1, count - count // 2)])
+    return IntersectionTable.from_records([
+        {"id": i + 1, "lat": la, "lng": ln} for i, (la, ln) in enumerate(zip(lat.tolist(), lng.tolist()))
+    ])
+
+
+@pytest.fixture(scope="module")
+def index():
+    return SpatialIndex(scattered_table(2000))
+
+
+def brute_distances(index, lat, lng):
+    return index.distances_m(np.arange(len(index.table)), lat, lng)
+
+
+@pytest.mark.parametrize("lat, lng, k", [(39.93, 32.85, 1), (39.93, 32.85, 25), (39.75, 33.05, 7),
+                                         (41.0, 30.0, 3)])     # son sorgu ızgaranın dışında
+def test_nearest_matches_brute_force(index, lat, lng, k):
+    rows, dist = index.nearest(lat, lng, k)
+    expected = np.sort(brute_distances(index, lat, lng))[:k]
+
+    assert len(rows) == k
+    np.testing.assert_allclose(dist, expected)
+    np.testing.assert_allclose(index.distances_m(rows, lat, lng), dist)
+
+
+def test_radius_and_bbox_match_brute_force(index):
+    distances = brute_distances(index, 39.93, 32.85)
+    rows = index.radius(39.93, 32.85, 1500, sort=True)
+    assert set(rows.tolist()) == set(np.flatnonzero(distances <= 1500).tolist())
+    assert (np.diff(distances[rows]) >= 0).all()
+
+    table = index.table
+    inside = ((table.lat >= 39.9) & (table.lat <= 39.95) & (table.lng >= 32.8) & (table.lng <= 32.9))
+    assert set(index.bbox(39.9, 32.8, 39.95, 32.9).tolist()) == set(np.flatnonzero(inside).tolist())
+    assert len(index.bbox(10.0, 10.0, 11.0, 11.0)) == 0
+
+
+def test_nearest_neighbors_exclude_self():
+    table = make_table(5)
+    neighbors = SpatialIndex(table).nearest_neighbors()
+    # Kavşaklar çapraz bir doğru üzerinde: komşu bir önceki veya sonraki satırdır
+    assert neighbors.tolist()[0] == 1 and neighbors.tolist()[-1] == 3
+    assert all(abs(n - row) == 1 for row, n in enumerate(neighbors.tolist()))
+
+
+def test_empty_and_single_point_index():
+    empty = SpatialIndex(IntersectionTable.from_records([]))
+    rows, dist = empty.nearest(39.9, 32.8, 3)
+    assert len(rows) == 0 and len(dist) == 0
+    assert len(empty.radius(39.9, 32.8, 1000)) == 0
+
+    single = SpatialIndex(make_table(1))
+    assert single.nearest(0.0, 0.0, 5)[0].tolist() == [0]
+    assert single.nearest_neighbors().tolist() == [0]
+
+
+def test_tile_index_groups_ids_by_tile(tmp_path):
+    table = make_table(4)
+    index = SpatialIndex(table)
+    path = str(tmp_path / "tiles.json")
+
+    written = index.write_tile_index(path, zoom=10)
+    with open(path, encoding="utf-8") as f:
+        document = json.load(f)
+    assert written == len(document["tiles"])
+    assert document["count"] == 4
+    assert sorted(i for ids in document["tiles"].values() for i in ids) == [1, 2, 3, 4]
+
+    tx, ty = tile_xy(table.lat[0], table.lng[0], 10)
+    assert 1 in document["tiles"][f"10/{int(tx)}/{int(ty)}"]
@@ -0,0 +1,246 @@
+# traffic_archive.py
+"""traffic_logs için gün bölümlü sütunlu arşiv (Arrow IPC): kapanmış günlerin taşınması ve bellek eşlemeli okuma"""
+
+import logging
+import os
+import re
+import sqlite3
+from datetime import date, datetime, timezone
+from typing import List, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+from batch_engine import STATUS_NAMES, IntersectionTable
+from db_schema import HISTORY_COLUMNS
+
+logger = logging.getLogger(__name__)
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+except ImportError:
+    pa = None
+
+ARCHIVE_AVAILABLE = pa is not None
+
+ARCHIVE_VERSION = 1
+DAY_SECONDS = 86400
+
+# traffic_logs sütunları (arşivde aynı adlarla)
+ARCHIVE_COLUMNS = ("intersection_id", "ts", "density", "avg_speed", "wait_time", "vehicle_count", "status")
+
+_PARTITION_RE = re.compile(r"^(\d{4}-\d{2}-\d{2})\.arrow$")
+
+DELETE_ARCHIVED_SQL = "DELETE FROM traffic_logs WHERE intersection_id = ? AND ts = ?"
+
+
+def day_start(day: date) -> int:
+    """UTC gün başlangıcı (epoch saniye)"""
+    return int(datetime(day.year, day.month, day.day, tzinfo=timezone.utc).timestamp())
+
+
+def day_of(ts: int) -> date:
+    return datetime.fromtimestamp(int(ts), tz=timezone.utc).date()
+
+
+def _schema(id_type, day: date):
+    # Kompakt tipler: ts 2106'ya kadar uint32'ye sığar, durum 3 değerli sözlük
+    return pa.schema([
+        ("intersection_id", id_type),
+        ("ts", pa.uint32()),
+        ("density", pa.float32()),
+        ("avg_speed", pa.int16()),
+        ("wait_time", pa.int16()),
+        ("vehicle_count", pa.int32()),
+        ("status", pa.dictionary(pa.int8(), pa.string())),
+    ], metadata={"version": str(ARCHIVE_VERSION), "day": day.isoformat()})
+
+
+class TrafficArchive:
+    """Kapanmış UTC günlerini `traffic_logs`'tan gün başına bir Arrow IPC dosyasına taşır.
+
+    Dosyalar sıkıştırılmamış tek kayıt partisidir; okuma bellek eşlemeyle yapılır ve
+    yalnızca istenen sütunların ve zaman aralığının sayfaları diskten okunur. Bölüm
+    içinde satırlar (ts, intersection_id) sırasındadır, zaman aralığı ikili aramayla
+    kesilir. SQLite ile sınır `boundary()`'dir: okuyucular bunun altını arşivden,
+    üstünü SQLite'tan alır; taşıma ile silme arasında çift satır görülmez.
+    """
+
+    def __init__(self, root: str, table: IntersectionTable):
+        if pa is None:
+            raise RuntimeError("Sütunlu arşiv için pyarrow kurulu olmalı")
+        self.root = root
+        self.table = table
+        os.makedirs(root, exist_ok=True)
+
+    def path_for(self, day: date) -> str:
+        return os.path.join(self.root, f"{day.isoformat()}.arrow")
+
+    def partitions(self) -> List[date]:
+        """Arşivdeki günler (eskiden yeniye)"""
+        days = []
+        for name in os.listdir(self.root):
+            match = _PARTITION_RE.match(name)
+            if match:
+                days.append(date.fromisoformat(match.group(1)))
+        return sorted(days)
+
+    def boundary(self) -> int:
+        """Arşivlenmiş son günün bitişi; bunun altındaki satırlar arşivdedir (arşiv boşsa 0)"""
+        days = self.partitions()
+        return day_start(days[-1]) + DAY_SECONDS if days else 0
+
+    # --- Taşıma ---
+
+    def compact(self, conn: sqlite3.Connection, cutoff: int) -> List[Tuple[str, List[Tuple]]]:
+        """`cutoff`'tan önce biten günleri arşive yaz; SQLite'tan silinecek satırlar için ifadeler.
+
+        Arşivlenmiş bir güne sonradan gelen satırlar (geri doldurma) mevcut bölümle birleştirilir.
+        Silme tam (intersection_id, ts) anahtarıyla yapılır; okuma ile silme arasında
+        gelen satırlar kaybolmaz, sonraki taşımada arşive girer.
+        """
+        cutoff -= cutoff % DAY_SECONDS
+        first = conn.execute("SELECT MIN(ts) FROM traffic_logs WHERE ts < ?", (cutoff,)).fetchone()[0]
+        if first is None:
+            return []
+
+        deletes = []
+        start = int(first) - int(first) % DAY_SECONDS
+        while start < cutoff:
+            rows = conn.execute(
+                f"SELECT {', '.join(ARCHIVE_COLUMNS)} FROM traffic_logs WHERE ts >= ? AND ts < ?",
+                (start, start + DAY_SECONDS)
+            ).fetchall()
+            if rows:
+                data = np.array(rows, dtype=np.float64)
+                count = self._merge(day_of(start), data)
+                deletes.append((DELETE_ARCHIVED_SQL, [(int(iid), int(ts)) for iid, ts in data[:, :2].tolist()]))
+                logger.info(f"🗜️ Arşiv {day_of(start).isoformat()}: {len(rows)} satır taşındı ({count} satırlık bölüm)")
+            start += DAY_SECONDS
+        return deletes
+
+    def write_rows(self, data: np.ndarray) -> int:
+        """`ARCHIVE_COLUMNS` sırasındaki satırları günlerine göre bölümlere ekle; yazılan gün sayısı"""
+        days = data[:, 1].astype(np.int64) // DAY_SECONDS
+        order = np.argsort(days, kind='stable')
+        data, days = data[order], days[order]
+        unique, starts = np.unique(days, return_index=True)
+        for day, chunk in zip(unique.tolist(), np.split(data, starts[1:])):
+            self._merge(day_of(day * DAY_SECONDS), chunk)
+        return len(unique)
+
+    def _merge(self, day: date, data: np.ndarray) -> int:
+        columns = {name: data[:, i] for i, name in enumerate(ARCHIVE_COLUMNS)}
+        path = self.path_for(day)
+        if os.path.exists(path):
+            # Mevcut satırlar önce gelir; aynı anahtarda yeni satır kazanır
+            with pa.memory_map(path) as source:
+                existing = pa.ipc.open_file(source).read_all()
+                columns = {
+                    name: np.concatenate([
+                        existing.column(name).combine_chunks().indices.to_numpy().astype(np.float64)
+                        if name == "status" else existing.column(name).to_numpy().astype(np.float64),
+                        values
+                    ])
+                    for name, values in columns.items()
+                }
+
+        ids, ts = columns["intersection_id"], columns["ts"]
+        order = np.lexsort((ids, ts))
+        last = np.ones(len(order), dtype=bool)
+        last[:-1] = (ts[order][1:] != ts[order][:-1]) | (ids[order][1:] != ids[order][:-1])
+        order = order[last]
+        self._write(path, day, {name: values[order] for name, values in columns.items()})
+        return len(order)
+
+    def _write(self, path: str, day: date, columns: dict):
+        ids = columns["intersection_id"]
+        id_type = pa.int16() if not len(ids) or (ids.min() >= -2 ** 15 and ids.max() < 2 ** 15) else pa.int32()
+        schema = _schema(id_type, day)
+        arrays = [
+            pa.DictionaryArray.from_arrays(pa.array(columns[name].astype(np.int8)), pa.array(STATUS_NAMES))
+            if name == "status" else
+            pa.array(columns[name].astype(schema.field(name).type.to_pandas_dtype()))
+            for name in ARCHIVE_COLUMNS
+        ]
+        table = pa.Table.from_arrays(arrays, schema=schema)
+
+        tmp_path = f"{path}.tmp"
+        try:
+            with pa.OSFile(tmp_path, "wb") as sink, pa.ipc.new_file(sink, schema) as writer:
+                writer.write_table(table)
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def expire(self, before: int) -> int:
+        """Tamamı `before`'dan önce kalan bölümleri sil; silinen gün sayısı"""
+        removed = 0
+        for day in self.partitions():
+            if day_start(day) + DAY_SECONDS <= before:
+                os.remove(self.path_for(day))
+                removed += 1
+        return removed
+
+    # --- Okuma ---
+
+    def read(self, since: int, until: int = None, columns: Sequence[str] = None,
+             intersection_ids: Sequence[int] = None) -> pd.DataFrame:
+        """[since, until) aralığındaki arşiv satırları (ts, intersection_id sırasıyla).
+
+        Aralıkla kesişmeyen günler açılmaz; istenmeyen sütunlar diskten okunmaz.
+        """
+        columns = list(columns or ARCHIVE_COLUMNS)
+        frames = []
+        for day in self.partitions():
+            start = day_start(day)
+            if start + DAY_SECONDS <= since or (until is not None and start >= until):
+                continue
+            with pa.memory_map(self.path_for(day)) as source:
+                table = pa.ipc.open_file(source).read_all()
+                ts = table.column("ts").to_numpy()
+                lo = int(np.searchsorted(ts, since, side="left"))
+                hi = len(ts) if until is None else int(np.searchsorted(ts, until, side="left"))
+                table = table.slice(lo, hi - lo)
+                if intersection_ids is not None:
+                    value_set = pa.array(np.asarray(intersection_ids, dtype=np.int64)).cast(
+                        table.schema.field("intersection_id").type)
+                    table = table.filter(pc.is_in(table.column("intersection_id"), value_set=value_set))
+                if table.num_rows:
+                    frames.append(table.select(columns).to_pandas())
+        if not frames:
+            return pd.DataFrame({name: pd.Series(dtype=object) for name in columns})
+        return pd.concat(frames, ignore_index=True)
+
+    def history(self, since: int, until: int = None, columns: Sequence[str] = None,
+                intersection_id: int = None) -> pd.DataFrame:
+        """`traffic_history` görünümü biçiminde arşiv satırları (yeniden eskiye)"""
+        columns = list(columns or HISTORY_COLUMNS)
+        raw = [name for name in ARCHIVE_COLUMNS
+               if name in columns or name in ("intersection_id", "ts")]
+        df = self.read(since, until, raw, None if intersection_id is None else [intersection_id])
+
+        # Görünümdeki JOIN gibi tanımı olmayan kavşaklar düşer
+        rows = self.table.rows_of(df["intersection_id"].to_numpy(dtype=np.int64))
+        known = rows >= 0
+        if not known.all():
+            df, rows = df[known].reset_index(drop=True), rows[known]
+
+        if "density" in columns:
+            # float32 saklanır; SQLite değerleriyle aynı görünüm için yuvarlanır
+            df["density"] = df["density"].astype(np.float64).round(2)
+        if "name" in columns:
+            df["name"] = np.asarray(self.table.names, dtype=object)[rows]
+        if "lat" in columns:
+            df["lat"] = self.table.lat[rows]
+        if "lng" in columns:
+            df["lng"] = self.table.lng[rows]
+        if "timestamp" in columns:
+            # Bir döngünün tüm satırları aynı ts'yi paylaşır; metin yalnızca tekil değerler için üretilir
+            unique, inverse = np.unique(df["ts"].to_numpy(), return_inverse=True)
+            text = pd.to_datetime(unique, unit="s").strftime("%Y-%m-%d %H:%M:%S").to_numpy(dtype=object)
+            df["timestamp"] = text[inverse]
+        return df[columns].iloc[::-1].reset_index(drop=True)
@@ -0,0 +1,214 @@
+# traffic_cli.py
+"""Komut satırı giriş noktası: run, query-history, export, backfill, bench
+
+Ağır modüller (pandas, awscrt, analizör) yalnızca onları kullanan alt komutta
+yüklenir. Geçmiş sorgusu ve export analizörü kurmaz: veritabanı salt okunur
+açılır, şema kurulumu ve MQTT bağlantısı yapılmaz.
+"""
+
+import argparse
+import csv
+import json
+import logging
+import os
+import sqlite3
+import sys
+import time
+from datetime import datetime
+from typing import Callable, List, Optional, Sequence
+from urllib.parse import quote
+
+logger = logging.getLogger(__name__)
+
+# Son döngü: her kavşağın pencere içindeki en yeni satırı (ts indeksiyle)
+LATEST_ROWS_SQL = '''
+    SELECT h.intersection_id, h.name, h.lat, h.lng, h.density, h.avg_speed,
+           h.wait_time, h.vehicle_count, h.status
+    FROM traffic_history h
+    JOIN (SELECT intersection_id, MAX(ts) AS ts FROM traffic_logs
+          WHERE ts >= ? GROUP BY intersection_id) m
+      ON m.intersection_id = h.intersection_id AND m.ts = h.ts
+    ORDER BY h.intersection_id
+'''
+
+
+def db_path(args) -> str:
+    return args.db or os.getenv('TRAFFIC_DB_PATH', 'traffic_data.db')
+
+
+def open_readonly(path: str) -> sqlite3.Connection:
+    """Veritabanını salt okunur aç; dosya yoksa oluşturmaz"""
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"Veritabanı bulunamadı: {path}")
+    return sqlite3.connect(f"file:{quote(os.path.abspath(path))}?mode=ro", uri=True)
+
+
+def open_archive():
+    """ARCHIVE_ENABLED=1 ve arşiv dizini varsa sütunlu arşiv (pyarrow/pandas burada yüklenir)"""
+    root = os.getenv('TRAFFIC_ARCHIVE_PATH', 'traffic_archive')
+    if os.getenv('ARCHIVE_ENABLED', '0') != '1' or not os.path.isdir(root):
+        return None
+    from batch_engine import load_intersections
+    from traffic_archive import ARCHIVE_AVAILABLE, TrafficArchive
+    if not ARCHIVE_AVAILABLE:
+        logger.warning("pyarrow kurulu değil, arşivlenmiş günler okunmayacak")
+        return None
+    return TrafficArchive(root, load_intersections(os.getenv('TRAFFIC_INTERSECTIONS_PATH', 'intersections.json')))
+
+
+def row_writer(fmt: str, columns: Sequence[str], out) -> Callable[[Sequence], None]:
+    """Satırları akış halinde yazan fonksiyon (bellekte toplanmaz)"""
+    if fmt == 'jsonl':
+        def write(row):
+            out.write(json.dumps(dict(zip(columns, row)), ensure_ascii=False, default=lambda v: v.item()))
+            out.write('\n')
+        return write
+    writer = csv.writer(out)
+    writer.writerow(columns)
+    return writer.writerow
+
+
+def cmd_run(args, extra: List[str]) -> int:
+    import trafik_analizi_aws
+    trafik_analizi_aws.main(args.mode, args.connect_wait)
+    return 0
+
+
+def cmd_query_history(args, extra: List[str]) -> int:
+    """Son `--hours` saatin ham verisi (yeniden eskiye); arşiv açıksa eski günler arşivden"""
+    import db_schema
+
+    columns = args.columns.split(',') if args.columns else list(db_schema.HISTORY_COLUMNS)
+    since = int(time.time() - args.hours * 3600)
+    archive = open_archive()
+    boundary = archive.boundary() if archive else 0
+    query, params = db_schema.history_query(columns, max(since, boundary), args.intersection)
+
+    conn = open_readonly(db_path(args))
+    out = open(args.output, 'w', newline='', encoding='utf-8') if args.output else sys.stdout
+    try:
+        write = row_writer(args.format, columns, out)
+        count = 0
+        for row in conn.execute(query, params):
+            write(row)
+            count += 1
+        if since < boundary:
+            archived = archive.history(since, boundary, columns, args.intersection)
+            for row in archived.itertuples(index=False, name=None):
+                write(row)
+            count += len(archived)
+    finally:
+        conn.close()
+        if out is not sys.stdout:
+            out.close()
+    logger.info(f"🕓 {count} satır yazıldı ({args.hours:g} saat)")
+    return 0
+
+
+def cmd_export(args, extra: List[str]) -> int:
+    """Veritabanındaki son döngüden Node.js API anlık görüntüsünü yaz (analizör çalışmıyorken)"""
+    conn = open_readonly(db_path(args))
+    try:
+        latest = conn.execute("SELECT MAX(ts) FROM traffic_logs").fetchone()[0]
+        if latest is None:
+            logger.error("Veritabanında trafik verisi yok")
+            return 1
+        rows = conn.execute(LATEST_ROWS_SQL, (latest - int(args.max_age),)).fetchall()
+    finally:
+        conn.close()
+
+    export_data = {
+        'timestamp': datetime.fromtimestamp(latest).isoformat(),
+        'source': 'traffic_db',
+        'intersections': [
+            {
+                'id': iid, 'name': name, 'lat': lat, 'lng': lng,
+                'density': density, 'avgSpeed': avg_speed, 'waitTime': wait_time,
+                'vehicleCount': vehicle_count, 'status': status
+            }
+            for iid, name, lat, lng, density, avg_speed, wait_time, vehicle_count, status in rows
+        ]
+    }
+    if args.output == '-':
+        json.dump(export_data, sys.stdout, ensure_ascii=False, indent=2)
+        sys.stdout.write('\n')
+        return 0
+
+    from snapshot_publisher import SnapshotPublisher
+    publisher = SnapshotPublisher(args.output or os.getenv('TRAFFIC_SNAPSHOT_PATH', 'current_traffic_data.json'))
+    if publisher.publish(export_data):
+        logger.info(f"📄 {len(rows)} kavşaklık anlık görüntü yazıldı (sürüm {publisher.version})")
+    else:
+        logger.info("📄 Anlık görüntü değişmedi, yazım atlandı")
+    return 0
+
+
+def cmd_backfill(args, extra: List[str]) -> int:
+    import traffic_replay
+    return traffic_replay.main(['backfill', *extra])
+
+
+def cmd_bench(args, extra: List[str]) -> int:
+    import benchmarks
+    return benchmarks.main(extra)
+
+
+# Kalan argümanları alt araca aktaran komutlar
+PASSTHROUGH = {'backfill', 'bench'}
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog='traffic_cli', description="Ankara trafik sistemi komut satırı")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    run = commands.add_parser('run', help="Analiz döngüsünü başlat")
+    run.add_argument('--mode', choices=('sync', 'async'), help="Varsayılan: TRAFFIC_RUN_MODE")
+    run.add_argument('--connect-wait', type=float,
+                     help="AWS IoT bağlantısı için başlangıçta beklenecek süre (sn, varsayılan 0: arka planda)")
+    run.set_defaults(handler=cmd_run)
+
+    history = commands.add_parser('query-history', help="Ham geçmiş veriyi CSV/JSON Lines olarak dök")
+    history.add_argument('--hours', type=float, default=1.0)
+    history.add_argument('--intersection', type=int, help="Yalnızca bu kavşak")
+    history.add_argument('--columns', help="Virgülle sütunlar (varsayılan: tümü)")
+    history.add_argument('--format', choices=('csv', 'jsonl'), default='csv')
+    history.add_argument('--output', help="Dosya (varsayılan: standart çıktı)")
+    history.add_argument('--db', help="Varsayılan: TRAFFIC_DB_PATH")
+    history.set_defaults(handler=cmd_query_history)
+
+    export = commands.add_parser('export', help="Son döngünün anlık görüntüsünü veritabanından yaz")
+    export.add_argument('--output', help="Dosya (varsayılan: TRAFFIC_SNAPSHOT_PATH, '-': standart çıktı)")
+    export.add_argument('--max-age', type=float, default=3600,
+                        help="Son döngüden bu kadar eski kavşak satırları alınmaz (sn)")
+    export.add_argument('--db', help="Varsayılan: TRAFFIC_DB_PATH")
+    export.set_defaults(handler=cmd_export)
+
+    commands.add_parser('backfill', help="Sentetik geri doldurma (traffic_replay backfill argümanları)",
+                        add_help=False).set_defaults(handler=cmd_backfill)
+    commands.add_parser('bench', help="Ölçüm paketi (benchmarks argümanları)",
+                        add_help=False).set_defaults(handler=cmd_bench)
+    return parser
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    from dotenv import load_dotenv
+    load_dotenv()
+
+    parser = build_parser()
+    args, extra = parser.parse_known_args(argv)
+    if extra and args.command not in PASSTHROUGH:
+        parser.error(f"tanınmayan argümanlar: {' '.join(extra)}")
+    try:
+        return args.handler(args, extra) or 0
+    except (FileNotFoundError, ValueError) as e:
+        logger.error(str(e))
+        return 2
+    except BrokenPipeError:
+        # Okuyan taraf erken kapandı (ör. `| head`); çıkışta tekrar yazılmaya çalışılmasın
+        os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+        return 1
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    sys.exit(main())
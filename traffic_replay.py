@@ -0,0 +1,410 @@
+# traffic_replay.py
+"""Simüle saatle hızlı sentetik geri doldurma ve kayıtlı geçmişin N× hızda yeniden yayını (yük testi)"""
+
+import argparse
+import json
+import logging
+import os
+import random
+import sys
+import time
+from datetime import datetime
+from typing import Dict, Iterator, List
+
+import numpy as np
+
+import db_schema
+from batch_engine import (INTERSECTION_TYPES, STATUS_NAMES, BatchTrafficEngine, IntersectionTable,
+                          hour_of_week, load_intersections)
+from db_writer import connect as connect_db
+from rollups import TrafficRollups
+from snapshot_publisher import SnapshotPublisher
+from traffic_archive import ARCHIVE_AVAILABLE, ARCHIVE_COLUMNS, DAY_SECONDS, TrafficArchive
+
+logger = logging.getLogger(__name__)
+
+# Bir blokta üretilen yaklaşık hücre (an × kavşak) sayısı
+BLOCK_CELLS = 1_000_000
+
+# Kayıt dizilerinde sütun konumları (ARCHIVE_COLUMNS sırası)
+ID, TS, DENSITY, SPEED, WAIT, VEHICLES, STATUS = range(len(ARCHIVE_COLUMNS))
+
+SINKS = ("db", "archive", "mqtt", "snapshot")
+MESSAGE_FORMATS = ("snapshot", "aws")
+
+
+def synthetic_intersections(count: int, seed: int = 42) -> List[Dict]:
+    """Ankara çevresinde rastgele `count` kavşak tanımı"""
+    rng = random.Random(seed)
+    return [
+        {"id": i + 1, "name": f"Kavşak {i + 1}",
+         "lat": round(39.85 + rng.random() * 0.15, 5), "lng": round(32.70 + rng.random() * 0.25, 5),
+         "type": rng.choice(INTERSECTION_TYPES)}
+        for i in range(count)
+    ]
+
+
+def parse_time(value: str) -> int:
+    """Epoch saniye veya ISO tarih/saat (yerel saat)"""
+    try:
+        return int(float(value))
+    except ValueError:
+        return int(datetime.fromisoformat(value).timestamp())
+
+
+def split_ticks(records: np.ndarray) -> Iterator[np.ndarray]:
+    """ts sırasındaki kayıtları an başına dilimlere böl"""
+    if not len(records):
+        return
+    starts = np.flatnonzero(np.diff(records[:, TS])) + 1
+    yield from np.split(records, starts)
+
+
+class SyntheticTraffic:
+    """Simüle saat aralığı için tohumlu üretici; canlı döngüyle aynı zirve saati modeli.
+
+    Aynı tohum, adım ve blok boyutuyla çıktı bit düzeyinde aynıdır.
+    """
+
+    def __init__(self, table: IntersectionTable, seed: int = 42, step: int = 20):
+        self.table = table
+        self.step = step
+        self.engine = BatchTrafficEngine(table, np.random.default_rng(seed))
+
+    def blocks(self, start: int, end: int, block_cells: int = BLOCK_CELLS) -> Iterator[np.ndarray]:
+        """[start, end) için kayıt blokları (ARCHIVE_COLUMNS sırası, an ve tablo sırasıyla)"""
+        rows = np.arange(len(self.table))
+        n = len(rows)
+        per_block = max(1, block_cells // max(n, 1))
+        ticks = np.arange(start, end, self.step, dtype=np.int64)
+        for i in range(0, len(ticks), per_block):
+            chunk = ticks[i:i + per_block]
+            # Zirve tablosu yerel saatle çalışır (canlı döngüdeki datetime.now() gibi)
+            hours = np.array([hour_of_week(datetime.fromtimestamp(t)) for t in chunk.tolist()])
+            metrics = self.engine.compute_block(hours, rows)
+
+            records = np.empty((len(chunk) * n, len(ARCHIVE_COLUMNS)))
+            records[:, ID] = np.tile(self.table.ids, len(chunk))
+            records[:, TS] = np.repeat(chunk, n)
+            records[:, DENSITY] = metrics['density'].ravel()
+            records[:, SPEED] = metrics['avg_speed'].ravel()
+            records[:, WAIT] = metrics['wait_time'].ravel()
+            records[:, VEHICLES] = metrics['vehicle_count'].ravel()
+            records[:, STATUS] = metrics['status_code'].ravel()
+            yield records
+
+
+def stored_history(db_path: str, archive: TrafficArchive, start: int, end: int,
+                   window: int = 3600) -> Iterator[np.ndarray]:
+    """Kayıtlı ham geçmiş (arşiv + SQLite), ts sırasıyla `window` saniyelik bloklar halinde"""
+    boundary = archive.boundary() if archive else 0
+    for day_from in range(start, min(end, boundary), DAY_SECONDS):
+        df = archive.read(day_from, min(day_from + DAY_SECONDS, end, boundary), ARCHIVE_COLUMNS)
+        if len(df):
+            df['status'] = df['status'].cat.codes if hasattr(df['status'], 'cat') else df['status']
+            yield df[list(ARCHIVE_COLUMNS)].to_numpy(dtype=np.float64)
+
+    conn = connect_db(db_path)
+    try:
+        for window_from in range(max(start, boundary), end, window):
+            rows = conn.execute(
+                f"SELECT {', '.join(ARCHIVE_COLUMNS)} FROM traffic_logs "
+                f"WHERE ts >= ? AND ts < ? ORDER BY ts, intersection_id",
+                (window_from, min(window_from + window, end))
+            ).fetchall()
+            if rows:
+                yield np.array(rows, dtype=np.float64)
+    finally:
+        conn.close()
+
+
+# --- Hedefler: her biri ts sırasındaki kayıt bloklarını `write` ile alır ---
+
+class DatabaseSink:
+    """traffic_logs'a büyük işlemlerle doğrudan yazar; kapatmada yazılan aralığın özetleri ham veriden kurulur.
+
+    Mevcut verinin üzerine doldurulursa var olan satırlar korunur (`INSERT OR IGNORE`);
+    özetler ham tablodan hesaplandığı için çift sayım olmaz.
+    """
+
+    def __init__(self, db_path: str, table: IntersectionTable):
+        self.table = table
+        self.conn = connect_db(db_path)
+        db_schema.migrate(self.conn)
+        db_schema.sync_intersections(self.conn, table)
+        self.rows = 0
+        self.start = self.end = None
+
+    def write(self, records: np.ndarray):
+        if not len(records):
+            return
+        ints = records[:, [ID, TS, SPEED, WAIT, VEHICLES, STATUS]].astype(np.int64)
+        # Birincil anahtar (intersection_id, ts) sırasında ekleme B-ağacında sıralı yazım sağlar
+        order = np.lexsort((ints[:, 1], ints[:, 0]))
+        self.conn.execute("BEGIN")
+        self.conn.executemany(db_schema.BACKFILL_TRAFFIC_LOG_SQL, zip(
+            ints[order, 0].tolist(), ints[order, 1].tolist(), records[order, DENSITY].tolist(),
+            ints[order, 2].tolist(), ints[order, 3].tolist(), ints[order, 4].tolist(), ints[order, 5].tolist()
+        ))
+        self.conn.execute("COMMIT")
+        self.rows += len(records)
+        first, last = int(ints[:, 1].min()), int(ints[:, 1].max())
+        self.start = first if self.start is None else min(self.start, first)
+        self.end = last + 1 if self.end is None else max(self.end, last + 1)
+
+    def close(self):
+        if self.start is not None:
+            TrafficRollups(self.table).rebuild_from_raw(self.conn, start=self.start, end=self.end)
+        self.conn.close()
+        logger.info(f"🗄️ Veritabanına {self.rows} satır yazıldı")
+
+
+class ArchiveSink:
+    """Kayıtları gün değişene kadar biriktirip arşiv bölümüne tek seferde yazar"""
+
+    def __init__(self, archive: TrafficArchive):
+        self.archive = archive
+        self.pending: List[np.ndarray] = []
+        self.day = None
+        self.rows = 0
+
+    def write(self, records: np.ndarray):
+        days = records[:, TS].astype(np.int64) // DAY_SECONDS
+        for day in np.unique(days).tolist():
+            if self.day is not None and day != self.day:
+                self._flush()
+            self.day = day
+            self.pending.append(records[days == day])
+
+    def _flush(self):
+        if self.pending:
+            data = np.concatenate(self.pending)
+            self.archive.write_rows(data)
+            self.rows += len(data)
+            self.pending = []
+
+    def close(self):
+        self._flush()
+        logger.info(f"🗜️ Arşive {self.rows} satır yazıldı")
+
+
+def tick_message(table: IntersectionTable, tick: np.ndarray, fmt: str, device: str) -> Dict:
+    """Bir anın kayıtlarından Node API anlık görüntüsü veya AWS veri paketi biçiminde mesaj"""
+    rows = table.rows_of(tick[:, ID].astype(np.int64))
+    tick, rows = tick[rows >= 0], rows[rows >= 0]
+    timestamp = datetime.fromtimestamp(int(tick[0, TS])).isoformat() if len(tick) else None
+    names = [table.names[row] for row in rows.tolist()]
+    lat, lng = table.lat[rows].tolist(), table.lng[rows].tolist()
+    ids, ints = tick[:, ID].astype(np.int64).tolist(), tick[:, [SPEED, WAIT, VEHICLES, STATUS]].astype(np.int64).tolist()
+    density = tick[:, DENSITY].tolist()
+
+    if fmt == "snapshot":
+        return {
+            'timestamp': timestamp,
+            'source': 'replay',
+            'intersections': [
+                {'id': i, 'name': name, 'lat': la, 'lng': ln, 'density': d,
+                 'avgSpeed': s, 'waitTime': w, 'vehicleCount': v, 'status': STATUS_NAMES[c]}
+                for i, name, la, ln, d, (s, w, v, c) in zip(ids, names, lat, lng, density, ints)
+            ]
+        }
+    return {
+        'deviceId': device,
+        'timestamp': timestamp,
+        'location': 'Ankara, Turkey',
+        'systemStatus': 'replay',
+        'dataType': 'traffic_analysis',
+        'intersections': [
+            {'intersectionId': i, 'name': name,
+             'coordinates': {'latitude': la, 'longitude': ln},
+             'metrics': {'density': d, 'averageSpeed': s, 'waitTime': w, 'vehicleCount': v},
+             'status': STATUS_NAMES[c], 'timestamp': timestamp, 'alerts': []}
+            for i, name, la, ln, d, (s, w, v, c) in zip(ids, names, lat, lng, density, ints)
+        ]
+    }
+
+
+class MQTTSink:
+    """An başına tek mesaj yayınlar (bloklamayan QoS1 yayıncı, taşan mesajlar diske)"""
+
+    def __init__(self, publisher, table: IntersectionTable, topic: str, fmt: str, device: str):
+        self.publisher = publisher
+        self.table = table
+        self.topic = topic
+        self.fmt = fmt
+        self.device = device
+        self.messages = 0
+
+    def write(self, records: np.ndarray):
+        for tick in split_ticks(records):
+            message = tick_message(self.table, tick, self.fmt, self.device)
+            self.publisher.publish(self.topic, json.dumps(message, ensure_ascii=False, separators=(',', ':')))
+            self.messages += 1
+
+    def close(self):
+        self.publisher.drain(30.0)
+        try:
+            self.publisher.connection.disconnect().result(5)
+        except Exception as e:
+            logger.warning(f"MQTT bağlantısı kapatılamadı: {e}")
+        self.publisher.close(timeout=0)
+        logger.info(f"📤 {self.messages} mesaj yayınlandı {self.publisher.stats}")
+
+
+class SnapshotSink:
+    """Her anı Node API anlık görüntü dosyalarına yazar (server.js REST uçları)"""
+
+    def __init__(self, path: str, table: IntersectionTable):
+        self.publisher = SnapshotPublisher(path)
+        self.table = table
+
+    def write(self, records: np.ndarray):
+        for tick in split_ticks(records):
+            self.publisher.publish(tick_message(self.table, tick, "snapshot", None))
+
+    def close(self):
+        logger.info(f"📄 Anlık görüntü sürümü {self.publisher.version}")
+
+
+def mqtt_publisher_from_env(client_id: str):
+    """Analizörle aynı ortam değişkenleriyle AWS IoT Core veya yerel broker yayıncısı"""
+    from awscrt import mqtt
+    from mqtt_publisher import AsyncMQTTPublisher, DiskSpool, build_connection
+
+    publisher = AsyncMQTTPublisher(
+        None,
+        DiskSpool(os.getenv('REPLAY_SPOOL_PATH', 'replay_spool.bin'),
+                  int(float(os.getenv('AWS_IOT_SPOOL_MAX_MB', '64')) * 1024 * 1024)),
+        qos=mqtt.QoS.AT_LEAST_ONCE,
+        max_inflight=int(os.getenv('AWS_IOT_MAX_INFLIGHT', '100'))
+    )
+    publisher.connection = build_connection(
+        client_id,
+        endpoint=os.getenv('AWS_IOT_ENDPOINT'),
+        cert_path=os.getenv('AWS_IOT_CERT_PATH', './certs/device.pem.crt'),
+        key_path=os.getenv('AWS_IOT_PRIVATE_KEY_PATH', './certs/private.pem.key'),
+        ca_path=os.getenv('AWS_IOT_CA_PATH', './certs/Amazon-root-CA-1.pem'),
+        broker_host=os.getenv('MQTT_BROKER_HOST'),
+        broker_port=int(os.getenv('MQTT_BROKER_PORT', '1883')),
+        on_interrupted=publisher.on_connection_interrupted,
+        on_resumed=publisher.on_connection_resumed,
+        clean_session=True
+    )
+    if publisher.connection is None:
+        raise RuntimeError("MQTT hedefi için AWS IoT sertifikaları veya MQTT_BROKER_HOST gerekli")
+    if not publisher.connect(wait=10.0):
+        logger.warning("MQTT bağlantısı henüz kurulamadı, mesajlar diske yazılacak")
+    return publisher
+
+
+# --- Çalıştırma ---
+
+def run_backfill(source: SyntheticTraffic, start: int, end: int, sinks: List) -> Dict:
+    """Simüle aralığı donanımın izin verdiği hızda üret ve hedeflere akıt"""
+    started = time.monotonic()
+    rows = 0
+    try:
+        for records in source.blocks(start, end):
+            for sink in sinks:
+                sink.write(records)
+            rows += len(records)
+            logger.info(f"⏩ {datetime.fromtimestamp(int(records[-1, TS])).isoformat()} "
+                        f"({rows} satır, {rows / (time.monotonic() - started):.0f} satır/sn)")
+    finally:
+        for sink in sinks:
+            sink.close()
+    elapsed = time.monotonic() - started
+    return {"rows": rows, "seconds": round(elapsed, 2), "rowsPerSec": round(rows / max(elapsed, 1e-9))}
+
+
+def run_replay(blocks: Iterator[np.ndarray], sinks: List, speed: float) -> Dict:
+    """Kayıtlı anları simüle zaman aralıklarını `speed` kat hızlandırarak yeniden yayınla (0: beklemesiz)"""
+    started = time.monotonic()
+    first = None
+    ticks = rows = 0
+    max_lag = 0.0
+    try:
+        for records in blocks:
+            for tick in split_ticks(records):
+                ts = float(tick[0, TS])
+                first = ts if first is None else first
+                if speed > 0:
+                    # Hedef duvar saati gerideyse beklenmez; gecikme raporlanır
+                    delay = started + (ts - first) / speed - time.monotonic()
+                    if delay > 0:
+                        time.sleep(delay)
+                    else:
+                        max_lag = max(max_lag, -delay)
+                for sink in sinks:
+                    sink.write(tick)
+                ticks += 1
+                rows += len(tick)
+    finally:
+        for sink in sinks:
+            sink.close()
+    elapsed = time.monotonic() - started
+    return {"ticks": ticks, "rows": rows, "seconds": round(elapsed, 2),
+            "ticksPerSec": round(ticks / max(elapsed, 1e-9), 1), "maxLagSec": round(max_lag, 3)}
+
+
+def build_sinks(names: List[str], args, table: IntersectionTable, archive: TrafficArchive) -> List:
+    sinks = []
+    for name in names:
+        if name == "db":
+            sinks.append(DatabaseSink(args.db, table))
+        elif name == "archive":
+            if archive is None:
+                raise RuntimeError("Arşiv hedefi için pyarrow kurulu olmalı")
+            sinks.append(ArchiveSink(archive))
+        elif name == "mqtt":
+            device = f"{os.getenv('AWS_IOT_THING_NAME', 'AnkaraTrafficSystem')}-replay"
+            topic = args.topic or ("traffic/analysis/update" if args.format == "snapshot"
+                                   else f"ankara-traffic/data/{device}")
+            sinks.append(MQTTSink(mqtt_publisher_from_env(device), table, topic, args.format, device))
+        elif name == "snapshot":
+            sinks.append(SnapshotSink(args.snapshot, table))
+    return sinks
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Sentetik geri doldurma ve geçmişin yeniden yayını")
+    parser.add_argument("mode", choices=("backfill", "replay"))
+    parser.add_argument("--start", help="Başlangıç (epoch veya ISO, varsayılan: bitişten 7 gün önce)")
+    parser.add_argument("--end", help="Bitiş (epoch veya ISO, varsayılan: şimdi)")
+    parser.add_argument("--sink", action="append", choices=SINKS,
+                        help="Hedef (tekrarlanabilir; varsayılan backfill: db, replay: mqtt)")
+    parser.add_argument("--intersections", default=os.getenv('TRAFFIC_INTERSECTIONS_PATH', 'intersections.json'))
+    parser.add_argument("--synthetic", type=int, default=0, help="Dosya yerine N rastgele kavşak")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--step", type=int, default=20, help="Simüle döngü aralığı (sn)")
+    parser.add_argument("--speed", type=float, default=60.0, help="Yeniden yayın hızı (×, 0: beklemesiz)")
+    parser.add_argument("--db", default=os.getenv('TRAFFIC_DB_PATH', 'traffic_data.db'))
+    parser.add_argument("--archive", default=os.getenv('TRAFFIC_ARCHIVE_PATH', 'traffic_archive'))
+    parser.add_argument("--snapshot", default=os.getenv('TRAFFIC_SNAPSHOT_PATH', 'current_traffic_data.json'))
+    parser.add_argument("--format", choices=MESSAGE_FORMATS, default="snapshot",
+                        help="MQTT mesaj biçimi: server.js anlık görüntüsü veya AWS veri paketi")
+    parser.add_argument("--topic", help="MQTT topic'i (varsayılan biçime göre)")
+    args = parser.parse_args(argv)
+
+    end = parse_time(args.end) if args.end else int(time.time())
+    start = parse_time(args.start) if args.start else end - 7 * DAY_SECONDS
+    table = (IntersectionTable.from_records(synthetic_intersections(args.synthetic, args.seed))
+             if args.synthetic else load_intersections(args.intersections))
+    names = args.sink or (["db"] if args.mode == "backfill" else ["mqtt"])
+    # Yeniden yayında arşiv yalnızca varsa okunur
+    wants_archive = "archive" in names or (args.mode == "replay" and os.path.isdir(args.archive))
+    archive = TrafficArchive(args.archive, table) if ARCHIVE_AVAILABLE and wants_archive else None
+    sinks = build_sinks(names, args, table, archive)
+
+    if args.mode == "backfill":
+        report = run_backfill(SyntheticTraffic(table, args.seed, args.step), start, end, sinks)
+    else:
+        report = run_replay(stored_history(args.db, archive, start, end), sinks, args.speed)
+    report.update(mode=args.mode, intersections=len(table), start=start, end=end)
+    print(json.dumps(report, indent=2, ensure_ascii=False))
+    return 0
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    sys.exit(main())
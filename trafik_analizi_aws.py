@@ -4,7 +4,6 @@ from dotenv import load_dotenv
 load_dotenv()
 import asyncio
 import json
-import requests
 import numpy as np
 import pandas as pd
 from datetime import datetime, timedelta
@@ -14,13 +13,30 @@ from dataclasses import dataclass
 import time
 import sqlite3
 import os
-from threading import Thread
+import threading
 import ssl
-
-# AWS IoT Core için gerekli kütüphaneler
-from awscrt import io, mqtt, auth, http
-from awsiot import mqtt_connection_builder
-import uuid
+from collections import deque
+
+from batch_engine import (BatchTrafficEngine, CRITICAL_DENSITY, INTERSECTION_TYPES, STATUS_CODES, TYPE_CODES, IntersectionTable,
+                          TrafficBatch, load_intersections, peak_multiplier)
+import db_schema
+from db_writer import TrafficDBWriter, connect as connect_db
+from rollups import DEFAULT_RETENTION, TrafficRollups, choose_resolution, retention_statements
+from traffic_archive import ARCHIVE_AVAILABLE, DAY_SECONDS, TrafficArchive
+from mqtt_publisher import AsyncMQTTPublisher, DiskSpool, build_connection
+from payload_codec import FRAME_MAGIC, PayloadEncoder
+from snapshot_publisher import SnapshotPublisher
+from forecaster import DEFAULT_HORIZONS, TrafficForecaster
+from recent_buffer import STAT_FIELDS, RecentCycleBuffer
+from scheduler import CycleScheduler
+from async_pipeline import AsyncTrafficPipeline
+from spatial_index import SpatialIndex
+from routing import RoutingEngine, RoutingServer
+from sensor_ingest import SENSOR_TOPIC, SensorIngestor
+from alert_engine import CONGESTION, AlertEngine, alert_payloads
+from sharding import ShardAssignment, heartbeat_topic, members_topic
+from maps_fetcher import DISTANCE_MATRIX_URL, DistanceMatrixFetcher, format_point
+from metrics import MetricsRegistry, MetricsServer, SamplingProfiler
 
 # Logging yapılandırması
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -40,18 +56,94 @@ class TrafficData:
     timestamp: datetime
 
 class AWSIoTTrafficAnalyzer:
-    def __init__(self, google_maps_api_key: str = None):
+    def __init__(self, google_maps_api_key: str = None, db_path: str = None, maps_api_url: str = None,
+                 connection=None, intersection_table: IntersectionTable = None):
+        """Verilmeyen bağımlılıklar ortam değişkenlerinden kurulur.
+        
+        Testler ve ölçümler için veritabanı yolu, Distance Matrix adresi (yerel taklit),
+        hazır bir MQTT bağlantısı (ör. local_stubs.FakeMQTTConnection) ve kavşak
+        tablosu doğrudan verilebilir.
+        """
         self.api_key = google_maps_api_key
-        self.intersections = [
-            {"id": 1, "name": "Kızılay Meydanı", "lat": 39.9208, "lng": 32.8541, "type": "major"},
-            {"id": 2, "name": "Tandoğan Kavşağı", "lat": 39.9347, "lng": 32.8197, "type": "major"},
-            {"id": 3, "name": "Kuğulu Park Kavşağı", "lat": 39.9019, "lng": 32.8597, "type": "medium"},
-            {"id": 4, "name": "Tunalı Hilmi Caddesi", "lat": 39.9089, "lng": 32.8486, "type": "medium"},
-            {"id": 5, "name": "Çankaya Caddesi", "lat": 39.9153, "lng": 32.8625, "type": "medium"},
-            {"id": 6, "name": "Atatürk Bulvarı - Sıhhiye", "lat": 39.9294, "lng": 32.8597, "type": "major"},
-            {"id": 7, "name": "GMK Bulvarı - Maltepe", "lat": 39.9256, "lng": 32.8378, "type": "medium"},
-            {"id": 8, "name": "Bahçelievler Kavşağı", "lat": 39.9133, "lng": 32.8264, "type": "medium"}
-        ]
+        
+        # Aşama süre histogramları ve bileşen sayaçları; yerel uç noktadan Prometheus biçiminde okunur (0: kapalı)
+        self.metrics = MetricsRegistry()
+        self.stage_seconds = {
+            stage: self.metrics.histogram('stage_seconds', 'Döngü aşaması süresi (sn)', stage=stage)
+            for stage in ('cycle', 'analyze', 'maps', 'save', 'publish', 'export')
+        }
+        self.metrics_port = int(os.getenv('METRICS_PORT', '3003'))
+        self.metrics_server = None
+        self.profiler = SamplingProfiler(interval=float(os.getenv('PROFILER_INTERVAL_MS', '10')) / 1000)
+        # Döngü özeti her N döngüde bir INFO, arada DEBUG seviyesinde loglanır
+        self.log_cycle_every = max(1, int(os.getenv('LOG_CYCLE_EVERY', '30')))
+        self.cycle_count = 0
+        
+        # Kavşak tanımları dosyadan yüklenir (JSON veya CSV)
+        self.intersections_path = os.getenv('TRAFFIC_INTERSECTIONS_PATH', 'intersections.json')
+        self.intersection_table = intersection_table or load_intersections(self.intersections_path)
+        self.intersections = self.intersection_table.to_dicts()
+        self.engine = BatchTrafficEngine(self.intersection_table)
+        
+        # Mekânsal indeks ve web haritası için karo indeksi dosyası
+        self.tile_index_path = os.getenv('TRAFFIC_TILE_INDEX_PATH', 'intersections.tiles.json')
+        self.tile_index_zoom = int(os.getenv('TILE_INDEX_ZOOM', '14'))
+        self.spatial_index = SpatialIndex(self.intersection_table)
+        self.write_tile_index()
+        
+        # Canlı ağırlıklı rota motoru ve Node API'nin çağırdığı yerel uç nokta (0: kapalı)
+        self.router = RoutingEngine(
+            self.spatial_index,
+            neighbors=int(os.getenv('ROUTING_NEIGHBORS', '4')),
+            critical_penalty=float(os.getenv('ROUTING_CRITICAL_PENALTY_SECS', '600')),
+            cache_size=int(os.getenv('ROUTING_CACHE_TREES', '32'))
+        )
+        self.routing_port = int(os.getenv('ROUTING_PORT', '3002'))
+        self.routing_server = None
+        
+        # Durumlu uyarı motoru: yalnızca geçişler yayınlanır, olaylar yayın aşamasına kadar kuyrukta bekler
+        self.alert_engine = AlertEngine(
+            self.intersection_table,
+            enter_density=float(os.getenv('ALERT_ENTER_DENSITY', str(CRITICAL_DENSITY * 100))),
+            exit_density=float(os.getenv('ALERT_EXIT_DENSITY', '60')),
+            min_duration=float(os.getenv('ALERT_MIN_DURATION_SECS', '60')),
+            renotify_interval=float(os.getenv('ALERT_RENOTIFY_SECS', '900')),
+            z_threshold=float(os.getenv('ALERT_Z_THRESHOLD', '4')),
+            cusum_h=float(os.getenv('ALERT_CUSUM_H', '8'))
+        )
+        self.alert_events = deque(maxlen=int(os.getenv('ALERT_QUEUE_SIZE', '10000')))
+
+        # Google Maps Distance Matrix ayarları
+        self.maps_destination = os.getenv('MAPS_DESTINATION', '39.9347,32.8197')
+        # 'nearest': her kavşağın süresi sabit hedef yerine en yakın komşu kavşağa ölçülür
+        self.maps_destinations = None
+        if os.getenv('MAPS_PAIRING', 'fixed') == 'nearest':
+            neighbors = self.spatial_index.nearest_neighbors()
+            self.maps_destinations = np.array([
+                format_point(lat, lng) for lat, lng in
+                zip(self.intersection_table.lat[neighbors].tolist(), self.intersection_table.lng[neighbors].tolist())
+            ])
+        self.maps_deadline = float(os.getenv('MAPS_DEADLINE_SECS', '5'))
+        self.maps_fetcher = None
+        if self.api_key:
+            self.maps_fetcher = DistanceMatrixFetcher(
+                self.api_key,
+                base_url=maps_api_url or os.getenv('MAPS_API_URL', DISTANCE_MATRIX_URL),
+                max_workers=int(os.getenv('MAPS_MAX_WORKERS', '4')),
+                cache_ttl=float(os.getenv('MAPS_CACHE_TTL_SECS', '300')),
+                on_request_latency=self.metrics.histogram(
+                    'maps_request_seconds', 'Distance Matrix HTTP isteği süresi (sn)').observe
+            )
+        
+        # Sensör mesajları: MQTT geri çağrısı yalnızca kuyruğa koyar, mikro partiler arka planda işlenir
+        self.sensor_topic = os.getenv('SENSOR_TOPIC', SENSOR_TOPIC)
+        self.sensors = SensorIngestor(
+            self.intersection_table,
+            maxsize=int(os.getenv('SENSOR_QUEUE_SIZE', '10000')),
+            batch_size=int(os.getenv('SENSOR_BATCH_SIZE', '500')),
+            max_age=float(os.getenv('SENSOR_MAX_AGE_SECS', '120'))
+        )
+        self.sensors.start()
         
         # AWS IoT Core ayarları
         self.aws_iot_endpoint = os.getenv('AWS_IOT_ENDPOINT')
@@ -59,103 +151,277 @@ class AWSIoTTrafficAnalyzer:
         self.private_key_path = os.getenv('AWS_IOT_PRIVATE_KEY_PATH', './certs/private.pem.key')
         self.ca_path = os.getenv('AWS_IOT_CA_PATH', './certs/Amazon-root-CA-1.pem')
         self.thing_name = os.getenv('AWS_IOT_THING_NAME', 'AnkaraTrafficSystem')
+        # AWS sertifikaları yoksa şifresiz yerel broker (test ve parçalı çalışma)
+        self.mqtt_broker_host = os.getenv('MQTT_BROKER_HOST')
+        self.mqtt_broker_port = int(os.getenv('MQTT_BROKER_PORT', '1883'))
+        
+        # Parçalı çalışma: her işçi kendi client id'si ve topic sonekiyle yalnızca kendi kavşaklarını işler
+        self.shard = None
+        self.shard_id = os.getenv('TRAFFIC_SHARD_ID')
+        self.device_name = f"{self.thing_name}-{self.shard_id}" if self.shard_id else self.thing_name
+        if self.shard_id:
+            self.shard = ShardAssignment(
+                self.intersection_table, self.shard_id,
+                os.getenv('TRAFFIC_SHARD_MEMBERS', self.shard_id).split(','),
+                os.getenv('TRAFFIC_SHARD_METHOD', 'hash')
+            )
+        
+        # Bloklamayan yayın: onaysız QoS1 penceresi ve çevrimdışı disk kuyruğu
+        self.spool_path = os.getenv('AWS_IOT_SPOOL_PATH', 'aws_iot_spool.bin')
+        self.spool_max_bytes = int(float(os.getenv('AWS_IOT_SPOOL_MAX_MB', '64')) * 1024 * 1024)
+        self.max_inflight = int(os.getenv('AWS_IOT_MAX_INFLIGHT', '100'))
+        self.publisher = None
+        
+        # Node.js API için anlık görüntü dosyaları
+        self.snapshot_publisher = SnapshotPublisher(
+            os.getenv('TRAFFIC_SNAPSHOT_PATH', 'current_traffic_data.json')
+        )
+        
+        # Opsiyonel kompakt payload: 'full' (varsayılan JSON), 'delta' veya 'binary'
+        self.payload_mode = os.getenv('AWS_IOT_PAYLOAD_MODE', 'full')
+        self.payload_encoder = None
+        if self.payload_mode in ('delta', 'binary'):
+            self.payload_encoder = PayloadEncoder(
+                self.intersection_table, self.device_name,
+                binary=self.payload_mode == 'binary',
+                compress=os.getenv('AWS_IOT_PAYLOAD_COMPRESS', '1') == '1',
+                keyframe_interval=int(os.getenv('AWS_IOT_KEYFRAME_INTERVAL', '30'))
+            )
+        
+        # Veritabanı: tek yazıcı bağlantısı (arka plan thread'i) ve tek okuyucu bağlantısı
+        self.db_path = db_path or os.getenv('TRAFFIC_DB_PATH', 'traffic_data.db')
+        
+        # 1 dakika / 1 saat / 1 gün özetleri ve saklama politikası (saat cinsinden, 0 = süresiz)
+        self.rollups = TrafficRollups(self.intersection_table)
+        self.rollup_lock = threading.Lock()
+        self.retention = dict(DEFAULT_RETENTION)
+        for name in self.retention:
+            hours = os.getenv(f'RETENTION_{name.upper()}_HOURS')
+            if hours is not None:
+                self.retention[name] = int(float(hours) * 3600) or None
+        self.retention_interval = int(os.getenv('RETENTION_INTERVAL_SECS', '3600'))
+        self._last_retention = 0
+        
+        # Opsiyonel sütunlu arşiv (pyarrow): kapanmış günler saklama turunda SQLite'tan taşınır
+        self.archive = None
+        self.archive_after = int(float(os.getenv('ARCHIVE_AFTER_HOURS', '24')) * 3600)
+        self.archive_retention = int(float(os.getenv('ARCHIVE_RETENTION_DAYS', '0')) * DAY_SECONDS) or None
+        self._archive_thread = None
+        if os.getenv('ARCHIVE_ENABLED', '0') == '1':
+            if ARCHIVE_AVAILABLE:
+                self.archive = TrafficArchive(os.getenv('TRAFFIC_ARCHIVE_PATH', 'traffic_archive'),
+                                              self.intersection_table)
+            else:
+                logger.warning("pyarrow kurulu değil, sütunlu arşiv kapalı")
+        
+        # Son döngüler bellekte (varsayılan 180 döngü ≈ 1 saat)
+        self.recent = RecentCycleBuffer(
+            self.intersection_table, capacity=int(os.getenv('RECENT_BUFFER_CYCLES', '180'))
+        )
+        
+        # 15/30/60 dakikalık tahminler; model durumu diskte tutulur
+        self.predictions_path = os.getenv('TRAFFIC_PREDICTIONS_PATH', 'traffic_predictions.json')
+        self.forecast_state_path = os.getenv('FORECAST_STATE_PATH', 'traffic_forecast_state.npz')
+        self.forecast_save_interval = int(os.getenv('FORECAST_SAVE_INTERVAL_SECS', '300'))
+        horizons = os.getenv('FORECAST_HORIZONS_MIN')
+        self.forecaster = TrafficForecaster(
+            self.intersection_table,
+            horizons=[int(h) for h in horizons.split(',')] if horizons else DEFAULT_HORIZONS
+        )
+        self._last_forecast_save = time.monotonic()
+        
+        # Döngü zamanlayıcısı: kavşak tipi başına aralık (saniye), varsayılan CYCLE_INTERVAL_SECS
+        cycle_interval = float(os.getenv('CYCLE_INTERVAL_SECS', '20'))
+        self.cycle_rows = {
+            name: np.flatnonzero(self.intersection_table.type_code == TYPE_CODES[name])
+            for name in INTERSECTION_TYPES
+        }
+        self.scheduler = CycleScheduler(self.run_cycle, {
+            name: float(os.getenv(f'CYCLE_INTERVAL_{name.upper()}_SECS', cycle_interval))
+            for name in INTERSECTION_TYPES if len(self.cycle_rows[name])
+        })
+        # Kısmi döngülerde API anlık görüntüsü her kavşağın son değeriyle tam kalır
+        self.latest_data: Dict[int, TrafficData] = {}
         
         self.connection = None
+        self.injected_connection = connection
         self.setup_database()
-        self.setup_aws_iot_connection()
+        commit_seconds = self.metrics.histogram('db_commit_seconds', 'Veritabanı grup commit süresi (sn)')
+        self.db_writer = TrafficDBWriter(
+            self.db_path,
+            batch_rows=int(os.getenv('DB_COMMIT_ROWS', '5000')),
+            flush_interval=float(os.getenv('DB_COMMIT_INTERVAL_SECS', '1.0')),
+            on_commit=lambda seconds, rows: commit_seconds.observe(seconds),
+            dead_letter_path=os.getenv('DB_DEAD_LETTER_PATH', 'traffic_db_dead_letter.jsonl')
+        )
+        self.db_reader = connect_db(self.db_path, check_same_thread=False)
+        self.db_reader_lock = threading.Lock()
+        self.register_metrics()
         
+    def write_tile_index(self):
+        """Karo -> kavşak id indeksini yaz (API ve harita yalnızca görünen karoları ister)"""
+        try:
+            tiles = self.spatial_index.write_tile_index(self.tile_index_path, self.tile_index_zoom)
+            logger.info(f"🗺️ Karo indeksi yazıldı: {tiles} karo (zoom {self.tile_index_zoom})")
+        except OSError as e:
+            logger.error(f"Karo indeksi yazılamadı: {e}")
+
+    def start_routing_server(self):
+        """Rota uç noktasını başlat (ROUTING_PORT=0 ise kapalı)"""
+        if not self.routing_port:
+            return
+        try:
+            self.routing_server = RoutingServer(self.router, port=self.routing_port).start()
+        except OSError as e:
+            logger.error(f"Rota servisi başlatılamadı: {e}")
+
+    def register_metrics(self):
+        """Bileşenlerin kendi sayaçlarını metrik uç noktasına bağla (kazıma anında okunur)"""
+        self.metrics.register_stats('db', 'Veritabanı yazıcısı', lambda: self.db_writer.stats)
+        self.metrics.register_stats(
+            'mqtt', 'MQTT yayıncısı',
+            lambda: self.publisher and dict(self.publisher.stats, inflight=self.publisher.inflight,
+                                            spool_pending=len(self.publisher.spool)),
+            gauges=('inflight', 'spool_pending')
+        )
+        self.metrics.register_stats('maps', 'Distance Matrix istemcisi',
+                                    lambda: self.maps_fetcher and self.maps_fetcher.stats)
+        self.metrics.register_stats('scheduler', 'Döngü zamanlayıcısı', lambda: self.scheduler.stats,
+                                    gauges=('last_lag', 'max_lag', 'last_duration', 'max_duration'))
+        self.metrics.register_stats('sensors', 'Sensör mesajı alımı', lambda: self.sensors.stats,
+                                    gauges=('max_queue',))
+        self.metrics.register_stats('alerts', 'Uyarı motoru', lambda: self.alert_engine.stats)
+        self.metrics.register_stats('routing', 'Rota motoru', lambda: self.router.stats)
+        self.metrics.register_stats('rollups', 'Özet tabloları (atlanan örnekler)', lambda: self.rollups.stats)
+        self.metrics.register_stats('snapshot', 'JSON anlık görüntüsü',
+                                    lambda: {'version': self.snapshot_publisher.version}, gauges=('version',))
+
+    def start_metrics_server(self):
+        """Metrik uç noktasını başlat (METRICS_PORT=0 ise kapalı)"""
+        if os.getenv('PROFILER_ENABLED', '0') == '1':
+            self.profiler.start()
+        if not self.metrics_port:
+            return
+        try:
+            self.metrics_server = MetricsServer(self.metrics, self.profiler, port=self.metrics_port).start()
+        except OSError as e:
+            logger.error(f"Metrik servisi başlatılamadı: {e}")
+
     def setup_database(self):
-        """SQLite veritabanını kurulum"""
-        conn = sqlite3.connect('traffic_data.db')
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS traffic_logs (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                intersection_id INTEGER,
-                name TEXT,
-                lat REAL,
-                lng REAL,
-                density REAL,
-                avg_speed INTEGER,
-                wait_time INTEGER,
-                vehicle_count INTEGER,
-                status TEXT,
-                timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
-                aws_message_id TEXT
-            )
-        ''')
-        
-        # AWS IoT mesaj logları için tablo
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS aws_iot_messages (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                topic TEXT,
-                message TEXT,
-                timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
-                status TEXT
-            )
-        ''')
+        """SQLite veritabanını kurulum (gerekirse eski şemadan yerinde geçiş)"""
+        conn = connect_db(self.db_path)
+        
+        old_version = db_schema.migrate(conn)
+        db_schema.sync_intersections(conn, self.intersection_table)
+        
+        # Özet tabloları yeni oluşturulduysa mevcut ham veriden doldur
+        if old_version < 3:
+            self.rollups.rebuild_from_raw(conn)
+        self.rollups.load_open_buckets(conn)
+        
+        # Tahmin modeli: kayıtlı durum yoksa yalnızca son haftaların saatlik özetleri okunur
+        if not self.forecaster.load(self.forecast_state_path):
+            self.forecaster.bootstrap_from_rollups(conn)
         
-        conn.commit()
         conn.close()
         logger.info("Veritabanı hazırlandı")
 
     def setup_aws_iot_connection(self):
-        """AWS IoT Core bağlantısını kur"""
+        """AWS IoT Core (veya yerel MQTT broker) bağlantısını kur"""
         try:
-            if not all([self.aws_iot_endpoint, os.path.exists(self.cert_path), 
-                       os.path.exists(self.private_key_path), os.path.exists(self.ca_path)]):
+            # awscrt yalnızca MQTT gerektiğinde yüklenir (geçmiş sorgusu, export vb. için gerekmez)
+            from awscrt import mqtt
+
+            aws_ready = all([self.aws_iot_endpoint, os.path.exists(self.cert_path),
+                             os.path.exists(self.private_key_path), os.path.exists(self.ca_path)])
+            if not aws_ready and not self.mqtt_broker_host and self.injected_connection is None:
                 logger.warning("AWS IoT sertifikaları bulunamadı, yerel MQTT kullanılacak")
                 return False
 
-            # Event loop ve host resolver
-            event_loop_group = io.EventLoopGroup(1)
-            host_resolver = io.DefaultHostResolver(event_loop_group)
-            client_bootstrap = io.ClientBootstrap(event_loop_group, host_resolver)
+            self.publisher = AsyncMQTTPublisher(
+                None,
+                DiskSpool(self.spool_path, self.spool_max_bytes),
+                qos=mqtt.QoS.AT_LEAST_ONCE,
+                max_inflight=self.max_inflight,
+                on_ack=self.on_publish_acked,
+                on_ack_latency=self.metrics.histogram(
+                    'mqtt_ack_seconds', 'MQTT gönderimden onaya geçen süre (sn)').observe
+            )
 
-            # MQTT bağlantısı oluştur
-            self.connection = mqtt_connection_builder.mtls_from_path(
+            # Verilen bağlantı varsa o kullanılır, yoksa MQTT bağlantısı oluştur
+            self.connection = self.injected_connection or build_connection(
+                self.device_name,
                 endpoint=self.aws_iot_endpoint,
-                cert_filepath=self.cert_path,
-                pri_key_filepath=self.private_key_path,
-                client_bootstrap=client_bootstrap,
-                ca_filepath=self.ca_path,
-                client_id=self.thing_name,
-                clean_session=False,
-                keep_alive_secs=6
+                cert_path=self.cert_path,
+                key_path=self.private_key_path,
+                ca_path=self.ca_path,
+                broker_host=None if aws_ready else self.mqtt_broker_host,
+                broker_port=self.mqtt_broker_port,
+                on_interrupted=self.publisher.on_connection_interrupted,
+                on_resumed=self.publisher.on_connection_resumed
             )
+            self.publisher.connection = self.connection
 
-            logger.info("AWS IoT Core bağlantısı hazırlandı")
+            if self.injected_connection is not None:
+                logger.info(f"Verilen MQTT bağlantısı kullanılıyor: {type(self.connection).__name__}")
+            elif aws_ready:
+                logger.info("AWS IoT Core bağlantısı hazırlandı")
+            else:
+                logger.info(f"Yerel MQTT broker bağlantısı hazırlandı: {self.mqtt_broker_host}:{self.mqtt_broker_port}")
             return True
 
         except Exception as e:
             logger.error(f"AWS IoT bağlantı kurulumu hatası: {e}")
             return False
 
-    def connect_to_aws_iot(self):
-        """AWS IoT Core'a bağlan"""
-        try:
-            if not self.connection:
-                return False
+    def connect_to_aws_iot(self, wait: float = 10.0):
+        """AWS IoT Core'a bağlan; bağlanamazsa arka planda üstel geri çekilmeyle denemeye devam et.
+        
+        Bağlantı nesnesi ilk çağrıda kurulur. `wait=0` beklemeden döner: bağlantı
+        gelene kadar yayınlar çevrimdışı kuyruğa yazılır, bağlanınca sırayla gönderilir.
+        """
+        if self.publisher is None and not self.setup_aws_iot_connection():
+            return False
+        if not self.connection:
+            return False
 
-            connect_future = self.connection.connect()
-            connect_future.result()
-            logger.info("✅ AWS IoT Core'a başarıyla bağlandı")
+        connected = self.publisher.connect(wait=wait, on_connected=self.subscribe_to_commands)
+        if not connected and wait:
+            logger.warning("AWS IoT Core'a henüz bağlanılamadı, mesajlar çevrimdışı kuyruğa yazılacak")
+        return connected
+
+    def subscribe_to_commands(self):
+        """Komut topic'ine abone ol (her bağlantıda)"""
+        try:
+            from awscrt import mqtt
 
-            # Komut topic'ine abone ol
             subscribe_future, packet_id = self.connection.subscribe(
                 topic=f"ankara-traffic/commands/{self.thing_name}",
                 qos=mqtt.QoS.AT_LEAST_ONCE,
                 callback=self.on_aws_message_received
             )
-            subscribe_future.result()
+            subscribe_future.result(10)
             logger.info(f"📡 AWS IoT topic'ine abone olundu: ankara-traffic/commands/{self.thing_name}")
-            return True
+            
+            # Sensör verileri veritabanına tek tek yazılmaz; döngüye katılmak üzere kuyruğa alınır
+            subscribe_future, packet_id = self.connection.subscribe(
+                topic=self.sensor_topic,
+                qos=mqtt.QoS.AT_MOST_ONCE,
+                callback=self.sensors.on_message
+            )
+            subscribe_future.result(10)
+            
+            # Koordinatörün (retained) üyelik listesi bu işçinin kavşaklarını belirler
+            if self.shard:
+                subscribe_future, packet_id = self.connection.subscribe(
+                    topic=members_topic(self.thing_name),
+                    qos=mqtt.QoS.AT_LEAST_ONCE,
+                    callback=self.shard.on_members_message
+                )
+                subscribe_future.result(10)
 
         except Exception as e:
-            logger.error(f"AWS IoT bağlantı hatası: {e}")
-            return False
+            logger.error(f"AWS IoT abonelik hatası: {e}")
 
     def on_aws_message_received(self, topic, payload, dup, qos, retain, **kwargs):
         """AWS IoT'den mesaj alındığında çalışır"""
@@ -170,8 +436,11 @@ class AWSIoTTrafficAnalyzer:
             # Özel komutları işle
             if message.get('command') == 'update_analysis':
                 logger.info("🔄 AWS'den analiz güncelleme komutu alındı")
-                # Hemen analiz yap ve gönder
-                Thread(target=self.immediate_analysis).start()
+                # Bir sonraki tike veya tek bekleyen anlık çalıştırmaya eklenir
+                self.scheduler.request_run()
+            elif message.get('command') == 'profile':
+                # Örneklemeli profil çıkarıcı çalışırken açılır; sonuç metrik uç noktasının /profile yolunda
+                self.profiler.start(float(message.get('seconds', 60)))
                 
         except Exception as e:
             logger.error(f"AWS mesaj işleme hatası: {e}")
@@ -179,286 +448,305 @@ class AWSIoTTrafficAnalyzer:
     def save_aws_message_to_db(self, topic: str, message: dict):
         """AWS IoT mesajını veritabanına kaydet"""
         try:
-            conn = sqlite3.connect('traffic_data.db')
-            cursor = conn.cursor()
-            
-            cursor.execute('''
+            self.db_writer.write('''
                 INSERT INTO aws_iot_messages (topic, message, status)
                 VALUES (?, ?, ?)
-            ''', (topic, json.dumps(message), 'received'))
-            
-            conn.commit()
-            conn.close()
+            ''', (topic, json.dumps(message, default=str), 'received'))
             
         except Exception as e:
             logger.error(f"AWS mesaj kaydetme hatası: {e}")
 
     def publish_to_aws_iot(self, topic: str, message: dict):
-        """AWS IoT Core'a mesaj gönder"""
+        """AWS IoT Core'a mesajı bloklamadan gönder (bağlantı yoksa çevrimdışı kuyruğa yazılır)"""
         try:
-            if not self.connection:
+            if not self.publisher:
                 logger.warning("AWS IoT bağlantısı yok, mesaj gönderilemedi")
                 return False
 
             message_json = json.dumps(message, ensure_ascii=False, default=str)
-            
-            publish_future, packet_id = self.connection.publish(
-                topic=topic,
-                payload=message_json,
-                qos=mqtt.QoS.AT_LEAST_ONCE
-            )
-            
-            publish_future.result()
-            logger.info(f"📤 AWS IoT'ye mesaj gönderildi: {topic}")
-            
-            # Başarılı gönderimi veritabanına kaydet
-            self.save_aws_message_to_db(topic, {"status": "published", "message": message})
-            return True
+            return self.publisher.publish(topic, message_json)
             
         except Exception as e:
             logger.error(f"AWS IoT mesaj gönderme hatası: {e}")
             return False
 
+    def on_publish_acked(self, topic: str, payload: bytes):
+        """Onaylanan gönderimi veritabanına kaydet"""
+        logger.debug(f"📤 AWS IoT'ye mesaj gönderildi: {topic}")
+        if payload[:len(FRAME_MAGIC)] == FRAME_MAGIC:
+            message = f"<binary {len(payload)} bytes>"
+        else:
+            message = payload.decode('utf-8', errors='replace')
+        self.db_writer.write('''
+            INSERT INTO aws_iot_messages (topic, message, status)
+            VALUES (?, ?, ?)
+        ''', (topic, message, 'published'))
+
+    def publish_encoded_traffic_data(self, topic: str, traffic_data_list: List[TrafficData]):
+        """Delta/binary modunda yalnızca değişen kavşakları (ve periyodik keyframe'leri) gönder"""
+        if not self.publisher:
+            logger.warning("AWS IoT bağlantısı yok, mesaj gönderilemedi")
+            return False
+
+        rows = self.intersection_table.rows_of(np.array([d.intersection_id for d in traffic_data_list]))
+        values = np.array([
+            (d.density, d.avg_speed, d.wait_time, d.vehicle_count, STATUS_CODES[d.status])
+            for d in traffic_data_list
+        ], dtype=np.float64).reshape(-1, 5)
+        seq, messages = self.payload_encoder.encode(rows, values)
+
+        # Referans görüntü ancak tüm parçalar onaylanınca ilerler
+        remaining = [len(messages)]
+        lock = threading.Lock()
+
+        def on_ack():
+            with lock:
+                remaining[0] -= 1
+                complete = remaining[0] == 0
+            if complete:
+                self.payload_encoder.acknowledge(seq)
+
+        return all([self.publisher.publish(topic, message, on_ack=on_ack) for message in messages])
+
     def calculate_traffic_density(self, intersection_type: str) -> float:
         """Zaman bazlı trafik yoğunluğu hesaplama"""
-        current_hour = datetime.now().hour
-        current_minute = datetime.now().minute
-        
-        # Hafta içi/hafta sonu kontrolü
-        is_weekend = datetime.now().weekday() >= 5
-        
-        # Temel trafik yoğunluğu
+        # Zirve saat çarpanları haftanın saati × kavşak tipi tablosundan gelir
         base_traffic = np.random.uniform(0.1, 0.3)
-        
-        # Zirve saat çarpanları
-        peak_multiplier = 1.0
-        
-        if not is_weekend:
-            # Sabah zirvesi (07:00-09:30)
-            if 7 <= current_hour <= 9 or (current_hour == 9 and current_minute <= 30):
-                peak_multiplier = 2.8 if intersection_type == "major" else 2.2
-            # Akşam zirvesi (17:00-19:30)
-            elif 17 <= current_hour <= 19 or (current_hour == 19 and current_minute <= 30):
-                peak_multiplier = 3.2 if intersection_type == "major" else 2.5
-            # Öğle arası (12:00-14:00)
-            elif 12 <= current_hour <= 14:
-                peak_multiplier = 1.8
-            # Normal çalışma saatleri
-            elif 10 <= current_hour <= 16:
-                peak_multiplier = 1.4
-        else:
-            # Hafta sonu daha düşük trafik
-            if 11 <= current_hour <= 15:
-                peak_multiplier = 1.6
-            elif 19 <= current_hour <= 22:
-                peak_multiplier = 1.3
-        
-        return min(base_traffic * peak_multiplier, 1.0)
+        return min(base_traffic * peak_multiplier(datetime.now(), intersection_type), 1.0)
 
     def get_google_maps_traffic_data(self, lat: float, lng: float) -> Dict:
         """Google Maps Distance Matrix API ile trafik süresi verisi çekme"""
-        if not self.api_key:
+        if not self.maps_fetcher:
             logger.warning("Google Maps API key bulunamadı, simüle edilmiş veri kullanılacak")
             return None
 
-        try:
-            # Test için sabit bir hedef nokta (örnek: Tandoğan Kavşağı)
-            destination = "39.9347,32.8197"
-            origin = f"{lat},{lng}"
-
-            url = "https://maps.googleapis.com/maps/api/distancematrix/json"
-            params = {
-                'origins': origin,
-                'destinations': destination,
-                'departure_time': 'now',
-                'key': self.api_key
-            }
-
-            response = requests.get(url, params=params, timeout=10)
-
-            if response.status_code == 200:
-                return response.json()
-            else:
-                logger.error(f"Distance Matrix API hatası: {response.status_code}")
-                return None
+        return self.maps_fetcher.request([format_point(lat, lng)], self.maps_destination)
+
+    def analyze_traffic_batch(self, rows: np.ndarray = None) -> TrafficBatch:
+        """Kavşaklar (varsayılan tümü) için tek geçişte (vektörel) trafik analizi"""
+        batch = self.engine.compute(datetime.now(), rows)
+
+        # Eğer gerçek trafik verisi geldiyse, kullan; süresinde gelmeyenler simüle kalır
+        if self.maps_fetcher:
+            started = time.perf_counter()
+            # Sakin kavşaklar daha uzun süre önbellekten okunur
+            ttl = np.where(batch.status_code == STATUS_CODES['normal'],
+                           self.maps_fetcher.cache_ttl, self.maps_fetcher.cache_ttl / 4)
+            duration_sec, distance_m = self.maps_fetcher.fetch(
+                self.intersection_table.lat[batch.rows],
+                self.intersection_table.lng[batch.rows],
+                (self.maps_destinations[batch.rows].tolist() if self.maps_destinations is not None
+                 else [self.maps_destination] * len(batch)),
+                deadline=time.monotonic() + self.maps_deadline,
+                ttl=ttl
+            )
+            batch.apply_travel_times(np.nan_to_num(duration_sec), np.nan_to_num(distance_m))
+            self.stage_seconds['maps'].observe_since(started)
 
-        except Exception as e:
-            logger.error(f"Distance Matrix API çağrısında hata: {e}")
-            return None
+        # Taze sensör ölçümleri simülasyon ve Maps değerlerinin yerine geçer
+        self.sensors.apply(batch)
 
-    def analyze_traffic_data(self) -> List[TrafficData]:
-        """Tüm kavşaklar için trafik analizi"""
-        traffic_data_list = []
+        return batch
 
-        for intersection in self.intersections:
-            maps_data = self.get_google_maps_traffic_data(
-                intersection['lat'], 
-                intersection['lng']
-            )
+    def analyze_traffic_data(self, rows: np.ndarray = None) -> List[TrafficData]:
+        """Tüm kavşaklar (veya verilen satırlar) için trafik analizi"""
+        started = time.perf_counter()
+        batch = self.analyze_traffic_batch(rows)
+        self.recent.push(batch)
+        self.update_forecasts(batch)
+        self.router.update(batch)
         
-            # Trafik yoğunluğunu hesapla
-            density = self.calculate_traffic_density(intersection['type'])
-        
-            # Varsayılanlar (simüle)
-            avg_speed = max(15, int(60 - (density * 45)))  # 15-60 km/h
-            wait_time = int(density * 180)
-        
-            # Eğer gerçek trafik verisi geldiyse, kullan
-            if maps_data and maps_data.get("rows"):
-                try:
-                    element = maps_data["rows"][0]["elements"][0]
-                    if "duration_in_traffic" in element:
-                        duration_sec = element["duration_in_traffic"]["value"]
-                        distance_m = element["distance"]["value"]
-                        distance_km = distance_m / 1000
-        
-                        if duration_sec > 0 and distance_km > 0:
-                            avg_speed = int((distance_km / (duration_sec / 3600)))  # km/h
-                            wait_time = int(duration_sec % 180)
-        
-                        logger.info(f"✅ {intersection['name']}: {distance_km:.1f} km, {duration_sec}s, {avg_speed} km/h")
-        
-                except Exception as e:
-                    logger.warning(f"Trafik süresi ayrıştırılamadı: {e}")
-        
-            # Durum belirleme
-            if density > 0.7:
-                status = "critical"
-            elif density > 0.4:
-                status = "moderate"
-            else:
-                status = "normal"
-        
-            traffic_data = TrafficData(
-                intersection_id=intersection['id'],
-                name=intersection['name'],
-                lat=intersection['lat'],
-                lng=intersection['lng'],
-                density=round(density * 100, 1),
-                avg_speed=avg_speed,
-                wait_time=wait_time,
-                vehicle_count=int(density * 150 + np.random.uniform(10, 50)),
-                status=status,
-                timestamp=datetime.now()
+        events = self.alert_engine.process(batch)
+        if events:
+            self.alert_events.extend(events)
+            logger.info(f"🚨 {len(events)} uyarı geçişi")
+        traffic_data = batch.to_traffic_data(self.intersection_table, TrafficData)
+        self.stage_seconds['analyze'].observe_since(started)
+        return traffic_data
+
+    def update_forecasts(self, batch: TrafficBatch):
+        """Tahmin profillerini partiyle güncelle ve tahmin dosyasını yaz"""
+        try:
+            self.forecaster.update(
+                batch.rows, np.column_stack([batch.density, batch.avg_speed]), batch.timestamp
             )
-        
-            traffic_data_list.append(traffic_data)
+            count = self.forecaster.write_predictions(self.predictions_path, batch.timestamp)
+            logger.debug(f"🔮 {count} kavşak için tahmin güncellendi")
+            
+            if time.monotonic() - self._last_forecast_save >= self.forecast_save_interval:
+                self.save_forecast_state()
+        except Exception as e:
+            logger.error(f"Tahmin güncelleme hatası: {e}")
 
-        return traffic_data_list
+    def save_forecast_state(self):
+        """Tahmin modeli durumunu diske kaydet"""
+        try:
+            self.forecaster.save(self.forecast_state_path)
+            self._last_forecast_save = time.monotonic()
+        except Exception as e:
+            logger.error(f"Tahmin durumu kaydetme hatası: {e}")
 
     def save_to_database(self, traffic_data_list: List[TrafficData]):
-        """Verileri veritabanına kaydet"""
-        conn = sqlite3.connect('traffic_data.db')
-        cursor = conn.cursor()
+        """Verileri veritabanı yazıcısının kuyruğuna al"""
+        started = time.perf_counter()
+        rows = [
+            (
+                data.intersection_id, int(data.timestamp.timestamp()),
+                data.density, data.avg_speed, data.wait_time,
+                data.vehicle_count, STATUS_CODES[data.status]
+            )
+            for data in traffic_data_list
+        ]
+        self.db_writer.write_many(db_schema.INSERT_TRAFFIC_LOG_SQL, rows)
         
+        # Özetler aynı grup commit'inde güncellenir
+        if rows:
+            data = np.array(rows, dtype=np.float64)
+            with self.rollup_lock:
+                writes = self.rollups.update(
+                    self.intersection_table.rows_of(data[:, 0].astype(np.int64)),
+                    data[:, 1].astype(np.int64), data[:, 2:5], data[:, 6].astype(np.int64)
+                )
+            for sql, records in writes:
+                self.db_writer.write_many(sql, records)
+        
+        self.apply_retention()
+        self.stage_seconds['save'].observe_since(started)
+        logger.debug(f"{len(traffic_data_list)} veri kayıt kuyruğuna alındı")
+
+    def take_alert_events(self) -> List[Dict]:
+        """Yayınlanmayı bekleyen uyarı olaylarını al"""
+        events = []
+        while self.alert_events:
+            events.append(self.alert_events.popleft())
+        return events
+
+    def publish_full_traffic_data(self, traffic_data_list: List[TrafficData], alert_events: List[Dict] = ()):
+        """Tüm kavşakları tam JSON belgesi olarak gönder"""
+        events_by_id = {}
+        for event in alert_events:
+            events_by_id.setdefault(event['id'], []).append(event)
+        # Ana veri paketi
+        aws_payload = {
+            'deviceId': self.device_name,
+            'timestamp': datetime.now().isoformat(),
+            'location': 'Ankara, Turkey',
+            'systemStatus': 'active',
+            'dataType': 'traffic_analysis',
+            'intersections': []
+        }
+
+        # Her kavşak için veri hazırla
         for data in traffic_data_list:
-            # AWS mesaj ID'si oluştur
-            aws_message_id = str(uuid.uuid4())
-            
-            cursor.execute('''
-                INSERT INTO traffic_logs 
-                (intersection_id, name, lat, lng, density, avg_speed, wait_time, vehicle_count, status, timestamp, aws_message_id)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            ''', (
-                data.intersection_id, data.name, data.lat, data.lng,
-                data.density, data.avg_speed, data.wait_time, 
-                data.vehicle_count, data.status, data.timestamp, aws_message_id
-            ))
-        
-        conn.commit()
-        conn.close()
-        logger.info(f"{len(traffic_data_list)} veri kaydedildi")
-
-    def send_traffic_data_to_aws(self, traffic_data_list: List[TrafficData]):
-        """Trafik verilerini AWS IoT Core'a gönder"""
-        try:
-            # Ana veri paketi
-            aws_payload = {
-                'deviceId': self.thing_name,
-                'timestamp': datetime.now().isoformat(),
-                'location': 'Ankara, Turkey',
-                'systemStatus': 'active',
-                'dataType': 'traffic_analysis',
-                'intersections': []
+            intersection_data = {
+                'intersectionId': data.intersection_id,
+                'name': data.name,
+                'coordinates': {
+                    'latitude': data.lat,
+                    'longitude': data.lng
+                },
+                'metrics': {
+                    'density': data.density,
+                    'averageSpeed': data.avg_speed,
+                    'waitTime': data.wait_time,
+                    'vehicleCount': data.vehicle_count
+                },
+                'status': data.status,
+                'timestamp': data.timestamp.isoformat(),
+                'alerts': []
             }
 
-            # Her kavşak için veri hazırla
-            for data in traffic_data_list:
-                intersection_data = {
-                    'intersectionId': data.intersection_id,
-                    'name': data.name,
-                    'coordinates': {
-                        'latitude': data.lat,
-                        'longitude': data.lng
-                    },
-                    'metrics': {
-                        'density': data.density,
-                        'averageSpeed': data.avg_speed,
-                        'waitTime': data.wait_time,
-                        'vehicleCount': data.vehicle_count
-                    },
-                    'status': data.status,
-                    'timestamp': data.timestamp.isoformat(),
-                    'alerts': []
-                }
-
-                # Kritik durum uyarıları
-                if data.status == 'critical':
+            # Kritik durum uyarıları: yalnızca bu döngüde açılan/hatırlatılan tıkanıklık
+            for event in events_by_id.get(data.intersection_id, ()):
+                if event['alertType'] == CONGESTION and event['event'] != 'cleared':
                     intersection_data['alerts'].append({
                         'type': 'HEAVY_TRAFFIC',
                         'message': f'Yoğun trafik: {data.name}',
-                        'severity': 'HIGH'
+                        'severity': 'HIGH',
+                        'since': event['since']
                     })
 
-                aws_payload['intersections'].append(intersection_data)
-
-            # AWS IoT'ye ana veri gönder
-            main_topic = f"ankara-traffic/data/{self.thing_name}"
-            self.publish_to_aws_iot(main_topic, aws_payload)
-
-            # Kritik durumlar için özel alert topic
-            critical_intersections = [d for d in traffic_data_list if d.status == 'critical']
-            if critical_intersections:
-                alert_payload = {
-                    'alertType': 'TRAFFIC_CONGESTION',
-                    'severity': 'HIGH',
-                    'timestamp': datetime.now().isoformat(),
-                    'affectedIntersections': [
-                        {
-                            'id': data.intersection_id,
-                            'name': data.name,
-                            'density': data.density
-                        }
-                        for data in critical_intersections
-                    ],
-                    'recommendedAction': 'Consider alternative routes'
-                }
-                
-                alert_topic = f"ankara-traffic/alerts/{self.thing_name}"
+            aws_payload['intersections'].append(intersection_data)
+
+        # AWS IoT'ye ana veri gönder
+        main_topic = f"ankara-traffic/data/{self.device_name}"
+        self.publish_to_aws_iot(main_topic, aws_payload)
+
+    def send_traffic_data_to_aws(self, traffic_data_list: List[TrafficData]):
+        """Trafik verilerini AWS IoT Core'a gönder"""
+        started = time.perf_counter()
+        try:
+            alert_events = self.take_alert_events()
+            if self.payload_encoder:
+                self.publish_encoded_traffic_data(
+                    f"ankara-traffic/data/{self.device_name}/{self.payload_mode}", traffic_data_list
+                )
+            else:
+                self.publish_full_traffic_data(traffic_data_list, alert_events)
+
+            # Alert topic'ine yalnızca durum geçişleri (açılış, hatırlatma, kapanış, anomali)
+            alert_topic = f"ankara-traffic/alerts/{self.device_name}"
+            for alert_payload in alert_payloads(alert_events):
                 self.publish_to_aws_iot(alert_topic, alert_payload)
 
-            logger.info(f"📤 {len(traffic_data_list)} kavşak verisi AWS IoT'ye gönderildi")
+            self.stage_seconds['publish'].observe_since(started)
+            logger.debug(f"📤 {len(traffic_data_list)} kavşak verisi AWS IoT'ye gönderildi")
 
         except Exception as e:
             logger.error(f"AWS IoT veri gönderme hatası: {e}")
 
-    def immediate_analysis(self):
-        """AWS'den komut geldiğinde hemen analiz yap"""
-        try:
-            logger.info("🚀 AWS komutu üzerine hızlı analiz başlatılıyor...")
-            traffic_data = self.analyze_traffic_data()
-            self.save_to_database(traffic_data)
+    def rows_for_classes(self, classes: tuple) -> Optional[np.ndarray]:
+        """Kavşak tiplerinin (parçalı çalışmada yalnızca bu işçiye ait) satırları; tümü için None"""
+        rows = None
+        if not set(classes) >= set(INTERSECTION_TYPES):
+            rows = np.concatenate([self.cycle_rows[name] for name in classes])
+        if self.shard is not None:
+            own = self.shard.rows
+            rows = own if rows is None else np.intersect1d(rows, own)
+        return rows
+
+    def publish_shard_heartbeat(self, count: int):
+        """Parçalı çalışmada koordinatöre canlılık bildirimi (kavşağı olmayan işçiler dahil)"""
+        if self.shard is None or not self.publisher:
+            return
+        self.publisher.publish(
+            heartbeat_topic(self.thing_name, self.shard_id),
+            json.dumps({'shard': self.shard_id, 'epoch': self.shard.epoch, 'intersections': count})
+        )
+
+    def run_cycle(self, classes: tuple = INTERSECTION_TYPES, reason: str = 'tick'):
+        """Verilen kavşak tipleri için analiz → kayıt → AWS → JSON export"""
+        started = time.perf_counter()
+        rows = self.rows_for_classes(classes)
+        self.publish_shard_heartbeat(len(self.intersection_table) if rows is None else len(rows))
+        if rows is not None and not len(rows):
+            return
+        
+        traffic_data = self.analyze_traffic_data(rows)
+        self.save_to_database(traffic_data)
+        
+        # AWS IoT'ye gönder (bağlantı kopuksa çevrimdışı kuyruğa yazılır)
+        if self.publisher:
             self.send_traffic_data_to_aws(traffic_data)
-            
-            # Node.js API için JSON export
-            self.export_to_json(traffic_data)
-            
-        except Exception as e:
-            logger.error(f"Hızlı analiz hatası: {e}")
+        
+        # JSON export (Node.js API için)
+        self.export_to_json(traffic_data)
+        
+        self.stage_seconds['cycle'].observe_since(started)
+        self.cycle_count += 1
+        # Her döngüde log yazmak yerine örneklenir; süre dağılımı metrik uç noktasında
+        level = logging.INFO if (self.cycle_count - 1) % self.log_cycle_every == 0 else logging.DEBUG
+        logger.log(level, f"🔄 Trafik verileri güncellendi ({reason}: {', '.join(classes)}, "
+                          f"{(time.perf_counter() - started) * 1000:.0f} ms, döngü {self.cycle_count})")
 
     def export_to_json(self, traffic_data_list: List[TrafficData]):
         """Node.js API için JSON dosyalarını oluştur"""
+        started = time.perf_counter()
         try:
+            self.latest_data.update((data.intersection_id, data) for data in traffic_data_list)
+            traffic_data_list = sorted(self.latest_data.values(),
+                                       key=lambda data: self.intersection_table.row_of(data.intersection_id))
+            
             # Ana trafik verileri
             export_data = {
                 'timestamp': datetime.now().isoformat(),
@@ -479,79 +767,232 @@ class AWSIoTTrafficAnalyzer:
                 ]
             }
             
-            with open('current_traffic_data.json', 'w', encoding='utf-8') as f:
-                json.dump(export_data, f, ensure_ascii=False, indent=2)
-                
-            logger.info("📄 JSON verileri güncellendi")
+            # Atomik yazım; içerik değişmediyse dosyalara dokunulmaz
+            if self.snapshot_publisher.publish(export_data):
+                logger.debug(f"📄 JSON verileri güncellendi (sürüm {self.snapshot_publisher.version})")
+            else:
+                logger.debug("JSON verileri değişmedi, yazım atlandı")
+            self.stage_seconds['export'].observe_since(started)
             
         except Exception as e:
             logger.error(f"JSON export hatası: {e}")
 
-    def get_historical_data(self, hours: int = 24) -> pd.DataFrame:
-        """Geçmiş verileri getir"""
-        conn = sqlite3.connect('traffic_data.db')
+    def apply_retention(self, force: bool = False):
+        """Saklama süresi dolan ham ve özet satırları periyodik olarak sil"""
+        now = int(time.time())
+        if not force and now - self._last_retention < self.retention_interval:
+            return
+        self._last_retention = now
+        if self.archive is None:
+            for sql, params in retention_statements(now, self.retention):
+                self.db_writer.write_many(sql, params)
+            return
         
-        query = '''
-            SELECT * FROM traffic_logs 
-            WHERE timestamp >= datetime('now', '-{} hours')
-            ORDER BY timestamp DESC
-        '''.format(hours)
+        # Taşıma ayrı bağlantıyla okur; saklama silmeleri taşımadan sonra kuyruğa alınır
+        if self._archive_thread is None or not self._archive_thread.is_alive():
+            self._archive_thread = threading.Thread(
+                target=self.archive_closed_days, args=(now,), name="traffic-archiver", daemon=True
+            )
+            self._archive_thread.start()
+
+    def archive_closed_days(self, now: int = None):
+        """Kapanmış günleri sütunlu arşive taşı, ardından saklama silmelerini uygula"""
+        now = int(now or time.time())
+        try:
+            conn = connect_db(self.db_path)
+            try:
+                for sql, params in self.archive.compact(conn, now - self.archive_after):
+                    self.db_writer.write_many(sql, params)
+            finally:
+                conn.close()
+            if self.archive_retention:
+                removed = self.archive.expire(now - self.archive_retention)
+                if removed:
+                    logger.info(f"🗜️ Saklama süresi dolan {removed} arşiv günü silindi")
+        except Exception as e:
+            logger.error(f"Arşiv taşıma hatası: {e}")
+        for sql, params in retention_statements(now, self.retention):
+            self.db_writer.write_many(sql, params)
+
+    def get_traffic_history(self, hours: float = 24, intersection_id: int = None,
+                            max_points: int = 1000) -> pd.DataFrame:
+        """Pencereyi kavşak başına `max_points` noktayla karşılayan çözünürlükten geçmiş veri"""
+        resolution = choose_resolution(int(hours * 3600), max_points, self.retention)
+        since = int(time.time()) - int(hours * 3600)
+        params = [since]
         
-        df = pd.read_sql_query(query, conn)
-        conn.close()
+        if resolution == 'raw':
+            df = self.get_historical_data(hours, intersection_id=intersection_id)
+            df.attrs['resolution'] = resolution
+            return df
+        else:
+            columns = ', '.join(['r.intersection_id', 'i.name', 'i.lat', 'i.lng', 'r.bucket', 'r.n',
+                                 *(f'r.{c}' for c in db_schema.ROLLUP_METRIC_COLUMNS),
+                                 'r.normal_count', 'r.moderate_count', 'r.critical_count'])
+            query = f'''
+                SELECT {columns}, datetime(r.bucket, 'unixepoch') AS timestamp
+                FROM traffic_rollup_{resolution} r
+                JOIN intersections i ON i.id = r.intersection_id
+                WHERE r.bucket >= ?
+            '''
+            order = 'r.bucket'
+            # Kova başlangıcı pencereden önce olabilir
+            params[0] -= db_schema.ROLLUP_RESOLUTIONS[resolution]
+        
+        if intersection_id is not None:
+            query += ' AND intersection_id = ?'
+            params.append(int(intersection_id))
+        query += f' ORDER BY {order} DESC'
+        
+        with self.db_reader_lock:
+            df = pd.read_sql_query(query, self.db_reader, params=params)
+        df.attrs['resolution'] = resolution
+        
+        return df
+
+    def get_nearby_intersections(self, lat: float, lng: float, k: int = 5,
+                                 radius_m: float = None) -> List[Dict]:
+        """Noktaya en yakın k kavşak (veya `radius_m` içindekiler), yakından uzağa"""
+        if radius_m is None:
+            rows, distances = self.spatial_index.nearest(lat, lng, k)
+        else:
+            rows = self.spatial_index.radius(lat, lng, radius_m, sort=True)
+            distances = self.spatial_index.distances_m(rows, lat, lng)
+        return [dict(self.intersections[row], distance_m=round(float(d), 1))
+                for row, d in zip(rows.tolist(), distances.tolist())]
+
+    def get_intersections_in_bbox(self, south: float, west: float, north: float, east: float) -> List[Dict]:
+        """Sınır kutusu içindeki kavşak tanımları (tablo sırasıyla)"""
+        return [self.intersections[row] for row in np.sort(self.spatial_index.bbox(south, west, north, east)).tolist()]
+
+    def get_recent_stats(self, minutes: float = None, intersection_id: int = None) -> Dict:
+        """Bellekteki son döngülerden kavşak başına count/mean/std/min/max.
+        
+        `minutes` verilmezse tüm tampon penceresinin artımlı istatistikleri döner.
+        """
+        rows = None
+        if intersection_id is not None:
+            row = self.intersection_table.row_of(intersection_id)
+            if row is None:
+                return {}
+            rows = np.array([row])
+        
+        if minutes is None:
+            stats = self.recent.stats(rows)
+        else:
+            stats = self.recent.window_stats(minutes * 60)
+            if rows is not None:
+                stats = {key: value[rows] for key, value in stats.items()}
+        
+        ids = self.intersection_table.ids if rows is None else self.intersection_table.ids[rows]
+        result = {}
+        for i, intersection_id in enumerate(ids.tolist()):
+            entry = {'count': int(stats['count'][i])}
+            for j, field in enumerate(STAT_FIELDS):
+                entry[field] = {
+                    key: (None if np.isnan(stats[key][i, j]) else round(float(stats[key][i, j]), 2))
+                    for key in ('mean', 'std', 'min', 'max')
+                }
+            result[intersection_id] = entry
+        return result
+
+    def get_recent_data(self, minutes: float = None, intersection_id: int = None) -> np.ndarray:
+        """Bellekteki son döngüler (yapısal dizi, eskiden yeniye); SQLite'a gidilmez"""
+        cells = self.recent.window(None if minutes is None else minutes * 60)
+        if intersection_id is not None:
+            row = self.intersection_table.row_of(intersection_id)
+            if row is None:
+                return cells[:, :0]
+            cells = cells[:, row]
+            return cells[cells['valid']]
+        return cells
+
+    def get_historical_data(self, hours: float = 24, columns: List[str] = None,
+                            intersection_id: int = None) -> pd.DataFrame:
+        """Geçmiş ham veriler (yeniden eskiye): arşiv bölümleri ve SQLite'taki son satırlar birleşik"""
+        columns = list(columns or db_schema.HISTORY_COLUMNS)
+        since = int(time.time()) - int(hours * 3600)
+        # Sınırın altı arşivde, üstü SQLite'tadır
+        boundary = self.archive.boundary() if self.archive else 0
+        query, params = db_schema.history_query(columns, max(since, boundary), intersection_id)
+        
+        with self.db_reader_lock:
+            df = pd.read_sql_query(query, self.db_reader, params=params)
+        
+        if since < boundary:
+            archived = self.archive.history(since, boundary, columns, intersection_id)
+            if len(archived):
+                df = pd.concat([df, archived], ignore_index=True) if len(df) else archived
         
         return df
 
     def disconnect_aws_iot(self):
         """AWS IoT bağlantısını kapat"""
+        # Onay bekleyen mesajları ve bekleyen veritabanı yazımlarını tamamla
+        if self.publisher:
+            self.publisher.drain()
+        if self.routing_server:
+            self.routing_server.stop()
+        if self.metrics_server:
+            self.metrics_server.stop()
+        self.profiler.stop()
+        self.sensors.stop()
+        if self._archive_thread is not None:
+            self._archive_thread.join(30)
+        self.db_writer.flush()
+        self.save_forecast_state()
         try:
-            if self.connection:
+            # Hiç bağlanamamış bağlantı kapatılmaz (arka plan denemesi zaten durdu)
+            if self.connection and self.publisher.connected.is_set():
                 disconnect_future = self.connection.disconnect()
-                disconnect_future.result()
+                disconnect_future.result(10)
                 logger.info("AWS IoT bağlantısı kapatıldı")
         except Exception as e:
             logger.error(f"AWS IoT bağlantı kapatma hatası: {e}")
+        # Kuyruk bağlantıdan sonra kapatılır: geç gelen hatalar diske yazılabilir,
+        # hâlâ onaysız mesajlar kapatmada diske aktarılır
+        if self.publisher:
+            self.publisher.close(timeout=0)
 
-def main():
+def main(run_mode: str = None, connect_wait: float = None):
     """Ana uygulama döngüsü"""
     # Çevre değişkenlerini al
     api_key = os.getenv('GOOGLE_MAPS_API_KEY')
+    run_mode = run_mode or os.getenv('TRAFFIC_RUN_MODE', 'sync')
+    if connect_wait is None:
+        connect_wait = float(os.getenv('AWS_IOT_CONNECT_WAIT_SECS', '0'))
     
     analyzer = AWSIoTTrafficAnalyzer(api_key)
     
-    # AWS IoT'ye bağlan
-    aws_connected = analyzer.connect_to_aws_iot()
+    # AWS IoT'ye arka planda bağlan; döngüler bağlantıyı beklemeden başlar
+    aws_connected = analyzer.connect_to_aws_iot(wait=connect_wait)
+    analyzer.start_routing_server()
+    analyzer.start_metrics_server()
     
     if aws_connected:
         logger.info("🚀 AWS IoT Core ile Ankara Trafik Sistemi başlatıldı")
+    elif analyzer.publisher:
+        logger.info("🚀 Ankara Trafik Sistemi başlatıldı, AWS IoT bağlantısı arka planda kuruluyor")
    
     
     try:
-        while True:
-            # Trafik verilerini analiz et
-            traffic_data = analyzer.analyze_traffic_data()
-            
-            # Veritabanına kaydet
-            analyzer.save_to_database(traffic_data)
-            
-            # AWS IoT'ye gönder (bağlantı varsa)
-            if aws_connected:
-                analyzer.send_traffic_data_to_aws(traffic_data)
-            
-            # JSON export (Node.js API için)
-            analyzer.export_to_json(traffic_data)
-            
-            logger.info("🔄 Trafik verileri güncellendi ve AWS'ye gönderildi")
-            
-            # 30 saniye bekle
-            time.sleep(20)
-            
+        # Sabit oranlı döngü; süre aralığı aşarsa kaçırılan tikler atlanır
+        if run_mode == 'async':
+            # Toplama, kayıt, yayın ve export aşamaları sınırlı kuyruklarla örtüşerek çalışır
+            pipeline = AsyncTrafficPipeline(analyzer, int(os.getenv('PIPELINE_QUEUE_SIZE', '2')))
+            analyzer.metrics.register_stats('pipeline', 'Asenkron boru hattı', lambda: pipeline.stats)
+            asyncio.run(pipeline.run())
+        else:
+            analyzer.scheduler.run_forever()
+
     except KeyboardInterrupt:
         logger.info("🛑 Sistem kapatılıyor...")
         analyzer.disconnect_aws_iot()
     except Exception as e:
         logger.error(f"Ana döngüde hata: {e}")
         analyzer.disconnect_aws_iot()
+    finally:
+        analyzer.db_writer.close()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file